@@ -3,6 +3,7 @@ echo ""
 echo "- uv run cback3"
 echo "- uv run cback3-amazons3-sync"
 echo "- uv run cback3-span"
+echo "- uv run cback3-journal"
 echo ""
 echo "These are the exact scripts published by UV as part of the Python package."
 echo ""
@@ -0,0 +1,577 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Benchmark the filesystem hot paths against synthetic trees
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Notes
+########################################################################
+
+"""
+What is this Program?
+=====================
+
+   This program benchmarks the hot paths used by the collect, stage and store
+   actions against synthetic directory trees, so that performance regressions
+   can be caught before a release.  It runs offline, on Linux.  The following
+   are measured for each tree:
+
+      - ``FilesystemList.addDirContents``
+      - ``BackupFileList.generateDigestMap``, once for each available digest algorithm
+      - ``BackupFileList.generateTarfile``
+      - the knapsack algorithms, via ``BackupFileList.generateFitted``
+      - ``compareContents``
+      - an incremental collect, scanning the whole tree or using the change journal
+
+   The ``generateDigestMap`` benchmark uses the default SHA-1 digest, and the
+   other algorithms are measured as ``digest_blake2b`` and so on.  The
+   ``digest_xxh3_128`` benchmark only runs if the ``xxhash`` package is
+   installed.
+
+   The incremental collect benchmarks pretend that one file in every
+   :any:`JOURNAL_CHANGE_RATIO` has changed since the last collect.  The
+   ``incrementalScan`` benchmark walks the tree and compares every file
+   against the digest, like a collect without the change journal, while
+   ``incrementalJournal`` only looks at the changed paths and merges them into
+   the digest, like a collect with the change journal.  Both report the number
+   of files in the tree as their items.
+
+   Each benchmark runs in its own forked process, and records elapsed and CPU
+   time, throughput, peak RSS, read and write system calls (from
+   ``/proc/self/io``) and context switches.  The results are written as JSON,
+   and can be compared against a stored baseline, in which case the program
+   exits with status 1 if any benchmark regressed.
+
+   Run it from the top level of the source tree, like this::
+
+      PYTHONPATH=src python3 notes/benchmark.py --scale=0.01 --output=results.json /tmp/scratch
+      PYTHONPATH=src python3 notes/benchmark.py --scale=0.01 --baseline=results.json /tmp/scratch
+
+
+Synthetic Trees
+===============
+
+   Trees are described by profiles in an INI file (``notes/benchmark.ini`` by
+   default).  Each section is a profile, and uses the same fields as the
+   configuration for ``notes/createtree.py``, plus a ``seed``::
+
+      [smallfiles]
+      seed       = 1
+      maxdepth   = 3
+      mindirs    = 10
+      maxdirs    = 10
+      minfiles   = 800
+      maxfiles   = 1000
+      minlinks   = 0
+      maxlinks   = 0
+      minsize    = 0
+      maxsize    = 4096
+
+   Unlike ``createtree.py``, the generator is seeded, so a profile always
+   produces the same tree, and soft links cycle over the items at their level
+   so there can be more links than items.  The file counts are multiplied by
+   the ``--scale`` option.  Generated trees are kept in the scratch directory
+   and reused by later runs with the same profile and scale.
+
+@author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Imported modules
+########################################################################
+
+import configparser
+import getopt
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import time
+
+from CedarBackup3.filesystem import (
+    DEFAULT_DIGEST_ALGORITHM,
+    VALID_DIGEST_ALGORITHMS,
+    XXHASH_AVAILABLE,
+    BackupFileList,
+    FilesystemList,
+    compareContents,
+)
+from CedarBackup3.journal import mergeDigest
+
+#######################################################################
+# Module-wide constants and variables
+#######################################################################
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark.ini")
+DEFAULT_TOLERANCE = 10.0  # percent
+RESULTS_VERSION = 1
+BLOCK_SIZE = 1024 * 1024
+COMPLETE_MARKER = ".complete"
+KNAPSACK_ALGORITHMS = ["first_fit", "best_fit", "worst_fit", "alternate_fit"]
+JOURNAL_CHANGE_RATIO = 1000  # one file in this many is treated as changed by the incremental benchmarks
+INTEGER_FIELDS = [
+    "seed",
+    "maxdepth",
+    "mindirs",
+    "maxdirs",
+    "minfiles",
+    "maxfiles",
+    "minlinks",
+    "maxlinks",
+    "minsize",
+    "maxsize",
+]
+
+
+#######################################################################
+# Functions
+#######################################################################
+
+
+def usage():
+    """
+    Prints out program usage information.
+    """
+    print("")
+    print("Usage: %s [options] <scratch-dir>" % os.path.basename(sys.argv[0]))
+    print("")
+    print("Generates synthetic trees in <scratch-dir> and benchmarks the filesystem hot paths.")
+    print("")
+    print("  -c, --config=FILE       Profile configuration (default: notes/benchmark.ini)")
+    print("  -p, --profile=NAME      Profile to run, may be repeated (default: all)")
+    print("  -s, --scale=FACTOR      Multiply file counts by FACTOR (default: 1.0)")
+    print("  -o, --output=FILE       Write results to FILE as JSON")
+    print("  -b, --baseline=FILE     Compare results against a baseline written by --output")
+    print("  -t, --tolerance=PCT     Slowdown allowed before reporting a regression (default: 10)")
+    print("  -d, --drop-caches       Drop the page cache before each benchmark (requires root)")
+    print("")
+
+
+def parseconfig(configfile):
+    """
+    Parses profile configuration on disk into a dictionary mapping profile name to settings.
+    """
+    parser = configparser.ConfigParser()
+    if not parser.read(configfile):
+        raise ValueError("Unable to read [%s]." % configfile)
+    profiles = {}
+    for section in parser.sections():
+        profiles[section] = {field: parser.getint(section, field) for field in INTEGER_FIELDS}
+    return profiles
+
+
+#######################
+# Generating the trees
+#######################
+
+
+def createfile(rng, path, size):
+    """
+    Creates a file of the indicated size, filled with reproducible random data.
+    """
+    block = rng.randbytes(min(size, BLOCK_SIZE))
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def filldir(rng, profile, scale, basedir, depth):
+    """
+    Fills in a directory based on a profile, recursively, in the same way as createtree.py.
+    """
+    if depth > profile["maxdepth"]:
+        return
+    itemlist = []
+    for index in range(1, rng.randint(profile["mindirs"], profile["maxdirs"]) + 1):
+        dirname = os.path.join(basedir, "dir%03d" % index)
+        itemlist.append(dirname)
+        os.mkdir(dirname)
+        filldir(rng, profile, scale, dirname, depth + 1)
+    filecount = round(rng.randint(profile["minfiles"], profile["maxfiles"]) * scale)
+    for index in range(1, filecount + 1):
+        filename = os.path.join(basedir, "file%03d" % index)
+        itemlist.append(filename)
+        createfile(rng, filename, rng.randint(profile["minsize"], profile["maxsize"]))
+    if itemlist:
+        for index in range(1, rng.randint(profile["minlinks"], profile["maxlinks"]) + 1):
+            target = itemlist[(index - 1) % len(itemlist)]
+            os.symlink(os.path.basename(target), os.path.join(basedir, "link%03d" % index))
+
+
+def buildtree(scratch, name, profile, scale):
+    """
+    Builds the tree for a profile in the scratch directory, or reuses one built earlier.
+    Returns:
+        Path to the tree
+    """
+    key = hashlib.sha1(json.dumps([profile, scale], sort_keys=True).encode("utf-8")).hexdigest()[:12]  # noqa: S324
+    path = os.path.join(scratch, "tree-%s-%s" % (name, key))
+    if os.path.exists(os.path.join(path, COMPLETE_MARKER)):
+        print("Reusing tree for profile [%s] in [%s]." % (name, path))
+        return path
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    print("Generating tree for profile [%s] in [%s]." % (name, path))
+    os.makedirs(os.path.join(path, "tree"))
+    filldir(random.Random(profile["seed"]), profile, scale, os.path.join(path, "tree"), 1)
+    with open(os.path.join(path, COMPLETE_MARKER), "w"):
+        pass
+    return path
+
+
+def describetree(path):
+    """
+    Counts the directories, files, links and bytes in a tree.
+    """
+    summary = {"dirs": 0, "files": 0, "links": 0, "bytes": 0}
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            itempath = os.path.join(dirpath, name)
+            if os.path.islink(itempath):
+                summary["links"] += 1
+            elif os.path.isdir(itempath):
+                summary["dirs"] += 1
+            else:
+                summary["files"] += 1
+                summary["bytes"] += os.path.getsize(itempath)
+    return summary
+
+
+##########################
+# Running the benchmarks
+##########################
+
+
+def readcounters():
+    """
+    Reads the resource counters for the current process.
+    """
+    counters = {}
+    with open("/proc/self/io") as f:
+        for line in f:
+            (name, value) = line.split(":")
+            counters[name] = int(value)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    counters["cpu"] = usage.ru_utime + usage.ru_stime
+    counters["nvcsw"] = usage.ru_nvcsw
+    counters["nivcsw"] = usage.ru_nivcsw
+    return counters
+
+
+def measure(connection, function, setup):
+    """
+    Runs a benchmark in a forked child process, and sends the measurements back over a pipe.
+    """
+    try:
+        arguments = setup()
+        before = readcounters()
+        start = time.perf_counter()
+        (items, size) = function(*arguments)
+        elapsed = time.perf_counter() - start
+        after = readcounters()
+        connection.send(
+            {
+                "elapsed": elapsed,
+                "cpu": after["cpu"] - before["cpu"],
+                "items": items,
+                "bytes": size,
+                "items_per_second": items / elapsed if elapsed else 0.0,
+                "bytes_per_second": size / elapsed if elapsed else 0.0,
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "read_syscalls": after["syscr"] - before["syscr"],
+                "write_syscalls": after["syscw"] - before["syscw"],
+                "read_bytes": after["rchar"] - before["rchar"],
+                "write_bytes": after["wchar"] - before["wchar"],
+                "voluntary_switches": after["nvcsw"] - before["nvcsw"],
+                "involuntary_switches": after["nivcsw"] - before["nivcsw"],
+            }
+        )
+    except Exception as e:
+        connection.send({"error": str(e)})
+    finally:
+        connection.close()
+
+
+def run(function, setup, dropCaches):
+    """
+    Runs one benchmark in a fresh process, so peak RSS is measured per benchmark.
+    """
+    if dropCaches:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+    context = multiprocessing.get_context("fork")
+    (receiver, sender) = context.Pipe(duplex=False)
+    process = context.Process(target=measure, args=(sender, function, setup))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def backuplist(tree):
+    """
+    Builds a backup file list for a tree, as the setup for a benchmark.
+    """
+    fileList = BackupFileList()
+    fileList.addDirContents(tree)
+    return (fileList,)
+
+
+def benchadddircontents(tree):
+    """Benchmarks FilesystemList.addDirContents()."""
+    fileList = FilesystemList()
+    return (fileList.addDirContents(tree), 0)
+
+
+def benchdigestmap(fileList, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """Benchmarks BackupFileList.generateDigestMap() with a digest algorithm."""
+    return (len(fileList.generateDigestMap(algorithm=algorithm)), fileList.totalSize())
+
+
+def benchtarfile(fileList, tarfilePath):
+    """Benchmarks BackupFileList.generateTarfile()."""
+    try:
+        fileList.generateTarfile(tarfilePath, mode="tar")
+        return (len(fileList), os.path.getsize(tarfilePath))
+    finally:
+        os.remove(tarfilePath)
+
+
+def benchknapsack(fileList, algorithm):
+    """Benchmarks a knapsack algorithm, fitting half of the list's total size."""
+    fitted = fileList.generateFitted(fileList.totalSize() / 2, algorithm)
+    return (len(fileList), sum(os.path.getsize(item) for item in fitted))
+
+
+def benchcomparecontents(tree):
+    """Benchmarks compareContents(), comparing a tree against itself."""
+    summary = describetree(tree)
+    compareContents(tree, tree, verbose=True)
+    return (2 * summary["files"], 2 * summary["bytes"])
+
+
+def incrementalsetup(tree):
+    """
+    Builds the digest for a tree and picks the changed files, as the setup for an incremental benchmark.
+    """
+    digest = backuplist(tree)[0].generateDigestMap()
+    changed = set(sorted(digest)[::JOURNAL_CHANGE_RATIO])
+    return (tree, digest, changed)
+
+
+def benchincrementalscan(tree, digest, changed):  # noqa: ARG001
+    """Benchmarks an incremental collect that scans the whole tree."""
+    fileList = BackupFileList()
+    fileList.addDirContents(tree)
+    fileList.removeUnchanged(digest, captureDigest=True)
+    return (len(digest), 0)
+
+
+def benchincrementaljournal(tree, digest, changed):
+    """Benchmarks an incremental collect that uses the changed paths from the change journal."""
+    fileList = BackupFileList()
+    fileList.addChangedPaths(tree, changed)
+    (_, captured) = fileList.removeUnchanged(digest, captureDigest=True)
+    mergeDigest(digest, captured, changed)
+    return (len(digest), 0)
+
+
+def runprofile(scratch, name, profile, scale, dropCaches):
+    """
+    Runs all of the benchmarks for a profile, returning results keyed by benchmark name.
+    """
+    path = buildtree(scratch, name, profile, scale)
+    tree = os.path.join(path, "tree")
+    tarfilePath = os.path.join(scratch, "benchmark.tar")
+    benchmarks = [
+        ("addDirContents", benchadddircontents, lambda: (tree,)),
+        ("generateDigestMap", benchdigestmap, lambda: backuplist(tree)),
+    ]
+    for algorithm in VALID_DIGEST_ALGORITHMS:
+        if algorithm == DEFAULT_DIGEST_ALGORITHM or (algorithm == "xxh3_128" and not XXHASH_AVAILABLE):
+            continue
+        benchmarks.append(("digest_%s" % algorithm, benchdigestmap, lambda algorithm=algorithm: backuplist(tree) + (algorithm,)))
+    benchmarks.append(("generateTarfile", benchtarfile, lambda: backuplist(tree) + (tarfilePath,)))
+    for algorithm in KNAPSACK_ALGORITHMS:
+        benchmarks.append(("knapsack_%s" % algorithm, benchknapsack, lambda algorithm=algorithm: backuplist(tree) + (algorithm,)))
+    benchmarks.append(("compareContents", benchcomparecontents, lambda: (tree,)))
+    benchmarks.append(("incrementalScan", benchincrementalscan, lambda: incrementalsetup(tree)))
+    benchmarks.append(("incrementalJournal", benchincrementaljournal, lambda: incrementalsetup(tree)))
+    results = {"tree": describetree(tree), "benchmarks": {}}
+    for benchmark, function, setup in benchmarks:
+        result = run(function, setup, dropCaches)
+        results["benchmarks"][benchmark] = result
+        if "error" in result:
+            print("%-12s %-26s failed: %s" % (name, benchmark, result["error"]))
+        else:
+            print(
+                "%-12s %-26s %9.3f s %12.1f items/s %9.1f MB/s %9d KB RSS %9d reads"
+                % (
+                    name,
+                    benchmark,
+                    result["elapsed"],
+                    result["items_per_second"],
+                    result["bytes_per_second"] / 1024 / 1024,
+                    result["peak_rss_kb"],
+                    result["read_syscalls"],
+                )
+            )
+    return results
+
+
+##########################
+# Comparing to a baseline
+##########################
+
+
+def compare(baseline, results, tolerance):
+    """
+    Compares results against a baseline, printing a report.
+    Returns:
+        List of regressions, as ``(profile, benchmark)`` tuples
+    """
+    regressions = []
+    if baseline.get("scale") != results["scale"]:
+        print("Warning: baseline was run with scale %s, not %s." % (baseline.get("scale"), results["scale"]))
+    print("")
+    print("%-12s %-26s %10s %10s %8s" % ("profile", "benchmark", "baseline", "current", "change"))
+    for name, profile in results["profiles"].items():
+        for benchmark, result in profile["benchmarks"].items():
+            try:
+                previous = baseline["profiles"][name]["benchmarks"][benchmark]
+            except KeyError:
+                continue
+            if "error" in previous or "error" in result or previous["elapsed"] == 0:
+                continue
+            change = 100.0 * (result["elapsed"] - previous["elapsed"]) / previous["elapsed"]
+            flag = ""
+            if change > tolerance:
+                regressions.append((name, benchmark))
+                flag = " REGRESSION"
+            print("%-12s %-26s %9.3fs %9.3fs %+7.1f%%%s" % (name, benchmark, previous["elapsed"], result["elapsed"], change, flag))
+    return regressions
+
+
+def main():
+    """
+    Main routine for program.
+    """
+    try:
+        (switches, args) = getopt.getopt(
+            sys.argv[1:],
+            "c:p:s:o:b:t:dh",
+            ["config=", "profile=", "scale=", "output=", "baseline=", "tolerance=", "drop-caches", "help"],
+        )
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+        sys.exit(1)
+    configfile = DEFAULT_CONFIG
+    selected = []
+    scale = 1.0
+    output = None
+    baselinePath = None
+    tolerance = DEFAULT_TOLERANCE
+    dropCaches = False
+    for switch, value in switches:
+        if switch in ("-c", "--config"):
+            configfile = value
+        elif switch in ("-p", "--profile"):
+            selected.append(value)
+        elif switch in ("-s", "--scale"):
+            scale = float(value)
+        elif switch in ("-o", "--output"):
+            output = value
+        elif switch in ("-b", "--baseline"):
+            baselinePath = value
+        elif switch in ("-t", "--tolerance"):
+            tolerance = float(value)
+        elif switch in ("-d", "--drop-caches"):
+            dropCaches = True
+        else:
+            usage()
+            sys.exit(0)
+    if len(args) != 1:
+        usage()
+        sys.exit(1)
+    if not sys.platform.startswith("linux"):
+        print("This program only runs on Linux.")
+        sys.exit(1)
+    scratch = os.path.abspath(args[0])
+    os.makedirs(scratch, exist_ok=True)
+    profiles = parseconfig(configfile)
+    for name in selected:
+        if name not in profiles:
+            print("Unknown profile [%s]." % name)
+            sys.exit(1)
+    baseline = None
+    if baselinePath is not None:
+        with open(baselinePath) as f:
+            baseline = json.load(f)  # read up front, in case it's also the output file
+    results = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "profiles": {},
+    }
+    for name in selected or list(profiles.keys()):
+        results["profiles"][name] = runprofile(scratch, name, profiles[name], scale, dropCaches)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("Wrote results to [%s]." % output)
+    if baseline is not None:
+        regressions = compare(baseline, results, tolerance)
+        if regressions:
+            print("%d benchmark(s) regressed by more than %.1f%%." % (len(regressions), tolerance))
+            sys.exit(1)
+        print("No regressions beyond %.1f%%." % tolerance)
+
+
+########################################################################
+# Module entry point
+########################################################################
+
+# Run the main routine if the module is executed rather than sourced
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Measure throughput of the mbox extraction engine
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Notes
+########################################################################
+
+"""
+What is this Program?
+=====================
+
+   This program measures the throughput of the in-process extraction engine in
+   the mbox extension.  It generates a synthetic mailbox of a given size in a
+   scratch directory, and then times three cases:
+
+      - a full scan with no date filter (a full backup)
+      - a full scan with a date filter (an incremental backup with no usable index)
+      - a tail extraction after appending 1% more mail (an incremental backup with an index)
+
+   If ``grepmail`` is available on the path, the equivalent ``grepmail -a -u``
+   commands are timed as well, for comparison.
+
+   Run it from the top level of the source tree, like this::
+
+      PYTHONPATH=src python3 notes/mboxbench.py /tmp/scratch 256
+
+@author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Imported modules
+########################################################################
+
+import datetime
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+from CedarBackup3.extend.mbox import _backupMboxFile, _extractMessages
+
+
+#######################################################################
+# Module-wide constants and variables
+#######################################################################
+
+MESSAGE = (
+    "From sender@example.com %(envelope)s\n"
+    "Received: from mail.example.com by host.example.com; %(date)s\n"
+    "Message-ID: <%(id)d@example.com>\n"
+    "Subject: message %(id)d\n"
+    "\n"
+    "%(body)s\n"
+    "\n"
+)
+
+
+#######################################################################
+# Functions
+#######################################################################
+
+
+def usage():
+    """
+    Prints out program usage information.
+    """
+    print("")
+    print("Usage: %s <scratch-dir> <size-in-mb>" % os.path.basename(sys.argv[0]))
+    print("")
+    print("Generates a synthetic mailbox of approximately <size-in-mb>")
+    print("megabytes in <scratch-dir> and reports extraction throughput.")
+    print("")
+
+
+def writemessages(path, start, count, mode):
+    """
+    Writes a number of synthetic messages to a mailbox, one minute apart.
+    """
+    rng = random.Random(start)
+    base = datetime.datetime(2006, 1, 1)
+    with open(path, mode) as f:
+        for i in range(start, start + count):
+            date = base + datetime.timedelta(minutes=i)
+            body = "x" * rng.randint(500, 20000)
+            f.write(MESSAGE % {
+                "envelope": date.strftime("%a %b %d %H:%M:%S %Y"),
+                "date": date.strftime("%a, %d %b %Y %H:%M:%S +0000"),
+                "id": i,
+                "body": "\n".join(body[j:j + 72] for j in range(0, len(body), 72)),
+            })
+
+
+def timed(label, size, function):
+    """
+    Runs a function, reporting elapsed time and throughput for a given number of bytes.
+    """
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print("%-40s %8.3f s %10.1f MB/s" % (label, elapsed, size / elapsed / 1024 / 1024 if elapsed else 0))
+
+
+def extract(path, outputPath, **kwargs):
+    """
+    Runs the extraction engine directly against a mailbox.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with open(outputPath, "wb") as outputFile:
+            _extractMessages(fd, outputFile, **kwargs)
+    finally:
+        os.close(fd)
+
+
+def main():
+    """
+    Main routine for program.
+    """
+    if len(sys.argv) != 3:
+        usage()
+        sys.exit(1)
+    scratch = sys.argv[1]
+    megabytes = int(sys.argv[2])
+    os.makedirs(scratch, exist_ok=True)
+    path = os.path.join(scratch, "mbox")
+    outputPath = os.path.join(scratch, "output")
+    targetDir = os.path.join(scratch, "target")
+    os.makedirs(targetDir, exist_ok=True)
+
+    count = megabytes * 100  # messages average roughly 10 KB
+    writemessages(path, 0, count, "w")
+    size = os.stat(path).st_size
+    since = datetime.datetime(2006, 1, 1) + datetime.timedelta(minutes=count // 2)
+    print("Mailbox is %d bytes with %d messages" % (size, count))
+
+    timed("engine: full scan", size, lambda: extract(path, outputPath))
+    timed("engine: full scan since midpoint", size, lambda: extract(path, outputPath, since=since.timestamp()))
+
+    index = {}
+    _backupMboxFile(None, path, False, "incr", "none", since, since, targetDir=targetDir, index=index)
+    writemessages(path, count, max(1, count // 100), "a")
+    tail = os.stat(path).st_size - index[path]["size"]
+    timed("engine: indexed tail extraction", tail,
+          lambda: _backupMboxFile(None, path, False, "incr", "none", since, since, targetDir=targetDir, index=index))
+
+    grepmail = shutil.which("grepmail")
+    if grepmail:
+        size = os.stat(path).st_size
+        revision = since.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(outputPath, "wb") as output:
+            timed("grepmail: -a -u", size, lambda: subprocess.run([grepmail, "-a", "-u", path], stdout=output, check=False))
+            timed("grepmail: -a -u -d since midpoint", size,
+                  lambda: subprocess.run([grepmail, "-a", "-u", "-d", "since %s" % revision, path], stdout=output, check=False))
+
+
+########################################################################
+# Module entry point
+########################################################################
+
+# Run the main routine if the module is executed rather than sourced
+if __name__ == "__main__":
+    main()
@@ -57,6 +57,7 @@
 import CedarBackup3.knapsack
 import CedarBackup3.peer
 import CedarBackup3.release
+import CedarBackup3.s3
 import CedarBackup3.tools
 import CedarBackup3.util
 import CedarBackup3.writers
@@ -70,6 +71,7 @@
     "knapsack",
     "peer",
     "release",
+    "s3",
     "tools",
     "util",
     "writers",
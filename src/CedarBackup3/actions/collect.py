@@ -47,11 +47,23 @@
 import logging
 import os
 import pickle  # noqa: S403 # we operate on trusted data, so pickle is ok
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from CedarBackup3.actions.constants import COLLECT_INDICATOR, DIGEST_EXTENSION
 from CedarBackup3.actions.util import writeIndicatorFile
-from CedarBackup3.filesystem import BackupFileList, FilesystemList
-from CedarBackup3.util import buildNormalizedPath, changeOwnership, displayBytes, isStartOfWeek, pathJoin
+from CedarBackup3.filesystem import (
+    DEFAULT_DIGEST_ALGORITHM,
+    XXHASH_AVAILABLE,
+    BackupFileList,
+    TraversalCache,
+    normalizeDir,
+    tagDigestMap,
+    untagDigestMap,
+)
+from CedarBackup3.journal import INOTIFY_AVAILABLE, JOURNAL_FILE, mergeDigest, readChanges, saveJournalState
+from CedarBackup3.metrics import increment, timer
+from CedarBackup3.util import buildNormalizedPath, changeOwnership, displayBytes, encodePath, isStartOfWeek, pathJoin
 
 ########################################################################
 # Module-wide constants and variables
@@ -59,6 +71,9 @@
 
 logger = logging.getLogger("CedarBackup3.log.actions.collect")
 
+MAX_WORKERS = min(4, os.cpu_count() or 1)  # number of partitions of a collect directory archived in parallel
+TRAVERSAL_CACHE_FILE = "traversal.cache"  # name of the traversal cache in the working directory
+
 
 ########################################################################
 # Public functions
@@ -98,6 +113,10 @@ def executeCollect(configPath, options, config):  # noqa: ARG001
     todayIsStart = isStartOfWeek(config.options.startingDay)
     resetDigest = fullBackup or todayIsStart
     logger.debug("Reset digest flag is [%s]", resetDigest)
+    digestAlgorithm = _getDigestAlgorithm(config)
+    traversalCache = _getTraversalCache(config)
+    journal = _getJournalChanges(config)
+    fingerprints = {}
     if config.collect.collectFiles is not None:
         for collectFile in config.collect.collectFiles:
             logger.debug("Working with collect file [%s]", collectFile.absolutePath)
@@ -120,7 +139,16 @@ def executeCollect(configPath, options, config):  # noqa: ARG001
             linkDepth = _getLinkDepth(collectDir)
             dereference = _getDereference(collectDir)
             recursionLevel = _getRecursionLevel(collectDir)
+            maxArchiveSize = _getMaxArchiveSize(collectDir)
             (excludePaths, excludePatterns) = _getExclusions(config, collectDir)
+            changedPaths = None
+            fingerprint = _getJournalFingerprint(
+                collectMode, ignoreFile, linkDepth, recursionLevel, excludePaths, excludePatterns, digestAlgorithm
+            )
+            if journal is not None and fingerprint is not None:
+                fingerprints[collectDir.absolutePath] = fingerprint
+                if not resetDigest:
+                    changedPaths = journal.getChanges(collectDir.absolutePath, fingerprint)
             if fullBackup or (collectMode in ["daily", "incr"]) or (collectMode == "weekly" and todayIsStart):
                 logger.debug("Directory meets criteria to be backed up today.")
                 _collectDirectory(
@@ -135,10 +163,18 @@ def executeCollect(configPath, options, config):  # noqa: ARG001
                     excludePaths,
                     excludePatterns,
                     recursionLevel,
+                    traversalCache,
+                    changedPaths,
+                    maxArchiveSize,
                 )
             else:
                 logger.debug("Directory will not be backed up, per collect mode.")
             logger.info("Completed collecting directory [%s]", collectDir.absolutePath)
+    if traversalCache is not None:
+        traversalCache.save()
+        changeOwnership(traversalCache.path, config.options.backupUser, config.options.backupGroup)
+    if journal is not None:
+        saveJournalState(config.options.workingDir, journal, fingerprints)
     writeIndicatorFile(config.collect.targetDir, COLLECT_INDICATOR, config.options.backupUser, config.options.backupGroup)
     logger.info("Executed the 'collect' action successfully.")
 
@@ -196,6 +232,9 @@ def _collectDirectory(
     excludePaths,
     excludePatterns,
     recursionLevel,
+    traversalCache=None,
+    changedPaths=None,
+    maxArchiveSize=None,
 ):
     """
     Collects a configured collect directory.
@@ -209,6 +248,16 @@ def _collectDirectory(
     The caller must decide what the collect and archive modes are, since they
     can be on both the collect configuration and the collect directory itself.
 
+    If the recursion level is greater than zero, the directory is walked once
+    and split into partitions, one per subdirectory at that depth, plus one
+    for the leftover entries in each directory above it.  Each partition is
+    collected into its own tarfile and digest, several at a time.
+
+    If changed paths from the change journal are passed in, only those paths
+    are checked, rather than the whole directory.  The directory is still
+    scanned completely if its digest is missing, or if the directory itself or
+    its own ignore file changed.
+
     Args:
        config: Config object
        absolutePath: Absolute path of directory to collect
@@ -221,60 +270,83 @@ def _collectDirectory(
        excludePaths: List of absolute paths to exclude
        excludePatterns: List of patterns to exclude
        recursionLevel: Recursion level (zero for no recursion)
+       traversalCache: Traversal cache to list directories through, or ``None``
+       changedPaths: Set of changed paths from the change journal, or ``None`` to scan the whole directory
+       maxArchiveSize: Maximum size of each tar volume in bytes, or ``None`` for a single tarfile
     """
-    if recursionLevel == 0:
-        # Collect the actual directory because we're at recursion level 0
-        logger.info("Collecting directory [%s]", absolutePath)
-        tarfilePath = _getTarfilePath(config, absolutePath, archiveMode)
-        digestPath = _getDigestPath(config, absolutePath)
+    if changedPaths is not None:
+        changedPaths = _getChangedPaths(config, absolutePath, ignoreFile, changedPaths)
+    backupList = BackupFileList()
+    backupList.ignoreFile = ignoreFile
+    backupList.excludePaths = excludePaths
+    backupList.excludePatterns = excludePatterns
+    backupList.traversalCache = traversalCache
+    if changedPaths is not None:
+        logger.debug("Checking %d changed paths in [%s] from the change journal.", len(changedPaths), absolutePath)
+        with timer("collect.traverse"):
+            backupList.addChangedPaths(absolutePath, changedPaths)
+        increment("collect.journal.paths", len(changedPaths))
+        _collectPartition(config, absolutePath, backupList, collectMode, archiveMode, resetDigest, changedPaths, maxArchiveSize)
+        return
+    with timer("collect.traverse"):
+        partitions = backupList.partitionDirContents(absolutePath, recursionLevel, linkDepth=linkDepth, dereference=dereference)
+    if len(partitions) == 1:
+        partition = next(iter(partitions.values()))
+        _collectPartition(config, absolutePath, partition, collectMode, archiveMode, resetDigest, maxArchiveSize=maxArchiveSize)
+    else:
+        logger.debug("Collecting %d partitions of [%s] at recursion level %d.", len(partitions), absolutePath, recursionLevel)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(
+                    _collectPartition, config, path, partition, collectMode, archiveMode, resetDigest, maxArchiveSize=maxArchiveSize
+                )
+                for (path, partition) in partitions.items()
+            ]
+            for future in futures:
+                future.result()  # raises the first failure, after all work is complete
 
-        backupList = BackupFileList()
-        backupList.ignoreFile = ignoreFile
-        backupList.excludePaths = excludePaths
-        backupList.excludePatterns = excludePatterns
-        backupList.addDirContents(absolutePath, linkDepth=linkDepth, dereference=dereference)
 
-        _executeBackup(config, backupList, absolutePath, tarfilePath, collectMode, archiveMode, resetDigest, digestPath)
-    else:
-        # Find all of the immediate subdirectories
-        subdirs = FilesystemList()
-        subdirs.excludeFiles = True
-        subdirs.excludeLinks = True
-        subdirs.excludePaths = excludePaths
-        subdirs.excludePatterns = excludePatterns
-        subdirs.addDirContents(path=absolutePath, recursive=False, addSelf=False)
-
-        # Back up the subdirectories separately
-        for subdir in subdirs:
-            _collectDirectory(
-                config,
-                subdir,
-                collectMode,
-                archiveMode,
-                ignoreFile,
-                linkDepth,
-                dereference,
-                resetDigest,
-                excludePaths,
-                excludePatterns,
-                recursionLevel - 1,
-            )
-            excludePaths.append(subdir)  # this directory is already backed up, so exclude it
-
-        # Back up everything that hasn't previously been backed up
-        _collectDirectory(
-            config,
-            absolutePath,
-            collectMode,
-            archiveMode,
-            ignoreFile,
-            linkDepth,
-            dereference,
-            resetDigest,
-            excludePaths,
-            excludePatterns,
-            0,
-        )
+###############################
+# _collectPartition() function
+###############################
+
+
+def _collectPartition(
+    config, absolutePath, backupList, collectMode, archiveMode, resetDigest, changedPaths=None, maxArchiveSize=None
+):
+    """
+    Collects one partition of a configured collect directory into its own tarfile.
+
+    With a recursion level of zero, the whole collect directory is a single
+    partition.  Otherwise, each partition is a subdirectory that gets its own
+    tarfile and digest, named for the subdirectory just as if it had been
+    configured as a collect directory itself.
+
+    Args:
+       config: Config object
+       absolutePath: Absolute path of the partition's directory
+       backupList: List of files in the partition
+       collectMode: Collect mode to use
+       archiveMode: Archive mode to use
+       resetDigest: Reset digest flag
+       changedPaths: Set of changed paths that the list was built from, or ``None``
+       maxArchiveSize: Maximum size of each tar volume in bytes, or ``None`` for a single tarfile
+    """
+    logger.info("Collecting directory [%s]", absolutePath)
+    tarfilePath = _getTarfilePath(config, absolutePath, archiveMode)
+    digestPath = _getDigestPath(config, absolutePath)
+    _executeBackup(
+        config,
+        backupList,
+        absolutePath,
+        tarfilePath,
+        collectMode,
+        archiveMode,
+        resetDigest,
+        digestPath,
+        changedPaths,
+        maxArchiveSize,
+    )
 
 
 ############################
@@ -282,7 +354,18 @@ def _collectDirectory(
 ############################
 
 
-def _executeBackup(config, backupList, absolutePath, tarfilePath, collectMode, archiveMode, resetDigest, digestPath):
+def _executeBackup(
+    config,
+    backupList,
+    absolutePath,
+    tarfilePath,
+    collectMode,
+    archiveMode,
+    resetDigest,
+    digestPath,
+    changedPaths=None,
+    maxArchiveSize=None,
+):
     """
     Execute the backup process for the indicated backup list.
 
@@ -296,6 +379,14 @@ def _executeBackup(config, backupList, absolutePath, tarfilePath, collectMode, a
     that is being backed up.  This might little wasteful in terms of the number
     of files that we keep around, but it's consistent and easy to understand.
 
+    If the backup list was built from changed paths in the change journal,
+    it only covers part of the directory, so the new digest is the old digest
+    with the changed paths replaced, rather than the digest of the list.
+
+    The digest is generated with the configured digest algorithm.  If the
+    digest on disk was generated with a different algorithm, it is discarded,
+    just as if the digest had been reset.
+
     Args:
        config: Config object
        backupList: List to execute backup for
@@ -305,6 +396,8 @@ def _executeBackup(config, backupList, absolutePath, tarfilePath, collectMode, a
        archiveMode: Archive mode to use
        resetDigest: Reset digest flag
        digestPath: Path to digest file on disk, if needed
+       changedPaths: Set of changed paths that the list was built from, or ``None``
+       maxArchiveSize: Maximum size of each tar volume in bytes, or ``None`` for a single tarfile
     """
     if collectMode != "incr":
         logger.debug("Collect mode is [%s]; no digest will be used.", collectMode)
@@ -313,25 +406,154 @@ def _executeBackup(config, backupList, absolutePath, tarfilePath, collectMode, a
         else:
             logger.info("Backing up %d files in [%s] (%s).", len(backupList), absolutePath, displayBytes(backupList.totalSize()))
         if len(backupList) > 0:
-            backupList.generateTarfile(tarfilePath, archiveMode, True)
-            changeOwnership(tarfilePath, config.options.backupUser, config.options.backupGroup)
+            _generateTarfile(config, backupList, absolutePath, tarfilePath, archiveMode, maxArchiveSize)
     else:
+        algorithm = _getDigestAlgorithm(config)
         if resetDigest:
             logger.debug("Based on resetDigest flag, digest will be cleared.")
             oldDigest = {}
         else:
             logger.debug("Based on resetDigest flag, digest will loaded from disk.")
-            oldDigest = _loadDigest(digestPath)
-        (removed, newDigest) = backupList.removeUnchanged(oldDigest, captureDigest=True)
+            oldDigest = _loadDigest(digestPath, algorithm)
+        with timer("collect.digest"):
+            (removed, newDigest) = backupList.removeUnchanged(oldDigest, captureDigest=True, algorithm=algorithm)
+            if changedPaths is not None:
+                newDigest = mergeDigest(oldDigest, newDigest, changedPaths)
+        increment("collect.unchanged", removed)
         logger.debug("Removed %d unchanged files based on digest values.", removed)
         if len(backupList) == 1 and backupList[0] == absolutePath:  # special case for individual file
             logger.info("Backing up file [%s] (%s).", absolutePath, displayBytes(backupList.totalSize()))
         else:
             logger.info("Backing up %d files in [%s] (%s).", len(backupList), absolutePath, displayBytes(backupList.totalSize()))
         if len(backupList) > 0:
+            _generateTarfile(config, backupList, absolutePath, tarfilePath, archiveMode, maxArchiveSize)
+        _writeDigest(config, newDigest, digestPath, algorithm)
+
+
+##############################
+# _generateTarfile() function
+##############################
+
+
+def _generateTarfile(config, backupList, absolutePath, tarfilePath, archiveMode, maxArchiveSize=None):
+    """
+    Generates the tarfile for a backup list, recording metrics about it.
+
+    In ``adaptive`` mode, files that are already compressed are written to a
+    separate uncompressed tarfile; see :any:`_generateAdaptiveTarfiles`.
+
+    If there is a maximum archive size, each tarfile is written as a sequence
+    of volumes no larger than that, plus a manifest; see
+    :any:`BackupFileList.generateTarVolumes`.
+
+    Args:
+       config: Config object
+       backupList: List to generate the tarfile for
+       absolutePath: Absolute path of directory or file to collect
+       tarfilePath: Path to tarfile that should be created
+       archiveMode: Archive mode to use
+       maxArchiveSize: Maximum size of each tar volume in bytes, or ``None`` for a single tarfile
+    """
+    increment("collect.files", len(backupList))
+    increment("collect.bytes", backupList.totalSize())
+    if archiveMode == "adaptive":
+        _generateAdaptiveTarfiles(config, backupList, absolutePath, tarfilePath, maxArchiveSize)
+    else:
+        _writeTarfile(config, backupList, tarfilePath, archiveMode, maxArchiveSize)
+
+
+#######################################
+# _generateAdaptiveTarfiles() function
+#######################################
+
+
+def _generateAdaptiveTarfiles(config, backupList, absolutePath, tarfilePath, maxArchiveSize=None):
+    """
+    Generates the tarfiles for a backup list in ``adaptive`` archive mode.
+
+    The list is split with :any:`BackupFileList.splitCompressible`.  Files
+    worth compressing go into a gzipped tarfile at ``tarfilePath``, just like
+    in ``targz`` mode, and files that are already compressed go into an
+    uncompressed tarfile with the same name, ending in ``.tar``.  Either
+    tarfile is left out if it would be empty.
+
+    The CPU time saved is estimated from the CPU time this thread spent on the
+    gzipped tarfile, scaled up to the size of the files that were not
+    compressed.  Since gzip is slower on data that doesn't compress, this
+    tends to underestimate.  It is logged for the collect directory along with
+    the size of both tarfiles, and added to the ``collect.adaptive.cpuSaved``
+    counter.
+
+    Args:
+       config: Config object
+       backupList: List to generate the tarfiles for
+       absolutePath: Absolute path of directory or file to collect
+       tarfilePath: Path to the gzipped tarfile
+       maxArchiveSize: Maximum size of each tar volume in bytes, or ``None`` for a single tarfile
+    """
+    with timer("collect.classify"):
+        (compressible, incompressible) = backupList.splitCompressible()
+    compressibleBytes = compressible.totalSize()
+    incompressibleBytes = incompressible.totalSize()
+    archiveBytes = 0
+    cpu = 0.0
+    if len(compressible) > 0:
+        start = time.thread_time()
+        archiveBytes += _writeTarfile(config, compressible, tarfilePath, "targz", maxArchiveSize)
+        cpu = time.thread_time() - start
+    if len(incompressible) > 0:
+        storedPath = _getTarfilePath(config, absolutePath, "tar")
+        archiveBytes += _writeTarfile(config, incompressible, storedPath, "tar", maxArchiveSize)
+    increment("collect.adaptive.storedFiles", len(incompressible))
+    increment("collect.adaptive.storedBytes", incompressibleBytes)
+    totalBytes = compressibleBytes + incompressibleBytes
+    logger.info(
+        "Stored %d already-compressed files (%s) without compression for [%s]; archives are %.1f%% of %s.",
+        len(incompressible),
+        displayBytes(incompressibleBytes),
+        absolutePath,
+        100.0 * archiveBytes / totalBytes if totalBytes > 0 else 100.0,
+        displayBytes(totalBytes),
+    )
+    if compressibleBytes > 0 and incompressibleBytes > 0:
+        saved = cpu * incompressibleBytes / compressibleBytes
+        increment("collect.adaptive.cpuSaved", saved)
+        logger.info("Saved an estimated %.2f seconds of CPU time for [%s].", saved, absolutePath)
+
+
+###########################
+# _writeTarfile() function
+###########################
+
+
+def _writeTarfile(config, backupList, tarfilePath, archiveMode, maxArchiveSize=None):
+    """
+    Writes one tarfile for a backup list and gives it to the backup user.
+
+    If there is a maximum archive size, the tarfile is written as a sequence of
+    volumes plus a manifest, which all go to the backup user.
+
+    Args:
+       config: Config object
+       backupList: List to write the tarfile for
+       tarfilePath: Path to tarfile that should be created
+       archiveMode: Archive mode to use, one of ``tar``, ``targz`` or ``tarbz2``
+       maxArchiveSize: Maximum size of each tar volume in bytes, or ``None`` for a single tarfile
+    Returns:
+        Size of the tarfile or volumes, in bytes
+    """
+    with timer("collect.archive"):
+        if maxArchiveSize is None:
             backupList.generateTarfile(tarfilePath, archiveMode, True)
-            changeOwnership(tarfilePath, config.options.backupUser, config.options.backupGroup)
-        _writeDigest(config, newDigest, digestPath)
+            paths = [tarfilePath]
+        else:
+            paths = backupList.generateTarVolumes(tarfilePath, maxArchiveSize, archiveMode, True)
+            logger.debug("Wrote %d volumes for [%s].", len(paths) - 1, tarfilePath)
+    size = sum(os.path.getsize(path) for path in paths)
+    increment("collect.archiveBytes", size)
+    for path in paths:
+        changeOwnership(path, config.options.backupUser, config.options.backupGroup)
+    return size
 
 
 #########################
@@ -339,7 +561,7 @@ def _executeBackup(config, backupList, absolutePath, tarfilePath, collectMode, a
 #########################
 
 
-def _loadDigest(digestPath):
+def _loadDigest(digestPath, algorithm=DEFAULT_DIGEST_ALGORITHM):
     """
     Loads the indicated digest path from disk into a dictionary.
 
@@ -347,8 +569,14 @@ def _loadDigest(digestPath):
     for some other reason), then an empty dictionary will be returned - but the
     condition will be logged.
 
+    The digest file is tagged with the algorithm that generated it, as by
+    :any:`filesystem.tagDigestMap`.  If that isn't the algorithm we expect, none
+    of its digests could match, so an empty dictionary is returned in that case
+    as well.  Digest files written before the tag existed are SHA-1.
+
     Args:
        digestPath: Path to the digest file on disk
+       algorithm: Digest algorithm that the digest must have been generated with
 
     Returns:
         Dictionary representing contents of digest path
@@ -359,11 +587,16 @@ def _loadDigest(digestPath):
     else:
         try:
             with open(digestPath, "rb") as f:
-                digest = pickle.load(f, fix_imports=True)  # noqa: S301 # this is trusted data, so pickle is ok
+                (stored, digest) = untagDigestMap(pickle.load(f, fix_imports=True))  # noqa: S301 # trusted data
             logger.debug("Loaded digest [%s] from disk: %d entries.", digestPath, len(digest))
         except Exception as e:
-            digest = {}
+            (stored, digest) = (algorithm, {})
             logger.error("Failed loading digest [%s] from disk: %s", digestPath, e)
+        if stored != algorithm:
+            logger.info(
+                "Digest [%s] was generated with [%s] rather than [%s]; starting a new digest.", digestPath, stored, algorithm
+            )
+            digest = {}
     return digest
 
 
@@ -372,31 +605,174 @@ def _loadDigest(digestPath):
 ##########################
 
 
-def _writeDigest(config, digest, digestPath):
+def _writeDigest(config, digest, digestPath, algorithm=DEFAULT_DIGEST_ALGORITHM):
     """
     Writes the digest dictionary to the indicated digest path on disk.
 
     If we can't write the digest successfully for any reason, we'll log the
     condition but won't throw an exception.
 
+    The digest is tagged with the algorithm that generated it, as by
+    :any:`filesystem.tagDigestMap`.
+
     Args:
        config: Config object
        digest: Digest dictionary to write to disk
        digestPath: Path to the digest file on disk
+       algorithm: Digest algorithm the digest was generated with
     """
     try:
         with open(digestPath, "wb") as f:
-            pickle.dump(digest, f, 0, fix_imports=True)  # be compatible with Python 2
+            pickle.dump(tagDigestMap(digest, algorithm), f, 0, fix_imports=True)  # be compatible with Python 2
         changeOwnership(digestPath, config.options.backupUser, config.options.backupGroup)
         logger.debug("Wrote new digest [%s] to disk: %d entries.", digestPath, len(digest))
     except Exception as e:
         logger.error("Failed to write digest [%s] to disk: %s", digestPath, e)
 
 
+###############################
+# _getChangedPaths() function
+###############################
+
+
+def _getChangedPaths(config, absolutePath, ignoreFile, changedPaths):
+    """
+    Adjusts the changed paths from the change journal for a collect directory.
+
+    If an ignore file was created or removed, the contents of its whole
+    directory are affected, so the directory is treated as changed.  If that
+    makes the collect directory itself changed, or if there is no digest to
+    merge the changes into, the collect directory must be scanned completely.
+
+    Args:
+       config: Config object
+       absolutePath: Absolute path of the collect directory
+       ignoreFile: Ignore file to use
+       changedPaths: Set of changed paths within the collect directory
+    Returns:
+        Adjusted set of changed paths, or ``None`` if the directory must be scanned
+    """
+    if ignoreFile is not None:
+        changedPaths = changedPaths.union(os.path.dirname(path) for path in changedPaths if os.path.basename(path) == ignoreFile)
+    if normalizeDir(encodePath(absolutePath)) in changedPaths:
+        logger.info("Not using the change journal for [%s], because its ignore file changed.", absolutePath)
+        return None
+    if not os.path.isfile(_getDigestPath(config, absolutePath)):
+        logger.info("Not using the change journal for [%s], because it has no digest.", absolutePath)
+        return None
+    return changedPaths
+
+
 ########################################################################
 # Private attribute "getter" functions
 ########################################################################
 
+###############################
+# _getTraversalCache() function
+###############################
+
+
+def _getTraversalCache(config):
+    """
+    Gets the traversal cache to use for collect directories, if any.
+
+    The cache is only used if it is enabled in the collect configuration.  It
+    lives in the working directory, alongside the digest files.
+
+    Args:
+       config: Config object
+    Returns:
+        ``TraversalCache`` loaded from disk, or ``None`` if the cache is not enabled
+    """
+    if not config.collect.traversalCache:
+        return None
+    path = pathJoin(config.options.workingDir, TRAVERSAL_CACHE_FILE)
+    logger.debug("Using traversal cache [%s].", path)
+    return TraversalCache(path)
+
+
+#################################
+# _getJournalChanges() function
+#################################
+
+
+def _getJournalChanges(config):
+    """
+    Gets the changes recorded in the change journal since the last collect, if any.
+
+    The journal is only read if it exists in the working directory, which
+    means that the ``cback3-journal`` watcher has been run.  This waits for
+    the watcher to catch up with every change made so far.
+
+    Args:
+       config: Config object
+    Returns:
+        ``JournalChanges``, or ``None`` if the journal is not available
+    """
+    if not INOTIFY_AVAILABLE or not config.collect.collectDirs:
+        return None
+    if not os.path.exists(pathJoin(config.options.workingDir, JOURNAL_FILE)):
+        return None
+    with timer("collect.journal"):
+        journal = readChanges(config.options.workingDir)
+    if journal is None:
+        logger.info("The change journal is not available; collect directories will be scanned.")
+    return journal
+
+
+#####################################
+# _getJournalFingerprint() function
+#####################################
+
+
+def _getJournalFingerprint(collectMode, ignoreFile, linkDepth, recursionLevel, excludePaths, excludePatterns, digestAlgorithm):
+    """
+    Gets the fingerprint of the settings that affect a collect directory's digest.
+
+    The change journal can only be used for a collect directory in ``incr``
+    mode that does not follow soft links and is not split into partitions.
+    If the fingerprint differs from the one saved by the last collect, the
+    directory's digest was built with different settings, so the directory
+    must be scanned instead of using the journal.
+
+    Args:
+       collectMode: Collect mode to use
+       ignoreFile: Ignore file to use
+       linkDepth: Link depth value to use
+       recursionLevel: Recursion level (zero for no recursion)
+       excludePaths: List of absolute paths to exclude
+       excludePatterns: List of patterns to exclude
+       digestAlgorithm: Digest algorithm to use
+    Returns:
+        Fingerprint string, or ``None`` if the collect directory can't use the journal
+    """
+    if collectMode != "incr" or linkDepth != 0 or recursionLevel != 0:
+        return None
+    return repr((ignoreFile, sorted(excludePaths), sorted(excludePatterns), digestAlgorithm))
+
+
+#################################
+# _getDigestAlgorithm() function
+#################################
+
+
+def _getDigestAlgorithm(config):
+    """
+    Gets the digest algorithm that should be used for collect directories and files in ``incr`` mode.
+    Args:
+       config: Config object
+    Returns:
+        Digest algorithm to use
+    Raises:
+       ValueError: If the configured algorithm is not available
+    """
+    algorithm = config.collect.digestAlgorithm or DEFAULT_DIGEST_ALGORITHM
+    if algorithm == "xxh3_128" and not XXHASH_AVAILABLE:
+        raise ValueError("Digest algorithm [xxh3_128] requires the xxhash package, which is not installed.")
+    logger.debug("Digest algorithm is [%s]", algorithm)
+    return algorithm
+
+
 ############################
 # getCollectMode() function
 ############################
@@ -532,6 +908,27 @@ def _getRecursionLevel(item):
     return recursionLevel
 
 
+################################
+# _getMaxArchiveSize() function
+################################
+
+
+def _getMaxArchiveSize(item):
+    """
+    Gets the maximum archive size that should be used for a collect directory.
+    If the directory doesn't have one, ``None`` is returned and no volumes are written.
+    Args:
+       item: ``CollectDir`` object
+    Returns:
+        Maximum size of each tar volume in bytes, or ``None``
+    """
+    if item.maxArchiveSize is None:
+        return None
+    maxArchiveSize = int(item.maxArchiveSize.bytes)
+    logger.debug("Maximum archive size is [%d] bytes", maxArchiveSize)
+    return maxArchiveSize
+
+
 ############################
 # _getDigestPath() function
 ############################
@@ -561,6 +958,7 @@ def _getDigestPath(config, absolutePath):
 def _getTarfilePath(config, absolutePath, archiveMode):
     """
     Gets the tarfile path (including correct extension) associated with a collect directory.
+    In ``adaptive`` mode, this is the path of the gzipped tarfile.
     Args:
        config: Config object
        absolutePath: Absolute path to generate tarfile for
@@ -570,7 +968,7 @@ def _getTarfilePath(config, absolutePath, archiveMode):
     """
     if archiveMode == "tar":
         extension = "tar"
-    elif archiveMode == "targz":
+    elif archiveMode in ("targz", "adaptive"):
         extension = "tar.gz"
     elif archiveMode == "tarbz2":
         extension = "tar.bz2"
@@ -34,3 +34,4 @@
 COLLECT_INDICATOR = "cback.collect"
 STAGE_INDICATOR = "cback.stage"
 STORE_INDICATOR = "cback.store"
+MANIFEST_FILE = "cback.manifest"
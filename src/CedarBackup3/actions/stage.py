@@ -50,6 +50,7 @@
 
 from CedarBackup3.actions.constants import DIR_TIME_FORMAT, STAGE_INDICATOR
 from CedarBackup3.actions.util import writeIndicatorFile
+from CedarBackup3.metrics import increment, timer
 from CedarBackup3.peer import LocalPeer, RemotePeer
 from CedarBackup3.util import changeOwnership, getUidGid, isRunningAsRoot, isStartOfWeek, pathJoin
 
@@ -121,7 +122,9 @@ def executeStage(configPath, options, config):  # noqa: ARG001
             ownership = None
             logger.debug("Using target dir [%s], ownership [None].", targetDir)
         try:
-            count = peer.stagePeer(targetDir=targetDir, ownership=ownership)  # note: utilize effective user's default umask
+            with timer("stage.peer.%s" % peer.name):
+                count = peer.stagePeer(targetDir=targetDir, ownership=ownership)  # note: utilize effective user's default umask
+            increment("stage.files", count)
             logger.info("Staged %d files for peer [%s].", count, peer.name)
             peer.writeStageIndicator()
         except (ValueError, OSError) as e:
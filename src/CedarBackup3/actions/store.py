@@ -51,10 +51,12 @@
 import sys
 import tempfile
 
-from CedarBackup3.actions.constants import DIR_TIME_FORMAT, STAGE_INDICATOR, STORE_INDICATOR
+from CedarBackup3.actions.constants import DIR_TIME_FORMAT, MANIFEST_FILE, STAGE_INDICATOR, STORE_INDICATOR
 from CedarBackup3.actions.util import buildMediaLabel, checkMediaState, createWriter, writeIndicatorFile
-from CedarBackup3.filesystem import compareContents
-from CedarBackup3.util import displayBytes, isStartOfWeek, mount, pathJoin, unmount
+from CedarBackup3.filesystem import DIGEST_THREADS, BackupFileList, normalizeDir, verifyContents
+from CedarBackup3.metrics import timer
+from CedarBackup3.util import changeOwnership, displayBytes, isStartOfWeek, mount, pathJoin, unmount
+from CedarBackup3.writers.iso9660 import openMedia
 
 ########################################################################
 # Module-wide constants and variables
@@ -111,7 +113,8 @@ def executeStore(configPath, options, config):  # noqa: ARG001
             logger.warning("See the Cedar Backup software manual for further information.")
         else:
             logger.debug("Running consistency check of media.")
-            consistencyCheck(config, stagingDirs)
+            with timer("store.verify"):
+                consistencyCheck(config, stagingDirs)
     writeStoreIndicator(config, stagingDirs)
     logger.info("Executed the 'store' action successfully.")
 
@@ -185,6 +188,10 @@ def writeImageBlankSafe(config, rebuildMedia, todayIsStart, blankBehavior, stagi
     The blanking factor will vary from setup to setup, and will probably
     require some experimentation to get it right.
 
+    If the store configuration asks for the data to be checked, a digest
+    manifest is written into each staging directory before the image is
+    built.  See :any:`writeManifest` for more information.
+
     Args:
        config: Config object
        rebuildMedia: Indicates whether media should be rebuilt
@@ -196,6 +203,9 @@ def writeImageBlankSafe(config, rebuildMedia, todayIsStart, blankBehavior, stagi
        ValueError: Under many generic error conditions
        IOError: If there is a problem writing the image to disc
     """
+    if config.store.checkData:
+        with timer("store.manifest"):
+            writeManifest(config, stagingDirs)
     mediaLabel = buildMediaLabel()
     writer = createWriter(config)
     writer.initializeImage(True, config.options.workingDir, mediaLabel)  # default value for newDisc
@@ -274,6 +284,58 @@ def writeStoreIndicator(config, stagingDirs):
         writeIndicatorFile(stagingDir, STORE_INDICATOR, config.options.backupUser, config.options.backupGroup)
 
 
+###########################
+# writeManifest() function
+###########################
+
+
+def writeManifest(config, stagingDirs):
+    """
+    Writes a digest manifest into staging directories.
+
+    The manifest (``cback.manifest``) records the size, modification time and
+    digest of every file in the staging directory.  It's written just before
+    the image is built, so the files are hashed while they are still in the
+    page cache for ``mkisofs``, and the consistency check then only needs to
+    read the media.
+
+    If a staging directory already has a manifest (because it was written to
+    disc before, by an earlier store or rebuild), digests are reused for any
+    file whose size and modification time are unchanged.  So, each staging
+    directory is normally hashed only once, no matter how many times it is
+    written to disc.
+
+    Args:
+       config: Config object
+       stagingDirs: Dictionary mapping directory path to date suffix
+    Raises:
+       IOError: If a staging directory can't be read or the manifest can't be written
+    """
+    for stagingDir in list(stagingDirs.keys()):
+        manifestPath = pathJoin(stagingDir, MANIFEST_FILE)
+        previous = _readManifest(manifestPath)
+        prefix = normalizeDir(stagingDir)
+        fileList = BackupFileList()
+        fileList.addDirContents(stagingDir)
+        manifest = {}
+        stale = BackupFileList()
+        for path in fileList:
+            if path == manifestPath or os.path.islink(path) or not os.path.isfile(path):
+                continue
+            key = path.replace(prefix, "", 1)
+            info = os.stat(path)
+            entry = previous.get(key)
+            if entry is not None and entry[0] == info.st_size and entry[1] == info.st_mtime_ns:
+                manifest[key] = entry
+            else:
+                manifest[key] = (info.st_size, info.st_mtime_ns, None)
+                stale.append(path)
+        for key, digest in stale.generateDigestMap(stripPrefix=prefix, threads=DIGEST_THREADS).items():
+            manifest[key] = (manifest[key][0], manifest[key][1], digest)
+        logger.debug("Reused %d of %d digests for [%s].", len(manifest) - len(stale), len(manifest), stagingDir)
+        _writeManifest(config, manifestPath, manifest)
+
+
 ##############################
 # consistencyCheck() function
 ##############################
@@ -288,9 +350,18 @@ def consistencyCheck(config, stagingDirs):
     while writing the disc.  This consistency check makes sure that the data
     read from disc matches the data that was used to create the disc.
 
-    The function mounts the device at a temporary mount point in the working
-    directory, and then compares the indicated staging directories in the
-    staging directory and on the media.  The comparison is done via
+    The function verifies each staging directory on the media against the
+    digest manifest written by :any:`writeManifest`.  The manifest is
+    refreshed first, which is cheap if it was written when the image was
+    built, so only the media has to be read in full.  Files on the media are
+    compared by size first and then hashed, and every file that doesn't match
+    is logged.
+
+    The media is read directly from the device using :any:`writers.iso9660.openMedia`,
+    without mounting it, so file data is read in one sequential sweep.  If
+    the device can't be read that way (for instance, if the image doesn't use
+    Rock Ridge extensions), the device is mounted at a temporary mount point
+    in the working directory instead, and the verification is done via
     functionality in ``filesystem.py``.
 
     If no exceptions are thrown, there were no problems with the consistency
@@ -308,13 +379,25 @@ def consistencyCheck(config, stagingDirs):
        IOError: If there is a problem working with the media
     """
     logger.debug("Running consistency check.")
+    writeManifest(config, stagingDirs)
+    reader = openMedia(config.store.devicePath)
+    if reader is not None:
+        with reader:
+            for stagingDir in list(stagingDirs.keys()):
+                discDir = "/%s" % stagingDirs[stagingDir]
+                (digest, sizes) = _readExpected(stagingDir)
+                logger.debug("Checking [%s] on media vs. manifest for [%s].", discDir, stagingDir)
+                reader.verifyContents(discDir, digest, ignore=["/%s" % MANIFEST_FILE], sizes=sizes)
+                logger.info("Consistency check completed for [%s].  No problems found.", stagingDir)
+        return
     mountPoint = tempfile.mkdtemp(dir=config.options.workingDir)
     try:
         mount(config.store.devicePath, mountPoint, "iso9660")
         for stagingDir in list(stagingDirs.keys()):
             discDir = pathJoin(mountPoint, stagingDirs[stagingDir])
-            logger.debug("Checking [%s] vs. [%s].", stagingDir, discDir)
-            compareContents(stagingDir, discDir, verbose=True)
+            (digest, sizes) = _readExpected(stagingDir)
+            logger.debug("Checking [%s] vs. manifest for [%s].", discDir, stagingDir)
+            verifyContents(discDir, digest, ignore=["/%s" % MANIFEST_FILE], threads=DIGEST_THREADS, sizes=sizes)
             logger.info("Consistency check completed for [%s].  No problems found.", stagingDir)
     finally:
         unmount(mountPoint, True, 5, 1)  # try 5 times, and remove mount point when done
@@ -324,6 +407,83 @@ def consistencyCheck(config, stagingDirs):
 # Private utility functions
 ########################################################################
 
+###########################
+# _readExpected() function
+###########################
+
+
+def _readExpected(stagingDir):
+    """
+    Reads the expected digests and sizes for a staging directory from its manifest.
+    Args:
+       stagingDir: Staging directory to read the manifest from
+    Returns:
+        Tuple of (digest map, dictionary mapping key to size)
+    """
+    manifest = _readManifest(pathJoin(stagingDir, MANIFEST_FILE))
+    digest = {key: entry[2] for key, entry in manifest.items()}
+    sizes = {key: entry[0] for key, entry in manifest.items()}
+    return (digest, sizes)
+
+
+###########################
+# _readManifest() function
+###########################
+
+
+def _readManifest(manifestPath):
+    """
+    Reads a digest manifest from disk.
+
+    Each line of the manifest holds the digest, size and modification time (in
+    nanoseconds) of a file, followed by the path of the file relative to the
+    staging directory.  If the manifest doesn't exist or can't be parsed, then
+    an empty dictionary is returned, and the condition is logged.
+
+    Args:
+       manifestPath: Path to the manifest on disk
+    Returns:
+        Dictionary mapping relative path to a tuple of ``(size, mtime, digest)``
+    """
+    manifest = {}
+    if not os.path.isfile(manifestPath):
+        logger.debug("Manifest [%s] does not exist on disk.", manifestPath)
+        return manifest
+    try:
+        with open(manifestPath, encoding="utf-8", errors="surrogateescape") as f:
+            for line in f:
+                (digest, size, mtime, key) = line.rstrip("\n").split(" ", 3)
+                manifest[key] = (int(size), int(mtime), digest)
+        logger.debug("Loaded manifest [%s] from disk: %d entries.", manifestPath, len(manifest))
+    except Exception as e:
+        logger.error("Failed loading manifest [%s] from disk: %s", manifestPath, e)
+        manifest = {}
+    return manifest
+
+
+############################
+# _writeManifest() function
+############################
+
+
+def _writeManifest(config, manifestPath, manifest):
+    """
+    Writes a digest manifest to disk, in the format read by :any:`_readManifest`.
+    Args:
+       config: Config object
+       manifestPath: Path to the manifest on disk
+       manifest: Dictionary mapping relative path to a tuple of ``(size, mtime, digest)``
+    Raises:
+       IOError: If the manifest can't be written
+    """
+    with open(manifestPath, "w", encoding="utf-8", errors="surrogateescape") as f:
+        for key in sorted(manifest.keys()):
+            (size, mtime, digest) = manifest[key]
+            f.write("%s %d %d %s\n" % (digest, size, mtime, key))
+    changeOwnership(manifestPath, config.options.backupUser, config.options.backupGroup)
+    logger.debug("Wrote manifest [%s] to disk: %d entries.", manifestPath, len(manifest))
+
+
 #########################
 # _findCorrectDailyDir()
 #########################
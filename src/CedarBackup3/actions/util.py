@@ -148,7 +148,9 @@ def createWriter(config):
     if deviceMounted(devicePath):
         raise OSError("Device [%s] is currently mounted." % (devicePath))
     if deviceType == "cdwriter":
-        return CdWriter(devicePath, deviceScsiId, driveSpeed, mediaType, noEject, refreshMediaDelay, ejectDelay)
+        return CdWriter(
+            devicePath, deviceScsiId, driveSpeed, mediaType, noEject, refreshMediaDelay, ejectDelay, config.store.streamImage
+        )
     elif deviceType == "dvdwriter":
         return DvdWriter(devicePath, deviceScsiId, driveSpeed, mediaType, noEject, refreshMediaDelay, ejectDelay)
     else:
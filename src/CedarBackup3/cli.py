@@ -95,7 +95,9 @@
 from CedarBackup3.actions.validate import executeValidate
 from CedarBackup3.config import Config
 from CedarBackup3.customize import customizeOverrides
+from CedarBackup3.metrics import MetricsSingleton, timer
 from CedarBackup3.peer import RemotePeer
+from CedarBackup3.profiler import VALID_PROFILE_MODES, profiled
 from CedarBackup3.release import AUTHOR, EMAIL, VERSION
 from CedarBackup3.util import (
     Diagnostics,
@@ -155,6 +157,8 @@
     "debug",
     "stack",
     "diagnostics",
+    "metrics=",
+    "profile=",
 ]
 
 
@@ -244,6 +248,7 @@ def cli():
             sys.stderr.write("Error setting up logging: %s\n" % e)
             return 3
 
+    MetricsSingleton.getInstance().reset()
     logger.info("Cedar Backup run started.")
     logger.info("Options were [%s]", options)
     logger.info("Logfile is [%s]", logfile)
@@ -274,6 +279,7 @@ def cli():
         actionSet = _ActionSet(options.actions, config.extensions, config.options, config.peers, executeManaged, executeLocal)
     except Exception as e:
         logger.error("Error reading or handling configuration: %s", e)
+        _writeMetrics(options, 4)
         logger.info("Cedar Backup run completed with status 4.")
         return 4
 
@@ -284,13 +290,16 @@ def cli():
             actionSet.executeActions(configPath, options, config)
         except KeyboardInterrupt:
             logger.error("Backup interrupted.")
+            _writeMetrics(options, 5)
             logger.info("Cedar Backup run completed with status 5.")
             return 5
         except Exception as e:
             logger.error("Error executing backup: %s", e)
+            _writeMetrics(options, 6)
             logger.info("Cedar Backup run completed with status 6.")
             return 6
 
+    _writeMetrics(options, 0)
     logger.info("Cedar Backup run completed with status 0.")
     return 0
 
@@ -406,7 +415,9 @@ def executeAction(self, configPath, options, config):
         if self.preHooks is not None:
             for hook in self.preHooks:
                 self._executeHook("pre-action", hook)
-        self._executeAction(configPath, options, config)
+        outputDir = config.options.workingDir if config.options is not None else None
+        with timer("action.%s" % self.name), profiled(self.name, options.profile, outputDir):
+            self._executeAction(configPath, options, config)
         if self.postHooks is not None:
             for hook in self.postHooks:
                 self._executeHook("post-action", hook)
@@ -538,7 +549,8 @@ def executeAction(self, configPath, options, config):  # noqa: ARG002
         for peer in self.remotePeers:
             logger.debug("Executing managed action [%s] on peer [%s].", self.name, peer.name)
             try:
-                peer.executeManagedAction(self.name, options.full)
+                with timer("managed.%s.%s" % (self.name, peer.name)):
+                    peer.executeManagedAction(self.name, options.full)
             except OSError as e:
                 logger.error(e)  # log the message and go on, so we don't kill the backup
 
@@ -1034,6 +1046,8 @@ def _usage(fd=sys.stderr):
         "   -s, --stack        Dump a Python stack trace instead of swallowing exceptions\n"
     )  # exactly 80 characters in width!
     fd.write("   -D, --diagnostics  Print runtime diagnostics to the screen and exit\n")
+    fd.write("       --metrics      Write run metrics to a file (Prometheus format if *.prom)\n")
+    fd.write("       --profile      Profile each action (mode: cprofile, sample or both)\n")
     fd.write("\n")
     fd.write(" The following actions may be specified:\n")
     fd.write("\n")
@@ -1101,6 +1115,30 @@ def _diagnostics(fd=sys.stdout):
     fd.write("\n")
 
 
+###########################
+# _writeMetrics() function
+###########################
+
+
+def _writeMetrics(options, status):
+    """
+    Writes the run metrics report, if the ``--metrics`` option was given.
+
+    A failure to write the report is logged but otherwise ignored, since it
+    shouldn't change the outcome of the backup.
+
+    Args:
+       options: Command-line options
+       status: Exit status of the run
+    """
+    if options.metrics is not None:
+        try:
+            MetricsSingleton.getInstance().writeReport(options.metrics, status)
+            logger.info("Wrote metrics to [%s].", options.metrics)
+        except Exception as e:
+            logger.error("Error writing metrics to [%s]: %s", options.metrics, e)
+
+
 ##########################
 # setupLogging() function
 ##########################
@@ -1416,6 +1454,8 @@ def __init__(self, argumentList=None, argumentString=None, validate=True):
         self._debug = False
         self._stacktrace = False
         self._diagnostics = False
+        self._metrics = None
+        self._profile = None
         self._actions = None
         self.actions = []  # initialize to an empty list; remainder are OK
         if argumentList is not None and argumentString is not None:
@@ -1545,6 +1585,16 @@ def __cmp__(self, other):
                 return -1
             else:
                 return 1
+        if self.metrics != other.metrics:
+            if str(self.metrics or "") < str(other.metrics or ""):
+                return -1
+            else:
+                return 1
+        if self.profile != other.profile:
+            if str(self.profile or "") < str(other.profile or ""):
+                return -1
+            else:
+                return 1
         if self.actions != other.actions:
             if self.actions < other.actions:
                 return -1
@@ -1815,6 +1865,41 @@ def _getDiagnostics(self):
         """
         return self._diagnostics
 
+    def _setMetrics(self, value):
+        """
+        Property target used to set the metrics parameter.
+        Raises:
+           ValueError: If the value cannot be encoded properly
+        """
+        if value is not None:
+            if len(value) < 1:
+                raise ValueError("The metrics parameter must be a non-empty string.")
+        self._metrics = encodePath(value)
+
+    def _getMetrics(self):
+        """
+        Property target used to get the metrics parameter.
+        """
+        return self._metrics
+
+    def _setProfile(self, value):
+        """
+        Property target used to set the profile mode.
+        If not ``None``, the mode must be one of the values in :any:`VALID_PROFILE_MODES`.
+        Raises:
+           ValueError: If the value is not valid
+        """
+        if value is not None:
+            if value not in VALID_PROFILE_MODES:
+                raise ValueError("Profile mode must be one of %s." % VALID_PROFILE_MODES)
+        self._profile = value
+
+    def _getProfile(self):
+        """
+        Property target used to get the profile mode.
+        """
+        return self._profile
+
     def _setActions(self, value):
         """
         Property target used to set the actions list.
@@ -1854,6 +1939,8 @@ def _getActions(self):
     debug = property(_getDebug, _setDebug, None, "Command-line debug (``-d,--debug``) flag.")
     stacktrace = property(_getStacktrace, _setStacktrace, None, "Command-line stacktrace (``-s,--stack``) flag.")
     diagnostics = property(_getDiagnostics, _setDiagnostics, None, "Command-line diagnostics (``-D,--diagnostics``) flag.")
+    metrics = property(_getMetrics, _setMetrics, None, "Command-line metrics (``--metrics``) parameter.")
+    profile = property(_getProfile, _setProfile, None, "Command-line profile (``--profile``) mode.")
     actions = property(_getActions, _setActions, None, "Command-line actions list.")
 
     ##################
@@ -1946,6 +2033,12 @@ def buildArgumentList(self, validate=True):
             argumentList.append("--stack")
         if self.diagnostics:
             argumentList.append("--diagnostics")
+        if self.metrics is not None:
+            argumentList.append("--metrics")
+            argumentList.append(self.metrics)
+        if self.profile is not None:
+            argumentList.append("--profile")
+            argumentList.append(self.profile)
         if self.actions is not None:
             for action in self.actions:
                 argumentList.append(action)
@@ -2012,6 +2105,10 @@ def buildArgumentString(self, validate=True):
             argumentString += "--stack "
         if self.diagnostics:
             argumentString += "--diagnostics "
+        if self.metrics is not None:
+            argumentString += '--metrics "%s" ' % self.metrics
+        if self.profile is not None:
+            argumentString += '--profile "%s" ' % self.profile
         if self.actions is not None:
             for action in self.actions:
                 argumentString += '"%s" ' % action
@@ -2080,6 +2177,10 @@ def _parseArgumentList(self, argumentList):
             self.stacktrace = True
         if "-D" in switches or "--diagnostics" in switches:
             self.diagnostics = True
+        if "--metrics" in switches:
+            self.metrics = switches["--metrics"]
+        if "--profile" in switches:
+            self.profile = switches["--profile"]
 
 
 #########################################################################
@@ -221,6 +221,7 @@
    VALID_COLLECT_MODES: List of valid collect modes
    VALID_COMPRESS_MODES: List of valid compress modes
    VALID_ARCHIVE_MODES: List of valid archive modes
+   VALID_DIGEST_ALGORITHMS: List of valid digest algorithms
    VALID_ORDER_MODES: List of valid extension order modes
 
 :author: Kenneth J. Pronovici <pronovic@ieee.org>
@@ -236,6 +237,7 @@
 import re
 from functools import total_ordering
 
+from CedarBackup3.filesystem import MIN_VOLUME_SIZE, VALID_DIGEST_ALGORITHMS
 from CedarBackup3.util import (
     UNIT_BYTES,
     UNIT_GBYTES,
@@ -264,6 +266,7 @@
     readBoolean,
     readChildren,
     readFirstChild,
+    readInputDom,
     readInteger,
     readString,
     readStringList,
@@ -284,7 +287,7 @@
 VALID_DVD_MEDIA_TYPES = ["dvd+r", "dvd+rw"]
 VALID_MEDIA_TYPES = VALID_CD_MEDIA_TYPES + VALID_DVD_MEDIA_TYPES
 VALID_COLLECT_MODES = ["daily", "weekly", "incr"]
-VALID_ARCHIVE_MODES = ["tar", "targz", "tarbz2"]
+VALID_ARCHIVE_MODES = ["tar", "targz", "tarbz2", "adaptive"]
 VALID_COMPRESS_MODES = ["none", "gzip", "bzip2"]
 VALID_ORDER_MODES = ["index", "dependency"]
 VALID_BLANK_MODES = ["daily", "weekly"]
@@ -1453,6 +1456,7 @@ class CollectDir:
        - The collect mode must be one of the values in :any:`VALID_COLLECT_MODES`.
        - The archive mode must be one of the values in :any:`VALID_ARCHIVE_MODES`.
        - The ignore file must be a non-empty string.
+       - The maximum archive size must be a ByteQuantity of at least :any:`filesystem.MIN_VOLUME_SIZE` bytes.
 
     For the ``absoluteExcludePaths`` list, validation is accomplished through the
     :any:`util.AbsolutePathList` list implementation that overrides common list
@@ -1474,6 +1478,7 @@ def __init__(
         linkDepth=None,
         dereference=False,
         recursionLevel=None,
+        maxArchiveSize=None,
     ):
         """
         Constructor for the ``CollectDir`` class.
@@ -1488,6 +1493,8 @@ def __init__(
            absoluteExcludePaths: List of absolute paths to exclude
            relativeExcludePaths: List of relative paths to exclude
            excludePatterns: List of regular expression patterns to exclude
+           recursionLevel: Recursion level to use for recursive directory collection
+           maxArchiveSize: Maximum size of each tar volume, as a ByteQuantity
 
         Raises:
            ValueError: If one of the values is invalid
@@ -1499,6 +1506,7 @@ def __init__(
         self._linkDepth = None
         self._dereference = None
         self._recursionLevel = None
+        self._maxArchiveSize = None
         self._absoluteExcludePaths = None
         self._relativeExcludePaths = None
         self._excludePatterns = None
@@ -1509,6 +1517,7 @@ def __init__(
         self.linkDepth = linkDepth
         self.dereference = dereference
         self.recursionLevel = recursionLevel
+        self.maxArchiveSize = maxArchiveSize
         self.absoluteExcludePaths = absoluteExcludePaths
         self.relativeExcludePaths = relativeExcludePaths
         self.excludePatterns = excludePatterns
@@ -1517,7 +1526,7 @@ def __repr__(self):
         """
         Official string representation for class instance.
         """
-        return "CollectDir(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)" % (
+        return "CollectDir(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)" % (
             self.absolutePath,
             self.collectMode,
             self.archiveMode,
@@ -1528,6 +1537,7 @@ def __repr__(self):
             self.linkDepth,
             self.dereference,
             self.recursionLevel,
+            self.maxArchiveSize,
         )
 
     def __str__(self):
@@ -1594,6 +1604,11 @@ def __cmp__(self, other):
                 return -1
             else:
                 return 1
+        if self.maxArchiveSize != other.maxArchiveSize:
+            if (self.maxArchiveSize or ByteQuantity()) < (other.maxArchiveSize or ByteQuantity()):
+                return -1
+            else:
+                return 1
         if self.absoluteExcludePaths != other.absoluteExcludePaths:
             if self.absoluteExcludePaths < other.absoluteExcludePaths:
                 return -1
@@ -1747,6 +1762,28 @@ def _getRecursionLevel(self):
         """
         return self._recursionLevel
 
+    def _setMaxArchiveSize(self, value):
+        """
+        Property target used to set the maximum archive size.
+        If not ``None``, the value must be a ``ByteQuantity`` object of at least :any:`filesystem.MIN_VOLUME_SIZE` bytes.
+        Raises:
+           ValueError: If the value is not valid
+        """
+        if value is None:
+            self._maxArchiveSize = None
+        else:
+            if not isinstance(value, ByteQuantity):
+                raise ValueError("Value must be a ``ByteQuantity`` object.")
+            if value.bytes < MIN_VOLUME_SIZE:
+                raise ValueError("Maximum archive size must be at least %d bytes." % MIN_VOLUME_SIZE)
+            self._maxArchiveSize = value
+
+    def _getMaxArchiveSize(self):
+        """
+        Property target used to get the maximum archive size.
+        """
+        return self._maxArchiveSize
+
     def _setAbsoluteExcludePaths(self, value):
         """
         Property target used to set the absolute exclude paths list.
@@ -1824,6 +1861,7 @@ def _getExcludePatterns(self):
     recursionLevel = property(
         _getRecursionLevel, _setRecursionLevel, None, "Recursion level to use for recursive directory collection"
     )
+    maxArchiveSize = property(_getMaxArchiveSize, _setMaxArchiveSize, None, "Maximum size of each tar volume, as a ByteQuantity.")
     absoluteExcludePaths = property(_getAbsoluteExcludePaths, _setAbsoluteExcludePaths, None, "List of absolute paths to exclude.")
     relativeExcludePaths = property(_getRelativeExcludePaths, _setRelativeExcludePaths, None, "List of relative paths to exclude.")
     excludePatterns = property(_getExcludePatterns, _setExcludePatterns, None, "List of regular expression patterns to exclude.")
@@ -3320,6 +3358,7 @@ class CollectConfig:
        - Each of the paths in ``absoluteExcludePaths`` must be an absolute path
        - The collect file list must be a list of ``CollectFile`` objects.
        - The collect directory list must be a list of ``CollectDir`` objects.
+       - The digest algorithm must be one of the values in :any:`VALID_DIGEST_ALGORITHMS`.
 
     For the ``absoluteExcludePaths`` list, validation is accomplished through the
     :any:`util.AbsolutePathList` list implementation that overrides common list
@@ -3344,6 +3383,8 @@ def __init__(
         excludePatterns=None,
         collectFiles=None,
         collectDirs=None,
+        traversalCache=False,
+        digestAlgorithm=None,
     ):
         """
         Constructor for the ``CollectConfig`` class.
@@ -3357,6 +3398,8 @@ def __init__(
            excludePatterns: List of regular expression patterns to exclude
            collectFiles: List of collect files
            collectDirs: List of collect directories
+           traversalCache: Whether to cache directory listings between runs
+           digestAlgorithm: Algorithm used for incremental digests
 
         Raises:
            ValueError: If one of the values is invalid
@@ -3369,6 +3412,8 @@ def __init__(
         self._excludePatterns = None
         self._collectFiles = None
         self._collectDirs = None
+        self._traversalCache = None
+        self._digestAlgorithm = None
         self.targetDir = targetDir
         self.collectMode = collectMode
         self.archiveMode = archiveMode
@@ -3377,12 +3422,14 @@ def __init__(
         self.excludePatterns = excludePatterns
         self.collectFiles = collectFiles
         self.collectDirs = collectDirs
+        self.traversalCache = traversalCache
+        self.digestAlgorithm = digestAlgorithm
 
     def __repr__(self):
         """
         Official string representation for class instance.
         """
-        return "CollectConfig(%s, %s, %s, %s, %s, %s, %s, %s)" % (
+        return "CollectConfig(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)" % (
             self.targetDir,
             self.collectMode,
             self.archiveMode,
@@ -3391,6 +3438,8 @@ def __repr__(self):
             self.excludePatterns,
             self.collectFiles,
             self.collectDirs,
+            self.traversalCache,
+            self.digestAlgorithm,
         )
 
     def __str__(self):
@@ -3462,6 +3511,16 @@ def __cmp__(self, other):
                 return -1
             else:
                 return 1
+        if self.traversalCache != other.traversalCache:
+            if self.traversalCache < other.traversalCache:
+                return -1
+            else:
+                return 1
+        if self.digestAlgorithm != other.digestAlgorithm:
+            if str(self.digestAlgorithm or "") < str(other.digestAlgorithm or ""):
+                return -1
+            else:
+                return 1
         return 0
 
     def _setTargetDir(self, value):
@@ -3633,6 +3692,40 @@ def _getCollectDirs(self):
         """
         return self._collectDirs
 
+    def _setTraversalCache(self, value):
+        """
+        Property target used to set the traversal cache flag.
+        No validations, but we normalize the value to ``True`` or ``False``.
+        """
+        if value:
+            self._traversalCache = True
+        else:
+            self._traversalCache = False
+
+    def _getTraversalCache(self):
+        """
+        Property target used to get the traversal cache flag.
+        """
+        return self._traversalCache
+
+    def _setDigestAlgorithm(self, value):
+        """
+        Property target used to set the digest algorithm.
+        If not ``None``, the algorithm must be one of :any:`VALID_DIGEST_ALGORITHMS`.
+        Raises:
+           ValueError: If the value is not valid
+        """
+        if value is not None:
+            if value not in VALID_DIGEST_ALGORITHMS:
+                raise ValueError("Digest algorithm must be one of %s." % VALID_DIGEST_ALGORITHMS)
+        self._digestAlgorithm = value
+
+    def _getDigestAlgorithm(self):
+        """
+        Property target used to get the digest algorithm.
+        """
+        return self._digestAlgorithm
+
     targetDir = property(_getTargetDir, _setTargetDir, None, "Directory to collect files into.")
     collectMode = property(_getCollectMode, _setCollectMode, None, "Default collect mode.")
     archiveMode = property(_getArchiveMode, _setArchiveMode, None, "Default archive mode for collect files.")
@@ -3641,6 +3734,8 @@ def _getCollectDirs(self):
     excludePatterns = property(_getExcludePatterns, _setExcludePatterns, None, "List of regular expressions patterns to exclude.")
     collectFiles = property(_getCollectFiles, _setCollectFiles, None, "List of collect files.")
     collectDirs = property(_getCollectDirs, _setCollectDirs, None, "List of collect directories.")
+    traversalCache = property(_getTraversalCache, _setTraversalCache, None, "Whether to cache directory listings between runs.")
+    digestAlgorithm = property(_getDigestAlgorithm, _setDigestAlgorithm, None, "Algorithm used for incremental digests.")
 
 
 ########################################################################
@@ -3860,6 +3955,7 @@ def __init__(
         blankBehavior=None,
         refreshMediaDelay=None,
         ejectDelay=None,
+        streamImage=False,
     ):
         """
         Constructor for the ``StoreConfig`` class.
@@ -3878,6 +3974,7 @@ def __init__(
            blankBehavior: Controls optimized blanking behavior
            refreshMediaDelay: Delay, in seconds, to add after refreshing media
            ejectDelay: Delay, in seconds, to add after ejecting media before closing the tray
+           streamImage: Whether to stream the image directly to the writer, rather than through a temporary file
 
         Raises:
            ValueError: If one of the values is invalid
@@ -3895,6 +3992,7 @@ def __init__(
         self._blankBehavior = None
         self._refreshMediaDelay = None
         self._ejectDelay = None
+        self._streamImage = None
         self.sourceDir = sourceDir
         self.mediaType = mediaType
         self.deviceType = deviceType
@@ -3908,12 +4006,13 @@ def __init__(
         self.blankBehavior = blankBehavior
         self.refreshMediaDelay = refreshMediaDelay
         self.ejectDelay = ejectDelay
+        self.streamImage = streamImage
 
     def __repr__(self):
         """
         Official string representation for class instance.
         """
-        return "StoreConfig(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)" % (
+        return "StoreConfig(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)" % (
             self.sourceDir,
             self.mediaType,
             self.deviceType,
@@ -3927,6 +4026,7 @@ def __repr__(self):
             self.blankBehavior,
             self.refreshMediaDelay,
             self.ejectDelay,
+            self.streamImage,
         )
 
     def __str__(self):
@@ -4022,6 +4122,11 @@ def __cmp__(self, other):
                 return -1
             else:
                 return 1
+        if self.streamImage != other.streamImage:
+            if self.streamImage < other.streamImage:
+                return -1
+            else:
+                return 1
         return 0
 
     def _setSourceDir(self, value):
@@ -4269,6 +4374,22 @@ def _getEjectDelay(self):
         """
         return self._ejectDelay
 
+    def _setStreamImage(self, value):
+        """
+        Property target used to set the stream image flag.
+        No validations, but we normalize the value to ``True`` or ``False``.
+        """
+        if value:
+            self._streamImage = True
+        else:
+            self._streamImage = False
+
+    def _getStreamImage(self):
+        """
+        Property target used to get the stream image flag.
+        """
+        return self._streamImage
+
     sourceDir = property(_getSourceDir, _setSourceDir, None, "Directory whose contents should be written to media.")
     mediaType = property(_getMediaType, _setMediaType, None, "Type of the media (see notes above).")
     deviceType = property(_getDeviceType, _setDeviceType, None, "Type of the device (optional, see notes above).")
@@ -4286,6 +4407,9 @@ def _getEjectDelay(self):
     ejectDelay = property(
         _getEjectDelay, _setEjectDelay, None, "Delay, in seconds, to add after ejecting media before closing the tray"
     )
+    streamImage = property(
+        _getStreamImage, _setStreamImage, None, "Whether to stream the image directly to the writer, without a temporary file."
+    )
 
 
 ########################################################################
@@ -4491,9 +4615,8 @@ def __init__(self, xmlData=None, xmlPath=None, validate=True):
             if validate:
                 self.validate()
         elif xmlPath is not None:
-            with open(xmlPath) as f:
-                xmlData = f.read()
-            self._parseXmlData(xmlData)
+            (_, parentNode) = readInputDom(xmlPath)
+            self._parseParentNode(parentNode)
             if validate:
                 self.validate()
 
@@ -4887,6 +5010,21 @@ def _parseXmlData(self, xmlData):
            ValueError: If the XML cannot be successfully parsed
         """
         (_, parentNode) = createInputDom(xmlData)
+        self._parseParentNode(parentNode)
+
+    def _parseParentNode(self, parentNode):
+        """
+        Internal method to parse a DOM tree into the object.
+
+        This method calls individual static methods to parse each of the individual
+        configuration sections.  It is used both for XML data and for a document
+        read via :any:`readInputDom`, which may be shared with other callers.
+
+        Args:
+           parentNode: Parent node of the parsed document
+        Raises:
+           ValueError: If the XML cannot be successfully parsed
+        """
         self._reference = Config._parseReference(parentNode)
         self._extensions = Config._parseExtensions(parentNode)
         self._options = Config._parseOptions(parentNode)
@@ -5052,6 +5190,8 @@ def _parseCollect(parentNode):
            collectMode          //cb_config/collect/collect_mode
            archiveMode          //cb_config/collect/archive_mode
            ignoreFile           //cb_config/collect/ignore_file
+           traversalCache       //cb_config/collect/traversal_cache
+           digestAlgorithm      //cb_config/collect/digest_algorithm
 
         We also read groups of the following items, one list element per
         item::
@@ -5081,6 +5221,8 @@ def _parseCollect(parentNode):
             collect.collectMode = readString(sectionNode, "collect_mode")
             collect.archiveMode = readString(sectionNode, "archive_mode")
             collect.ignoreFile = readString(sectionNode, "ignore_file")
+            collect.traversalCache = readBoolean(sectionNode, "traversal_cache")
+            collect.digestAlgorithm = readString(sectionNode, "digest_algorithm")
             (collect.absoluteExcludePaths, _, collect.excludePatterns) = Config._parseExclusions(sectionNode)
             collect.collectFiles = Config._parseCollectFiles(sectionNode)
             collect.collectDirs = Config._parseCollectDirs(sectionNode)
@@ -5136,6 +5278,9 @@ def _parseStore(parentNode):
            checkMedia        //cb_config/store/check_media
            warnMidnite       //cb_config/store/warn_midnite
            noEject           //cb_config/store/no_eject
+           refreshMediaDelay //cb_config/store/refresh_media_delay
+           ejectDelay        //cb_config/store/eject_delay
+           streamImage       //cb_config/store/stream_image
 
         Blanking behavior configuration is parsed by the ``_parseBlankBehavior``
         method.
@@ -5165,6 +5310,7 @@ def _parseStore(parentNode):
             store.blankBehavior = Config._parseBlankBehavior(sectionNode)
             store.refreshMediaDelay = readInteger(sectionNode, "refresh_media_delay")
             store.ejectDelay = readInteger(sectionNode, "eject_delay")
+            store.streamImage = readBoolean(sectionNode, "stream_image")
         return store
 
     @staticmethod
@@ -5380,6 +5526,7 @@ def _parseCollectDirs(parentNode):
            linkDepth               link_depth
            dereference             dereference
            recursionLevel          recursion_level
+           maxArchiveSize          max_archive_size
 
         The collect mode is a special case.  Just a ``mode`` tag is accepted for
         backwards compatibility, but we prefer ``collect_mode`` for consistency
@@ -5416,6 +5563,7 @@ def _parseCollectDirs(parentNode):
                 cdir.linkDepth = readInteger(entry, "link_depth")
                 cdir.dereference = readBoolean(entry, "dereference")
                 cdir.recursionLevel = readInteger(entry, "recursion_level")
+                cdir.maxArchiveSize = readByteQuantity(entry, "max_archive_size")
                 (cdir.absoluteExcludePaths, cdir.relativeExcludePaths, cdir.excludePatterns) = Config._parseExclusions(entry)
                 lst.append(cdir)
         if not lst:
@@ -5756,6 +5904,8 @@ def _addCollect(xmlDom, parentNode, collectConfig):
            collectMode          //cb_config/collect/collect_mode
            archiveMode          //cb_config/collect/archive_mode
            ignoreFile           //cb_config/collect/ignore_file
+           traversalCache       //cb_config/collect/traversal_cache
+           digestAlgorithm      //cb_config/collect/digest_algorithm
 
         We also add groups of the following items, one list element per
         item::
@@ -5781,6 +5931,8 @@ def _addCollect(xmlDom, parentNode, collectConfig):
             addStringNode(xmlDom, sectionNode, "collect_mode", collectConfig.collectMode)
             addStringNode(xmlDom, sectionNode, "archive_mode", collectConfig.archiveMode)
             addStringNode(xmlDom, sectionNode, "ignore_file", collectConfig.ignoreFile)
+            addBooleanNode(xmlDom, sectionNode, "traversal_cache", collectConfig.traversalCache)
+            addStringNode(xmlDom, sectionNode, "digest_algorithm", collectConfig.digestAlgorithm)
             if (collectConfig.absoluteExcludePaths is not None and collectConfig.absoluteExcludePaths != []) or (
                 collectConfig.excludePatterns is not None and collectConfig.excludePatterns != []
             ):
@@ -5852,6 +6004,7 @@ def _addStore(xmlDom, parentNode, storeConfig):
            noEject           //cb_config/store/no_eject
            refreshMediaDelay //cb_config/store/refresh_media_delay
            ejectDelay        //cb_config/store/eject_delay
+           streamImage       //cb_config/store/stream_image
 
         Blanking behavior configuration is added by the :any:`_addBlankBehavior`
         method.
@@ -5877,6 +6030,7 @@ def _addStore(xmlDom, parentNode, storeConfig):
             addBooleanNode(xmlDom, sectionNode, "no_eject", storeConfig.noEject)
             addIntegerNode(xmlDom, sectionNode, "refresh_media_delay", storeConfig.refreshMediaDelay)
             addIntegerNode(xmlDom, sectionNode, "eject_delay", storeConfig.ejectDelay)
+            addBooleanNode(xmlDom, sectionNode, "stream_image", storeConfig.streamImage)
             Config._addBlankBehavior(xmlDom, sectionNode, storeConfig.blankBehavior)
 
     @staticmethod
@@ -6045,6 +6199,7 @@ def _addCollectDir(xmlDom, parentNode, collectDir):
            linkDepth               dir/link_depth
            dereference             dir/dereference
            recursionLevel          dir/recursion_level
+           maxArchiveSize          dir/max_archive_size
 
         Note that an original XML document might have listed the collect mode
         using the ``mode`` tag, since we accept both ``collect_mode`` and ``mode``.
@@ -6076,6 +6231,7 @@ def _addCollectDir(xmlDom, parentNode, collectDir):
             addIntegerNode(xmlDom, sectionNode, "link_depth", collectDir.linkDepth)
             addBooleanNode(xmlDom, sectionNode, "dereference", collectDir.dereference)
             addIntegerNode(xmlDom, sectionNode, "recursion_level", collectDir.recursionLevel)
+            addByteQuantityNode(xmlDom, sectionNode, "max_archive_size", collectDir.maxArchiveSize)
             if (
                 (collectDir.absoluteExcludePaths is not None and collectDir.absoluteExcludePaths != [])
                 or (collectDir.relativeExcludePaths is not None and collectDir.relativeExcludePaths != [])
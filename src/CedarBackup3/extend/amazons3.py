@@ -44,13 +44,16 @@
 Since it is intended to replace the store action, it does not rely on any store
 configuration.
 
-The underlying functionality relies on the U{AWS CLI interface
-<http://aws.amazon.com/documentation/cli/>}.  Before you use this extension,
-you need to set up your Amazon S3 account and configure the AWS CLI connection
-per Amazon's documentation.  The extension assumes that the backup is being
-executed as root, and switches over to the configured backup user to
-communicate with AWS.  So, make sure you configure AWS CLI as the backup user
-and not root.
+Data is uploaded with the native S3 client in :any:`CedarBackup3.s3`, which
+sends large files as concurrent multipart uploads, skips objects that are
+already present with the same size and ETag, and verifies every object against
+an MD5 checksum computed while it is being uploaded.  Before you use this
+extension, you need to set up your Amazon S3 account and configure credentials
+per Amazon's documentation for the U{AWS CLI
+<http://aws.amazon.com/documentation/cli/>}, although the AWS CLI itself is not
+required.  The extension assumes that the backup is being executed as root, and
+reads the credentials in the configured backup user's ``~/.aws`` directory.  So,
+make sure you configure credentials as the backup user and not root.
 
 You can optionally configure Cedar Backup to encrypt data before sending it
 to S3.  To do that, provide a complete command line using the ``${input``} and
@@ -83,18 +86,23 @@
 ########################################################################
 
 import datetime
-import json
 import logging
 import os
 import shutil
 import sys
 import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from functools import total_ordering
 
 from CedarBackup3.actions.constants import DIR_TIME_FORMAT, STAGE_INDICATOR
 from CedarBackup3.actions.util import writeIndicatorFile
 from CedarBackup3.config import ByteQuantity, addByteQuantityNode, readByteQuantity
 from CedarBackup3.filesystem import BackupFileList, FilesystemList
+from CedarBackup3.metrics import increment
+from CedarBackup3.s3 import S3Uploader, buildClient
 from CedarBackup3.util import (
     UNIT_BYTES,
     changeOwnership,
@@ -112,6 +120,7 @@
     createInputDom,
     readBoolean,
     readFirstChild,
+    readInputDom,
     readString,
 )
 
@@ -122,7 +131,10 @@
 logger = logging.getLogger("CedarBackup3.log.extend.amazons3")
 
 SU_COMMAND = ["su"]
-AWS_COMMAND = ["aws"]
+
+ENCRYPT_WORKERS = min(4, os.cpu_count() or 1)
+SCRATCH_SIZE = 1024 * 1024 * 1024
+SCRATCH_WAIT = 5
 
 STORE_INDICATOR = "cback.amazons3"
 
@@ -405,9 +417,8 @@ def __init__(self, xmlData=None, xmlPath=None, validate=True):
             if validate:
                 self.validate()
         elif xmlPath is not None:
-            with open(xmlPath) as f:
-                xmlData = f.read()
-            self._parseXmlData(xmlData)
+            (_, parentNode) = readInputDom(xmlPath)
+            self._parseParentNode(parentNode)
             if validate:
                 self.validate()
 
@@ -529,6 +540,21 @@ def _parseXmlData(self, xmlData):
            ValueError: If the XML cannot be successfully parsed
         """
         (_, parentNode) = createInputDom(xmlData)
+        self._parseParentNode(parentNode)
+
+    def _parseParentNode(self, parentNode):
+        """
+        Internal method to parse a DOM tree into the object.
+
+        This method calls a static method to parse the amazons3 configuration
+        section.  It is used both for XML data and for a document read via
+        :any:`readInputDom`, which may be shared with other callers.
+
+        Args:
+           parentNode: Parent node of the parsed document
+        Raises:
+           ValueError: If the XML cannot be successfully parsed
+        """
         self._amazons3 = LocalConfig._parseAmazonS3(parentNode)
 
     @staticmethod
@@ -725,7 +751,10 @@ def _writeToAmazonS3(config, local, stagingDirs):
     the configured Amazon S3 bucket from local configuration.  The directories
     will be placed into the image at the root by date, so staging directory
     ``/opt/stage/2005/02/10`` will be placed into the S3 bucket at ``/2005/02/10``.
-    If an encrypt commmand is provided, the files will be encrypted first.
+    If the configured bucket includes a subdirectory, like ``bucket/staging``,
+    the dated directories are placed beneath it, at ``/staging/2005/02/10``.
+    If an encrypt commmand is provided, the files will be encrypted first, in a
+    temporary directory within the working directory.
 
     Args:
        config: Config object
@@ -736,27 +765,44 @@ def _writeToAmazonS3(config, local, stagingDirs):
        ValueError: Under many generic error conditions
        IOError: If there is a problem writing to Amazon S3
     """
-    for stagingDir in list(stagingDirs.keys()):
-        logger.debug("Storing stage directory to Amazon S3 [%s].", stagingDir)
-        dateSuffix = stagingDirs[stagingDir]
-        s3BucketUrl = "s3://%s/%s" % (local.amazons3.s3Bucket, dateSuffix)
-        logger.debug("S3 bucket URL is [%s]", s3BucketUrl)
-        _clearExistingBackup(config, s3BucketUrl)
-        if local.amazons3.encryptCommand is None:
-            logger.debug("Encryption is disabled; files will be uploaded in cleartext.")
-            _uploadStagingDir(config, stagingDir, s3BucketUrl)
-            _verifyUpload(config, stagingDir, s3BucketUrl)
-        else:
-            logger.debug("Encryption is enabled; files will be uploaded after being encrypted.")
-            encryptedDir = tempfile.mkdtemp(dir=config.options.workingDir)
-            changeOwnership(encryptedDir, config.options.backupUser, config.options.backupGroup)
-            try:
-                _encryptStagingDir(config, local, stagingDir, encryptedDir)
-                _uploadStagingDir(config, encryptedDir, s3BucketUrl)
-                _verifyUpload(config, encryptedDir, s3BucketUrl)
-            finally:
-                if os.path.exists(encryptedDir):
-                    shutil.rmtree(encryptedDir)
+    (bucket, subdir) = _splitBucket(local.amazons3.s3Bucket)
+    with buildClient(bucket, config.options.backupUser) as client:
+        for stagingDir in list(stagingDirs.keys()):
+            logger.debug("Storing stage directory to Amazon S3 [%s].", stagingDir)
+            prefix = "%s%s/" % (subdir, stagingDirs[stagingDir])
+            logger.debug("S3 bucket prefix is [%s] in %s", prefix, client)
+            if local.amazons3.encryptCommand is None:
+                logger.debug("Encryption is disabled; files will be uploaded in cleartext.")
+                results = _uploadStagingDir(client, stagingDir, prefix)
+                _verifyUpload(client, prefix, results)
+            else:
+                logger.debug("Encryption is enabled; files will be uploaded after being encrypted.")
+                encryptedDir = tempfile.mkdtemp(dir=config.options.workingDir)
+                changeOwnership(encryptedDir, config.options.backupUser, config.options.backupGroup)
+                try:
+                    results = _uploadEncryptedStagingDir(config, local, client, stagingDir, encryptedDir, prefix)
+                    _verifyUpload(client, prefix, results)
+                finally:
+                    if os.path.exists(encryptedDir):
+                        shutil.rmtree(encryptedDir)
+
+
+##########################
+# _splitBucket() function
+##########################
+
+
+def _splitBucket(s3Bucket):
+    """
+    Split a configured S3 bucket like ``bucket/subdir`` into a bucket name and key prefix.
+    Args:
+       s3Bucket: Configured S3 bucket, optionally including a subdirectory
+    Returns:
+        Tuple of (bucket, prefix), where the prefix is either empty or ends with a slash
+    """
+    (bucket, _, subdir) = s3Bucket.partition("/")
+    subdir = subdir.strip("/")
+    return (bucket, "%s/" % subdir if subdir else "")
 
 
 ##################################
@@ -780,20 +826,19 @@ def _writeStoreIndicator(config, stagingDirs):
 ##################################
 
 
-def _clearExistingBackup(config, s3BucketUrl):
+def _clearExistingBackup(client, prefix, existing, results):
     """
-    Clear any existing backup files for an S3 bucket URL.
+    Clear any existing backup files under an S3 prefix that were not part of this upload.
     Args:
-       config: Config object
-       s3BucketUrl: S3 bucket URL associated with the staging directory
+       client: S3Client for the bucket
+       prefix: S3 key prefix associated with the staging directory
+       existing: Dict mapping key to (size, etag) for objects present before the upload
+       results: Dict mapping key to (size, etag) for objects that were just uploaded
     """
-    suCommand = resolveCommand(SU_COMMAND)
-    awsCommand = resolveCommand(AWS_COMMAND)
-    actualCommand = "%s s3 rm --recursive %s/" % (awsCommand[0], s3BucketUrl)
-    result = executeCommand(suCommand, [config.options.backupUser, "-c", actualCommand])[0]
-    if result != 0:
-        raise OSError("Error [%d] calling AWS CLI to clear existing backup for [%s]." % (result, s3BucketUrl))
-    logger.debug("Completed clearing any existing backup in S3 for [%s]", s3BucketUrl)
+    stale = sorted(set(existing) - set(results))
+    if stale:
+        client.deleteObjects(stale)
+    logger.debug("Completed clearing %d stale objects in S3 for [%s]", len(stale), prefix)
 
 
 ###############################
@@ -801,26 +846,120 @@ def _clearExistingBackup(config, s3BucketUrl):
 ###############################
 
 
-def _uploadStagingDir(config, stagingDir, s3BucketUrl):
+def _uploadStagingDir(client, stagingDir, prefix):
     """
     Upload the contents of a staging directory out to the Amazon S3 cloud.
+
+    Objects that are already present with the same size and ETag are not
+    uploaded again, and objects under the prefix that no longer exist in the
+    staging directory are removed once the upload has completed.
+
     Args:
-       config: Config object
+       client: S3Client for the bucket
        stagingDir: Staging directory to upload
-       s3BucketUrl: S3 bucket URL associated with the staging directory
-    """
-    # The version of awscli in Debian stretch (1.11.13-1) has a problem
-    # uploading empty files, due to running with Python 3 rather than Python 2
-    # as the upstream maintainers intended.  To work around this, I'm explicitly
-    # excluding files like cback.stage, cback.collect, etc. which should be the
-    # only empty files we ever try to copy.  See: https://github.com/aws/aws-cli/issues/2403
-    suCommand = resolveCommand(SU_COMMAND)
-    awsCommand = resolveCommand(AWS_COMMAND)
-    actualCommand = '%s s3 cp --recursive --exclude "*cback.*" %s/ %s/' % (awsCommand[0], stagingDir, s3BucketUrl)
-    result = executeCommand(suCommand, [config.options.backupUser, "-c", actualCommand])[0]
-    if result != 0:
-        raise OSError("Error [%d] calling AWS CLI to upload staging directory to [%s]." % (result, s3BucketUrl))
-    logger.debug("Completed uploading staging dir [%s] to [%s]", stagingDir, s3BucketUrl)
+       prefix: S3 key prefix associated with the staging directory
+
+    Returns:
+        Dict mapping key to (size, etag) for each object uploaded
+    """
+    results = _uploadFiles(client, _listStagingDir(stagingDir, prefix), prefix)
+    logger.debug("Completed uploading staging dir [%s] to [%s]", stagingDir, prefix)
+    return results
+
+
+########################################
+# _uploadEncryptedStagingDir() function
+########################################
+
+
+def _uploadEncryptedStagingDir(config, local, client, stagingDir, encryptedDir, prefix):
+    """
+    Encrypt the contents of a staging directory and upload it to the Amazon S3 cloud.
+
+    Files are encrypted by a pool of workers, and each encrypted file is handed
+    to the uploader as soon as it is ready, in staging directory order.  Each
+    encrypted file is deleted as soon as its upload has been verified.  No new
+    file is encrypted while the encrypted files waiting in ``encryptedDir``
+    would exceed ``SCRATCH_SIZE``, so scratch space stays bounded no matter how
+    large the staging directory is.  If an upload fails while no space is free,
+    the space it holds will never be released, so the scratch space is aborted
+    and the failure is raised instead of waiting forever.
+
+    Args:
+       config: Config object
+       local: Local config object
+       client: S3Client for the bucket
+       stagingDir: Staging directory to use as source
+       encryptedDir: Scratch directory into which encrypted files should be written
+       prefix: S3 key prefix associated with the staging directory
+
+    Returns:
+        Dict mapping key to (size, etag) for each object uploaded
+    """
+    scratch = _ScratchSpace(SCRATCH_SIZE)
+    cleartexts = _listStagingDir(stagingDir, prefix)
+    with closing(_encryptFiles(config, local, stagingDir, encryptedDir, cleartexts, scratch)) as encrypted:
+        results = _uploadFiles(client, encrypted, prefix, scratch.release, scratch.abort)
+    logger.debug("Peak scratch space used while encrypting was %s.", displayBytes(scratch.peak))
+    logger.debug("Completed encrypting and uploading staging dir [%s] to [%s]", stagingDir, prefix)
+    return results
+
+
+##########################
+# _uploadFiles() function
+##########################
+
+
+def _uploadFiles(client, files, prefix, callback=None, failed=None):
+    """
+    Upload files to an S3 prefix, skipping unchanged objects and removing stale ones.
+    Args:
+       client: S3Client for the bucket
+       files: Iterable of (path, key) tuples to upload
+       prefix: S3 key prefix associated with the staging directory
+       callback: Function to call as ``callback(path, key, etag, checksum)`` once each file is finished
+       failed: Function to call as ``failed(exception)`` if an upload fails
+    Returns:
+        Dict mapping key to (size, etag) for each object uploaded
+    """
+    existing = client.listObjects(prefix)
+    uploader = S3Uploader(client)
+    results = uploader.uploadFiles(files, existing, callback, failed=failed)
+    _clearExistingBackup(client, prefix, existing, results)
+    statistics = uploader.statistics
+    increment("amazons3.objects", statistics.objectsUploaded)
+    increment("amazons3.bytes", statistics.bytesUploaded)
+    increment("amazons3.skipped", statistics.objectsSkipped)
+    logger.info(
+        "Uploaded %d objects (%s) in %.1f seconds at %s/s; skipped %d unchanged objects (%s).",
+        statistics.objectsUploaded,
+        displayBytes(statistics.bytesUploaded),
+        statistics.elapsed,
+        displayBytes(statistics.throughput),
+        statistics.objectsSkipped,
+        displayBytes(statistics.bytesSkipped),
+    )
+    return results
+
+
+#############################
+# _listStagingDir() function
+#############################
+
+
+def _listStagingDir(stagingDir, prefix):
+    """
+    List the files in a staging directory that should be uploaded, along with their S3 keys.
+    Args:
+       stagingDir: Staging directory to list
+       prefix: S3 key prefix associated with the staging directory
+    Returns:
+        List of (path, key) tuples, excluding indicator files
+    """
+    files = FilesystemList()
+    files.excludeBasenamePatterns = [r"cback\..*"]  # indicator files are not part of the backup
+    files.addDirContents(stagingDir)
+    return [(path, prefix + os.path.relpath(path, stagingDir)) for path in files if os.path.isfile(path)]
 
 
 ###########################
@@ -828,71 +967,173 @@ def _uploadStagingDir(config, stagingDir, s3BucketUrl):
 ###########################
 
 
-def _verifyUpload(config, stagingDir, s3BucketUrl):
+def _verifyUpload(client, prefix, results):
     """
     Verify that a staging directory was properly uploaded to the Amazon S3 cloud.
+
+    Each object was already verified against a checksum computed during the
+    upload, so all that remains is to confirm that the bucket listing agrees.
+
     Args:
-       config: Config object
-       stagingDir: Staging directory to verify
-       s3BucketUrl: S3 bucket URL associated with the staging directory
-    """
-    (bucket, prefix) = s3BucketUrl.replace("s3://", "").split("/", 1)
-    suCommand = resolveCommand(SU_COMMAND)
-    awsCommand = resolveCommand(AWS_COMMAND)
-    query = "Contents[].{Key: Key, Size: Size}"
-    actualCommand = "%s s3api list-objects --bucket %s --prefix %s --query '%s'" % (awsCommand[0], bucket, prefix, query)
-    (result, data) = executeCommand(suCommand, [config.options.backupUser, "-c", actualCommand], returnOutput=True)
-    if result != 0:
-        raise OSError("Error [%d] calling AWS CLI verify upload to [%s]." % (result, s3BucketUrl))
-    contents = {}
-    for entry in json.loads("".join(data)):
-        key = entry["Key"].replace(prefix, "")
-        size = int(entry["Size"])
-        contents[key] = size
-    files = FilesystemList()
-    files.excludeBasenamePatterns = [r"cback\..*"]  # because these are excluded from the upload
-    files.addDirContents(stagingDir)
-    for entry in files:
-        if os.path.isfile(entry):
-            key = entry.replace(stagingDir, "")
-            size = int(os.stat(entry).st_size)
-            if key not in contents:
-                raise OSError("File was apparently not uploaded: [%s]" % entry)
-            else:
-                if size != contents[key]:
-                    raise OSError("File size differs [%s], expected %s bytes but got %s bytes" % (entry, size, contents[key]))
-    logger.debug("Completed verifying upload from [%s] to [%s].", stagingDir, s3BucketUrl)
+       client: S3Client for the bucket
+       prefix: S3 key prefix associated with the staging directory
+       results: Dict mapping key to (size, etag) for each object uploaded
+    """
+    contents = client.listObjects(prefix)
+    for key, (size, etag) in results.items():
+        if key not in contents:
+            raise OSError("File was apparently not uploaded: [%s]" % key)
+        if contents[key] != (size, etag):
+            raise OSError("Object differs [%s], expected %s but got %s" % (key, (size, etag), contents[key]))
+    logger.debug("Completed verifying upload to [%s].", prefix)
 
 
-################################
-# _encryptStagingDir() function
-################################
+###########################
+# _encryptFiles() function
+###########################
 
 
-def _encryptStagingDir(config, local, stagingDir, encryptedDir):
+def _encryptFiles(config, local, stagingDir, encryptedDir, files, scratch):
     """
-    Encrypt a staging directory, creating a new directory in the process.
+    Encrypt files on a pool of workers, yielding each encrypted file as it becomes ready.
+
+    Files are yielded in the order they are listed.  Space for each encrypted
+    file is reserved before it is encrypted, using the cleartext size as an
+    estimate.  If there is no room, files that are already encrypted are yielded
+    to the uploader first, and if there are none of those either, this waits for
+    the uploader to release space.
+
     Args:
        config: Config object
+       local: Local config object
        stagingDir: Staging directory to use as source
        encryptedDir: Target directory into which encrypted files should be written
+       files: List of (path, key) tuples for the cleartext files
+       scratch: _ScratchSpace tracking the space used in the encrypted directory
+
+    Yields:
+        Tuple of (path, key) for each encrypted file
     """
-    suCommand = resolveCommand(SU_COMMAND)
-    files = FilesystemList()
-    files.addDirContents(stagingDir)
-    for cleartext in files:
-        if os.path.isfile(cleartext):
-            encrypted = "%s%s" % (encryptedDir, cleartext.replace(stagingDir, ""))
-            if int(os.stat(cleartext).st_size) == 0:
-                with open(encrypted, "a") as f:
-                    f.close()  # don't bother encrypting empty files
-            else:
-                actualCommand = local.amazons3.encryptCommand.replace("${input}", cleartext).replace("${output}", encrypted)
-                subdir = os.path.dirname(encrypted)
-                if not os.path.isdir(subdir):
-                    os.makedirs(subdir)
-                    changeOwnership(subdir, config.options.backupUser, config.options.backupGroup)
-                result = executeCommand(suCommand, [config.options.backupUser, "-c", actualCommand])[0]
-                if result != 0:
-                    raise OSError("Error [%d] encrypting [%s]." % (result, cleartext))
-    logger.debug("Completed encrypting staging directory [%s] into [%s]", stagingDir, encryptedDir)
+    with ThreadPoolExecutor(max_workers=ENCRYPT_WORKERS) as executor:
+        try:
+            yield from _submitEncryption(executor, config, local, stagingDir, encryptedDir, files, scratch)
+        except:
+            executor.shutdown(cancel_futures=True)
+            raise
+
+
+def _submitEncryption(executor, config, local, stagingDir, encryptedDir, files, scratch):
+    """
+    Submit files for encryption as space allows, yielding each encrypted file in order.
+    """
+    pending = deque()
+    for cleartext, key in files:
+        encrypted = pathJoin(encryptedDir, os.path.relpath(cleartext, stagingDir))
+        size = os.stat(cleartext).st_size
+        while not scratch.reserve(encrypted, size, wait=not pending):
+            yield pending.popleft().result()
+        subdir = os.path.dirname(encrypted)
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+            changeOwnership(subdir, config.options.backupUser, config.options.backupGroup)
+        pending.append(executor.submit(_encryptFile, config, local, cleartext, encrypted, key))
+        while pending and pending[0].done():
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+##########################
+# _encryptFile() function
+##########################
+
+
+def _encryptFile(config, local, cleartext, encrypted, key):
+    """
+    Encrypt a single file using the configured encrypt command, running as the backup user.
+    Args:
+       config: Config object
+       local: Local config object
+       cleartext: Path of the file to encrypt
+       encrypted: Path of the encrypted file to create
+       key: S3 key for the encrypted file
+    Returns:
+        Tuple of (encrypted, key)
+    """
+    if int(os.stat(cleartext).st_size) == 0:
+        with open(encrypted, "a") as f:
+            f.close()  # don't bother encrypting empty files
+    else:
+        suCommand = resolveCommand(SU_COMMAND)
+        actualCommand = local.amazons3.encryptCommand.replace("${input}", cleartext).replace("${output}", encrypted)
+        result = executeCommand(suCommand, [config.options.backupUser, "-c", actualCommand])[0]
+        if result != 0:
+            raise OSError("Error [%d] encrypting [%s]." % (result, cleartext))
+    return (encrypted, key)
+
+
+########################################################################
+# _ScratchSpace class definition
+########################################################################
+
+
+class _ScratchSpace:
+    """
+    Tracks the space used by encrypted files waiting to be uploaded.
+
+    A reservation is made for each file before it is encrypted, and is released
+    (and the file deleted) once its upload has been verified.  A single file
+    larger than the limit can still be reserved when nothing else is.
+
+    Once the upload has failed, space held by files that were not uploaded will
+    never be released, so the failure is passed to :any:`abort`, and any
+    reservation that is waiting, or made afterwards, raises it.  Waits also time
+    out every ``SCRATCH_WAIT`` seconds to check the abort flag again.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.aborted = None
+        self._sizes = {}
+        self._condition = threading.Condition()
+
+    def reserve(self, path, size, wait=False):
+        """
+        Reserve space for a file, returning False if there is no room and not waiting.
+
+        Raises:
+           Exception: The failure passed to :any:`abort`, if the upload has failed
+        """
+        with self._condition:
+            while self.used > 0 and self.used + size > self.limit:
+                if self.aborted is not None:
+                    raise self.aborted
+                if not wait:
+                    return False
+                self._condition.wait(SCRATCH_WAIT)
+            if self.aborted is not None:
+                raise self.aborted
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            self._sizes[path] = size
+            return True
+
+    def release(self, path, key, etag, checksum):  # noqa: ARG002
+        """
+        Delete an encrypted file whose upload has been verified, releasing its space.
+        """
+        os.remove(path)
+        with self._condition:
+            self.used -= self._sizes.pop(path)
+            self._condition.notify_all()
+
+    def abort(self, exception):
+        """
+        Record that the upload has failed, waking up any reservation that is waiting.
+        """
+        with self._condition:
+            if self.aborted is None:
+                self.aborted = exception
+            self._condition.notify_all()
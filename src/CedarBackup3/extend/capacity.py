@@ -55,7 +55,7 @@
 from CedarBackup3.actions.util import checkMediaState, createWriter
 from CedarBackup3.config import ByteQuantity, addByteQuantityNode, readByteQuantity
 from CedarBackup3.util import displayBytes
-from CedarBackup3.xmlutil import addContainerNode, addStringNode, createInputDom, readFirstChild, readString
+from CedarBackup3.xmlutil import addContainerNode, addStringNode, createInputDom, readFirstChild, readInputDom, readString
 
 ########################################################################
 # Module-wide constants and variables
@@ -357,9 +357,8 @@ def __init__(self, xmlData=None, xmlPath=None, validate=True):
             if validate:
                 self.validate()
         elif xmlPath is not None:
-            with open(xmlPath) as f:
-                xmlData = f.read()
-            self._parseXmlData(xmlData)
+            (_, parentNode) = readInputDom(xmlPath)
+            self._parseParentNode(parentNode)
             if validate:
                 self.validate()
 
@@ -476,6 +475,21 @@ def _parseXmlData(self, xmlData):
            ValueError: If the XML cannot be successfully parsed
         """
         (_, parentNode) = createInputDom(xmlData)
+        self._parseParentNode(parentNode)
+
+    def _parseParentNode(self, parentNode):
+        """
+        Internal method to parse a DOM tree into the object.
+
+        This method calls a static method to parse the capacity configuration
+        section.  It is used both for XML data and for a document read via
+        :any:`readInputDom`, which may be shared with other callers.
+
+        Args:
+           parentNode: Parent node of the parsed document
+        Raises:
+           ValueError: If the XML cannot be successfully parsed
+        """
         self._capacity = LocalConfig._parseCapacity(parentNode)
 
     @staticmethod
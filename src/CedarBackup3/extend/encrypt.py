@@ -60,8 +60,9 @@
 from functools import total_ordering
 
 from CedarBackup3.actions.util import findDailyDirs, getBackupFiles, writeIndicatorFile
+from CedarBackup3.metrics import increment
 from CedarBackup3.util import changeOwnership, executeCommand, resolveCommand
-from CedarBackup3.xmlutil import addContainerNode, addStringNode, createInputDom, readFirstChild, readString
+from CedarBackup3.xmlutil import addContainerNode, addStringNode, createInputDom, readFirstChild, readInputDom, readString
 
 ########################################################################
 # Module-wide constants and variables
@@ -76,6 +77,7 @@
     "gpg",
 ]
 ENCRYPT_INDICATOR = "cback.encrypt"
+ENCRYPTED_RECORD = "cback.encrypted"  # files in a daily directory that were already encrypted by the split extension
 
 
 ########################################################################
@@ -257,9 +259,8 @@ def __init__(self, xmlData=None, xmlPath=None, validate=True):
             if validate:
                 self.validate()
         elif xmlPath is not None:
-            with open(xmlPath) as f:
-                xmlData = f.read()
-            self._parseXmlData(xmlData)
+            (_, parentNode) = readInputDom(xmlPath)
+            self._parseParentNode(parentNode)
             if validate:
                 self.validate()
 
@@ -378,6 +379,21 @@ def _parseXmlData(self, xmlData):
            ValueError: If the XML cannot be successfully parsed
         """
         (_, parentNode) = createInputDom(xmlData)
+        self._parseParentNode(parentNode)
+
+    def _parseParentNode(self, parentNode):
+        """
+        Internal method to parse a DOM tree into the object.
+
+        This method calls a static method to parse the encrypt configuration
+        section.  It is used both for XML data and for a document read via
+        :any:`readInputDom`, which may be shared with other callers.
+
+        Args:
+           parentNode: Parent node of the parsed document
+        Raises:
+           ValueError: If the XML cannot be successfully parsed
+        """
         self._encrypt = LocalConfig._parseEncrypt(parentNode)
 
     @staticmethod
@@ -445,6 +461,33 @@ def executeAction(configPath, options, config):  # noqa: ARG001
     logger.info("Executed the encrypt extended action successfully.")
 
 
+##################################
+# recordEncryptedFiles() function
+##################################
+
+
+def recordEncryptedFiles(dailyDir, paths, backupUser, backupGroup):
+    """
+    Records files in a daily staging directory that have already been encrypted.
+
+    The split extension calls this for chunks that it encrypts as it splits
+    them, so that :any:`_encryptDailyDir` doesn't encrypt them again.  The
+    record is a text file (``cback.encrypted``) in the daily directory, with
+    one path per line relative to the daily directory.  Its name matches the
+    indicator file pattern, so it is never treated as a backup file itself.
+
+    Args:
+       dailyDir: Daily staging directory the files are in
+       paths: List of absolute paths of encrypted files
+       backupUser: User that the record should be owned by
+       backupGroup: Group that the record should be owned by
+    """
+    recordPath = os.path.join(dailyDir, ENCRYPTED_RECORD)
+    with open(recordPath, "a", encoding="utf-8", errors="surrogateescape") as f:
+        f.writelines("%s\n" % os.path.relpath(path, dailyDir) for path in paths)
+    changeOwnership(recordPath, backupUser, backupGroup)
+
+
 ##############################
 # _encryptDailyDir() function
 ##############################
@@ -454,8 +497,11 @@ def _encryptDailyDir(dailyDir, encryptMode, encryptTarget, backupUser, backupGro
     """
     Encrypts the contents of a daily staging directory.
 
-    Indicator files are ignored.  All other files are encrypted.  The only valid
-    encrypt mode is ``"gpg"``.
+    Indicator files are ignored, as are files that the split extension
+    recorded as already encrypted, when it is configured to encrypt chunks
+    (see :any:`recordEncryptedFiles`).  All other files are encrypted, even if
+    their names already end in ``.gpg``.  The only valid encrypt mode is
+    ``"gpg"``.
 
     Args:
        dailyDir: Daily directory to encrypt
@@ -469,12 +515,36 @@ def _encryptDailyDir(dailyDir, encryptMode, encryptTarget, backupUser, backupGro
        ValueError: If the daily staging directory does not exist
     """
     logger.debug("Begin encrypting contents of [%s].", dailyDir)
-    fileList = getBackupFiles(dailyDir)  # ignores indicator files
+    fileList = getBackupFiles(dailyDir)  # ignores indicator files, including the record of encrypted files
+    encrypted = _readEncryptedRecord(dailyDir)
     for path in fileList:
+        if path in encrypted:
+            logger.debug("Skipping already-encrypted file [%s].", path)
+            continue
         _encryptFile(path, encryptMode, encryptTarget, backupUser, backupGroup, removeSource=True)
     logger.debug("Completed encrypting contents of [%s].", dailyDir)
 
 
+##################################
+# _readEncryptedRecord() function
+##################################
+
+
+def _readEncryptedRecord(dailyDir):
+    """
+    Reads the record of already-encrypted files written by :any:`recordEncryptedFiles`.
+    Args:
+       dailyDir: Daily staging directory to read the record from
+    Returns:
+        Set of absolute paths of encrypted files, empty if there is no record
+    """
+    recordPath = os.path.join(dailyDir, ENCRYPTED_RECORD)
+    if not os.path.exists(recordPath):
+        return set()
+    with open(recordPath, encoding="utf-8", errors="surrogateescape") as f:
+        return {os.path.join(dailyDir, line.rstrip("\n")) for line in f if line.strip()}
+
+
 ##########################
 # _encryptFile() function
 ##########################
@@ -511,6 +581,8 @@ def _encryptFile(sourcePath, encryptMode, encryptTarget, backupUser, backupGroup
         encryptedPath = _encryptFileWithGpg(sourcePath, recipient=encryptTarget)
     else:
         raise ValueError("Unknown encrypt mode [%s]" % encryptMode)
+    increment("encrypt.files")
+    increment("encrypt.bytes", os.path.getsize(sourcePath))
     changeOwnership(encryptedPath, backupUser, backupGroup)
     if removeSource:
         if os.path.exists(sourcePath):
@@ -65,14 +65,29 @@
    Backup command line.  Individual mbox files or directories containing mbox
    files can be backed up using the same collect modes allowed for filesystems in
    the standard Cedar Backup collect action: weekly, daily, incremental.  It
-   implements the "smart" incremental backup process discussed above, using
-   functionality provided by the ``grepmail`` utility.
+   implements the "smart" incremental backup process discussed above, using an
+   in-process extraction engine that selects messages the same way that the
+   ``grepmail`` utility historically did (``grepmail -a -u -d "since ..."``).
 
    This extension requires a new configuration section <mbox> and is intended to
    be run either immediately before or immediately after the standard collect
    action.  Aside from its own configuration, it requires the options and collect
    configuration sections in the standard Cedar Backup configuration file.
 
+Incremental extraction
+======================
+
+   Most mailboxes are only ever appended to.  So, in addition to the revision
+   date, the extension keeps a small index for each mailbox in the working
+   directory.  The index records the size of the mailbox as of the last
+   backup, along with the device, inode, offset of the last ``From`` line, and
+   digests of the beginning and end of the backed-up content.  If all of this
+   still matches on the next incremental run, the mailbox has only been
+   appended to, so the extension seeks directly to the old end of the file and
+   extracts only the new tail.  Otherwise (the mailbox was rewritten,
+   truncated, or replaced), the extension falls back to a full scan, selecting
+   messages by received date just like ``grepmail`` did.
+
    The mbox action is conceptually similar to the standard collect action,
    except that mbox directories are not collected recursively.  This implies
    some configuration changes (i.e. there's no need for global exclusions or an
@@ -88,17 +103,23 @@
 ########################################################################
 
 import datetime
+import hashlib
 import logging
 import os
 import pickle  # noqa: S403 # we operate on trusted data, so pickle is ok
 import posixpath
+import tarfile
 import tempfile
+import time
 from bz2 import BZ2File
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
 from functools import total_ordering
 from gzip import GzipFile
 
 from CedarBackup3.config import VALID_COLLECT_MODES, VALID_COMPRESS_MODES
-from CedarBackup3.filesystem import BackupFileList, FilesystemList
+from CedarBackup3.filesystem import FilesystemList
 from CedarBackup3.util import (
     ObjectTypeList,
     RegexList,
@@ -106,10 +127,8 @@
     buildNormalizedPath,
     changeOwnership,
     encodePath,
-    executeCommand,
     isStartOfWeek,
     pathJoin,
-    resolveCommand,
 )
 from CedarBackup3.xmlutil import (
     addContainerNode,
@@ -118,6 +137,7 @@
     isElement,
     readChildren,
     readFirstChild,
+    readInputDom,
     readString,
     readStringList,
 )
@@ -128,8 +148,18 @@
 
 logger = logging.getLogger("CedarBackup3.log.extend.mbox")
 
-GREPMAIL_COMMAND = ["grepmail"]
 REVISION_PATH_EXTENSION = "mboxlast"
+INDEX_PATH_EXTENSION = "mboxindex"
+
+READ_BUFFER_SIZE = 1024 * 1024  # 1 MB buffered reads when scanning a mailbox
+PREFIX_DIGEST_SIZE = 64 * 1024  # bytes at the start of a mailbox used to detect a rewrite
+TAIL_DIGEST_SIZE = 4 * 1024  # bytes before the old end of a mailbox used to detect a rewrite
+INDEX_ENTRY_KEYS = ["device", "inode", "size", "lastFrom", "prefixDigest", "tailDigest"]
+
+MAX_WORKERS = min(8, os.cpu_count() or 1)  # worker threads used to extract mailboxes in a directory
+MAX_PENDING = 2 * MAX_WORKERS  # extracted mailboxes allowed to wait for the tarfile at once
+SPOOL_MEMORY_SIZE = 8 * 1024 * 1024  # extracted mailboxes larger than this spill to the working directory
+TAR_MODES = {"tar": "w:", "targz": "w:gz", "tarbz2": "w:bz2"}
 
 
 ########################################################################
@@ -762,9 +792,8 @@ def __init__(self, xmlData=None, xmlPath=None, validate=True):
             if validate:
                 self.validate()
         elif xmlPath is not None:
-            with open(xmlPath) as f:
-                xmlData = f.read()
-            self._parseXmlData(xmlData)
+            (_, parentNode) = readInputDom(xmlPath)
+            self._parseParentNode(parentNode)
             if validate:
                 self.validate()
 
@@ -919,6 +948,21 @@ def _parseXmlData(self, xmlData):
            ValueError: If the XML cannot be successfully parsed
         """
         (_, parentNode) = createInputDom(xmlData)
+        self._parseParentNode(parentNode)
+
+    def _parseParentNode(self, parentNode):
+        """
+        Internal method to parse a DOM tree into the object.
+
+        This method calls a static method to parse the mbox configuration section.
+        It is used both for XML data and for a document read via
+        :any:`readInputDom`, which may be shared with other callers.
+
+        Args:
+           parentNode: Parent node of the parsed document
+        Raises:
+           ValueError: If the XML cannot be successfully parsed
+        """
         self._mbox = LocalConfig._parseMbox(parentNode)
 
     @staticmethod
@@ -1163,19 +1207,24 @@ def executeAction(configPath, options, config):
             collectMode = _getCollectMode(local, mboxFile)
             compressMode = _getCompressMode(local, mboxFile)
             lastRevision = _loadLastRevision(config, mboxFile, fullBackup, collectMode)
+            index = _loadMboxIndex(config, mboxFile, fullBackup, collectMode)
             if fullBackup or (collectMode in ["daily", "incr"]) or (collectMode == "weekly" and todayIsStart):
                 logger.debug("Mbox file meets criteria to be backed up today.")
-                _backupMboxFile(config, mboxFile.absolutePath, fullBackup, collectMode, compressMode, lastRevision, newRevision)
+                _backupMboxFile(
+                    config, mboxFile.absolutePath, fullBackup, collectMode, compressMode, lastRevision, newRevision, index=index
+                )
             else:
                 logger.debug("Mbox file will not be backed up, per collect mode.")
             if collectMode == "incr":
                 _writeNewRevision(config, mboxFile, newRevision)
+                _writeMboxIndex(config, mboxFile, index)
     if local.mbox.mboxDirs is not None:
         for mboxDir in local.mbox.mboxDirs:
             logger.debug("Working with mbox directory [%s]", mboxDir.absolutePath)
             collectMode = _getCollectMode(local, mboxDir)
             compressMode = _getCompressMode(local, mboxDir)
             lastRevision = _loadLastRevision(config, mboxDir, fullBackup, collectMode)
+            index = _loadMboxIndex(config, mboxDir, fullBackup, collectMode)
             (excludePaths, excludePatterns) = _getExclusions(mboxDir)
             if fullBackup or (collectMode in ["daily", "incr"]) or (collectMode == "weekly" and todayIsStart):
                 logger.debug("Mbox directory meets criteria to be backed up today.")
@@ -1189,11 +1238,13 @@ def executeAction(configPath, options, config):
                     newRevision,
                     excludePaths,
                     excludePatterns,
+                    index=index,
                 )
             else:
                 logger.debug("Mbox directory will not be backed up, per collect mode.")
             if collectMode == "incr":
                 _writeNewRevision(config, mboxDir, newRevision)
+                _writeMboxIndex(config, mboxDir, index)
     logger.info("Executed the mbox extended action successfully.")
 
 
@@ -1449,10 +1500,417 @@ def _getOutputFile(backupPath, compressMode):
         return open(backupPath, "wb")
 
 
-def _backupMboxFile(config, absolutePath, fullBackup, collectMode, compressMode, lastRevision, newRevision, targetDir=None):
+def _getIndexPath(config, item):
+    """
+    Gets the path to the extraction index file associated with an mbox file or directory.
+    Args:
+       config: Cedar Backup configuration
+       item: Mbox file or directory
+    Returns:
+        Absolute path to the index file associated with the item
+    """
+    normalized = buildNormalizedPath(item.absolutePath)
+    filename = "%s.%s" % (normalized, INDEX_PATH_EXTENSION)
+    indexPath = pathJoin(config.options.workingDir, filename)
+    logger.debug("Index file path is [%s]", indexPath)
+    return indexPath
+
+
+def _loadMboxIndex(config, item, fullBackup, collectMode):
+    """
+    Loads the extraction index for this item from disk and returns it.
+
+    The index is a dictionary mapping the absolute path of each mailbox to an
+    index entry, as returned by :any:`_buildIndexEntry`.  If this is a full
+    backup, if the item is not collected incrementally, or if the index cannot
+    be loaded for some reason, then an empty dictionary is returned.  This
+    means that every mailbox will be fully scanned.
+
+    Args:
+       config: Cedar Backup configuration
+       item: Mbox file or directory
+       fullBackup: Indicates whether this is a full backup
+       collectMode: Indicates the collect mode for this item
+
+    Returns:
+        Dictionary mapping mailbox path to index entry
+    """
+    index = {}
+    if fullBackup or collectMode != "incr":
+        logger.debug("Index file ignored for full or non-incremental backup.")
+    else:
+        indexPath = _getIndexPath(config, item)
+        if not os.path.isfile(indexPath):
+            logger.debug("Index file [%s] does not exist on disk.", indexPath)
+        else:
+            try:
+                with open(indexPath, "rb") as f:
+                    index = pickle.load(f, fix_imports=True)  # noqa: S301 # this is trusted data, so pickle is ok
+                logger.debug("Loaded index file [%s] from disk with %d entries.", indexPath, len(index))
+            except Exception as e:
+                index = {}
+                logger.error("Failed loading index file [%s] from disk: %s", indexPath, e)
+    return index
+
+
+def _writeMboxIndex(config, item, index):
+    """
+    Writes the extraction index for an item to disk.
+
+    If we can't write the index file successfully for any reason, we'll log the
+    condition but won't throw an exception.  The next run will just fall back
+    to a full scan.
+
+    Args:
+       config: Cedar Backup configuration
+       item: Mbox file or directory
+       index: Dictionary mapping mailbox path to index entry
+    """
+    indexPath = _getIndexPath(config, item)
+    try:
+        with open(indexPath, "wb") as f:
+            pickle.dump(index, f, 0, fix_imports=True)  # be compatible with Python 2
+        changeOwnership(indexPath, config.options.backupUser, config.options.backupGroup)
+        logger.debug("Wrote index file [%s] to disk with %d entries.", indexPath, len(index))
+    except Exception as e:
+        logger.error("Failed to write index file [%s] to disk: %s", indexPath, e)
+
+
+def _digestRange(fd, start, end):
+    """
+    Computes the SHA-1 digest of a range of bytes in an open file.
+    Args:
+       fd: Open file descriptor
+       start: Offset of the first byte in the range
+       end: Offset just past the last byte in the range
+    Returns:
+        Hex digest of the bytes in the range
+    """
+    digest = hashlib.sha1()  # noqa: S324 # only used to detect changes, not for security
+    offset = start
+    while offset < end:
+        data = os.pread(fd, min(READ_BUFFER_SIZE, end - offset), offset)
+        if not data:
+            break
+        digest.update(data)
+        offset += len(data)
+    return digest.hexdigest()
+
+
+def _buildIndexEntry(fd, stat, size, lastFrom):
+    """
+    Builds an index entry describing the content of a mailbox that was backed up.
+
+    The entry is a plain dictionary (rather than an object) so that the pickled
+    index remains readable even if this module changes.
+
+    Args:
+       fd: Open file descriptor for the mailbox
+       stat: Result of ``os.fstat()`` for the mailbox
+       size: Number of bytes in the mailbox that have been backed up
+       lastFrom: Offset of the last ``From`` line at or before ``size``, or ``None``
+
+    Returns:
+        Index entry as a dictionary
+    """
+    return {
+        "device": stat.st_dev,
+        "inode": stat.st_ino,
+        "size": size,
+        "lastFrom": lastFrom,
+        "prefixDigest": _digestRange(fd, 0, min(size, PREFIX_DIGEST_SIZE)),
+        "tailDigest": _digestRange(fd, max(0, size - TAIL_DIGEST_SIZE), size),
+    }
+
+
+def _getResumeOffset(fd, stat, entry):
+    """
+    Gets the offset at which extraction can resume for an append-only mailbox.
+
+    The mailbox is considered to have only been appended to if it is the same
+    file (device and inode) as last time, has not shrunk, still has a ``From``
+    line at the recorded offset, and still has the same content at the start
+    of the file and just before the old end of the file.
+
+    The last backup might have ended partway through a message that was still
+    being delivered.  If the appended content doesn't start a new message,
+    extraction resumes from the start of the last message instead, so that
+    the whole message is backed up again rather than losing the rest of it.
+
+    Args:
+       fd: Open file descriptor for the mailbox
+       stat: Result of ``os.fstat()`` for the mailbox
+       entry: Index entry from the last backup, or ``None``
+
+    Returns:
+        Offset to resume extraction from, or ``None`` if a full scan is required
+    """
+    if not isinstance(entry, dict) or any(key not in entry for key in INDEX_ENTRY_KEYS):
+        return None
+    size = entry["size"]
+    if entry["device"] != stat.st_dev or entry["inode"] != stat.st_ino:
+        logger.debug("Mailbox was replaced since the last backup.")
+        return None
+    if stat.st_size < size:
+        logger.debug("Mailbox was truncated since the last backup.")
+        return None
+    if entry["lastFrom"] is not None and os.pread(fd, 5, entry["lastFrom"]) != b"From ":
+        logger.debug("Mailbox no longer has a message boundary at offset %d.", entry["lastFrom"])
+        return None
+    if entry["prefixDigest"] != _digestRange(fd, 0, min(size, PREFIX_DIGEST_SIZE)):
+        logger.debug("Mailbox prefix was rewritten since the last backup.")
+        return None
+    if entry["tailDigest"] != _digestRange(fd, max(0, size - TAIL_DIGEST_SIZE), size):
+        logger.debug("Mailbox content was rewritten since the last backup.")
+        return None
+    if entry["lastFrom"] is not None and stat.st_size > size and not _isMessageStart(fd, size):
+        logger.debug("Last backup ended partway through the message at offset %d.", entry["lastFrom"])
+        return entry["lastFrom"]
+    return size
+
+
+def _isMessageStart(fd, offset):
+    """
+    Indicates whether a message starts at an offset in a mailbox.
+    A message starts with a ``From`` line at the start of the file or just after a blank line.
+    Args:
+       fd: Open file descriptor for the mailbox
+       offset: Offset to check
+    Returns:
+        Boolean true if a message starts at the offset
+    """
+    if os.pread(fd, 5, offset) != b"From ":
+        return False
+    if offset == 0:
+        return True
+    previous = os.pread(fd, min(offset, 3), max(0, offset - 3))
+    return previous.endswith((b"\n\n", b"\n\r\n")) or previous in (b"\n", b"\r\n")
+
+
+def _parseMessageDate(value):
+    """
+    Parses an RFC 2822 date into a POSIX timestamp.
+    Args:
+       value: Date string
+    Returns:
+        Timestamp as a float, or ``None`` if the date cannot be parsed
+    """
+    try:
+        return parsedate_to_datetime(value.strip()).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _parseFromLineDate(line):
+    """
+    Parses the envelope date from an mbox ``From`` line into a POSIX timestamp.
+    Args:
+       line: ``From`` line as bytes, like ``From user@example.com Sat Jun 24 12:00:00 2006``
+    Returns:
+        Timestamp as a float, or ``None`` if the date cannot be parsed
+    """
+    try:
+        fields = line.decode("latin-1").split()
+        return datetime.datetime.strptime(" ".join(fields[-5:]), "%a %b %d %H:%M:%S %Y").timestamp()
+    except (ValueError, IndexError, OverflowError):
+        return None
+
+
+def _parseHeaders(lines):
+    """
+    Parses the headers that matter for message selection out of a message header block.
+
+    Folded (continuation) lines are unfolded.  Only the ``Received``, ``Date``
+    and ``Message-ID`` headers are returned.
+
+    Args:
+       lines: Header lines as bytes, including the ``From`` line
+
+    Returns:
+        Dictionary mapping lowercase header name to list of string values
+    """
+    headers = {"received": [], "date": [], "message-id": []}
+    current = None
+    for line in lines[1:]:
+        text = line.decode("latin-1").rstrip("\r\n")
+        if not text:
+            break
+        if text[0] in " \t":
+            if current is not None:
+                current[-1] += " " + text.strip()
+            continue
+        name, _, value = text.partition(":")
+        current = headers.get(name.strip().lower())
+        if current is not None:
+            current.append(value.strip())
+    return headers
+
+
+def _getMessageDate(lines):
+    """
+    Gets the date that is used to decide whether a message is new.
+
+    Like ``grepmail -a``, this prefers the received date, which is taken from
+    the most recent (first) ``Received`` header.  If there is no usable received
+    date, the ``Date`` header is used, and then the envelope date on the
+    ``From`` line.
+
+    Args:
+       lines: Header lines as bytes, including the ``From`` line
+
+    Returns:
+        Timestamp as a float, or ``None`` if no date could be found
+    """
+    headers = _parseHeaders(lines)
+    for received in headers["received"]:
+        if ";" in received:
+            timestamp = _parseMessageDate(received.rpartition(";")[2])
+            if timestamp is not None:
+                return timestamp
+    for date in headers["date"]:
+        timestamp = _parseMessageDate(date)
+        if timestamp is not None:
+            return timestamp
+    return _parseFromLineDate(lines[0])
+
+
+def _getMessageKey(lines):
+    """
+    Gets the key used to identify duplicate messages, like ``grepmail -u``.
+    Args:
+       lines: Header lines as bytes, including the ``From`` line
+    Returns:
+        Message id if the message has one, otherwise a digest of the header block
+    """
+    headers = _parseHeaders(lines)
+    if headers["message-id"]:
+        return headers["message-id"][0]
+    return hashlib.sha1(b"".join(lines[1:])).hexdigest()  # noqa: S324 # only used to detect duplicates
+
+
+def _extractMessages(fd, outputFile, since=None, startOffset=0, endOffset=None):
+    """
+    Extracts messages from an mbox file, writing them to an output file.
+
+    A message starts with a line beginning with ``From `` that is either at the
+    start of the scanned range or immediately follows a blank line.  Anything
+    before the first message is ignored.  Duplicate messages (by message id)
+    are written only once.  If ``since`` is set, only messages with a date on or
+    after that time are written.  Messages with no determinable date are always
+    written, since it's safer to back up too much than too little.
+
+    Content past ``endOffset`` (which might be a message being delivered while
+    we scan) is left for the next run.
+
+    Args:
+       fd: Open file descriptor for the mailbox
+       outputFile: File-like object opened in binary mode to write messages to
+       since: Only extract messages on or after this timestamp, or ``None`` for all messages
+       startOffset: Offset to start scanning from
+       endOffset: Offset to stop scanning at, or ``None`` for the current end of file
+
+    Returns:
+        Tuple of (messages written, offset of last ``From`` line or ``None``, offset where scanning stopped)
+    """
+    if endOffset is None:
+        endOffset = os.fstat(fd).st_size
+    written = 0
+    lastFrom = None
+    offset = startOffset
+    seen = set()
+    header = None  # header lines for the message being parsed, until it is selected or skipped
+    selected = False
+    previousBlank = True
+
+    def _finishHeader():
+        nonlocal written
+        if since is not None:
+            timestamp = _getMessageDate(header)
+            if timestamp is not None and timestamp < since:
+                return False
+        key = _getMessageKey(header)
+        if key in seen:
+            return False
+        seen.add(key)
+        outputFile.writelines(header)
+        written += 1
+        return True
+
+    with os.fdopen(os.dup(fd), "rb", buffering=READ_BUFFER_SIZE) as f:
+        f.seek(startOffset)
+        for line in f:
+            if offset + len(line) > endOffset:
+                break  # content appended while we were scanning is left for the next run
+            if previousBlank and line.startswith(b"From "):
+                if header is not None:
+                    _finishHeader()
+                header = [line]
+                selected = False
+                lastFrom = offset
+            elif header is not None:
+                header.append(line)
+                if line in (b"\n", b"\r\n"):
+                    selected = _finishHeader()
+                    header = None
+            elif selected:
+                outputFile.write(line)
+            previousBlank = line in (b"\n", b"\r\n")
+            offset += len(line)
+    if header is not None:
+        _finishHeader()
+    return (written, lastFrom, offset)
+
+
+def _extractMailbox(absolutePath, outputFile, incremental, lastRevision, entry):
+    """
+    Extracts the messages that should be backed up from a single mailbox.
+
+    For an incremental backup, the index entry from the last backup (if any)
+    is used to locate the new tail of a mailbox that has only been appended to.
+    Otherwise, the whole mailbox is scanned, and for an incremental backup only
+    messages since the last revision are extracted.
+
+    Args:
+       absolutePath: Path to mbox file to extract from
+       outputFile: File-like object opened in binary mode to write messages to
+       incremental: Indicates whether this is an incremental backup
+       lastRevision: Date of last backup as datetime.datetime
+       entry: Index entry from the last backup, or ``None``
+
+    Returns:
+        Tuple of (messages written, new index entry, ``os.stat_result`` for the mailbox)
+
+    Raises:
+       IOError: If there is a problem reading the mbox file
+    """
+    fd = os.open(absolutePath, os.O_RDONLY)
+    try:
+        stat = os.fstat(fd)
+        resumeOffset = _getResumeOffset(fd, stat, entry) if incremental else None
+        if resumeOffset is not None:
+            logger.debug("Extracting messages appended to [%s] after offset %d.", absolutePath, resumeOffset)
+            (written, lastFrom, endOffset) = _extractMessages(fd, outputFile, startOffset=resumeOffset, endOffset=stat.st_size)
+            if lastFrom is None:
+                lastFrom = entry["lastFrom"]
+        else:
+            since = lastRevision.timestamp() if incremental else None
+            logger.debug("Scanning all of [%s] for messages since [%s].", absolutePath, lastRevision if incremental else None)
+            (written, lastFrom, endOffset) = _extractMessages(fd, outputFile, since=since, endOffset=stat.st_size)
+        return (written, _buildIndexEntry(fd, stat, endOffset, lastFrom), stat)
+    finally:
+        os.close(fd)
+
+
+def _backupMboxFile(
+    config, absolutePath, fullBackup, collectMode, compressMode, lastRevision, newRevision, targetDir=None, index=None
+):
     """
     Backs up an individual mbox file.
 
+    If an index is passed in, it is used to locate the new tail of a mailbox
+    that has only been appended to since the last backup, and it is updated in
+    place to describe the content that was backed up this time.
+
     Args:
        config: Cedar Backup configuration
        absolutePath: Path to mbox file to back up
@@ -1462,32 +1920,146 @@ def _backupMboxFile(config, absolutePath, fullBackup, collectMode, compressMode,
        lastRevision: Date of last backup as datetime.datetime
        newRevision: Date of new (current) backup as datetime.datetime
        targetDir: Target directory to write the backed-up file into
+       index: Dictionary mapping mailbox path to index entry, or ``None``
 
     Raises:
        ValueError: If some value is missing or invalid
        IOError: If there is a problem backing up the mbox file
     """
-    if fullBackup or collectMode != "incr" or lastRevision is None:
-        args = ["-a", "-u", absolutePath]  # remove duplicates but fetch entire mailbox
-    else:
-        revisionDate = lastRevision.strftime("%Y-%m-%dT%H:%M:%S")  # ISO-8601 format; grepmail calls Date::Parse::str2time()
-        args = ["-a", "-u", "-d", "since %s" % revisionDate, absolutePath]
-    command = resolveCommand(GREPMAIL_COMMAND)
+    incremental = not fullBackup and collectMode == "incr" and lastRevision is not None
+    entry = index.get(absolutePath) if index is not None else None
     backupPath = _getBackupPath(config, absolutePath, compressMode, newRevision, targetDir=targetDir)
     with _getOutputFile(backupPath, compressMode) as outputFile:
-        result = executeCommand(command, args, returnOutput=False, ignoreStderr=True, doNotLog=True, outputFile=outputFile)[0]
-        if result != 0:
-            raise OSError("Error [%d] executing grepmail on [%s]." % (result, absolutePath))
-    logger.debug("Completed backing up mailbox [%s].", absolutePath)
+        (written, entry, _) = _extractMailbox(absolutePath, outputFile, incremental, lastRevision, entry)
+    if index is not None:
+        index[absolutePath] = entry
+    logger.debug("Completed backing up mailbox [%s]: %d messages.", absolutePath, written)
     return backupPath
 
 
+def _spoolMailbox(workingDir, absolutePath, incremental, lastRevision, entry):
+    """
+    Extracts the messages to be backed up from a mailbox into a spool file.
+
+    This is run by the worker threads in :any:`_backupMboxDir`.  Small results
+    stay in memory, and larger ones spill to an anonymous temporary file in the
+    working directory, which goes away as soon as the spool is closed.
+
+    Args:
+       workingDir: Working directory that large spool files are created in
+       absolutePath: Path to mbox file to extract from
+       incremental: Indicates whether this is an incremental backup
+       lastRevision: Date of last backup as datetime.datetime
+       entry: Index entry from the last backup, or ``None``
+
+    Returns:
+        Tuple of (spool file positioned at the start, size of spooled data, new index entry, mailbox stat)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_SIZE, dir=workingDir)
+    try:
+        (written, entry, stat) = _extractMailbox(absolutePath, spool, incremental, lastRevision, entry)
+        size = spool.tell()
+        spool.seek(0)
+        logger.debug("Extracted %d messages (%d bytes) from mailbox [%s].", written, size, absolutePath)
+        return (spool, size, entry, stat)
+    except:
+        spool.close()
+        raise
+
+
+def _streamMailboxes(tar, workingDir, mboxList, incremental, lastRevision, index):
+    """
+    Extracts a list of mailboxes on a pool of worker threads, streaming the results into a tarfile.
+
+    Results are added to the tarfile in list order.  Each tar entry gets the
+    permissions and ownership of the mailbox it was extracted from.
+
+    A mailbox that can't be read is logged and left out of the tarfile, just
+    like :any:`BackupFileList.generateTarfile` does with ``ignore=True``.  Its
+    old index entry (if any) is kept, so the next backup picks up where the
+    last successful one left off.
+
+    Args:
+       tar: Tarfile opened for writing
+       workingDir: Working directory that large spool files are created in
+       mboxList: List of absolute paths to mailboxes
+       incremental: Indicates whether this is an incremental backup
+       lastRevision: Date of last backup as datetime.datetime
+       index: Dictionary mapping mailbox path to index entry, or ``None``
+
+    Returns:
+        Dictionary mapping mailbox path to new index entry
+
+    Raises:
+       IOError: If there is a problem writing the tarfile
+    """
+    entries = {}
+    pending = deque()
+    items = iter(mboxList)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        try:
+            while True:
+                while len(pending) < MAX_PENDING:  # bound the number of spool files in existence at once
+                    item = next(items, None)
+                    if item is None:
+                        break
+                    entry = index.get(item) if index is not None else None
+                    future = executor.submit(_spoolMailbox, workingDir, item, incremental, lastRevision, entry)
+                    pending.append((item, entry, future))
+                if not pending:
+                    break
+                (item, entry, future) = pending.popleft()
+                try:
+                    (spool, size, entries[item], stat) = future.result()
+                except OSError:
+                    logger.info("Unable to add file [%s]; going on anyway.", item)
+                    if entry is not None:
+                        entries[item] = entry
+                    continue
+                with spool:
+                    tarinfo = tarfile.TarInfo(os.path.basename(item))
+                    tarinfo.size = size
+                    tarinfo.mtime = int(time.time())
+                    tarinfo.mode = stat.st_mode & 0o7777
+                    tarinfo.uid = stat.st_uid
+                    tarinfo.gid = stat.st_gid
+                    tar.addfile(tarinfo, spool)
+        finally:
+            for _, _, future in pending:
+                if not future.cancel():
+                    try:
+                        future.result()[0].close()
+                    except:
+                        pass
+    return entries
+
+
 def _backupMboxDir(
-    config, absolutePath, fullBackup, collectMode, compressMode, lastRevision, newRevision, excludePaths, excludePatterns
+    config,
+    absolutePath,
+    fullBackup,
+    collectMode,
+    compressMode,
+    lastRevision,
+    newRevision,
+    excludePaths,
+    excludePatterns,
+    index=None,
 ):
     """
     Backs up a directory containing mbox files.
 
+    Mailboxes are extracted by a pool of worker threads, and each extracted
+    result is streamed into the tarfile (in directory listing order) as soon as
+    it is ready.  Results are spooled in memory or in an anonymous temporary
+    file in the working directory, and only a bounded number of them exist at
+    any one time, so the working directory never needs to hold a full copy of
+    the extracted mail.
+
+    If an index is passed in, it is used and updated for each mailbox as
+    described for :any:`_backupMboxFile`.  Entries for mailboxes that no longer
+    exist in the directory are dropped.
+
     Args:
        config: Cedar Backup configuration
        absolutePath: Path to mbox directory to back up
@@ -1498,46 +2070,33 @@ def _backupMboxDir(
        newRevision: Date of new (current) backup as datetime.datetime
        excludePaths: List of absolute paths to exclude
        excludePatterns: List of patterns to exclude
+       index: Dictionary mapping mailbox path to index entry, or ``None``
 
     Raises:
        ValueError: If some value is missing or invalid
        IOError: If there is a problem backing up the mbox file
     """
+    incremental = not fullBackup and collectMode == "incr" and lastRevision is not None
+    mboxList = FilesystemList()
+    mboxList.excludeDirs = True
+    mboxList.excludePaths = excludePaths
+    mboxList.excludePatterns = excludePatterns
+    mboxList.addDirContents(absolutePath, recursive=False)
+    if len(mboxList) == 0:
+        raise ValueError("Empty list cannot be used to generate tarfile.")
+    (tarfilePath, archiveMode) = _getTarfilePath(config, absolutePath, compressMode, newRevision)
     try:
-        tmpdir = tempfile.mkdtemp(dir=config.options.workingDir)
-        mboxList = FilesystemList()
-        mboxList.excludeDirs = True
-        mboxList.excludePaths = excludePaths
-        mboxList.excludePatterns = excludePatterns
-        mboxList.addDirContents(absolutePath, recursive=False)
-        tarList = BackupFileList()
-        for item in mboxList:
-            backupPath = _backupMboxFile(
-                config,
-                item,
-                fullBackup,
-                collectMode,
-                "none",  # no need to compress inside compressed tar
-                lastRevision,
-                newRevision,
-                targetDir=tmpdir,
-            )
-            tarList.addFile(backupPath)
-        (tarfilePath, archiveMode) = _getTarfilePath(config, absolutePath, compressMode, newRevision)
-        tarList.generateTarfile(tarfilePath, archiveMode, ignore=True, flat=True)
-        changeOwnership(tarfilePath, config.options.backupUser, config.options.backupGroup)
-        logger.debug("Completed backing up directory [%s].", absolutePath)
-    finally:
-        try:
-            for cleanitem in tarList:
-                if os.path.exists(cleanitem):
-                    try:
-                        os.remove(cleanitem)
-                    except:
-                        pass
-        except:
-            pass
-        try:
-            os.rmdir(tmpdir)
-        except:
-            pass
+        with tarfile.open(tarfilePath, TAR_MODES[archiveMode], format=tarfile.GNU_FORMAT) as tar:
+            entries = _streamMailboxes(tar, config.options.workingDir, mboxList, incremental, lastRevision, index)
+    except:
+        if os.path.exists(tarfilePath):
+            try:
+                os.remove(tarfilePath)
+            except:
+                pass
+        raise
+    changeOwnership(tarfilePath, config.options.backupUser, config.options.backupGroup)
+    if index is not None:
+        index.clear()  # drops entries for mailboxes that no longer exist
+        index.update(entries)
+    logger.debug("Completed backing up directory [%s].", absolutePath)
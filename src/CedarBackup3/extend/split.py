@@ -39,9 +39,19 @@
 
 When this extension is executed, it will look through the configured Cedar
 Backup staging directory for files exceeding a specified size limit, and split
-them down into smaller files using the 'split' utility.  Any directory which
-has already been split (as indicated by the ``cback.split`` file) will be
-ignored.
+them down into smaller files.  Any directory which has already been split (as
+indicated by the ``cback.split`` file) will be ignored.
+
+Files are split in-process, using the same ``_00000``-style names that the
+GNU ``split`` utility generates, and several large files are split in
+parallel.  Chunks are copied with ``copy_file_range()`` where the platform
+supports it, so the data usually never has to pass through user space.
+
+If the ``encrypt_chunks`` option is enabled, each chunk is piped through
+``gpg`` as it is split, using the configuration in the <encrypt> section.  This
+yields the same ``_00000.gpg``-style files that running the split extension
+and then the encrypt extension would, but each large file is read only once
+and the unencrypted chunks are never written to disk.
 
 This extension requires a new configuration section <split> and is intended
 to be run immediately after the standard stage action or immediately before the
@@ -58,13 +68,15 @@
 
 import logging
 import os
-import re
+from concurrent.futures import ThreadPoolExecutor
 from functools import total_ordering
 
 from CedarBackup3.actions.util import findDailyDirs, getBackupFiles, writeIndicatorFile
 from CedarBackup3.config import ByteQuantity, addByteQuantityNode, readByteQuantity
+from CedarBackup3.extend import encrypt
+from CedarBackup3.metrics import increment
 from CedarBackup3.util import changeOwnership, executeCommand, resolveCommand
-from CedarBackup3.xmlutil import addContainerNode, createInputDom, readFirstChild
+from CedarBackup3.xmlutil import addBooleanNode, addContainerNode, createInputDom, readBoolean, readFirstChild, readInputDom
 
 ########################################################################
 # Module-wide constants and variables
@@ -72,9 +84,11 @@
 
 logger = logging.getLogger("CedarBackup3.log.extend.split")
 
-SPLIT_COMMAND = ["split"]
 SPLIT_INDICATOR = "cback.split"
 
+COPY_BUFFER_SIZE = 4 * 1024 * 1024  # buffer size used when copy_file_range() is not available
+MAX_WORKERS = min(4, os.cpu_count() or 1)  # number of large files split in parallel
+
 
 ########################################################################
 # SplitConfig class definition
@@ -92,30 +106,34 @@ class SplitConfig:
 
        - The size limit must be a ByteQuantity
        - The split size must be a ByteQuantity
+       - The encrypt chunks flag is normalized to ``True`` or ``False``
 
     """
 
-    def __init__(self, sizeLimit=None, splitSize=None):
+    def __init__(self, sizeLimit=None, splitSize=None, encryptChunks=None):
         """
         Constructor for the ``SplitCOnfig`` class.
 
         Args:
            sizeLimit: Size limit of the files, in bytes
            splitSize: Size that files exceeding the limit will be split into, in bytes
+           encryptChunks: Whether to encrypt chunks with gpg as they are split
 
         Raises:
            ValueError: If one of the values is invalid
         """
         self._sizeLimit = None
         self._splitSize = None
+        self._encryptChunks = None
         self.sizeLimit = sizeLimit
         self.splitSize = splitSize
+        self.encryptChunks = encryptChunks
 
     def __repr__(self):
         """
         Official string representation for class instance.
         """
-        return "SplitConfig(%s, %s)" % (self.sizeLimit, self.splitSize)
+        return "SplitConfig(%s, %s, %s)" % (self.sizeLimit, self.splitSize, self.encryptChunks)
 
     def __str__(self):
         """
@@ -156,6 +174,11 @@ def __cmp__(self, other):
                 return -1
             else:
                 return 1
+        if self.encryptChunks != other.encryptChunks:
+            if self.encryptChunks < other.encryptChunks:
+                return -1
+            else:
+                return 1
         return 0
 
     def _setSizeLimit(self, value):
@@ -198,8 +221,27 @@ def _getSplitSize(self):
         """
         return self._splitSize
 
+    def _setEncryptChunks(self, value):
+        """
+        Property target used to set the encrypt chunks flag.
+        No validations, but we normalize the value to ``True`` or ``False``.
+        """
+        if value:
+            self._encryptChunks = True
+        else:
+            self._encryptChunks = False
+
+    def _getEncryptChunks(self):
+        """
+        Property target used to get the encrypt chunks flag.
+        """
+        return self._encryptChunks
+
     sizeLimit = property(_getSizeLimit, _setSizeLimit, None, doc="Size limit, as a ByteQuantity")
     splitSize = property(_getSplitSize, _setSplitSize, None, doc="Split size, as a ByteQuantity")
+    encryptChunks = property(
+        _getEncryptChunks, _setEncryptChunks, None, doc="Whether to encrypt chunks with gpg as they are split."
+    )
 
 
 ########################################################################
@@ -262,9 +304,8 @@ def __init__(self, xmlData=None, xmlPath=None, validate=True):
             if validate:
                 self.validate()
         elif xmlPath is not None:
-            with open(xmlPath) as f:
-                xmlData = f.read()
-            self._parseXmlData(xmlData)
+            (_, parentNode) = readInputDom(xmlPath)
+            self._parseParentNode(parentNode)
             if validate:
                 self.validate()
 
@@ -360,6 +401,7 @@ def addConfig(self, xmlDom, parentNode):
 
            sizeLimit      //cb_config/split/size_limit
            splitSize      //cb_config/split/split_size
+           encryptChunks  //cb_config/split/encrypt_chunks
 
         Args:
            xmlDom: DOM tree as from ``impl.createDocument()``
@@ -369,6 +411,7 @@ def addConfig(self, xmlDom, parentNode):
             sectionNode = addContainerNode(xmlDom, parentNode, "split")
             addByteQuantityNode(xmlDom, sectionNode, "size_limit", self.split.sizeLimit)
             addByteQuantityNode(xmlDom, sectionNode, "split_size", self.split.splitSize)
+            addBooleanNode(xmlDom, sectionNode, "encrypt_chunks", self.split.encryptChunks)
 
     def _parseXmlData(self, xmlData):
         """
@@ -383,6 +426,21 @@ def _parseXmlData(self, xmlData):
            ValueError: If the XML cannot be successfully parsed
         """
         (_, parentNode) = createInputDom(xmlData)
+        self._parseParentNode(parentNode)
+
+    def _parseParentNode(self, parentNode):
+        """
+        Internal method to parse a DOM tree into the object.
+
+        This method calls a static method to parse the split configuration
+        section.  It is used both for XML data and for a document read via
+        :any:`readInputDom`, which may be shared with other callers.
+
+        Args:
+           parentNode: Parent node of the parsed document
+        Raises:
+           ValueError: If the XML cannot be successfully parsed
+        """
         self._split = LocalConfig._parseSplit(parentNode)
 
     @staticmethod
@@ -394,6 +452,7 @@ def _parseSplit(parent):
 
            sizeLimit      //cb_config/split/size_limit
            splitSize      //cb_config/split/split_size
+           encryptChunks  //cb_config/split/encrypt_chunks
 
         Args:
            parent: Parent node to search beneath
@@ -409,6 +468,7 @@ def _parseSplit(parent):
             split = SplitConfig()
             split.sizeLimit = readByteQuantity(section, "size_limit")
             split.splitSize = readByteQuantity(section, "split_size")
+            split.encryptChunks = readBoolean(section, "encrypt_chunks")
         return split
 
 
@@ -425,6 +485,9 @@ def executeAction(configPath, options, config):  # noqa: ARG001
     """
     Executes the split backup action.
 
+    If chunks are to be encrypted as they are split, the <encrypt> section in
+    the same configuration file is used to decide how to encrypt them.
+
     Args:
        configPath (String representing a path on disk): Path to configuration file on disk
        options (Options object): Program command-line options
@@ -437,10 +500,21 @@ def executeAction(configPath, options, config):  # noqa: ARG001
     if config.options is None or config.stage is None:
         raise ValueError("Cedar Backup configuration is not properly filled in.")
     local = LocalConfig(xmlPath=configPath)
+    encryptTarget = None
+    if local.split.encryptChunks:
+        encryptConfig = encrypt.LocalConfig(xmlPath=configPath)
+        if encryptConfig.encrypt.encryptMode != "gpg":
+            raise ValueError("Unknown encrypt mode [%s]" % encryptConfig.encrypt.encryptMode)
+        encryptTarget = encryptConfig.encrypt.encryptTarget
     dailyDirs = findDailyDirs(config.stage.targetDir, SPLIT_INDICATOR)
     for dailyDir in dailyDirs:
         _splitDailyDir(
-            dailyDir, local.split.sizeLimit, local.split.splitSize, config.options.backupUser, config.options.backupGroup
+            dailyDir,
+            local.split.sizeLimit,
+            local.split.splitSize,
+            config.options.backupUser,
+            config.options.backupGroup,
+            encryptTarget=encryptTarget,
         )
         writeIndicatorFile(dailyDir, SPLIT_INDICATOR, config.options.backupUser, config.options.backupGroup)
     logger.info("Executed the split extended action successfully.")
@@ -451,13 +525,17 @@ def executeAction(configPath, options, config):  # noqa: ARG001
 ##############################
 
 
-def _splitDailyDir(dailyDir, sizeLimit, splitSize, backupUser, backupGroup):
+def _splitDailyDir(dailyDir, sizeLimit, splitSize, backupUser, backupGroup, encryptTarget=None):
     """
     Splits large files in a daily staging directory.
 
     Files that match INDICATOR_PATTERNS (i.e. ``"cback.store"``,
     ``"cback.stage"``, etc.) are assumed to be indicator files and are ignored.
-    All other files are split.
+    All other files are split.  Several files are split in parallel.
+
+    If chunks are encrypted as they are split, they are recorded with
+    :any:`encrypt.recordEncryptedFiles`, so that the encrypt extension doesn't
+    encrypt them again.
 
     Args:
        dailyDir: Daily directory to encrypt
@@ -465,6 +543,7 @@ def _splitDailyDir(dailyDir, sizeLimit, splitSize, backupUser, backupGroup):
        splitSize: Split size, in bytes
        backupUser: User that target files should be owned by
        backupGroup: Group that target files should be owned by
+       encryptTarget: GPG recipient to encrypt chunks for, or ``None`` to leave chunks unencrypted
 
     Raises:
        ValueError: If the encrypt mode is not supported
@@ -472,10 +551,15 @@ def _splitDailyDir(dailyDir, sizeLimit, splitSize, backupUser, backupGroup):
     """
     logger.debug("Begin splitting contents of [%s].", dailyDir)
     fileList = getBackupFiles(dailyDir)  # ignores indicator files
-    for path in fileList:
-        size = float(os.stat(path).st_size)
-        if size > sizeLimit:
-            _splitFile(path, splitSize, backupUser, backupGroup, removeSource=True)
+    largeFiles = [path for path in fileList if float(os.stat(path).st_size) > sizeLimit]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(_splitFile, path, splitSize, backupUser, backupGroup, removeSource=True, encryptTarget=encryptTarget)
+            for path in largeFiles
+        ]
+        chunks = [chunk for future in futures for chunk in future.result()]  # raises the first failure, after all work is complete
+    if encryptTarget is not None and chunks:
+        encrypt.recordEncryptedFiles(dailyDir, chunks, backupUser, backupGroup)
     logger.debug("Completed splitting contents of [%s].", dailyDir)
 
 
@@ -484,54 +568,155 @@ def _splitDailyDir(dailyDir, sizeLimit, splitSize, backupUser, backupGroup):
 ########################
 
 
-def _splitFile(sourcePath, splitSize, backupUser, backupGroup, removeSource=False):
+def _splitFile(sourcePath, splitSize, backupUser, backupGroup, removeSource=False, encryptTarget=None):
     """
     Splits the source file into chunks of the indicated size.
 
+    Chunks are named like the GNU ``split`` utility would name them, i.e.
+    ``file_00000``, ``file_00001``, etc., and are written into the same
+    directory as the source file.  The final chunk may be smaller than the
+    split size.  If an encrypt target is passed in, each chunk is piped through
+    ``gpg`` instead, yielding ``file_00000.gpg``, ``file_00001.gpg``, etc.
+
     The split files will be owned by the indicated backup user and group.  If
     ``removeSource`` is ``True``, then the source file will be removed after it is
     successfully split.
 
     Args:
        sourcePath: Absolute path of the source file to split
-       splitSize: Encryption mode (only "gpg" is allowed)
+       splitSize: Split size, as a ByteQuantity
        backupUser: User that target files should be owned by
        backupGroup: Group that target files should be owned by
        removeSource: Indicates whether to remove the source file
+       encryptTarget: GPG recipient to encrypt chunks for, or ``None`` to leave chunks unencrypted
+
+    Returns:
+        List of paths to the chunks that were created
 
     Raises:
        IOError: If there is a problem accessing, splitting or removing the source file
     """
-    cwd = os.getcwd()
-    try:
-        if not os.path.exists(sourcePath):
-            raise ValueError("Source path [%s] does not exist." % sourcePath)
-        dirname = os.path.dirname(sourcePath)
-        filename = os.path.basename(sourcePath)
-        prefix = "%s_" % filename
-        bytes = int(splitSize.bytes)  # noqa: A001
-        os.chdir(dirname)  # need to operate from directory that we want files written to
-        command = resolveCommand(SPLIT_COMMAND)
-        args = ["--verbose", "--numeric-suffixes", "--suffix-length=5", "--bytes=%d" % bytes, filename, prefix]
-        (result, output) = executeCommand(command, args, returnOutput=True, ignoreStderr=False)
-        if result != 0:
-            raise OSError("Error [%d] calling split for [%s]." % (result, sourcePath))
-        pattern = re.compile(r"(creating file [`'])(%s)(.*)(')" % prefix)
-        match = pattern.search(output[-1:][0])
-        if match is None:
-            raise OSError("Unable to parse output from split command.")
-        value = int(match.group(3).strip())
-        for index in range(value):
-            path = "%s%05d" % (prefix, index)
-            if not os.path.exists(path):
-                raise OSError("After call to split, expected file [%s] does not exist." % path)
-            changeOwnership(path, backupUser, backupGroup)
-        if removeSource:
-            if os.path.exists(sourcePath):
-                try:
-                    os.remove(sourcePath)
-                    logger.debug("Completed removing old file [%s].", sourcePath)
-                except Exception:
-                    raise OSError("Failed to remove file [%s] after splitting it." % (sourcePath))
-    finally:
-        os.chdir(cwd)
+    if not os.path.exists(sourcePath):
+        raise ValueError("Source path [%s] does not exist." % sourcePath)
+    chunkSize = int(splitSize.bytes)
+    if chunkSize <= 0:
+        raise ValueError("Split size must be positive.")
+    chunks = []
+    with open(sourcePath, "rb") as source:
+        size = os.fstat(source.fileno()).st_size
+        for index, offset in enumerate(range(0, size, chunkSize)):
+            length = min(chunkSize, size - offset)
+            chunkPath = "%s_%05d" % (sourcePath, index)
+            if encryptTarget is None:
+                _copyChunk(source, offset, length, chunkPath)
+            else:
+                chunkPath = _encryptChunk(source, offset, length, chunkPath, encryptTarget)
+            changeOwnership(chunkPath, backupUser, backupGroup)
+            chunks.append(chunkPath)
+    logger.debug("Completed splitting [%s] into %d chunks.", sourcePath, len(chunks))
+    increment("split.files")
+    increment("split.chunks", len(chunks))
+    increment("split.bytes", size)
+    if removeSource:
+        if os.path.exists(sourcePath):
+            try:
+                os.remove(sourcePath)
+                logger.debug("Completed removing old file [%s].", sourcePath)
+            except Exception:
+                raise OSError("Failed to remove file [%s] after splitting it." % (sourcePath))
+    return chunks
+
+
+def _copyChunk(source, offset, length, chunkPath):
+    """
+    Copies one chunk of a source file into a new file.
+
+    This uses ``copy_file_range()`` if possible, so the copy can happen entirely
+    within the kernel (or even be done as a reflink by some filesystems).  If
+    that's not supported, we fall back to copying through a large buffer.
+
+    Args:
+       source: Source file opened in binary mode
+       offset: Offset of the chunk within the source file
+       length: Length of the chunk
+       chunkPath: Path of the chunk file to create
+
+    Raises:
+       IOError: If the chunk cannot be written
+    """
+    with open(chunkPath, "wb") as target:
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < length:
+                    count = os.copy_file_range(source.fileno(), target.fileno(), length - copied, offset + copied)
+                    if count == 0:
+                        break
+                    copied += count
+            except OSError as e:
+                logger.debug("Unable to use copy_file_range() for [%s], falling back to buffered copy: %s", chunkPath, e)
+                target.seek(copied)
+        while copied < length:
+            data = os.pread(source.fileno(), min(COPY_BUFFER_SIZE, length - copied), offset + copied)
+            if not data:
+                break
+            target.write(data)
+            copied += len(data)
+    if copied != length:
+        raise OSError("Source file changed while writing chunk [%s]." % chunkPath)
+
+
+class _ChunkReader:
+    """
+    Read-only file-like view of one chunk of a larger file.
+
+    This allows a chunk to be passed as an ``inputFile`` to ``executeCommand``
+    without copying it anywhere first.  Reads use ``pread()``, so the underlying
+    file's position is not touched.
+    """
+
+    def __init__(self, source, offset, length):
+        self.fd = source.fileno()
+        self.offset = offset
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = os.pread(self.fd, min(size, COPY_BUFFER_SIZE), self.offset)
+        self.offset += len(data)
+        self.remaining -= len(data)
+        return data
+
+
+def _encryptChunk(source, offset, length, chunkPath, recipient):
+    """
+    Encrypts one chunk of a source file with GPG, as it is split.
+
+    The encrypted file has the same name as the chunk plus a ``".gpg"``
+    extension, just like the encrypt extension would create.
+
+    Args:
+       source: Source file opened in binary mode
+       offset: Offset of the chunk within the source file
+       length: Length of the chunk
+       chunkPath: Path of the (unencrypted) chunk
+       recipient: Recipient name to be passed to GPG's ``"-r"`` option
+
+    Returns:
+        Path to the newly-created encrypted chunk
+
+    Raises:
+       IOError: If there is a problem encrypting the chunk
+    """
+    encryptedPath = "%s.gpg" % chunkPath
+    command = resolveCommand(encrypt.GPG_COMMAND)
+    args = ["--batch", "--yes", "-e", "-r", recipient, "-o", encryptedPath]
+    result = executeCommand(command, args, inputFile=_ChunkReader(source, offset, length))[0]
+    if result != 0:
+        raise OSError("Error [%d] calling gpg to encrypt [%s]." % (result, chunkPath))
+    if not os.path.exists(encryptedPath):
+        raise OSError("After call to [%s], encrypted file [%s] does not exist." % (command, encryptedPath))
+    return encryptedPath
@@ -37,6 +37,17 @@
 
 """
 Provides filesystem-related objects.
+
+Module Attributes
+=================
+
+Attributes:
+   VALID_DIGEST_ALGORITHMS: List of digest algorithms that may be configured
+   DEFAULT_DIGEST_ALGORITHM: Digest algorithm used when none is configured
+   XXHASH_AVAILABLE: Whether the optional ``xxhash`` package is installed
+   INCOMPRESSIBLE_EXTENSIONS: File extensions treated as already compressed
+   MIN_VOLUME_SIZE: Smallest maximum size allowed for tar volumes, in bytes
+
 :author: Kenneth J. Pronovici <pronovic@ieee.org>
 """
 
@@ -45,18 +56,26 @@
 # Imported modules
 ########################################################################
 
+import bz2
+import collections
+import copy
+import gzip
 import hashlib
 import logging
 import math
 import os
+import pickle  # noqa: S403 # we operate on trusted data, so pickle is ok
 import re
 import tarfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 from CedarBackup3.knapsack import alternateFit, bestFit, firstFit, worstFit
+from CedarBackup3.metrics import increment
 from CedarBackup3.util import (
     AbsolutePathList,
     RegexList,
-    UnorderedList,
     calculateFileAge,
     dereferenceLink,
     displayBytes,
@@ -65,12 +84,48 @@
     removeKeys,
 )
 
+try:
+    import xxhash
+
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
 ########################################################################
 # Module-wide variables
 ########################################################################
 
 logger = logging.getLogger("CedarBackup3.log.filesystem")
 
+DIGEST_THREADS = 4  # default number of files hashed concurrently when verifying contents
+
+VALID_DIGEST_ALGORITHMS = ["sha1", "blake2b", "blake2s", "xxh3_128"]
+DEFAULT_DIGEST_ALGORITHM = "sha1"
+DIGEST_FORMAT_VERSION = 2  # a bare dictionary is version 1, which is always SHA-1
+
+# images, audio, video, compressed files, archives, zip-based documents and encrypted data
+INCOMPRESSIBLE_EXTENSIONS = frozenset(
+    """
+    .jpg .jpeg .png .gif .webp .heic .heif .avif .jp2 .jxl
+    .mp3 .m4a .aac .ogg .oga .opus .flac .wma
+    .mp4 .m4v .mkv .webm .mov .avi .wmv .ogv .mpg .mpeg
+    .gz .tgz .bz2 .tbz2 .xz .txz .lz .lzma .lz4 .zst .z
+    .zip .7z .rar .cab .jar .war .apk .deb .rpm .whl
+    .docx .xlsx .pptx .odt .ods .odp .epub
+    .gpg .pgp
+    """.split()  # noqa: SIM905 # easier to read than a list literal
+)
+ENTROPY_SAMPLE_SIZE = 4096  # bytes read from the start of a file to estimate its entropy
+ENTROPY_MIN_SIZE = 65536  # smaller files are classified by extension only
+ENTROPY_THRESHOLD = 7.5  # bits per byte; a sample this random is already compressed
+
+MIN_VOLUME_SIZE = 1024 * 1024
+VOLUME_EXPANSION = {"tar": 1.0, "targz": 1.001, "tarbz2": 1.01}  # worst-case growth of data that doesn't compress
+VOLUME_OVERHEAD = {"tar": 0, "targz": 64, "tarbz2": 1024}  # bytes added when the compressed stream is closed
+
+TRAVERSAL_CACHE_VERSION = 1
+TRAVERSAL_CACHE_MARGIN = 2 * 1000000000  # nanoseconds a directory must be unchanged before its listing is cached
+
 
 ########################################################################
 # FilesystemList class definition
@@ -129,6 +184,7 @@ def __init__(self):
         self._excludePatterns = None
         self._excludeBasenamePatterns = None
         self._ignoreFile = None
+        self._traversalCache = None
         self.excludeFiles = False
         self.excludeLinks = False
         self.excludeDirs = False
@@ -136,6 +192,7 @@ def __init__(self):
         self.excludePatterns = RegexList()
         self.excludeBasenamePatterns = RegexList()
         self.ignoreFile = None
+        self.traversalCache = None
 
     #############
     # Properties
@@ -255,6 +312,24 @@ def _getIgnoreFile(self):
         """
         return self._ignoreFile
 
+    def _setTraversalCache(self, value):
+        """
+        Property target used to set the traversal cache.
+        The value must be a ``TraversalCache`` if it is not ``None``.
+        Raises:
+           ValueError: If the value is not a ``TraversalCache``
+        """
+        if value is not None:
+            if not isinstance(value, TraversalCache):
+                raise ValueError("The traversal cache must be a TraversalCache.")
+        self._traversalCache = value
+
+    def _getTraversalCache(self):
+        """
+        Property target used to get the traversal cache.
+        """
+        return self._traversalCache
+
     excludeFiles = property(_getExcludeFiles, _setExcludeFiles, None, "Boolean indicating whether files should be excluded.")
     excludeDirs = property(_getExcludeDirs, _setExcludeDirs, None, "Boolean indicating whether directories should be excluded.")
     excludeLinks = property(_getExcludeLinks, _setExcludeLinks, None, "Boolean indicating whether soft links should be excluded.")
@@ -272,6 +347,9 @@ def _getIgnoreFile(self):
         "List of regular expression patterns (matching basename) to be excluded.",
     )
     ignoreFile = property(_getIgnoreFile, _setIgnoreFile, None, "Name of file which will cause directory contents to be ignored.")
+    traversalCache = property(
+        _getTraversalCache, _setTraversalCache, None, "Cache of directory listings used when adding directory contents, if any."
+    )
 
     ##############
     # Add methods
@@ -298,7 +376,18 @@ def addFile(self, path):
         if not os.path.exists(path) or not os.path.isfile(path):
             logger.debug("Path [%s] is not a file or does not exist on disk.", path)
             raise ValueError("Path is not a file or does not exist on disk.")
-        if self.excludeLinks and os.path.islink(path):
+        return self._addFileInternal(path, os.path.islink(path))
+
+    def _addFileInternal(self, path, link):
+        """
+        Internal implementation of ``addFile``, for a path already known to be a file.
+        Args:
+           path: Normalized file path to be added to the list
+           link: Indicates whether the path is a soft link
+        Returns:
+            Number of items added to the list
+        """
+        if self.excludeLinks and link:
             logger.debug("Path [%s] is excluded based on excludeLinks.", path)
             return 0
         if self.excludeFiles:
@@ -461,56 +550,192 @@ def _addDirContentsInternal(self, path, includePath=True, recursive=True, linkDe
         if not os.path.exists(path) or not os.path.isdir(path):
             logger.debug("Path [%s] is not a directory or does not exist on disk.", path)
             raise ValueError("Path is not a directory or does not exist on disk.")
+        if self._isExcludedDir(path):
+            return added
+        if self._isIgnoredDir(path):
+            return added
+        if includePath:
+            added += self.addDir(path)  # could actually be excluded by addDir, yet
+        for entry, kind in self._listDir(path):
+            added += self._addDirEntry(pathJoin(path, entry), recursive, linkDepth, dereference, kind)
+        return added
+
+    def _listDir(self, path):
+        """
+        Lists a directory, through the traversal cache if there is one.
+
+        Without a traversal cache, the kind of each entry is ``None``, meaning
+        that it is unknown.  See :any:`TraversalCache.listDir` for the kinds.
+
+        Args:
+           path: Directory path to list
+        Returns:
+            List of ``(name, kind)`` tuples, one for each entry in the directory
+        """
+        if self.traversalCache is not None:
+            return self.traversalCache.listDir(path)
+        return [(entry, None) for entry in os.listdir(path)]
+
+    def _addDirEntry(self, entrypath, recursive, linkDepth, dereference, kind=None):
+        """
+        Adds a single entry discovered within a directory by ``_addDirContentsInternal``.
+
+        If the kind of the entry is known from the traversal cache, regular files
+        and real directories are handled without checking the filesystem again.
+        Soft links are always checked, since their targets can change without
+        their directory changing.
+
+        Args:
+           entrypath: Path of the entry within its directory
+           recursive: Indicates whether directory contents should be added recursively
+           linkDepth: Depth of soft links that should be followed, relative to the entry's directory
+           dereference: Indicates whether soft links, if followed, should be dereferenced
+           kind: Kind of the entry, as from :any:`TraversalCache.listDir`, or ``None`` if unknown
+
+        Returns:
+            Number of items recursively added to the list
+        """
+        added = 0
+        if kind == "f":
+            added += self._addFileInternal(entrypath, False)
+        elif kind == "d":
+            if recursive:
+                added += self._addDirContentsInternal(entrypath, True, recursive, linkDepth - 1, dereference)
+            else:
+                added += self.addDir(entrypath)
+        elif kind == "o":
+            pass
+        elif os.path.isfile(entrypath):
+            if linkDepth > 0 and dereference:
+                derefpath = dereferenceLink(entrypath)
+                if derefpath != entrypath:
+                    added += self.addFile(derefpath)
+            added += self.addFile(entrypath)
+        elif os.path.isdir(entrypath):
+            if os.path.islink(entrypath):
+                if recursive:
+                    if linkDepth > 0:
+                        newDepth = linkDepth - 1
+                        if dereference:
+                            derefpath = dereferenceLink(entrypath)
+                            if derefpath != entrypath:
+                                added += self._addDirContentsInternal(derefpath, True, recursive, newDepth, dereference)
+                            added += self.addDir(entrypath)
+                        else:
+                            added += self._addDirContentsInternal(entrypath, False, recursive, newDepth, dereference)
+                    else:
+                        added += self.addDir(entrypath)
+                else:
+                    added += self.addDir(entrypath)
+            else:
+                if recursive:
+                    newDepth = linkDepth - 1
+                    added += self._addDirContentsInternal(entrypath, True, recursive, newDepth, dereference)
+                else:
+                    added += self.addDir(entrypath)
+        return added
+
+    def _isExcludedDir(self, path):
+        """
+        Indicates whether a directory is excluded by path, pattern or basename pattern.
+        Args:
+           path: Normalized directory path to check
+        Returns:
+            Boolean true if the directory and its contents are excluded
+        """
         if path in self.excludePaths:
             logger.debug("Path [%s] is excluded based on excludePaths.", path)
-            return added
+            return True
         for pattern in self.excludePatterns:  # safe to assume all are valid due to RegexList
             pattern = encodePath(pattern)  # use same encoding as filenames
             if re.compile(r"^%s$" % pattern).match(path):
                 logger.debug("Path [%s] is excluded based on pattern [%s].", path, pattern)
-                return added
+                return True
         for pattern in self.excludeBasenamePatterns:  # safe to assume all are valid due to RegexList
             pattern = encodePath(pattern)  # use same encoding as filenames
             if re.compile(r"^%s$" % pattern).match(os.path.basename(path)):
                 logger.debug("Path [%s] is excluded based on basename pattern [%s].", path, pattern)
-                return added
+                return True
+        return False
+
+    def _isIgnoredDir(self, path):
+        """
+        Indicates whether a directory contains the configured ignore file.
+        Args:
+           path: Normalized directory path to check
+        Returns:
+            Boolean true if the directory's contents should be ignored
+        """
         if self.ignoreFile is not None and os.path.exists(pathJoin(path, self.ignoreFile)):
             logger.debug("Path [%s] is excluded based on ignore file.", path)
-            return added
-        if includePath:
-            added += self.addDir(path)  # could actually be excluded by addDir, yet
-        for entry in os.listdir(path):
-            entrypath = pathJoin(path, entry)
-            if os.path.isfile(entrypath):
-                if linkDepth > 0 and dereference:
-                    derefpath = dereferenceLink(entrypath)
-                    if derefpath != entrypath:
-                        added += self.addFile(derefpath)
-                added += self.addFile(entrypath)
+            return True
+        return False
+
+    def addChangedPaths(self, path, changed):
+        """
+        Adds the entries at a set of changed paths within a directory to the list.
+
+        This adds what :any:`addDirContents` would have added for each changed
+        path, without walking the rest of the directory.  A changed path that is
+        a file is added as a file.  A changed path that is a real directory is
+        added along with all of its contents.  A changed path that no longer
+        exists is ignored, as is one beneath a directory that is excluded or
+        that contains the ignore file.  Soft links are added but never followed,
+        as for :any:`addDirContents` with a link depth of zero.
+
+        Args:
+           path (String representing a path on disk): Directory path that the changed paths are within
+           changed (Set of paths): Changed paths, as from :any:`journal.JournalChanges.getChanges`
+        Returns:
+            Number of items added to the list
+
+        Raises:
+           ValueError: If path is not a directory or does not exist
+           ValueError: If the path could not be encoded properly
+        """
+        path = encodePath(path)
+        path = normalizeDir(path)
+        if not os.path.exists(path) or not os.path.isdir(path):
+            logger.debug("Path [%s] is not a directory or does not exist on disk.", path)
+            raise ValueError("Path is not a directory or does not exist on disk.")
+        added = 0
+        skipped = {}
+        prefix = path + "/"
+        for entrypath in sorted(encodePath(entry) for entry in changed):  # parents sort before their contents
+            if not entrypath.startswith(prefix):
+                continue
+            parent = os.path.dirname(entrypath)
+            if self._isSkippedParent(path, parent, skipped):
+                continue
+            if os.path.islink(entrypath):
+                if os.path.isdir(entrypath):
+                    added += self.addDir(entrypath)
+                elif os.path.isfile(entrypath):
+                    added += self.addFile(entrypath)
             elif os.path.isdir(entrypath):
-                if os.path.islink(entrypath):
-                    if recursive:
-                        if linkDepth > 0:
-                            newDepth = linkDepth - 1
-                            if dereference:
-                                derefpath = dereferenceLink(entrypath)
-                                if derefpath != entrypath:
-                                    added += self._addDirContentsInternal(derefpath, True, recursive, newDepth, dereference)
-                                added += self.addDir(entrypath)
-                            else:
-                                added += self._addDirContentsInternal(entrypath, False, recursive, newDepth, dereference)
-                        else:
-                            added += self.addDir(entrypath)
-                    else:
-                        added += self.addDir(entrypath)
-                else:
-                    if recursive:
-                        newDepth = linkDepth - 1
-                        added += self._addDirContentsInternal(entrypath, True, recursive, newDepth, dereference)
-                    else:
-                        added += self.addDir(entrypath)
+                added += self._addDirContentsInternal(entrypath, True, True, 0, False)
+                skipped[entrypath] = True  # its contents were all just added
+            elif os.path.isfile(entrypath):
+                added += self._addFileInternal(entrypath, False)
         return added
 
+    def _isSkippedParent(self, path, parent, skipped):
+        """
+        Indicates whether changed paths in a directory should be skipped by ``addChangedPaths``.
+        Args:
+           path: Normalized top-level directory path
+           parent: Normalized directory path within the top-level directory, or the top-level directory itself
+           skipped: Dictionary caching the result for each directory checked so far
+        Returns:
+            Boolean true if the directory, or any directory above it, is excluded, ignored or already added
+        """
+        if parent not in skipped:
+            if parent != path and self._isSkippedParent(path, os.path.dirname(parent), skipped):
+                skipped[parent] = True
+            else:
+                skipped[parent] = self._isExcludedDir(parent) or self._isIgnoredDir(parent)
+        return skipped[parent]
+
     #################
     # Remove methods
     #################
@@ -735,6 +960,219 @@ def verify(self):
         return True
 
 
+########################################################################
+# TraversalCache class definition
+########################################################################
+
+
+class TraversalCache:
+    ######################
+    # Class documentation
+    ######################
+
+    """
+    Persistent cache of directory listings, used to speed up repeated traversals.
+
+    Most of the directories walked by a backup are unchanged since the
+    previous run.  A directory's modification time changes whenever an entry
+    is added, removed or renamed within it, so if the modification time,
+    change time, inode and device are the same as last time, the listing is
+    the same, too.  This cache stores the listing of each directory along
+    with those values, and replays it instead of reading the directory again.
+
+    Each entry in a listing is a ``(name, kind)`` tuple, where the kind is
+    one of:
+
+       - ``"f"``: a regular file
+       - ``"d"``: a real directory
+       - ``"l"``: a soft link
+       - ``"o"``: anything else (a device, socket, etc.)
+
+    The kind of a regular file or real directory cannot change without its
+    directory changing, so callers can trust it without checking the
+    filesystem.  The target of a soft link can change at any time, so callers
+    must still check links themselves.  Nothing else about a file (its size,
+    contents or modification time) is cached.
+
+    Two checks keep the cache safe in the face of coarse timestamps and clock
+    skew.  A listing is only cached if the directory was last changed at least
+    :any:`TRAVERSAL_CACHE_MARGIN` before it was read, so a change made within
+    the same timestamp tick as the read can't be missed, and a directory with
+    a timestamp in the future is never cached.  If the clock has gone
+    backwards since the cache was saved, the whole cache is discarded.
+
+    When the cache is saved, it only keeps the directories that were listed
+    during this run, so directories that are removed or no longer backed up
+    don't accumulate.
+    """
+
+    ##############
+    # Constructor
+    ##############
+
+    def __init__(self, path=None):
+        """
+        Constructor for the ``TraversalCache`` class.
+
+        If a path is passed in, the cache is loaded from that path if it exists
+        and saved back to it by :any:`save`.  Otherwise, the cache only lasts as
+        long as this object.  A cache file that can't be read is logged and
+        otherwise ignored.
+
+        Args:
+           path: Path of the cache file on disk, or ``None``
+        """
+        self._path = path
+        self._entries = {}
+        self._listed = {}
+        self._hits = 0
+        self._misses = 0
+        if path is not None:
+            self._entries = TraversalCache._load(path)
+
+    ################
+    # Public methods
+    ################
+
+    def listDir(self, path):
+        """
+        Lists a directory, replaying the cached listing if the directory is unchanged.
+        Args:
+           path: Directory path to list
+        Returns:
+            List of ``(name, kind)`` tuples, one for each entry in the directory
+        Raises:
+           OSError: If the directory can't be read
+        """
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino, stat.st_dev)
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == key:
+            self._hits += 1
+            self._listed[path] = cached
+            return cached[1]
+        self._misses += 1
+        listing = TraversalCache._scanDir(path)
+        if max(stat.st_mtime_ns, stat.st_ctime_ns) <= time.time_ns() - TRAVERSAL_CACHE_MARGIN:
+            self._entries[path] = self._listed[path] = (key, listing)
+        else:
+            logger.debug("Directory [%s] changed too recently to cache its listing.", path)
+            self._entries.pop(path, None)
+            self._listed.pop(path, None)
+        return listing
+
+    def save(self):
+        """
+        Saves the directories listed during this run to disk, and logs the hit rate.
+
+        This is a no-op apart from logging if the cache has no path.  A cache
+        file that can't be written is logged and otherwise ignored.
+        """
+        increment("traversal.hits", self._hits)
+        increment("traversal.misses", self._misses)
+        if self.hitRate is not None:
+            logger.info("Traversal cache: %d hits, %d misses (%.1f%% hit rate).", self._hits, self._misses, 100.0 * self.hitRate)
+        if self._path is None:
+            return
+        try:
+            temp = "%s.tmp" % self._path
+            with open(temp, "wb") as f:
+                pickle.dump({"version": TRAVERSAL_CACHE_VERSION, "saved": time.time_ns(), "entries": self._listed}, f)
+            os.replace(temp, self._path)
+            logger.debug("Wrote traversal cache [%s] to disk: %d directories.", self._path, len(self._listed))
+        except Exception as e:
+            logger.error("Failed to write traversal cache [%s] to disk: %s", self._path, e)
+
+    ##################
+    # Private methods
+    ##################
+
+    @staticmethod
+    def _load(path):
+        """
+        Loads the cached listings from disk.
+        Args:
+           path: Path of the cache file on disk
+        Returns:
+            Dictionary mapping directory path to ``(key, listing)``, empty if the cache can't be used
+        """
+        if not os.path.isfile(path):
+            logger.debug("Traversal cache [%s] does not exist on disk.", path)
+            return {}
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)  # noqa: S301 # this is trusted data, so pickle is ok
+        except Exception as e:
+            logger.error("Failed loading traversal cache [%s] from disk: %s", path, e)
+            return {}
+        if not isinstance(data, dict) or data.get("version") != TRAVERSAL_CACHE_VERSION:
+            logger.warning("Traversal cache [%s] has an unknown format; ignoring it.", path)
+            return {}
+        if data["saved"] > time.time_ns():
+            logger.warning("Traversal cache [%s] was saved in the future; the clock has changed, so ignoring it.", path)
+            return {}
+        logger.debug("Loaded traversal cache [%s] from disk: %d directories.", path, len(data["entries"]))
+        return data["entries"]
+
+    @staticmethod
+    def _scanDir(path):
+        """
+        Reads a directory, determining the kind of each entry without following links.
+        Args:
+           path: Directory path to read
+        Returns:
+            List of ``(name, kind)`` tuples, one for each entry in the directory
+        """
+        listing = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    kind = "l"
+                elif entry.is_dir(follow_symlinks=False):
+                    kind = "d"
+                elif entry.is_file(follow_symlinks=False):
+                    kind = "f"
+                else:
+                    kind = "o"
+                listing.append((entry.name, kind))
+        return listing
+
+    #############
+    # Properties
+    #############
+
+    def _getPath(self):
+        """
+        Property target to get the path of the cache file on disk.
+        """
+        return self._path
+
+    def _getHits(self):
+        """
+        Property target to get the number of listings replayed from the cache.
+        """
+        return self._hits
+
+    def _getMisses(self):
+        """
+        Property target to get the number of directories that had to be read.
+        """
+        return self._misses
+
+    def _getHitRate(self):
+        """
+        Property target to get the fraction of listings replayed from the cache.
+        """
+        if self._hits + self._misses == 0:
+            return None
+        return float(self._hits) / (self._hits + self._misses)
+
+    path = property(_getPath, None, None, "Path of the cache file on disk, or ``None``.")
+    hits = property(_getHits, None, None, "Number of listings replayed from the cache.")
+    misses = property(_getMisses, None, None, "Number of directories that had to be read.")
+    hitRate = property(_getHitRate, None, None, "Fraction of listings replayed from the cache, or ``None`` if nothing was listed.")
+
+
 ########################################################################
 # SpanItem class definition
 ########################################################################
@@ -823,6 +1261,91 @@ def addDir(self, path):
         else:
             return FilesystemList.addDir(self, path)
 
+    ####################
+    # Partition methods
+    ####################
+
+    def partitionDirContents(self, path, depth, linkDepth=0, dereference=False):
+        """
+        Adds the contents of a directory to a set of lists, one per subdirectory at a given depth.
+
+        This walks the directory tree once, and splits the entries it finds
+        into partitions.  There is one partition for each real (non-link)
+        subdirectory exactly ``depth`` levels below ``path``, holding that
+        subdirectory's complete contents.  There is also one partition for
+        ``path`` and each real subdirectory above that depth, holding only
+        the entries that are not within a deeper partition.  With a depth of
+        zero, the result is a single partition, equivalent to calling
+        :any:`addDirContents` on ``path``.  With a negative depth, every real
+        subdirectory gets its own partition.
+
+        Each partition is a new ``BackupFileList`` with the same exclusions as
+        this list, and this list itself is not modified.  Exclusions apply as
+        they would for :any:`addDirContents`, except that the ignore file in a
+        directory above the partition depth only excludes that directory's own
+        entries, not the partitions beneath it.  Soft links are followed to
+        ``linkDepth`` counting from the top of each partition.
+
+        Args:
+           path (String representing a path on disk): Directory path whose contents should be partitioned
+           depth (Integer value): Depth of the subdirectories that get their own partition, negative for unlimited
+           linkDepth (Integer value): Maximum depth of the tree at which soft links should be followed, zero means not to follow
+           dereference (Boolean value): Indicates whether soft links, if followed, should be dereferenced
+        Returns:
+            Dictionary mapping each partition's directory path to its ``BackupFileList``
+
+        Raises:
+           ValueError: If path is not a directory or does not exist
+           ValueError: If the path could not be encoded properly
+        """
+        path = encodePath(path)
+        path = normalizeDir(path)
+        if not os.path.exists(path) or not os.path.isdir(path):
+            logger.debug("Path [%s] is not a directory or does not exist on disk.", path)
+            raise ValueError("Path is not a directory or does not exist on disk.")
+        partitions = {}
+        self._partitionDirInternal(path, depth, linkDepth, dereference, partitions)
+        return partitions
+
+    def _partitionDirInternal(self, path, depth, linkDepth, dereference, partitions):
+        """
+        Internal implementation of ``partitionDirContents``.
+        Args:
+           path: Directory path whose contents should be partitioned
+           depth: Depth of the subdirectories that get their own partition, relative to path
+           linkDepth: Depth of soft links that should be followed
+           dereference: Indicates whether soft links, if followed, should be dereferenced
+           partitions: Dictionary of partitions to add to
+        """
+        partition = BackupFileList()
+        partition.excludeFiles = self.excludeFiles
+        partition.excludeDirs = self.excludeDirs
+        partition.excludeLinks = self.excludeLinks
+        partition.excludePaths = self.excludePaths
+        partition.excludePatterns = self.excludePatterns
+        partition.excludeBasenamePatterns = self.excludeBasenamePatterns
+        partition.ignoreFile = self.ignoreFile
+        partition.traversalCache = self.traversalCache
+        partitions[path] = partition
+        if depth == 0:
+            partition.addDirContents(path, linkDepth=linkDepth, dereference=dereference)
+            return
+        if self._isExcludedDir(path):
+            return
+        ignored = self._isIgnoredDir(path)
+        if not ignored:
+            partition.addDir(path)  # only adds anything if the path is a link
+        for entry, kind in self._listDir(path):
+            entrypath = pathJoin(path, entry)
+            if kind is None:
+                realDir = os.path.isdir(entrypath) and not os.path.islink(entrypath)
+            else:
+                realDir = kind == "d"
+            if realDir and not self._isExcludedDir(entrypath):
+                self._partitionDirInternal(entrypath, depth - 1, linkDepth, dereference, partitions)
+            elif not ignored:
+                partition._addDirEntry(entrypath, True, linkDepth, dereference, kind)
+
     ##################
     # Utility methods
     ##################
@@ -858,14 +1381,15 @@ def generateSizeMap(self):
                 table[entry] = float(os.stat(entry).st_size)
         return table
 
-    def generateDigestMap(self, stripPrefix=None):
+    def generateDigestMap(self, stripPrefix=None, threads=1, algorithm=DEFAULT_DIGEST_ALGORITHM):
         """
         Generates a mapping from file to file digest.
 
-        Currently, the digest is an SHA hash, which should be pretty secure.  In
-        the future, this might be a different kind of hash, but we guarantee that
-        the type of the hash will not change unless the library major version
-        number is bumped.
+        By default, the digest is an SHA hash, which should be pretty secure.
+        Another of the :any:`VALID_DIGEST_ALGORITHMS` can be passed in as
+        ``algorithm``.  Digests generated with different algorithms can't be
+        compared, so callers that save a digest map should also save the
+        algorithm; see :any:`tagDigestMap`.
 
         Entries which do not exist on disk are ignored.
 
@@ -876,27 +1400,42 @@ def generateDigestMap(self, stripPrefix=None):
         each key when the map is generated.  This can be useful in generating two
         "relative" digest maps to be compared to one another.
 
+        If ``threads`` is greater than one, that many files are hashed at once.
+        Hashing releases the interpreter lock, so this helps when reading from
+        slow media like a CD or DVD, where one file can be read while another
+        is being hashed.
+
         Args:
            stripPrefix (String with any contents): Common prefix to be stripped from paths
+           threads (Integer >= 1): Number of files to hash concurrently
+           algorithm: Digest algorithm, one of :any:`VALID_DIGEST_ALGORITHMS`
         Returns:
             Dictionary mapping file to digest value
+        Raises:
+           ValueError: If the digest algorithm is not valid or not available
         @see: :any:`removeUnchanged`
         """
+        _newDigest(algorithm)  # fail before reading anything if the algorithm is unusable
+        entries = [entry for entry in self if os.path.isfile(entry) and not os.path.islink(entry)]
+        if threads > 1 and len(entries) > 1:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                digests = list(executor.map(lambda entry: BackupFileList._generateDigest(entry, algorithm), entries))
+        else:
+            digests = [BackupFileList._generateDigest(entry, algorithm) for entry in entries]
+        increment("filesystem.digest.files", len(entries))
         table = {}
         if stripPrefix is not None:
-            for entry in self:
-                if os.path.isfile(entry) and not os.path.islink(entry):
-                    table[entry.replace(stripPrefix, "", 1)] = BackupFileList._generateDigest(entry)
+            for entry, digest in zip(entries, digests, strict=True):
+                table[entry.replace(stripPrefix, "", 1)] = digest
         else:
-            for entry in self:
-                if os.path.isfile(entry) and not os.path.islink(entry):
-                    table[entry] = BackupFileList._generateDigest(entry)
+            for entry, digest in zip(entries, digests, strict=True):
+                table[entry] = digest
         return table
 
     @staticmethod
-    def _generateDigest(path):
+    def _generateDigest(path, algorithm=DEFAULT_DIGEST_ALGORITHM):
         """
-        Generates an SHA digest for a given file on disk.
+        Generates a digest for a given file on disk, SHA by default.
 
         The original code for this function used this simplistic implementation,
         which requires reading the entire file into memory at once in order to
@@ -925,13 +1464,15 @@ def _generateDigest(path):
 
         Args:
            path: Path to generate digest for
+           algorithm: Digest algorithm, one of :any:`VALID_DIGEST_ALGORITHMS`
 
         Returns:
-            ASCII-safe SHA digest for the file
+            ASCII-safe digest for the file
         Raises:
            OSError: If the file cannot be opened
+           ValueError: If the digest algorithm is not valid or not available
         """
-        s = hashlib.sha1()  # noqa: S324 # we're not using SHA-1 for cryptographic purposes, only to identify file changes
+        s = _newDigest(algorithm)
         with open(path, mode="rb") as f:
             readBytes = 4096  # see notes above
             while readBytes > 0:
@@ -1138,6 +1679,8 @@ def generateTarfile(self, path, mode="tar", ignore=False, flat=False):
                         raise tarfile.TarError(e)
                     logger.info("Unable to add file [%s]; going on anyway.", entry)
             tar.close()
+            increment("filesystem.tar.files", len(self))
+            increment("filesystem.tar.bytes", os.path.getsize(path))
         except tarfile.ReadError:
             try:
                 tar.close()
@@ -1161,7 +1704,116 @@ def generateTarfile(self, path, mode="tar", ignore=False, flat=False):
                     pass
             raise e
 
-    def removeUnchanged(self, digestMap, captureDigest=False):
+    def generateTarVolumes(self, path, maxSize, mode="tar", ignore=False):
+        """
+        Creates a sequence of size-capped tar files containing the files in the list.
+
+        This works like :any:`generateTarfile`, except that the archive is
+        written as a sequence of volumes, none of them larger than ``maxSize``
+        bytes.  The volumes are named after ``path``, with a volume number in
+        front of the extension, so ``/tmp/etc.tar.gz`` becomes
+        ``/tmp/etc.00001.tar.gz``, ``/tmp/etc.00002.tar.gz`` and so on.  Each
+        volume is a complete tar file, which can be extracted on its own.
+
+        Files are added in list order.  A file that doesn't fit in the rest of
+        the current volume starts a new volume.  A file that doesn't fit even
+        in an empty volume is split into pieces, one per volume, named like
+        ``home/user/disk.img_00001``, ``home/user/disk.img_00002`` and so on.
+        The file can be put back together with ``cat disk.img_* > disk.img``.
+        Pieces are sized by their uncompressed size, since the size is part of
+        the tar header written before the data.
+
+        A manifest is written to ``path`` plus ``.manifest``.  It's a text file
+        with one line for each file or piece.  Each line contains the name of
+        the volume, the offset and length of the data within the file, and the
+        path of the file, separated by spaces.
+
+        For ``targz`` volumes, the compressed stream is flushed when a volume
+        gets close to full, so that volumes can be filled up to the limit.  The
+        bzip2 format can't be flushed that way, so ``tarbz2`` volumes are sized
+        as if their contents don't compress at all.
+
+        The ``ignore`` flag works the same way as for :any:`generateTarfile`.
+        If an exception is thrown, we'll attempt to remove all of the volumes
+        and the manifest.
+
+        Args:
+           path (String representing a path on disk): Path of tar file that the volumes are named after
+           maxSize (Integer, at least :any:`MIN_VOLUME_SIZE`): Maximum size of each volume, in bytes
+           mode (One of either ``'tar'``, ``'targz'`` or ``'tarbz2'``): Tar creation mode
+           ignore (Boolean): Indicates whether to ignore certain errors
+        Returns:
+            List of paths written, the volumes in order followed by the manifest
+        Raises:
+           ValueError: If mode is not valid
+           ValueError: If the maximum size is too small
+           ValueError: If list is empty
+           ValueError: If the path could not be encoded properly
+           TarError: If there is a problem creating the tar files
+        """
+        path = encodePath(path)
+        if len(self) == 0:
+            raise ValueError("Empty list cannot be used to generate tarfile.")
+        if mode not in VOLUME_EXPANSION:
+            raise ValueError("Mode [%s] is not valid." % mode)
+        if maxSize < MIN_VOLUME_SIZE:
+            raise ValueError("Maximum volume size must be at least %d bytes." % MIN_VOLUME_SIZE)
+        volumes = []
+        manifestPath = "%s.manifest" % path
+        try:
+            manifest = _writeTarVolumes(self, volumes, path, mode, maxSize, ignore)
+            with open(manifestPath, "w") as f:
+                f.writelines("%s %d %d %s\n" % item for item in manifest)
+        except Exception as e:
+            for volume in volumes:
+                volume.discard()
+            if os.path.exists(manifestPath):
+                try:
+                    os.remove(manifestPath)
+                except:
+                    pass
+            if isinstance(e, OSError):
+                raise tarfile.TarError(e)
+            raise e
+        increment("filesystem.tar.files", len(self))
+        increment("filesystem.tar.volumes", len(volumes))
+        increment("filesystem.tar.bytes", sum(os.path.getsize(volume.path) for volume in volumes))
+        return [volume.path for volume in volumes] + [manifestPath]
+
+    def splitCompressible(self):
+        """
+        Splits the list into files worth compressing and files that are already compressed.
+
+        Compressing a JPEG, a video or a gzipped log burns CPU without making
+        it any smaller, so callers building a compressed archive can put those
+        files into an uncompressed archive instead.
+
+        A file is treated as already compressed if its extension is one of
+        :any:`INCOMPRESSIBLE_EXTENSIONS` (compared without regard to case).
+        Otherwise, if the file is at least 64 kB, the first 4 kB are read and
+        the file is treated as already compressed if the Shannon entropy of
+        that sample is at least 7.5 bits per byte.  Smaller files are always
+        worth compressing, since there is little CPU to save on them.  Soft
+        links and entries that do not exist on disk go into the list of files
+        to compress, so they are handled exactly as before.
+
+        Both of the returned lists are ``BackupFileList`` objects, and the order
+        of the entries is preserved within each one.
+
+        Returns:
+            Tuple of (files to compress, files already compressed)
+        """
+        compressible = BackupFileList()
+        incompressible = BackupFileList()
+        for entry in self:
+            if os.path.isfile(entry) and not os.path.islink(entry) and _isCompressed(entry):
+                incompressible.append(entry)
+            else:
+                compressible.append(entry)
+        increment("filesystem.compressed.files", len(incompressible))
+        return (compressible, incompressible)
+
+    def removeUnchanged(self, digestMap, captureDigest=False, algorithm=DEFAULT_DIGEST_ALGORITHM):
         """
         Removes unchanged entries from the list.
 
@@ -1193,6 +1845,9 @@ def removeUnchanged(self, digestMap, captureDigest=False):
         map)}.  The returned digest map will be in exactly the form returned by
         :any:`generateDigestMap`.
 
+        The ``algorithm`` must be the one that was used to generate ``digestMap``.
+        Otherwise, every file will look changed.
+
         *Note:* For performance reasons, this method actually ends up rebuilding
         the list from scratch.  First, we build a temporary dictionary containing
         all of the items from the original list.  Then, we remove items as needed
@@ -1203,6 +1858,7 @@ def removeUnchanged(self, digestMap, captureDigest=False):
         Args:
            digestMap (Map as returned from :any:`generateDigestMap`): Dictionary mapping file name to digest value
            captureDigest (Boolean): Indicates that digest information should be captured
+           algorithm: Digest algorithm, one of :any:`VALID_DIGEST_ALGORITHMS`
         Returns:
             Results as discussed above (format varies based on arguments)
         """
@@ -1212,7 +1868,7 @@ def removeUnchanged(self, digestMap, captureDigest=False):
             captured = {}
             for entry in self:
                 if os.path.isfile(entry) and not os.path.islink(entry):
-                    table[entry] = BackupFileList._generateDigest(entry)
+                    table[entry] = BackupFileList._generateDigest(entry, algorithm)
                     captured[entry] = table[entry]
                 else:
                     table[entry] = None
@@ -1234,7 +1890,7 @@ def removeUnchanged(self, digestMap, captureDigest=False):
             for entry in list(digestMap.keys()):
                 if entry in table:
                     if os.path.isfile(entry) and not os.path.islink(entry):
-                        digest = BackupFileList._generateDigest(entry)
+                        digest = BackupFileList._generateDigest(entry, algorithm)
                         if digest == digestMap[entry]:
                             removed += 1
                             del table[entry]
@@ -1480,27 +2136,27 @@ def normalizeDir(path):
 #############################
 
 
-def compareContents(path1, path2, verbose=False):
+def compareContents(path1, path2, verbose=False, threads=DIGEST_THREADS):
     """
     Compares the contents of two directories to see if they are equivalent.
 
-    The two directories are recursively compared.  First, we check whether they
-    contain exactly the same set of files.  Then, we check to see every given
-    file has exactly the same contents in both directories.
+    The two directories are recursively compared, to check that they contain
+    exactly the same set of files and that every file has exactly the same
+    contents in both directories.
 
-    This is all relatively simple to implement through the magic of
-    :any:`BackupFileList.generateDigestMap`, which knows how to strip a path prefix
-    off the front of each entry in the mapping it generates.  This makes our
-    comparison as simple as creating a list for each path, then generating a
-    digest map for each path and comparing the two.
+    The two trees are walked together, in the same order, so the comparison
+    works in bounded memory no matter how large the trees are.  It fails fast:
+    the first file that exists on only one side, or that has a different size
+    on each side, ends the comparison before anything else is hashed.  Files
+    whose sizes match are hashed on both sides at once, ``threads`` files at a
+    time.
 
     If no exception is thrown, the two directories are considered identical.
 
-    If the ``verbose`` flag is ``True``, then an alternate (but slower) method is
-    used so that any thrown exception can indicate exactly which file caused the
-    comparison to fail.  The thrown ``ValueError`` exception distinguishes
-    between the directories containing different files, and containing the same
-    files with differing content.
+    If the ``verbose`` flag is ``True``, then any thrown exception will
+    indicate exactly which file caused the comparison to fail.  The thrown
+    ``ValueError`` exception distinguishes between the directories containing
+    different files, and containing the same files with differing content.
 
     *Note:* Symlinks are *not* followed for the purposes of this comparison.
 
@@ -1508,43 +2164,548 @@ def compareContents(path1, path2, verbose=False):
        path1 (String representing a path on disk): First path to compare
        path2 (String representing a path on disk): First path to compare
        verbose (Boolean): Indicates whether a verbose response should be given
+       threads (Integer >= 1): Number of files to hash concurrently on each side
     Raises:
        ValueError: If a directory doesn't exist or can't be read
        ValueError: If the two directories are not equivalent
        IOError: If there is an unusual problem reading the directories
     """
     try:
-        path1List = BackupFileList()
-        path1List.addDirContents(path1)
-        path1Digest = path1List.generateDigestMap(stripPrefix=normalizeDir(path1))
-        path2List = BackupFileList()
-        path2List.addDirContents(path2)
-        path2Digest = path2List.generateDigestMap(stripPrefix=normalizeDir(path2))
-        compareDigestMaps(path1Digest, path2Digest, verbose)
+        _compareFiles(_walkDirectory(path1), _walkDirectory(path2), verbose, threads)
+    except OSError as e:
+        logger.error("I/O error encountered during consistency check.")
+        raise e
+
+
+def compareListContents(fileList, stripPrefix, path, verbose=False, threads=DIGEST_THREADS):
+    """
+    Compares the files in a list to the contents of a directory, to see if they are equivalent.
+
+    This works like :any:`compareContents`, except that one side of the
+    comparison is a list of files rather than a directory.  Each file in the
+    list is compared to the file at the same path relative to ``path``, once
+    ``stripPrefix`` has been removed from the front of it.  Only regular files
+    in the list are considered.
+
+    Args:
+       fileList (List of paths on disk, i.e. a ``BackupFileList``): Files to compare
+       stripPrefix (String with any contents): Common prefix to be stripped from the files in the list
+       path (String representing a path on disk): Directory to compare against
+       verbose (Boolean): Indicates whether a verbose response should be given
+       threads (Integer >= 1): Number of files to hash concurrently on each side
+    Raises:
+       ValueError: If the directory doesn't exist or can't be read
+       ValueError: If the list and the directory are not equivalent
+       IOError: If there is an unusual problem reading the files
+    """
+    try:
+        files = []
+        for entry in fileList:
+            if os.path.isfile(entry) and not os.path.islink(entry):
+                files.append((entry.replace(stripPrefix, "", 1), entry, os.stat(entry).st_size))
+        files.sort(key=lambda item: _canonicalKey(item[0]))
+        _compareFiles(files, _walkDirectory(path), verbose, threads)
     except OSError as e:
         logger.error("I/O error encountered during consistency check.")
         raise e
 
 
+def tagDigestMap(digest, algorithm=DEFAULT_DIGEST_ALGORITHM):
+    """
+    Tags a digest map with the algorithm that generated it, for saving to disk.
+
+    The result is a dictionary with ``version``, ``algorithm`` and ``digest``
+    keys.  A caller that loads the digest map again can use :any:`untagDigestMap`
+    to find out whether it was generated with the algorithm it expects.
+
+    Args:
+       digest (Digest as returned from BackupFileList.generateDigestMap()): Digest map to tag
+       algorithm: Digest algorithm used to generate the map
+    Returns:
+        Tagged digest map
+    """
+    return {"version": DIGEST_FORMAT_VERSION, "algorithm": algorithm, "digest": digest}
+
+
+def untagDigestMap(digest):
+    """
+    Splits a tagged digest map into its algorithm and digest map.
+
+    Untagged digest maps, as saved before the algorithm was configurable, are
+    plain dictionaries mapping path to SHA-1 digest.  They are returned as-is,
+    with an algorithm of ``sha1``.
+
+    Args:
+       digest: Digest map, tagged as by :any:`tagDigestMap` or untagged
+    Returns:
+        Tuple of (algorithm, digest map)
+    Raises:
+       ValueError: If the digest map is tagged with an unknown format version
+    """
+    if isinstance(digest.get("version"), int) and "digest" in digest:
+        if digest["version"] != DIGEST_FORMAT_VERSION:
+            raise ValueError("Unknown digest format version [%s]." % digest["version"])
+        return (digest["algorithm"], digest["digest"])
+    return ("sha1", digest)
+
+
 def compareDigestMaps(digest1, digest2, verbose=False):
     """
     Compares two digest maps and throws an exception if they differ.
 
+    Either digest map may be tagged with its algorithm, as returned from
+    :any:`tagDigestMap`.  An untagged digest map is assumed to use SHA-1, like
+    every digest map written before the algorithm was configurable.  Digest
+    maps generated with different algorithms can't be compared, so that is
+    an error rather than a difference.
+
     Args:
        digest1 (Digest as returned from BackupFileList.generateDigestMap()): First digest to compare
        digest2 (Digest as returned from BackupFileList.generateDigestMap()): Second digest to compare
        verbose (Boolean): Indicates whether a verbose response should be given
     Raises:
        ValueError: If the two directories are not equivalent
+       ValueError: If the digest maps were generated with different algorithms
     """
+    (algorithm1, digest1) = untagDigestMap(digest1)
+    (algorithm2, digest2) = untagDigestMap(digest2)
+    if algorithm1 != algorithm2:
+        raise ValueError("Digest maps were generated with different algorithms [%s] and [%s]." % (algorithm1, algorithm2))
     if not verbose:
         if digest1 != digest2:
             raise ValueError("Consistency check failed.")
     else:
-        list1 = UnorderedList(list(digest1.keys()))
-        list2 = UnorderedList(list(digest2.keys()))
-        if list1 != list2:
+        if digest1.keys() != digest2.keys():
             raise ValueError("Directories contain a different set of files.")
-        for key in list1:
+        for key in digest1:
             if digest1[key] != digest2[key]:
                 raise ValueError("File contents for [%s] vary between directories." % key)
+
+
+def verifyContents(path, digest, ignore=None, threads=DIGEST_THREADS, sizes=None):
+    """
+    Verifies the contents of a directory against a previously-generated digest map.
+
+    This is the one-sided equivalent of :any:`compareContents`, for when the
+    digests of the original directory are already known (for instance, from a
+    manifest written when a disc was created).  Only the indicated directory
+    is read, and ``threads`` of its files are hashed at once.  If ``sizes``
+    is passed in, then any file whose size differs is reported without being
+    hashed.
+
+    The digest map must be relative, as generated by
+    :any:`BackupFileList.generateDigestMap` with ``stripPrefix`` set to the
+    normalized original directory.  Any keys listed in ``ignore`` are skipped
+    if they exist in the directory.
+
+    Every file that is missing, unexpected or has different contents is logged
+    individually before an exception is raised, so a single check identifies
+    all of the damaged files.  If no exception is thrown, the directory matches
+    the digest map.
+
+    *Note:* Symlinks are *not* followed for the purposes of this comparison.
+
+    Args:
+       path (String representing a path on disk): Directory to verify
+       digest (Digest as returned from BackupFileList.generateDigestMap()): Expected digest map
+       ignore (List of keys, as in the digest map): Files in the directory to skip, if any
+       threads (Integer >= 1): Number of files to hash concurrently
+       sizes (Dictionary mapping key to size in bytes): Expected file sizes, if known
+    Raises:
+       ValueError: If the directory doesn't exist or can't be read
+       ValueError: If the directory does not match the digest map
+       IOError: If there is an unusual problem reading the directory
+    """
+    ignore = set(ignore or [])
+    sizes = sizes or {}
+    expected = sorted(((key, None, sizes.get(key)) for key in digest), key=lambda item: _canonicalKey(item[0]))
+    actual = (item for item in _walkDirectory(path) if item[0] not in ignore)
+    missing = []
+    unexpected = []
+    changed = []
+
+    def candidates():
+        for item1, item2 in _mergeFiles(expected, actual):
+            if item2 is None:
+                missing.append(item1[0])
+            elif item1 is None:
+                unexpected.append(item2[0])
+            elif item1[2] is not None and item1[2] != item2[2]:
+                changed.append(item2[0])
+            else:
+                yield item2
+
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            generate = BackupFileList._generateDigest  # noqa: SLF001
+            results = _pipeline(candidates(), lambda item: executor.submit(generate, item[1]), threads * 4)
+            for item, future in results:
+                if future.result() != digest[item[0]]:
+                    changed.append(item[0])
+    except OSError as e:
+        logger.error("I/O error encountered during consistency check.")
+        raise e
+    for key in missing:
+        logger.error("File [%s] is missing from [%s].", key, path)
+    for key in unexpected:
+        logger.error("File [%s] in [%s] is unexpected.", key, path)
+    for key in sorted(changed, key=_canonicalKey):
+        logger.error("File contents for [%s] in [%s] vary from the expected digest.", key, path)
+    if missing or unexpected or changed:
+        raise ValueError(
+            "Consistency check failed: %d missing, %d unexpected and %d changed files."
+            % (len(missing), len(unexpected), len(changed))
+        )
+
+
+########################################################################
+# Private functions used to compare directory contents
+########################################################################
+
+# The comparison functions above all work on sequences of ``(key, path, size)``
+# tuples, where the key is the path relative to some directory (with a leading
+# slash, like the keys in a relative digest map).  Each sequence is in canonical
+# order, i.e. sorted by the components of the key, which is the order in which
+# a depth-first walk visits files when it takes the entries of each directory in
+# name order.  That way, two sequences can be merged like sorted lists without
+# ever holding either one in memory.
+
+
+def _canonicalKey(key):
+    """
+    Returns the sort key used to put relative paths in canonical order.
+    """
+    return key.split("/")
+
+
+def _walkDirectory(path):
+    """
+    Walks a directory, yielding ``(key, path, size)`` for each regular file in canonical order.
+    Soft links are not followed, and anything other than a regular file is ignored.
+    Args:
+       path: Directory to walk
+    Raises:
+       ValueError: If the path is not a directory or does not exist
+    """
+    path = encodePath(path)
+    if not os.path.isdir(path):
+        raise ValueError("Path is not a directory or does not exist on disk.")
+    prefix = normalizeDir(path)
+    return _walkEntries(path, len(prefix))
+
+
+def _walkEntries(path, length):
+    """
+    Recursive implementation of :any:`_walkDirectory`, where ``length`` is the length of the prefix to strip.
+    """
+    with os.scandir(path) as iterator:
+        entries = sorted(iterator, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walkEntries(entry.path, length)
+        elif entry.is_file(follow_symlinks=False):
+            yield (entry.path[length:], entry.path, entry.stat(follow_symlinks=False).st_size)
+
+
+def _mergeFiles(files1, files2):
+    """
+    Merges two sequences of files in canonical order, yielding pairs of items with the same key.
+    If a key exists in only one of the sequences, the other item in the pair is ``None``.
+    """
+    files1 = iter(files1)
+    files2 = iter(files2)
+    item1 = next(files1, None)
+    item2 = next(files2, None)
+    while item1 is not None or item2 is not None:
+        if item2 is None or (item1 is not None and _canonicalKey(item1[0]) < _canonicalKey(item2[0])):
+            yield (item1, None)
+            item1 = next(files1, None)
+        elif item1 is None or _canonicalKey(item2[0]) < _canonicalKey(item1[0]):
+            yield (None, item2)
+            item2 = next(files2, None)
+        else:
+            yield (item1, item2)
+            item1 = next(files1, None)
+            item2 = next(files2, None)
+
+
+def _pipeline(items, submit, limit):
+    """
+    Submits work for a sequence of items, yielding ``(item, result)`` in order.
+    At most ``limit`` items are outstanding at once, which bounds memory use.
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append((item, submit(item)))
+        if len(pending) >= limit:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def _compareFiles(files1, files2, verbose, threads):
+    """
+    Compares two sequences of files in canonical order, failing on the first difference.
+    Raises:
+       ValueError: If the two sequences are not equivalent
+    """
+
+    def candidates():
+        for item1, item2 in _mergeFiles(files1, files2):
+            if item1 is None or item2 is None:
+                key = item2[0] if item1 is None else item1[0]
+                raise _comparisonError(verbose, "Directories contain a different set of files, starting with [%s]." % key)
+            if item1[2] != item2[2]:
+                raise _comparisonError(verbose, "File contents for [%s] vary between directories." % item1[0])
+            yield (item1, item2)
+
+    def submit(pair):
+        return (executor.submit(generate, pair[0][1]), executor.submit(generate, pair[1][1]))
+
+    generate = BackupFileList._generateDigest  # noqa: SLF001
+
+    executor = ThreadPoolExecutor(max_workers=threads * 2)
+    try:
+        for (item1, _), (future1, future2) in _pipeline(candidates(), submit, threads * 4):
+            if future1.result() != future2.result():
+                raise _comparisonError(verbose, "File contents for [%s] vary between directories." % item1[0])
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _comparisonError(verbose, message):
+    """
+    Builds the exception for a failed comparison, which only includes details if ``verbose`` is set.
+    """
+    return ValueError(message if verbose else "Consistency check failed.")
+
+
+########################################################################
+# Private functions used to generate digests
+########################################################################
+
+
+def _newDigest(algorithm):
+    """
+    Returns a new hash object for one of the :any:`VALID_DIGEST_ALGORITHMS`.
+
+    BLAKE2b and BLAKE2s are truncated to 160 bits, the same size as SHA-1,
+    which is plenty to identify file changes and keeps digest maps from
+    growing.  The ``xxh3_128`` algorithm is not cryptographic at all, but is
+    much faster than the others; it requires the optional ``xxhash`` package.
+
+    Raises:
+       ValueError: If the digest algorithm is not valid or not available
+    """
+    if algorithm == "sha1":
+        return hashlib.sha1()  # noqa: S324 # we're not using SHA-1 for cryptographic purposes, only to identify file changes
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=20)
+    if algorithm == "blake2s":
+        return hashlib.blake2s(digest_size=20)
+    if algorithm == "xxh3_128":
+        if not XXHASH_AVAILABLE:
+            raise ValueError("Digest algorithm [xxh3_128] requires the xxhash package, which is not installed.")
+        return xxhash.xxh3_128()
+    raise ValueError("Digest algorithm must be one of %s." % VALID_DIGEST_ALGORITHMS)
+
+
+########################################################################
+# Private functions used to classify compressed files
+########################################################################
+
+
+def _isCompressed(path):
+    """
+    Indicates whether a file is already compressed, as described in :any:`BackupFileList.splitCompressible`.
+    """
+    if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return True
+    try:
+        if os.stat(path).st_size < ENTROPY_MIN_SIZE:
+            return False
+        with open(path, mode="rb") as f:
+            sample = f.read(ENTROPY_SAMPLE_SIZE)
+    except OSError:
+        return False  # let the archive deal with it
+    return _calculateEntropy(sample) >= ENTROPY_THRESHOLD
+
+
+def _calculateEntropy(data):
+    """
+    Calculates the Shannon entropy of a byte string, in bits per byte.
+    """
+    if not data:
+        return 0.0
+    length = float(len(data))
+    return -sum((count / length) * math.log2(count / length) for count in collections.Counter(data).values())
+
+
+########################################################################
+# Private classes and functions used to generate tar volumes
+########################################################################
+
+
+class _TarVolume:
+    """
+    One volume written by :any:`BackupFileList.generateTarVolumes`.
+
+    The volume keeps track of how much more tar data it can hold without
+    growing past the maximum size.  For compressed volumes, that is based on
+    the compressed size so far, plus the worst-case size of the tar data
+    added since the compressed stream was last flushed.
+    """
+
+    def __init__(self, path, mode, maxSize):
+        """
+        Creates the volume on disk.
+        Args:
+           path: Path of the volume
+           mode: Tar creation mode
+           maxSize: Maximum size of the volume, in bytes
+        """
+        self.path = path
+        self.members = 0
+        self._maxSize = maxSize
+        self._expansion = VOLUME_EXPANSION[mode]
+        self._overhead = VOLUME_OVERHEAD[mode]
+        self._flushed = 0  # offset in the tar data up to which the compressed output is on disk
+        self._raw = open(path, "wb")  # closed by close() or discard()
+        if mode == "targz":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif mode == "tarbz2":
+            self._stream = bz2.BZ2File(self._raw, mode="wb")
+        else:
+            self._stream = self._raw
+        self.tar = tarfile.open(fileobj=self._stream, mode="w:", format=tarfile.GNU_FORMAT)
+
+    def headerSize(self, tarinfo):
+        """
+        Returns the size of the header blocks for a member, in bytes.
+        """
+        return len(tarinfo.tobuf(tarfile.GNU_FORMAT, self.tar.encoding, self.tar.errors))
+
+    def room(self):
+        """
+        Returns how many more bytes of tar data fit in the volume, including the end-of-archive blocks.
+        """
+        if self._stream is self._raw:
+            self._flushed = self.tar.offset
+        budget = (self._maxSize - self._overhead - self._raw.tell()) / self._expansion
+        limit = int(self._flushed + budget) // tarfile.RECORDSIZE * tarfile.RECORDSIZE
+        return limit - self.tar.offset - 2 * tarfile.BLOCKSIZE
+
+    def fits(self, size):
+        """
+        Indicates whether ``size`` more bytes of tar data fit in the volume, flushing a gzipped volume if that helps.
+        """
+        if size <= self.room():
+            return True
+        if isinstance(self._stream, gzip.GzipFile) and self._flushed < self.tar.offset:
+            self._stream.flush(zlib.Z_SYNC_FLUSH)
+            self._flushed = self.tar.offset
+            return size <= self.room()
+        return False
+
+    def close(self):
+        """
+        Closes the volume, writing the end of the archive.
+        """
+        self.tar.close()
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+
+    def discard(self):
+        """
+        Closes the volume, ignoring errors, and removes it from disk.
+        """
+        for item in (self.tar, self._stream, self._raw):
+            try:
+                item.close()
+            except:
+                pass
+        if os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except:
+                pass
+
+
+def _getVolumePath(path, volume):
+    """
+    Returns the path of a tar volume, with the volume number in front of the extension.
+    """
+    for extension in (".tar.gz", ".tar.bz2", ".tar"):
+        if path.endswith(extension):
+            return "%s.%05d%s" % (path[: -len(extension)], volume, extension)
+    return "%s.%05d" % (path, volume)
+
+
+def _writeTarVolumes(entries, volumes, path, mode, maxSize, ignore):
+    """
+    Writes entries into tar volumes, as described in :any:`BackupFileList.generateTarVolumes`.
+    Volumes are appended to ``volumes`` as they are created, so the caller can clean up after an error.
+    Returns:
+        Manifest, as a list of ``(volume, offset, length, path)`` tuples
+    """
+    manifest = []
+    volumes.append(_TarVolume(_getVolumePath(path, 1), mode, maxSize))
+    for entry in entries:
+        try:
+            _addVolumeEntry(volumes, manifest, path, mode, maxSize, entry)
+        except tarfile.TarError as e:
+            if not ignore:
+                raise e
+            logger.info("Unable to add file [%s]; going on anyway.", entry)
+        except OSError as e:
+            if not ignore:
+                raise tarfile.TarError(e)
+            logger.info("Unable to add file [%s]; going on anyway.", entry)
+    volumes[-1].close()
+    return manifest
+
+
+def _addVolumeEntry(volumes, manifest, path, mode, maxSize, entry):
+    """
+    Adds one entry to the tar volumes, as described in :any:`BackupFileList.generateTarVolumes`.
+    A new volume is appended to ``volumes`` whenever the last one is full.
+    """
+
+    def nextVolume():
+        volumes[-1].close()
+        volumes.append(_TarVolume(_getVolumePath(path, len(volumes) + 1), mode, maxSize))
+        return volumes[-1]
+
+    volume = volumes[-1]
+    tarinfo = volume.tar.gettarinfo(entry)
+    if tarinfo is None:
+        raise tarfile.TarError("Unable to archive [%s], which is not a file or soft link." % entry)
+    size = tarinfo.size if tarinfo.isreg() else 0
+    cost = volume.headerSize(tarinfo) + -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    if not volume.fits(cost) and volume.members > 0:
+        volume = nextVolume()
+    if volume.fits(cost):
+        if tarinfo.isreg():
+            with open(entry, "rb") as f:
+                volume.tar.addfile(tarinfo, f)
+        else:
+            volume.tar.addfile(tarinfo)
+        volume.members += 1
+        manifest.append((os.path.basename(volume.path), 0, size, entry))
+        return
+    offset = 0
+    number = 0
+    with open(entry, "rb") as f:
+        while offset < size:
+            if volume.members > 0:
+                volume = nextVolume()
+            number += 1
+            piece = copy.copy(tarinfo)
+            piece.name = "%s_%05d" % (tarinfo.name, number)
+            piece.size = min(size - offset, (volume.room() - volume.headerSize(piece)) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE)
+            f.seek(offset)
+            volume.tar.addfile(piece, f)
+            volume.members += 1
+            manifest.append((os.path.basename(volume.path), offset, piece.size, entry))
+            offset += piece.size
@@ -0,0 +1,916 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Maintains a journal of changed paths for incremental collect
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Maintains a journal of changed paths, used to speed up incremental collect.
+
+Summary
+=======
+
+   An incremental collect normally walks every directory and hashes every
+   file in a collect directory, just to find the few files that changed
+   since yesterday.  The ``cback3-journal`` tool runs alongside ``cback3``
+   and watches the configured collect directories with Linux ``inotify``,
+   appending the path of every file or directory that changes to a journal
+   in the working directory.  For a collect directory in ``incr`` mode, the
+   collect action reads the changed paths from the journal and only looks at
+   those, instead of walking the whole tree.
+
+   The collect action falls back to a full scan of a collect directory
+   whenever the journal can't be trusted to be complete for it:
+
+      - the watcher is not running, or doesn't answer in time
+      - the watcher was restarted since the last collect
+      - the kernel's event queue overflowed
+      - the watcher ran out of inotify watches, or couldn't watch some
+        directory in the tree
+      - the collect directory's exclusions have changed, or it has never
+        been collected with the journal before
+
+Barriers
+========
+
+   Before it reads the journal, the collect action writes a random token
+   into a barrier file in the working directory.  The watcher watches the
+   working directory too, and inotify delivers events in order, so by the
+   time the watcher sees the barrier file change, it has seen every change
+   made before it.  The watcher flushes its pending paths, then writes the
+   token into the journal.  The collect action reads up to that token, and
+   remembers the position for next time.
+
+Journal Format
+==============
+
+   The journal is a sequence of records, each a one-byte code, a payload and
+   a NUL byte.  Paths are written in the filesystem encoding, so they can't
+   contain NUL.  The codes are:
+
+      - ``S``: the watcher started, with a random identifier
+      - ``C``: a path changed (created, modified, deleted or moved)
+      - ``O``: changes under a collect directory (or all, if empty) were lost
+      - ``W``: a collect directory was completely watched, as of the next barrier
+      - ``B``: a barrier was reached, with the token from the collect action
+      - ``K``: the journal was compacted, with the inode and consumed offset
+        of the journal it replaced
+
+   The watcher only buffers a second or so of changes in memory, and it
+   removes duplicate paths as it goes.  When the journal grows past
+   :any:`COMPACT_SIZE`, the watcher rewrites it, keeping only the unique
+   paths that the collect action has not consumed yet.
+
+Limitations
+===========
+
+   inotify only reports changes made through the local kernel.  It does not
+   see changes made on another host to a network filesystem, writes through
+   a memory map, or changes made through a hard link that lives outside the
+   watched tree.  The full collect at the start of each week (or with
+   ``--full``) does not use the journal, so anything missed this way is
+   picked up then.
+
+   Only collect directories with a recursion level and link depth of zero
+   use the journal, because links may point outside the watched tree.
+
+Module Attributes
+=================
+
+Attributes:
+   INOTIFY_AVAILABLE: Whether inotify is available on this platform
+   JOURNAL_FILE: Name of the journal, in the working directory
+   SYNC_INTERVAL: Interval between journal flushes, in seconds
+   BARRIER_TIMEOUT: Time to wait for the watcher to reach a barrier, in seconds
+   COMPACT_SIZE: Journal size at which the watcher compacts the journal, in bytes
+
+:author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+########################################################################
+# Imported modules
+########################################################################
+
+import errno
+import logging
+import os
+import pickle  # noqa: S403 # we operate on trusted data, so pickle is ok
+import select
+import struct
+import sys
+import time
+import uuid
+
+from CedarBackup3.filesystem import normalizeDir
+from CedarBackup3.metrics import increment
+from CedarBackup3.util import encodePath, pathJoin
+
+try:
+    import ctypes
+    import fcntl
+
+    INOTIFY_AVAILABLE = sys.platform.startswith("linux")
+except ImportError:
+    INOTIFY_AVAILABLE = False
+
+########################################################################
+# Module-wide constants and variables
+########################################################################
+
+logger = logging.getLogger("CedarBackup3.log.journal")
+
+JOURNAL_FILE = "change.journal"
+JOURNAL_LOCK = "change.journal.lock"
+JOURNAL_BARRIER = "change.journal.barrier"
+JOURNAL_STATE = "change.journal.state"
+JOURNAL_STATE_VERSION = 1
+
+SYNC_INTERVAL = 1.0
+BARRIER_TIMEOUT = 60.0
+BARRIER_POLL = 0.1  # seconds between checks for the barrier token
+COMPACT_SIZE = 64 * 1024 * 1024
+READ_SIZE = 64 * 1024  # bytes read from the inotify descriptor at once
+MAX_USER_WATCHES = "/proc/sys/fs/inotify/max_user_watches"
+
+RECORD_START = b"S"
+RECORD_CHANGED = b"C"
+RECORD_OVERFLOW = b"O"
+RECORD_WATCHED = b"W"
+RECORD_BARRIER = b"B"
+RECORD_COMPACTED = b"K"
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONTFOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+########################################################################
+# Inotify class definition
+########################################################################
+
+
+class Inotify:
+    """
+    Thin wrapper around the Linux inotify interface, called through ``ctypes``.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the ``Inotify`` class.
+        Raises:
+           OSError: If inotify is not available or can't be initialized
+        """
+        if not INOTIFY_AVAILABLE:
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def fileno(self):
+        """
+        Returns the inotify file descriptor.
+        """
+        return self._fd
+
+    def addWatch(self, path, mask):
+        """
+        Adds a watch for a path, or updates the existing watch for it.
+        Args:
+           path: Path to watch
+           mask: Mask of events to watch for
+        Returns:
+            Watch descriptor
+        Raises:
+           OSError: If the watch can't be added, with ``ENOSPC`` if the watch limit was reached
+        """
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def removeWatch(self, wd):
+        """
+        Removes a watch, ignoring errors since the watch may already be gone.
+        Args:
+           wd: Watch descriptor
+        """
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def readEvents(self, timeout):
+        """
+        Reads the events that are available, waiting up to a timeout for the first one.
+        Args:
+           timeout: Time to wait, in seconds
+        Returns:
+            List of ``(wd, mask, cookie, name)`` tuples, where the name is empty for events on a watched directory itself
+        """
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        if not poller.poll(timeout * 1000):
+            return []
+        data = os.read(self._fd, READ_SIZE)
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            (wd, mask, cookie, length) = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        """
+        Closes the inotify file descriptor, removing all watches.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+########################################################################
+# ChangeWatcher class definition
+########################################################################
+
+
+class ChangeWatcher:
+    """
+    Watches a set of collect directories, appending changed paths to the journal.
+
+    Only one watcher may run against a working directory at a time, which is
+    enforced with a lock file.  Call :any:`open` to start watching, then
+    :any:`poll` in a loop (or :any:`run`), then :any:`close`.
+    """
+
+    def __init__(self, workingDir, roots):
+        """
+        Constructor for the ``ChangeWatcher`` class.
+        Args:
+           workingDir: Working directory, where the journal is kept
+           roots: List of collect directories to watch
+        """
+        self._workingDir = normalizeDir(encodePath(workingDir))
+        self._roots = [normalizeDir(encodePath(root)) for root in roots]
+        self._journalPath = pathJoin(self._workingDir, JOURNAL_FILE)
+        self._inotify = None
+        self._lock = None
+        self._journal = None
+        self._control = None
+        self._paths = {}
+        self._degraded = set()
+        self._pending = set()
+        self._lastSync = 0.0
+        self._compactSize = COMPACT_SIZE
+        self._limitReached = False
+
+    def open(self):
+        """
+        Takes the lock, starts a new session in the journal, and watches every directory.
+        Raises:
+           ValueError: If another watcher is already running against the working directory
+           OSError: If inotify can't be initialized
+        """
+        lockPath = pathJoin(self._workingDir, JOURNAL_LOCK)
+        self._lock = os.open(lockPath, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(self._lock)
+            self._lock = None
+            raise ValueError("Another change journal watcher is already running for [%s]." % self._workingDir)
+        os.ftruncate(self._lock, 0)
+        os.write(self._lock, b"%d\n" % os.getpid())
+        self._journal = os.open(self._journalPath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._writeRecords([(RECORD_START, uuid.uuid4().hex)])
+        self._inotify = Inotify()
+        self._control = self._inotify.addWatch(self._workingDir, IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR)
+        for root in self._roots:
+            self._watchTree(root)
+        logger.info("Watching %d directories under %d collect directories.", len(self._paths), len(self._roots))
+        limit = _getWatchLimit()
+        if limit is not None:
+            logger.info("The inotify watch limit is %d (%s).", limit, MAX_USER_WATCHES)
+        for root in sorted(self._degraded):
+            logger.warning("Collect directory [%s] is not completely watched; it will be scanned on every collect.", root)
+
+    def close(self):
+        """
+        Flushes the journal, stops watching, and releases the lock.
+        """
+        if self._journal is not None:
+            self.sync()
+            os.close(self._journal)
+            self._journal = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._paths = {}
+        if self._lock is not None:
+            os.close(self._lock)  # releases the lock
+            self._lock = None
+
+    def run(self, stop):
+        """
+        Watches until the stop event is set.
+        Args:
+           stop: ``threading.Event`` that is set to stop watching
+        """
+        self.open()
+        try:
+            while not stop.is_set():
+                self.poll(SYNC_INTERVAL)
+        finally:
+            self.close()
+
+    def poll(self, timeout):
+        """
+        Handles the events that arrive within a timeout, flushing the journal when it is due.
+        Args:
+           timeout: Time to wait for events, in seconds
+        """
+        for event in self._inotify.readEvents(timeout):
+            self._handleEvent(*event)
+        if time.monotonic() - self._lastSync >= SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        """
+        Writes the pending changed paths to the journal and flushes it to disk.
+        """
+        records = [(RECORD_CHANGED, path) for path in sorted(self._pending)]
+        self._pending = set()
+        if records:
+            self._writeRecords(records)
+            increment("journal.changed", len(records))
+        self._lastSync = time.monotonic()
+        if os.fstat(self._journal).st_size >= self._compactSize:
+            self._compact()
+
+    def _handleEvent(self, wd, mask, cookie, name):  # noqa: ARG002
+        """
+        Handles a single inotify event.
+        Args:
+           wd: Watch descriptor the event is for
+           mask: Mask describing the event
+           cookie: Cookie relating the two halves of a rename
+           name: Name of the entry within the watched directory, empty for the directory itself
+        """
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("The inotify event queue overflowed; the next collect will scan every directory.")
+            self._writeRecords([(RECORD_OVERFLOW, "")])
+            return
+        if wd == self._control:
+            if name == JOURNAL_BARRIER:
+                self._barrier()
+            return
+        path = self._paths.get(wd)
+        if path is None:
+            return
+        if mask & IN_IGNORED:
+            del self._paths[wd]
+            return
+        if not name:
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT) and path in self._roots:
+                logger.warning("Collect directory [%s] was removed or moved; it is no longer watched.", path)
+                self._degraded.add(path)
+            return
+        entry = pathJoin(path, name)
+        if entry == self._workingDir or entry.startswith(self._workingDir + "/"):
+            return  # our own journal writes would otherwise feed back into the journal
+        self._pending.add(entry)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._watchTree(entry)
+            elif mask & IN_MOVED_FROM:
+                self._unwatchTree(entry)
+
+    def _watchTree(self, top):
+        """
+        Adds watches for a directory and all of the real directories beneath it.
+        Soft links are never followed, other than a collect directory that is itself a link.
+        Args:
+           top: Top of the tree to watch
+        """
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            mask = WATCH_MASK if path in self._roots else WATCH_MASK | IN_DONTFOLLOW
+            try:
+                self._paths[self._inotify.addWatch(path, mask)] = path
+                with os.scandir(path) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # removed before we got to it, which its parent's watch will report
+                if e.errno == errno.ENOSPC:
+                    if not self._limitReached:
+                        logger.error("Reached the inotify watch limit; increase %s to watch every directory.", MAX_USER_WATCHES)
+                        self._limitReached = True
+                else:
+                    logger.warning("Unable to watch [%s]: %s", path, e)
+                self._degraded.update(self._rootsFor(path))
+
+    def _unwatchTree(self, top):
+        """
+        Removes the watches for a directory and everything beneath it.
+        Args:
+           top: Top of the tree to stop watching
+        """
+        prefix = top + "/"
+        for wd, path in list(self._paths.items()):
+            if path == top or path.startswith(prefix):
+                self._inotify.removeWatch(wd)
+                del self._paths[wd]
+
+    def _rootsFor(self, path):
+        """
+        Returns the collect directories that contain a path.
+        Args:
+           path: Path to check
+        Returns:
+            List of collect directories
+        """
+        return [root for root in self._roots if path == root or path.startswith(root + "/")]
+
+    def _barrier(self):
+        """
+        Answers a barrier request, writing the token after every change seen before it.
+        """
+        try:
+            with open(pathJoin(self._workingDir, JOURNAL_BARRIER)) as f:
+                token = f.read().strip()
+        except OSError as e:
+            logger.warning("Unable to read the barrier token: %s", e)
+            return
+        if not token:
+            return
+        self.sync()
+        records = [(RECORD_WATCHED, root) for root in self._roots if root not in self._degraded]
+        records.extend((RECORD_OVERFLOW, root) for root in sorted(self._degraded))
+        records.append((RECORD_BARRIER, token))
+        self._writeRecords(records)
+        logger.debug("Reached barrier [%s].", token)
+
+    def _writeRecords(self, records):
+        """
+        Appends records to the journal and flushes them to disk.
+        Args:
+           records: List of ``(code, payload)`` tuples
+        """
+        os.write(self._journal, _encodeRecords(records))
+        os.fsync(self._journal)
+
+    def _compact(self):
+        """
+        Rewrites the journal, keeping only the unique records the collect action has not consumed.
+        """
+        stat = os.fstat(self._journal)
+        offset = _getConsumedOffset(self._workingDir, self._journalPath, stat.st_ino)
+        records = []
+        if offset is not None:
+            seen = set()
+            with open(self._journalPath, "rb") as f:
+                for code, payload, _ in _readRecords(f, offset):
+                    if code == RECORD_CHANGED:
+                        if payload not in seen:
+                            seen.add(payload)
+                            records.append((code, payload))
+                    elif code in (RECORD_START, RECORD_OVERFLOW):
+                        records.append((code, payload))
+        else:
+            offset = stat.st_size  # nothing has been consumed, so the collect action will scan anyway
+        temp = "%s.tmp" % self._journalPath
+        with open(temp, "wb") as f:
+            f.write(_encodeRecords([(RECORD_COMPACTED, "%d %d" % (stat.st_ino, offset)), *records]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self._journalPath)
+        os.close(self._journal)
+        self._journal = os.open(self._journalPath, os.O_WRONLY | os.O_APPEND)
+        size = os.fstat(self._journal).st_size
+        self._compactSize = max(COMPACT_SIZE, 2 * size)
+        increment("journal.compactions")
+        logger.info("Compacted the change journal from %d to %d bytes.", stat.st_size, size)
+
+    def _getDegraded(self):
+        """
+        Property target to get the collect directories that are not completely watched.
+        """
+        return set(self._degraded)
+
+    def _getWatches(self):
+        """
+        Property target to get the number of directories being watched.
+        """
+        return len(self._paths)
+
+    degraded = property(_getDegraded, None, None, "Collect directories that are not completely watched.")
+    watches = property(_getWatches, None, None, "Number of directories being watched.")
+
+
+########################################################################
+# JournalChanges class definition
+########################################################################
+
+
+class JournalChanges:
+    """
+    Changes read from the journal, from the last collect up to a barrier.
+
+    Use :any:`getChanges` to get the changed paths for a collect directory,
+    which returns ``None`` if the collect directory must be scanned instead.
+    Once every collect directory has been collected, save the position with
+    :any:`saveJournalState`, so the next collect starts where this one ended.
+    """
+
+    def __init__(self, trusted, changed, overflow, watched, inode, offset, fingerprints):
+        """
+        Constructor for the ``JournalChanges`` class.
+        Args:
+           trusted: Whether the journal covers the whole time since the last collect
+           changed: Set of changed paths
+           overflow: Set of collect directories whose changes were lost, with an empty string for all
+           watched: Set of collect directories that were completely watched at the barrier
+           inode: Inode of the journal
+           offset: Offset just past the barrier
+           fingerprints: Fingerprints of the collect directories saved by the last collect
+        """
+        self.trusted = trusted
+        self.changed = changed
+        self.overflow = overflow
+        self.watched = watched
+        self.inode = inode
+        self.offset = offset
+        self.fingerprints = fingerprints
+
+    def getChanges(self, path, fingerprint):
+        """
+        Returns the changed paths within a collect directory.
+
+        The fingerprint identifies the settings that the collect directory was
+        collected with, such as its exclusions.  If it differs from the last
+        collect, the previous digest doesn't match what the journal would
+        produce, so the directory must be scanned.
+
+        Args:
+           path: Collect directory
+           fingerprint: Fingerprint of the collect directory's settings
+        Returns:
+            Set of changed paths, or ``None`` if the collect directory must be scanned
+        """
+        path = normalizeDir(encodePath(path))
+        reason = None
+        if not self.trusted:
+            reason = "the watcher was not running for the whole time since the last collect"
+        elif "" in self.overflow or path in self.overflow:
+            reason = "some changes were lost"
+        elif path not in self.watched:
+            reason = "it is not watched"
+        elif self.fingerprints.get(path) != fingerprint:
+            reason = "it has not been collected with these settings before"
+        if reason is not None:
+            logger.info("Not using the change journal for [%s], because %s.", path, reason)
+            return None
+        prefix = path + "/"
+        return {changed for changed in self.changed if changed == path or changed.startswith(prefix)}
+
+
+########################################################################
+# Public functions
+########################################################################
+
+##########################
+# readChanges() function
+##########################
+
+
+def readChanges(workingDir, timeout=BARRIER_TIMEOUT):
+    """
+    Reads the changes recorded since the last collect, up to a new barrier.
+    Args:
+       workingDir: Working directory, where the journal is kept
+       timeout: Time to wait for the watcher to reach the barrier, in seconds
+    Returns:
+        ``JournalChanges``, or ``None`` if the watcher is not running or did not answer in time
+    """
+    token = requestBarrier(workingDir)
+    if token is None:
+        return None
+    deadline = time.monotonic() + timeout
+    while True:
+        changes = readJournal(workingDir, token)
+        if changes is not None:
+            logger.debug("Read %d changed paths from the change journal.", len(changes.changed))
+            return changes
+        if time.monotonic() >= deadline:
+            logger.warning("The change journal watcher did not reach the barrier within %.0f seconds.", timeout)
+            return None
+        time.sleep(BARRIER_POLL)
+
+
+#############################
+# requestBarrier() function
+#############################
+
+
+def requestBarrier(workingDir):
+    """
+    Asks the watcher to write a barrier to the journal.
+    Args:
+       workingDir: Working directory, where the journal is kept
+    Returns:
+        Barrier token to wait for, or ``None`` if the watcher is not running
+    """
+    if not INOTIFY_AVAILABLE:
+        return None
+    lockPath = pathJoin(workingDir, JOURNAL_LOCK)
+    if not os.path.exists(lockPath):
+        return None
+    fd = os.open(lockPath, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        logger.info("The change journal watcher is not running.")
+        return None
+    except OSError:
+        pass  # the watcher holds the lock
+    finally:
+        os.close(fd)
+    token = uuid.uuid4().hex
+    barrierPath = pathJoin(workingDir, JOURNAL_BARRIER)
+    temp = "%s.tmp" % barrierPath
+    with open(temp, "w") as f:
+        f.write(token)
+    os.replace(temp, barrierPath)
+    return token
+
+
+##########################
+# readJournal() function
+##########################
+
+
+def readJournal(workingDir, token):
+    """
+    Reads the journal from the position saved by the last collect, up to a barrier.
+    Args:
+       workingDir: Working directory, where the journal is kept
+       token: Barrier token, as from :any:`requestBarrier`
+    Returns:
+        ``JournalChanges``, or ``None`` if the barrier has not been reached yet
+    """
+    journalPath = pathJoin(workingDir, JOURNAL_FILE)
+    if not os.path.exists(journalPath):
+        return None
+    state = _loadState(workingDir)
+    with open(journalPath, "rb") as f:
+        inode = os.fstat(f.fileno()).st_ino
+        offset = _getStartOffset(state, f, inode)
+        trusted = offset is not None
+        changed = set()
+        overflow = set()
+        watched = set()
+        for code, payload, end in _readRecords(f, offset or 0):
+            if code == RECORD_START:
+                trusted = False
+            elif code == RECORD_CHANGED:
+                changed.add(payload)
+            elif code == RECORD_OVERFLOW:
+                overflow.add(payload)
+            elif code == RECORD_WATCHED:
+                watched.add(payload)
+            elif code == RECORD_BARRIER:
+                if payload == token:
+                    fingerprints = state["fingerprints"] if state is not None else {}
+                    return JournalChanges(trusted, changed, overflow, watched, inode, end, fingerprints)
+                watched = set()
+    return None
+
+
+###############################
+# saveJournalState() function
+###############################
+
+
+def saveJournalState(workingDir, changes, fingerprints):
+    """
+    Saves the journal position reached by a collect, so the next collect starts there.
+
+    A failure to save the state is logged but otherwise ignored; the next
+    collect will then scan every collect directory.
+
+    Args:
+       workingDir: Working directory, where the journal is kept
+       changes: ``JournalChanges`` read by this collect
+       fingerprints: Dictionary mapping collect directory to the fingerprint of its settings
+    """
+    path = pathJoin(workingDir, JOURNAL_STATE)
+    fingerprints = {normalizeDir(encodePath(key)): value for key, value in fingerprints.items()}
+    state = {"version": JOURNAL_STATE_VERSION, "inode": changes.inode, "offset": changes.offset, "fingerprints": fingerprints}
+    try:
+        temp = "%s.tmp" % path
+        with open(temp, "wb") as f:
+            pickle.dump(state, f)
+        os.replace(temp, path)
+        logger.debug("Saved change journal position %d.", changes.offset)
+    except Exception as e:
+        logger.error("Failed to save change journal state [%s]: %s", path, e)
+
+
+##########################
+# mergeDigest() function
+##########################
+
+
+def mergeDigest(oldDigest, captured, changed):
+    """
+    Builds the digest for a collect directory from the previous digest and the changed paths.
+
+    Entries in the previous digest at or beneath a changed path are dropped,
+    since the path may have been removed, and then the digests captured for
+    the files that exist now are added.
+
+    Args:
+       oldDigest: Digest from the previous collect, mapping path to digest
+       captured: Digests captured for the files at the changed paths
+       changed: Set of changed paths
+    Returns:
+        New digest, mapping path to digest
+    """
+    prefixes = tuple(path + "/" for path in changed if path not in oldDigest)  # files have nothing beneath them
+    if prefixes:
+        digest = {key: value for key, value in oldDigest.items() if key not in changed and not key.startswith(prefixes)}
+    else:
+        digest = {key: value for key, value in oldDigest.items() if key not in changed}
+    digest.update(captured)
+    return digest
+
+
+########################################################################
+# Private utility functions
+########################################################################
+
+
+def _encodeRecords(records):
+    """
+    Encodes a list of ``(code, payload)`` records into journal format.
+    """
+    return b"".join(code + os.fsencode(payload) + b"\0" for code, payload in records)
+
+
+def _readRecords(f, offset):
+    """
+    Generates the complete records in a journal file from an offset.
+    A trailing partial record, still being written, is ignored.
+    Args:
+       f: Journal file, opened in binary mode
+       offset: Offset to start at
+    Returns:
+        Generator of ``(code, payload, end)`` tuples, where ``end`` is the offset just past the record
+    """
+    f.seek(offset)
+    data = f.read()
+    position = 0
+    while True:
+        end = data.find(b"\0", position)
+        if end < 0:
+            return
+        yield (data[position : position + 1], os.fsdecode(data[position + 1 : end]), offset + end + 1)
+        position = end + 1
+
+
+def _readCompacted(f):
+    """
+    Reads the compaction record at the start of a journal, if there is one.
+    Returns:
+        Tuple of ``(inode, offset, end)`` describing the journal that was replaced, or ``None``
+    """
+    for code, payload, end in _readRecords(f, 0):
+        if code == RECORD_COMPACTED:
+            (inode, offset) = payload.split()
+            return (int(inode), int(offset), end)
+        return None
+    return None
+
+
+def _getStartOffset(state, f, inode):
+    """
+    Determines where the last collect stopped reading the journal.
+    Args:
+       state: Saved state, as from :any:`_loadState`, or ``None``
+       f: Journal file, opened in binary mode
+       inode: Inode of the journal
+    Returns:
+        Offset to start reading at, or ``None`` if the position is unknown
+    """
+    if state is None:
+        return None
+    if state["inode"] == inode:
+        if state["offset"] <= os.fstat(f.fileno()).st_size:
+            return state["offset"]
+        return None
+    compacted = _readCompacted(f)
+    if compacted is not None and compacted[0] == state["inode"] and state["offset"] >= compacted[1]:
+        return compacted[2]
+    return None
+
+
+def _getConsumedOffset(workingDir, journalPath, inode):
+    """
+    Determines how much of the current journal the collect action has consumed.
+    Returns:
+        Offset in the current journal, or ``None`` if the collect action has no usable position
+    """
+    with open(journalPath, "rb") as f:
+        return _getStartOffset(_loadState(workingDir), f, inode)
+
+
+def _loadState(workingDir):
+    """
+    Loads the state saved by the last collect.
+    Returns:
+        State dictionary, or ``None`` if there is no usable state
+    """
+    path = pathJoin(workingDir, JOURNAL_STATE)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)  # noqa: S301 # this is trusted data, so pickle is ok
+    except Exception as e:
+        logger.error("Failed loading change journal state [%s]: %s", path, e)
+        return None
+    if not isinstance(state, dict) or state.get("version") != JOURNAL_STATE_VERSION:
+        logger.warning("Change journal state [%s] has an unknown format; ignoring it.", path)
+        return None
+    return state
+
+
+def _getWatchLimit():
+    """
+    Returns the per-user inotify watch limit, or ``None`` if it can't be read.
+    """
+    try:
+        with open(MAX_USER_WATCHES) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
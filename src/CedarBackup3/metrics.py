@@ -0,0 +1,454 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Provides timers and counters used to report run metrics
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Provides timers and counters used to report run metrics.
+
+Summary
+=======
+
+   Cedar Backup records how long each action and each phase within an action
+   takes, along with simple counters (files processed, bytes written, etc.)
+   and the time spent in every external command.  All of this is collected
+   in :any:`MetricsSingleton`, and the ``cback3 --metrics`` option writes it
+   out at the end of a run.
+
+   Instrumented code uses the module-level functions, which always act on the
+   singleton instance::
+
+      with timer("collect.archive"):
+         backupList.generateTarfile(tarfilePath, archiveMode, True)
+      increment("collect.files", len(backupList))
+
+   Timers and counters are cheap (a couple of clock reads and a lock per
+   call), so they are always enabled and are used at the level of a phase or
+   a file list, never per file.  Names are dotted strings, conventionally
+   starting with the action or module that owns them.
+
+Report Format
+=============
+
+   The report is written as JSON by default.  If the path ends in ``.prom``,
+   it is written in the Prometheus text exposition format instead, suitable
+   for the node exporter's textfile collector.  Either way, the file is
+   written to a temporary file and renamed into place, so a collector never
+   sees a partial report.
+
+   Wall and CPU time for the run are measured from the point the singleton
+   was last reset.  CPU time for a timer is process CPU time, so it includes
+   the work of any threads running during the timed phase.  CPU time used by
+   external commands is reported once for the whole run.
+
+Module Attributes
+=================
+
+Attributes:
+   REPORT_VERSION: Version of the report format
+   PROMETHEUS_SUFFIX: Report path suffix that selects the Prometheus format
+
+:author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+########################################################################
+# Imported modules
+########################################################################
+
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+########################################################################
+# Module-wide constants and variables
+########################################################################
+
+logger = logging.getLogger("CedarBackup3.log.metrics")
+
+REPORT_VERSION = 1
+PROMETHEUS_SUFFIX = ".prom"
+PROMETHEUS_PREFIX = "cback3"
+PROC_IO = "/proc/self/io"
+
+
+########################################################################
+# MetricsSingleton class definition
+########################################################################
+
+
+class MetricsSingleton:
+    """
+    Singleton used to collect run metrics.
+
+    The class follows the same pattern as :any:`util.PathResolverSingleton`.
+    Everyone who records metrics gets the instance using :any:`getInstance`,
+    usually indirectly via the module-level :any:`timer`, :any:`increment` and
+    :any:`recordCommand` functions.  The main routine calls :any:`reset` when
+    a run starts and :any:`writeReport` when it finishes.
+
+    All methods are safe to call from multiple threads.
+
+    Attributes:
+       _instance: Holds a reference to the singleton
+    """
+
+    _instance = None  # Holds a reference to singleton instance
+
+    class _Helper:
+        """Helper class to provide a singleton factory method."""
+
+        def __init__(self):
+            pass
+
+        def __call__(self, *args, **kw):  # noqa: ARG002
+            if MetricsSingleton._instance is None:
+                obj = MetricsSingleton()
+                MetricsSingleton._instance = obj
+            return MetricsSingleton._instance
+
+    getInstance = _Helper()  # Method that callers will use to get an instance
+
+    def __init__(self):
+        """Singleton constructor, which just creates the singleton instance."""
+        MetricsSingleton._instance = self
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Discards all recorded metrics and restarts the run clocks.
+        """
+        with self._lock:
+            self._started = time.time()
+            self._wall = time.perf_counter()
+            self._cpu = time.process_time()
+            self._childCpu = childCpuTime()
+            self._io = _readProcIo()
+            self._timers = {}
+            self._counters = {}
+            self._commands = {}
+            self._active = {}
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Context manager that times the enclosed block, adding to the named timer.
+
+        The time is recorded even if the block raises an exception.
+
+        Args:
+           name: Name of the timer
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def addTime(self, name, wall, cpu=0.0):
+        """
+        Adds one measurement to the named timer.
+        Args:
+           name: Name of the timer
+           wall: Elapsed wall-clock time, in seconds
+           cpu: Elapsed CPU time, in seconds
+        """
+        with self._lock:
+            entry = self._timers.setdefault(name, {"count": 0, "wall": 0.0, "cpu": 0.0})
+            entry["count"] += 1
+            entry["wall"] += wall
+            entry["cpu"] += cpu
+
+    def increment(self, name, value=1):
+        """
+        Adds a value to the named counter.
+        Args:
+           name: Name of the counter
+           value: Amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def recordCommand(self, command, wall):
+        """
+        Records one execution of an external command.
+        Args:
+           command: Path or name of the command, which is reduced to its basename
+           wall: Elapsed wall-clock time, in seconds
+        """
+        name = os.path.basename(command)
+        with self._lock:
+            entry = self._commands.setdefault(name, {"count": 0, "wall": 0.0})
+            entry["count"] += 1
+            entry["wall"] += wall
+
+    def startCommand(self, command):
+        """
+        Marks an external command as running in the current thread.
+
+        While the command runs, it's reported by :any:`getActiveCommands`, which
+        lets a sampling profiler attribute the thread's time to the command
+        rather than to the Python code waiting on it.
+
+        Args:
+           command: Path or name of the command, which is reduced to its basename
+        Returns:
+            Token to pass to :any:`finishCommand`
+        """
+        name = os.path.basename(command)
+        with self._lock:
+            self._active[threading.get_ident()] = name
+        return (name, time.perf_counter())
+
+    def finishCommand(self, token):
+        """
+        Marks an external command as finished, recording its elapsed time.
+        Args:
+           token: Token returned by :any:`startCommand`
+        """
+        (name, started) = token
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        self.recordCommand(name, time.perf_counter() - started)
+
+    def getActiveCommands(self):
+        """
+        Returns a dict mapping thread identifier to the name of the command that thread is running.
+        """
+        with self._lock:
+            return dict(self._active)
+
+    def getCommands(self):
+        """
+        Returns a copy of the command timings, as a dict mapping name to a dict with count and wall.
+        """
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._commands.items()}
+
+    def getCounter(self, name):
+        """
+        Returns the current value of the named counter, or zero if it was never incremented.
+        """
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def getTimer(self, name):
+        """
+        Returns a copy of the named timer, as a dict with count, wall and cpu, or ``None``.
+        """
+        with self._lock:
+            entry = self._timers.get(name)
+            return dict(entry) if entry is not None else None
+
+    def buildReport(self, status=None):
+        """
+        Builds a report of everything recorded since the last reset.
+        Args:
+           status: Exit status of the run, if known
+        Returns:
+            Report as a dict that can be serialized to JSON
+        """
+        with self._lock:
+            report = {
+                "version": REPORT_VERSION,
+                "started": self._started,
+                "wall": time.perf_counter() - self._wall,
+                "cpu": time.process_time() - self._cpu,
+                "childCpu": childCpuTime() - self._childCpu,
+                "timers": {name: dict(entry) for name, entry in self._timers.items()},
+                "counters": dict(self._counters),
+                "commands": {name: dict(entry) for name, entry in self._commands.items()},
+            }
+            io = _readProcIo()
+            if io is not None and self._io is not None:
+                report["io"] = {name: io[name] - self._io[name] for name in io if name in self._io}
+        if status is not None:
+            report["status"] = status
+        return report
+
+    def writeReport(self, path, status=None):
+        """
+        Writes a report to disk, as JSON or in the Prometheus text format.
+
+        The Prometheus format is used if the path ends in :any:`PROMETHEUS_SUFFIX`.
+
+        Args:
+           path: Path of the report file
+           status: Exit status of the run, if known
+        Raises:
+           OSError: If the report cannot be written
+        """
+        report = self.buildReport(status)
+        if path.endswith(PROMETHEUS_SUFFIX):
+            content = _formatPrometheus(report)
+        else:
+            content = json.dumps(report, indent=2, sort_keys=True) + "\n"
+        temp = "%s.tmp" % path
+        with open(temp, "w") as f:
+            f.write(content)
+        os.replace(temp, path)
+        logger.debug("Wrote metrics report to [%s].", path)
+
+
+########################################################################
+# Public functions
+########################################################################
+
+
+def timer(name):
+    """
+    Times the enclosed block using the singleton; see :any:`MetricsSingleton.timer`.
+    """
+    return MetricsSingleton.getInstance().timer(name)
+
+
+def increment(name, value=1):
+    """
+    Adds to a counter using the singleton; see :any:`MetricsSingleton.increment`.
+    """
+    MetricsSingleton.getInstance().increment(name, value)
+
+
+def recordCommand(command, wall):
+    """
+    Records an external command using the singleton; see :any:`MetricsSingleton.recordCommand`.
+    """
+    MetricsSingleton.getInstance().recordCommand(command, wall)
+
+
+def startCommand(command):
+    """
+    Marks a command as running using the singleton; see :any:`MetricsSingleton.startCommand`.
+    """
+    return MetricsSingleton.getInstance().startCommand(command)
+
+
+def finishCommand(token):
+    """
+    Marks a command as finished using the singleton; see :any:`MetricsSingleton.finishCommand`.
+    """
+    MetricsSingleton.getInstance().finishCommand(token)
+
+
+def childCpuTime():
+    """
+    Returns the CPU time used by terminated child processes, in seconds.
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+########################################################################
+# Private utility functions
+########################################################################
+
+
+def _readProcIo():
+    """
+    Reads the I/O counters for this process from ``/proc/self/io``.
+    Returns:
+        Dict mapping counter name to value, or ``None`` if the counters are not available
+    """
+    try:
+        counters = {}
+        with open(PROC_IO) as f:
+            for line in f:
+                (name, value) = line.split(":", 1)
+                counters[name.strip()] = int(value)
+        return counters
+    except (OSError, ValueError):
+        return None
+
+
+def _formatPrometheus(report):
+    """
+    Formats a report in the Prometheus text exposition format.
+    Args:
+       report: Report as returned by :any:`MetricsSingleton.buildReport`
+    Returns:
+        Report as a string
+    """
+    lines = []
+
+    def metric(name, kind, help, samples):  # noqa: A002
+        name = "%s_%s" % (PROMETHEUS_PREFIX, name)
+        lines.append("# HELP %s %s" % (name, help))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for labels, value in samples:
+            if labels:
+                label = ",".join('%s="%s"' % (key, _escapeLabel(labels[key])) for key in sorted(labels))
+                lines.append("%s{%s} %s" % (name, label, _formatValue(value)))
+            else:
+                lines.append("%s %s" % (name, _formatValue(value)))
+
+    metric("run_start_time_seconds", "gauge", "Time the run started, in seconds since the epoch.", [({}, report["started"])])
+    metric("run_wall_seconds", "gauge", "Wall-clock duration of the run.", [({}, report["wall"])])
+    metric("run_cpu_seconds", "gauge", "CPU time used by the run, not including external commands.", [({}, report["cpu"])])
+    metric("run_child_cpu_seconds", "gauge", "CPU time used by external commands.", [({}, report["childCpu"])])
+    if "status" in report:
+        metric("run_status", "gauge", "Exit status of the run.", [({}, report["status"])])
+    if "io" in report:
+        samples = [({"counter": name}, value) for name, value in sorted(report["io"].items())]
+        metric("run_io", "gauge", "Change in /proc/self/io counters over the run.", samples)
+    timers = sorted(report["timers"].items())
+    metric("timer_wall_seconds", "gauge", "Wall-clock time spent in a phase.", [({"timer": n}, t["wall"]) for n, t in timers])
+    metric("timer_cpu_seconds", "gauge", "CPU time spent in a phase.", [({"timer": n}, t["cpu"]) for n, t in timers])
+    metric("timer_count", "gauge", "Number of times a phase ran.", [({"timer": n}, t["count"]) for n, t in timers])
+    counters = sorted(report["counters"].items())
+    metric("counter", "gauge", "Value of a counter.", [({"counter": n}, v) for n, v in counters])
+    commands = sorted(report["commands"].items())
+    metric("command_wall_seconds", "gauge", "Time spent in a command.", [({"command": n}, c["wall"]) for n, c in commands])
+    metric("command_count", "gauge", "Runs of a command.", [({"command": n}, c["count"]) for n, c in commands])
+    return "\n".join(lines) + "\n"
+
+
+def _escapeLabel(value):
+    """
+    Escapes a label value for the Prometheus text format.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatValue(value):
+    """
+    Formats a sample value for the Prometheus text format.
+    """
+    if isinstance(value, int):
+        return "%d" % value
+    return repr(float(value))
@@ -52,6 +52,7 @@
 # Imported modules
 ########################################################################
 
+import errno
 import logging
 import os
 import posixpath
@@ -60,7 +61,23 @@
 
 from CedarBackup3.config import VALID_FAILURE_MODES
 from CedarBackup3.filesystem import FilesystemList
-from CedarBackup3.util import encodePath, executeCommand, isRunningAsRoot, pathJoin, resolveCommand, splitCommandLine
+from CedarBackup3.metrics import increment
+from CedarBackup3.util import (
+    displayBytes,
+    encodePath,
+    executeCommand,
+    isRunningAsRoot,
+    pathJoin,
+    resolveCommand,
+    splitCommandLine,
+)
+
+try:
+    import fcntl
+
+    _FICLONE_AVAILABLE = sys.platform.startswith("linux")
+except ImportError:
+    _FICLONE_AVAILABLE = False
 
 ########################################################################
 # Module-wide constants and variables
@@ -77,6 +94,9 @@
 
 SU_COMMAND = ["su"]
 
+FICLONE = 0x40049409  # Linux ioctl(dest, FICLONE, src) to share extents copy-on-write
+CLONE_UNSUPPORTED = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EBADF, errno.ENOSYS)
+
 
 ########################################################################
 # LocalPeer class definition
@@ -205,6 +225,14 @@ def stagePeer(self, targetDir, ownership=None, permissions=None):
         method is called.  If passed in, ownership and permissions will be
         applied to the files that are copied.
 
+        If the collect and target directories are on the same filesystem, each
+        file is cloned as a reflink where the filesystem supports it (for
+        instance, btrfs or XFS), so the data is shared copy-on-write rather than
+        being read and written again.  Otherwise, the data is copied within the
+        kernel where possible, falling back to an ordinary copy.  Either way,
+        each staged file is a separate file with its own ownership and
+        permissions.
+
         *Note:* The caller is responsible for checking that the indicator exists,
         if they care.  This function only stages the files within the directory.
 
@@ -333,17 +361,30 @@ def _copyLocalDir(sourceDir, targetDir, ownership=None, permissions=None):
            OSError: If there is an OS error copying or changing permissions on a files
         """
         filesCopied = 0
+        bytesStaged = 0
+        bytesCopied = 0
         sourceDir = encodePath(sourceDir)
         targetDir = encodePath(targetDir)
+        sameDevice = os.stat(sourceDir).st_dev == os.stat(targetDir).st_dev
         for fileName in os.listdir(sourceDir):
             sourceFile = pathJoin(sourceDir, fileName)
             targetFile = pathJoin(targetDir, fileName)
-            LocalPeer._copyLocalFile(sourceFile, targetFile, ownership, permissions)
+            bytesCopied += LocalPeer._copyLocalFile(sourceFile, targetFile, ownership, permissions, sameDevice=sameDevice)
             filesCopied += 1
+            bytesStaged += os.path.getsize(targetFile)
+        logger.info(
+            "Staged %d files (%s) from [%s], of which %s were physically copied.",
+            filesCopied,
+            displayBytes(bytesStaged),
+            sourceDir,
+            displayBytes(bytesCopied),
+        )
+        increment("peer.bytes", bytesStaged)
+        increment("peer.bytesCopied", bytesCopied)
         return filesCopied
 
     @staticmethod
-    def _copyLocalFile(sourceFile=None, targetFile=None, ownership=None, permissions=None, overwrite=True):
+    def _copyLocalFile(sourceFile=None, targetFile=None, ownership=None, permissions=None, overwrite=True, sameDevice=False):
         """
         Copies a source file to a target file.
 
@@ -352,6 +393,11 @@ def _copyLocalFile(sourceFile=None, targetFile=None, ownership=None, permissions
         is a no-op.  Attempting to copy a soft link or a directory will result in
         an exception.
 
+        If ``sameDevice`` is set, the caller has determined that the source and
+        target are on the same filesystem, so we first try to clone the file as
+        a reflink, and then to copy it with ``copy_file_range()``.  The file's
+        permission bits are copied either way, just like ``shutil.copy``.
+
         *Note:* If you have user/group as strings, call the :any:`util.getUidGid`
         function to get the associated uid/gid as an ownership tuple.
 
@@ -364,6 +410,9 @@ def _copyLocalFile(sourceFile=None, targetFile=None, ownership=None, permissions
            ownership: Owner and group that files should have, tuple of numeric ``(uid, gid)``
            permissions: Unix permissions mode that the staged files should have, in octal like ``0640``
            overwrite: Indicates whether it's OK to overwrite the target file
+           sameDevice: Indicates whether the source and target are on the same filesystem
+        Returns:
+            Number of bytes physically copied, which is zero for a cloned or empty file
         Raises:
            ValueError: If the passed-in source file is not a regular file
            ValueError: If a path cannot be encoded properly
@@ -374,16 +423,21 @@ def _copyLocalFile(sourceFile=None, targetFile=None, ownership=None, permissions
         targetFile = encodePath(targetFile)
         sourceFile = encodePath(sourceFile)
         if targetFile is None:
-            return
+            return 0
         if not overwrite:
             if os.path.exists(targetFile):
                 raise OSError("Target file [%s] already exists." % targetFile)
+        bytesCopied = 0
         if sourceFile is None:
             with open(targetFile, "w") as f:
                 f.write("")
         else:
             if os.path.isfile(sourceFile) and not os.path.islink(sourceFile):
-                shutil.copy(sourceFile, targetFile)
+                if sameDevice:
+                    bytesCopied = LocalPeer._cloneLocalFile(sourceFile, targetFile)
+                else:
+                    shutil.copy(sourceFile, targetFile)
+                    bytesCopied = os.path.getsize(targetFile)
             else:
                 logger.debug("Source [%s] is not a regular file.", sourceFile)
                 raise ValueError("Source is not a regular file.")
@@ -392,6 +446,60 @@ def _copyLocalFile(sourceFile=None, targetFile=None, ownership=None, permissions
                 os.chown(targetFile, ownership[0], ownership[1])
         if permissions is not None:
             os.chmod(targetFile, permissions)
+        return bytesCopied
+
+    @staticmethod
+    def _cloneLocalFile(sourceFile, targetFile):
+        """
+        Copies a source file to a target file on the same filesystem, as cheaply as possible.
+
+        We first try to clone the file with the ``FICLONE`` ioctl, which shares
+        the source's data blocks copy-on-write, so nothing is read or written.
+        If the filesystem doesn't support that, we copy with ``copy_file_range()``,
+        which keeps the copy within the kernel (and is itself done as a reflink
+        or server-side copy by some filesystems).  As a last resort, we fall back
+        to ``shutil.copyfileobj``.  The target gets the source's permission bits.
+
+        Hard links are deliberately not used.  A hard link would share the
+        source's ownership and permissions, and the collect action rewrites its
+        tarfiles in place using the same names every night, which would also
+        change an already-staged file.
+
+        Args:
+           sourceFile: Source file to copy
+           targetFile: Target file to create
+        Returns:
+            Number of bytes physically copied, zero if the file was cloned
+        Raises:
+           IOError: If there is an IO error copying the file
+        """
+        with open(sourceFile, "rb") as source, open(targetFile, "wb") as target:
+            if _FICLONE_AVAILABLE:
+                try:
+                    fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+                    shutil.copymode(sourceFile, targetFile)
+                    return 0
+                except OSError as e:
+                    if e.errno not in CLONE_UNSUPPORTED:
+                        raise
+                    logger.debug("Unable to clone [%s], copying it instead: %s", sourceFile, e)
+            copied = 0
+            if hasattr(os, "copy_file_range"):
+                try:
+                    while True:
+                        count = os.copy_file_range(source.fileno(), target.fileno(), 1024 * 1024 * 1024)
+                        if count == 0:
+                            break
+                        copied += count
+                except OSError as e:
+                    if e.errno not in CLONE_UNSUPPORTED:
+                        raise
+                    logger.debug("Unable to use copy_file_range() for [%s], falling back to buffered copy: %s", sourceFile, e)
+                    source.seek(copied)
+                    target.seek(copied)
+            shutil.copyfileobj(source, target)
+        shutil.copymode(sourceFile, targetFile)
+        return os.path.getsize(targetFile)
 
 
 ########################################################################
@@ -1008,6 +1116,7 @@ def _copyRemoteDir(
                     os.chown(targetFile, ownership[0], ownership[1])
             if permissions is not None:
                 os.chmod(targetFile, permissions)
+        increment("peer.bytes", sum(os.path.getsize(targetFile) for targetFile in differenceSet))
         return len(differenceSet)
 
     @staticmethod
@@ -0,0 +1,313 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Provides profiling support for the command-line scripts
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Provides profiling support for the command-line scripts.
+
+Summary
+=======
+
+   The ``--profile`` option of ``cback3``, ``cback3-span`` and
+   ``cback3-amazons3-sync`` wraps each action in :any:`profiled`, which writes
+   a set of files named like ``cback3-profile-<timestamp>-<action>.*`` when
+   the action completes.  There are three profile modes:
+
+      - ``cprofile``: run the action under ``cProfile``, writing a ``.prof`` dump
+      - ``sample``: sample the stacks of all threads, writing a ``.folded`` file
+      - ``both``: do both
+
+   The ``.prof`` dump can be loaded with ``pstats`` or a viewer like
+   ``snakeviz``.  The ``.folded`` file is in the collapsed-stack format used by
+   ``flamegraph.pl`` and ``speedscope``.  A ``.txt`` summary is always written.
+
+   The ``cProfile`` mode is exact but only sees the thread that started the
+   action, and slows down Python code noticeably.  The sampling mode sees
+   every thread and costs very little, so it is the better choice for a
+   production run.
+
+Child Processes
+===============
+
+   Time spent in external commands run via :any:`util.executeCommand` is
+   attributed separately from Python time.  The summary lists the wall time
+   of each command, along with the CPU time used by child processes as a
+   whole.  In the ``.folded`` file, samples taken while a thread is waiting on
+   a command get an extra leaf frame naming the command, like ``[tar]``, so
+   the flame graph shows directly whether time went to Python or to tools
+   like ``tar``, ``gpg`` or ``mkisofs``.
+
+Module Attributes
+=================
+
+Attributes:
+   VALID_PROFILE_MODES: List of valid profile modes
+   SAMPLE_INTERVAL: Interval between stack samples, in seconds
+
+:author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+########################################################################
+# Imported modules
+########################################################################
+
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from CedarBackup3.metrics import MetricsSingleton, childCpuTime
+
+########################################################################
+# Module-wide constants and variables
+########################################################################
+
+logger = logging.getLogger("CedarBackup3.log.profiler")
+
+VALID_PROFILE_MODES = ["cprofile", "sample", "both"]
+SAMPLE_INTERVAL = 0.01
+PROFILE_PREFIX = "cback3-profile"
+SUMMARY_FUNCTIONS = 40
+
+
+########################################################################
+# StackSampler class definition
+########################################################################
+
+
+class StackSampler:
+    """
+    Low-overhead sampling profiler that records collapsed stacks.
+
+    A background thread wakes up every ``interval`` seconds and records the
+    current stack of every other thread, as a string of frames separated by
+    semicolons, with the thread name as the outermost frame.  If a thread is
+    running an external command (see :any:`metrics.MetricsSingleton.startCommand`),
+    a frame naming the command is added as the innermost frame.
+
+    Identical stacks are counted rather than stored, so memory use depends on
+    the number of distinct stacks, not on the length of the run.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        """
+        Constructor for the ``StackSampler`` class.
+        Args:
+           interval: Interval between samples, in seconds
+        """
+        self._interval = interval
+        self._stacks = {}
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts sampling in a background thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cback3-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling, waiting for the background thread to exit.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """
+        Body of the sampling thread.
+        """
+        while not self._stop.wait(self._interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Records the current stack of every thread other than the sampling thread.
+        """
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        commands = MetricsSingleton.getInstance().getActiveCommands()
+        for ident, top in sys._current_frames().items():  # noqa: SLF001
+            if ident == own:
+                continue
+            frames = []
+            frame = top
+            while frame is not None:
+                code = frame.f_code
+                frames.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            frames.append(names.get(ident, "thread-%d" % ident))
+            frames.reverse()
+            if ident in commands:
+                frames.append("[%s]" % commands[ident])
+            stack = ";".join(frames)
+            self._stacks[stack] = self._stacks.get(stack, 0) + 1
+        self._samples += 1
+
+    def writeCollapsed(self, path):
+        """
+        Writes the recorded stacks in collapsed-stack format, one ``stack count`` per line.
+        Args:
+           path: Path of the file to write
+        """
+        with open(path, "w") as f:
+            f.writelines("%s %d\n" % (stack, self._stacks[stack]) for stack in sorted(self._stacks))
+
+    def _getSamples(self):
+        """
+        Property target to get the number of times the threads were sampled.
+        """
+        return self._samples
+
+    def _getStacks(self):
+        """
+        Property target to get a copy of the recorded stacks, mapping stack to count.
+        """
+        return dict(self._stacks)
+
+    samples = property(_getSamples, None, None, "Number of times the threads were sampled.")
+    stacks = property(_getStacks, None, None, "Recorded stacks, mapping collapsed stack to count.")
+
+
+########################################################################
+# Public functions
+########################################################################
+
+########################
+# profiled() function
+########################
+
+
+@contextmanager
+def profiled(name, mode, outputDir=None):
+    """
+    Context manager that profiles the enclosed block, writing the results to disk.
+
+    If ``mode`` is ``None``, the block runs without profiling.  Otherwise,
+    files named like ``cback3-profile-<timestamp>-<name>.*`` are written in
+    ``outputDir`` when the block completes, even if it raises an exception.
+    A failure to write the profile is logged but otherwise ignored, so
+    profiling never changes the outcome of a run.
+
+    Args:
+       name: Name of the profiled action, used in file names
+       mode: Profile mode, one of :any:`VALID_PROFILE_MODES`, or ``None``
+       outputDir: Directory to write profiles into, or ``None`` for the current directory
+    Raises:
+       ValueError: If the profile mode is not valid
+    """
+    if mode is None:
+        yield
+        return
+    if mode not in VALID_PROFILE_MODES:
+        raise ValueError("Profile mode must be one of %s." % VALID_PROFILE_MODES)
+    if outputDir is None:
+        outputDir = os.getcwd()
+    prefix = os.path.join(outputDir, "%s-%s-%s" % (PROFILE_PREFIX, time.strftime("%Y%m%d%H%M%S"), name))
+    profiler = cProfile.Profile() if mode in ("cprofile", "both") else None
+    sampler = StackSampler() if mode in ("sample", "both") else None
+    commands = MetricsSingleton.getInstance().getCommands()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    childCpu = childCpuTime()
+    if sampler is not None:
+        sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        elapsed = (time.perf_counter() - wall, time.process_time() - cpu, childCpuTime() - childCpu)
+        try:
+            _writeProfile(prefix, name, elapsed, commands, profiler, sampler)
+        except Exception as e:
+            logger.error("Error writing profile for [%s]: %s", name, e)
+
+
+########################################################################
+# Private utility functions
+########################################################################
+
+
+def _writeProfile(prefix, name, elapsed, commands, profiler, sampler):
+    """
+    Writes the profile files for one profiled action.
+    Args:
+       prefix: Path prefix for the files
+       name: Name of the profiled action
+       elapsed: Tuple of (wall, cpu, childCpu) elapsed during the action
+       commands: Command timings from before the action started, from :any:`metrics.MetricsSingleton.getCommands`
+       profiler: ``cProfile.Profile`` for the action, or ``None``
+       sampler: :any:`StackSampler` for the action, or ``None``
+    """
+    (wall, cpu, childCpu) = elapsed
+    with open("%s.txt" % prefix, "w") as f:
+        f.write("Profile of [%s]\n\n" % name)
+        f.write("Wall time:                %10.3f s\n" % wall)
+        f.write("Python CPU time:          %10.3f s\n" % cpu)
+        f.write("Child process CPU time:   %10.3f s\n\n" % childCpu)
+        f.write("External commands (wall time):\n")
+        after = MetricsSingleton.getInstance().getCommands()
+        found = False
+        for command in sorted(after):
+            before = commands.get(command, {"count": 0, "wall": 0.0})
+            count = after[command]["count"] - before["count"]
+            if count > 0:
+                found = True
+                f.write("   %-20s %6d run(s) %10.3f s\n" % (command, count, after[command]["wall"] - before["wall"]))
+        if not found:
+            f.write("   (none)\n")
+        if profiler is not None:
+            f.write("\nPython functions by cumulative time:\n")
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_FUNCTIONS)
+    if profiler is not None:
+        profiler.dump_stats("%s.prof" % prefix)
+    if sampler is not None:
+        sampler.writeCollapsed("%s.folded" % prefix)
+    logger.info("Wrote profile for [%s] to [%s.*].", name, prefix)
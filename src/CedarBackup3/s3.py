@@ -0,0 +1,939 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Provides a native client and upload engine for Amazon S3.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Provides a native client and upload engine for Amazon S3.
+
+The :any:`S3Client` class implements the handful of S3 REST operations that
+Cedar Backup needs (head, put, list, delete and multipart upload), signed with
+AWS Signature Version 4, on top of the standard library's ``http.client``.
+There is no dependency on the AWS CLI or on any third-party SDK.  The client
+works against Amazon S3 itself and against S3-compatible services, which is
+also how the unit tests exercise it.
+
+The :any:`S3Uploader` class is the upload engine.  Files are split into parts
+which are uploaded concurrently on a thread pool, with the amount of file data
+held in memory bounded by a memory budget.  Objects whose remote size and ETag
+already match the local file are skipped.  An MD5 checksum is computed for each
+part as it is read and sent to S3 as ``Content-MD5``, so the service rejects a
+corrupted body and an upload is verified without having to read anything back
+from S3.  Where the ETag that comes back is an MD5 digest, it is also checked
+against the local checksum.  That is not the case for objects encrypted with
+KMS or with a customer-provided key, whose ETags are opaque.  Throughput
+metrics are gathered in an :any:`UploadStatistics` object.
+
+Credentials and settings are found the same way the AWS CLI finds them: the
+``AWS_ACCESS_KEY_ID``, ``AWS_SECRET_ACCESS_KEY``, ``AWS_SESSION_TOKEN``,
+``AWS_REGION``/``AWS_DEFAULT_REGION`` and ``AWS_ENDPOINT_URL`` environment
+variables take precedence, and otherwise the ``credentials`` and ``config``
+files in a user's ``~/.aws`` directory are read for the profile named by
+``AWS_PROFILE`` (or ``default``).  Other credential sources supported by the
+AWS CLI, such as instance metadata or SSO, are not supported.
+
+:author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+########################################################################
+# Imported modules
+########################################################################
+
+import base64
+import configparser
+import hashlib
+import hmac
+import http.client
+import logging
+import os
+import ssl
+import threading
+import time
+import xml.etree.ElementTree as ET  # noqa: S405
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+from xml.sax.saxutils import escape
+
+########################################################################
+# Module-wide constants and variables
+########################################################################
+
+logger = logging.getLogger("CedarBackup3.log.s3")
+
+DEFAULT_REGION = "us-east-1"
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+MAX_WORKERS = 8
+MAX_ATTEMPTS = 4
+RETRY_DELAY = 0.5
+TIMEOUT = 300
+READ_BUFFER_SIZE = 1024 * 1024
+DELETE_BATCH_SIZE = 1000
+
+
+########################################################################
+# Public functions
+########################################################################
+
+#########################
+# buildClient() function
+#########################
+
+
+def buildClient(bucket, user=None):
+    """
+    Builds an S3 client for a bucket, using credentials configured for a user.
+
+    Environment variables take precedence over the configuration files.  If
+    ``user`` is None, the files for the current user are read; otherwise, the
+    files in the named user's home directory are read.
+
+    Args:
+       bucket: Name of the S3 bucket
+       user: User whose ``~/.aws`` configuration should be read, or None
+
+    Returns:
+        S3Client for the bucket
+    Raises:
+       ValueError: If no credentials can be found
+    """
+    home = os.path.expanduser("~%s" % (user or ""))
+    profile = os.environ.get("AWS_PROFILE", "default")
+    credentials = _readProfile(os.environ.get("AWS_SHARED_CREDENTIALS_FILE", os.path.join(home, ".aws", "credentials")), profile)
+    settings = _readProfile(
+        os.environ.get("AWS_CONFIG_FILE", os.path.join(home, ".aws", "config")),
+        profile if profile == "default" else "profile %s" % profile,
+    )
+    settings.update(credentials)
+    accessKey = os.environ.get("AWS_ACCESS_KEY_ID", settings.get("aws_access_key_id"))
+    secretKey = os.environ.get("AWS_SECRET_ACCESS_KEY", settings.get("aws_secret_access_key"))
+    sessionToken = os.environ.get("AWS_SESSION_TOKEN", settings.get("aws_session_token"))
+    region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION", settings.get("region", DEFAULT_REGION)))
+    endpoint = os.environ.get("AWS_ENDPOINT_URL_S3", os.environ.get("AWS_ENDPOINT_URL", settings.get("endpoint_url")))
+    if not accessKey or not secretKey:
+        raise ValueError("Unable to find AWS credentials for profile [%s] in environment or [%s]." % (profile, home))
+    return S3Client(bucket, accessKey, secretKey, sessionToken=sessionToken, region=region, endpoint=endpoint)
+
+
+######################
+# getEtag() function
+######################
+
+
+def getEtag(path, partSize=DEFAULT_PART_SIZE):
+    """
+    Computes the ETag that S3 would assign to a file uploaded by :any:`S3Uploader`.
+
+    For a file uploaded in a single request, this is the MD5 digest of the file.
+    For a multipart upload, it is the MD5 digest of the concatenated part
+    digests, followed by a dash and the number of parts.
+
+    Args:
+       path: Path of the local file
+       partSize: Nominal part size used by the uploader
+
+    Returns:
+        ETag as a string, without quotes
+    """
+    size = os.stat(path).st_size
+    partSize = getPartSize(size, partSize)
+    digests = []
+    with open(path, "rb") as f:
+        while True:
+            digest = hashlib.md5()  # noqa: S324
+            remaining = partSize
+            while remaining > 0:
+                data = f.read(min(READ_BUFFER_SIZE, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                remaining -= len(data)
+            digests.append(digest.digest())
+            if remaining > 0 or f.tell() >= size:
+                break
+    if size <= partSize:
+        return digests[0].hex()
+    return "%s-%d" % (hashlib.md5(b"".join(digests)).hexdigest(), len(digests))  # noqa: S324
+
+
+#########################
+# getPartSize() function
+#########################
+
+
+def getPartSize(size, partSize=DEFAULT_PART_SIZE):
+    """
+    Returns the part size to use for a file, respecting the S3 limits on parts.
+
+    Args:
+       size: Size of the file in bytes
+       partSize: Nominal part size
+
+    Returns:
+        Part size in bytes, at least ``MIN_PART_SIZE`` and large enough to need no more than ``MAX_PARTS`` parts
+    """
+    partSize = max(partSize, MIN_PART_SIZE)
+    if size > partSize * MAX_PARTS:
+        partSize = -(-size // MAX_PARTS)
+    return partSize
+
+
+########################################################################
+# S3Client class definition
+########################################################################
+
+
+class S3Client:
+    """
+    Native client for a single Amazon S3 bucket.
+
+    Requests are signed with AWS Signature Version 4.  Each thread gets its own
+    persistent HTTP connection, so a single client may be shared by a thread
+    pool.  The client keeps track of every connection it opens, so
+    :any:`close` can close them all, including those of threads that have
+    since finished.  The client may also be used as a context manager.
+    Requests that fail with a connection error or a 5xx response are retried a
+    few times with exponential backoff.
+
+    If no endpoint is given, the standard regional Amazon endpoint is used with
+    virtual-hosted addressing.  If an endpoint is given (for an S3-compatible
+    service), path-style addressing is used.
+
+    ETags are always returned without the surrounding quotes.  When data is
+    uploaded, the returned ETag is checked against the MD5 digest of the data,
+    unless the response shows that the object is encrypted with KMS or with a
+    customer-provided key, in which case the ETag is not a digest.
+    """
+
+    def __init__(self, bucket, accessKey, secretKey, sessionToken=None, region=DEFAULT_REGION, endpoint=None):
+        """
+        Constructor for the ``S3Client`` class.
+
+        Args:
+           bucket: Name of the S3 bucket
+           accessKey: AWS access key id
+           secretKey: AWS secret access key
+           sessionToken: AWS session token, if using temporary credentials
+           region: AWS region the bucket lives in
+           endpoint: Endpoint URL for an S3-compatible service, or None for Amazon S3
+        """
+        self.bucket = bucket
+        self.region = region
+        self._accessKey = accessKey
+        self._secretKey = secretKey
+        self._sessionToken = sessionToken
+        if endpoint is not None:
+            url = urlsplit(endpoint)
+            self._scheme = url.scheme
+            self._host = url.netloc
+            self._basePath = "%s/%s" % (url.path.rstrip("/"), bucket)
+        elif "." in bucket:
+            self._scheme = "https"
+            self._host = "s3.%s.amazonaws.com" % region
+            self._basePath = "/%s" % bucket
+        else:
+            self._scheme = "https"
+            self._host = "%s.s3.%s.amazonaws.com" % (bucket, region)
+            self._basePath = ""
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """
+        Official string representation for class instance.
+        """
+        return "S3Client(%s, %s://%s%s)" % (self.bucket, self._scheme, self._host, self._basePath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Closes every connection opened by the client.
+
+        This must not be called while requests are in progress.  The client may
+        still be used afterwards, and opens new connections as needed.
+        """
+        with self._lock:
+            (connections, self._connections) = (self._connections, [])
+        for connection in connections:
+            connection.close()
+
+    def headObject(self, key):
+        """
+        Returns the size and ETag of an object, or None if it does not exist.
+        """
+        (status, headers, _) = self._request("HEAD", key, expected=(200, 404))
+        if status == 404:
+            return None
+        return (int(headers["content-length"]), headers["etag"].strip('"'))
+
+    def getObject(self, key):
+        """
+        Returns the contents of an object as bytes.
+        """
+        return self._request("GET", key)[2]
+
+    def putObject(self, key, data, digest=None):
+        """
+        Uploads an object in a single request, returning its ETag.
+
+        Args:
+           key: Object key
+           data: Object contents as bytes
+           digest: MD5 digest of the data, computed if not provided
+
+        Returns:
+            ETag of the new object
+        Raises:
+           IOError: If the upload fails or the ETag does not match the digest
+        """
+        digest = digest or hashlib.md5(data).digest()  # noqa: S324
+        headers = self._request("PUT", key, body=data, headers={"content-md5": base64.b64encode(digest).decode()})[1]
+        return _checkEtag(key, headers, headers["etag"].strip('"'), digest.hex)
+
+    def listObjects(self, prefix=""):
+        """
+        Lists the objects under a prefix.
+
+        Args:
+           prefix: Key prefix to list
+
+        Returns:
+            Dict mapping key to a tuple of (size, etag)
+        """
+        return {key: (size, etag) for (key, size, etag) in self.iterObjects(prefix)}
+
+    def iterObjects(self, prefix=""):
+        """
+        Lists the objects under a prefix one page at a time, without holding the whole listing in memory.
+
+        Args:
+           prefix: Key prefix to list
+
+        Yields:
+            Tuple of (key, size, etag) for each object, in key order
+        """
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix}
+            if token:
+                query["continuation-token"] = token
+            root = _parseXml(self._request("GET", None, query=query)[2])
+            for entry in _children(root, "Contents"):
+                yield (_text(entry, "Key"), int(_text(entry, "Size")), _text(entry, "ETag").strip('"'))
+            token = _text(root, "NextContinuationToken")
+            if _text(root, "IsTruncated") != "true" or not token:
+                return
+
+    def deleteObjects(self, keys):
+        """
+        Deletes a list of objects, in batches.
+
+        Raises:
+           IOError: If any object could not be deleted
+        """
+        keys = list(keys)
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            body = "<Delete><Quiet>true</Quiet>%s</Delete>" % "".join(
+                "<Object><Key>%s</Key></Object>" % escape(key) for key in keys[start : start + DELETE_BATCH_SIZE]
+            )
+            body = body.encode("utf-8")
+            digest = base64.b64encode(hashlib.md5(body).digest()).decode()  # noqa: S324
+            root = _parseXml(self._request("POST", None, query={"delete": ""}, body=body, headers={"content-md5": digest})[2])
+            errors = list(_children(root, "Error"))
+            if errors:
+                raise OSError("Unable to delete [%s] from S3: %s" % (_text(errors[0], "Key"), _text(errors[0], "Message")))
+
+    def createMultipartUpload(self, key):
+        """
+        Starts a multipart upload, returning its upload id.
+        """
+        root = _parseXml(self._request("POST", key, query={"uploads": ""})[2])
+        return _text(root, "UploadId")
+
+    def uploadPart(self, key, uploadId, partNumber, data, digest=None):
+        """
+        Uploads one part of a multipart upload, returning the part's ETag.
+
+        Raises:
+           IOError: If the upload fails or the ETag does not match the digest
+        """
+        digest = digest or hashlib.md5(data).digest()  # noqa: S324
+        query = {"partNumber": str(partNumber), "uploadId": uploadId}
+        headers = self._request("PUT", key, query=query, body=data, headers={"content-md5": base64.b64encode(digest).decode()})[1]
+        return _checkEtag("%s part %d" % (key, partNumber), headers, headers["etag"].strip('"'), digest.hex)
+
+    def completeMultipartUpload(self, key, uploadId, etags):
+        """
+        Completes a multipart upload, returning the ETag of the new object.
+
+        Args:
+           key: Object key
+           uploadId: Upload id from :any:`createMultipartUpload`
+           etags: List of part ETags as returned by :any:`uploadPart`, in part order
+        Raises:
+           IOError: If the upload fails or the ETag does not match the part ETags
+        """
+        body = "<CompleteMultipartUpload>%s</CompleteMultipartUpload>" % "".join(
+            '<Part><PartNumber>%d</PartNumber><ETag>"%s"</ETag></Part>' % (number, etag) for (number, etag) in enumerate(etags, 1)
+        )
+        (_, headers, data) = self._request("POST", key, query={"uploadId": uploadId}, body=body.encode("utf-8"))
+        root = _parseXml(data)
+        if _localName(root.tag) == "Error":  # S3 can report a failure after sending a 200 status
+            raise OSError("Unable to complete upload of [%s] to S3: %s" % (key, _text(root, "Message")))
+        return _checkEtag(key, headers, _text(root, "ETag").strip('"'), lambda: _combineEtags(etags))
+
+    def abortMultipartUpload(self, key, uploadId):
+        """
+        Aborts a multipart upload, discarding any parts already uploaded.
+        """
+        self._request("DELETE", key, query={"uploadId": uploadId}, expected=(204, 404))
+
+    def _request(self, method, key, query=None, body=b"", headers=None, expected=(200, 204)):
+        """
+        Sends a signed request, retrying on connection errors and server errors.
+
+        Returns:
+            Tuple of (status, headers, body), with header names in lowercase
+        Raises:
+           IOError: If the request fails
+        """
+        path = self._basePath + "/" + (key or "")
+        query = "&".join("%s=%s" % (_quote(name), _quote(value)) for (name, value) in sorted((query or {}).items()))
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                connection = self._getConnection()
+                url = _quote(path, "/") + ("?" + query if query else "")
+                connection.request(method, url, body=body, headers=self._sign(method, path, query, body, headers or {}))
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self._closeConnection()
+                logger.debug("S3 %s [%s] failed on attempt %d: %s", method, path, attempt + 1, e)
+                error = OSError("Unable to complete S3 %s for [%s]: %s" % (method, path, e))
+                continue
+            if response.status in expected:
+                return (response.status, {name.lower(): value for (name, value) in response.getheaders()}, data)
+            error = OSError("S3 %s for [%s] failed with status %d: %s" % (method, path, response.status, _errorCode(data)))
+            if response.status < 500:
+                break
+            logger.debug("S3 %s [%s] returned status %d on attempt %d", method, path, response.status, attempt + 1)
+        raise error
+
+    def _sign(self, method, path, query, body, headers):
+        """
+        Returns the headers for a request, including an AWS Signature Version 4 authorization.
+        """
+        now = time.gmtime()
+        amzDate = time.strftime("%Y%m%dT%H%M%SZ", now)
+        scope = "%s/%s/s3/aws4_request" % (amzDate[:8], self.region)
+        headers = dict(headers)
+        headers["host"] = self._host
+        headers["x-amz-date"] = amzDate
+        headers["x-amz-content-sha256"] = hashlib.sha256(body).hexdigest()
+        if self._sessionToken:
+            headers["x-amz-security-token"] = self._sessionToken
+        signed = sorted(headers)
+        canonical = "\n".join([
+            method,
+            _quote(path, "/"),
+            query,
+            "".join("%s:%s\n" % (name, str(headers[name]).strip()) for name in signed),
+            ";".join(signed),
+            headers["x-amz-content-sha256"],
+        ])
+        toSign = "\n".join(["AWS4-HMAC-SHA256", amzDate, scope, hashlib.sha256(canonical.encode("utf-8")).hexdigest()])
+        key = ("AWS4%s" % self._secretKey).encode("utf-8")
+        for component in (amzDate[:8], self.region, "s3", "aws4_request"):
+            key = hmac.new(key, component.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, toSign.encode("utf-8"), hashlib.sha256).hexdigest()
+        headers["authorization"] = "AWS4-HMAC-SHA256 Credential=%s/%s, SignedHeaders=%s, Signature=%s" % (
+            self._accessKey,
+            scope,
+            ";".join(signed),
+            signature,
+        )
+        return headers
+
+    def _getConnection(self):
+        """
+        Returns the persistent connection for the current thread.
+        """
+        connection = getattr(self._local, "connection", None)
+        with self._lock:
+            if connection is None or connection not in self._connections:
+                if self._scheme == "https":
+                    connection = http.client.HTTPSConnection(self._host, timeout=TIMEOUT, context=ssl.create_default_context())
+                else:
+                    connection = http.client.HTTPConnection(self._host, timeout=TIMEOUT)
+                self._connections.append(connection)
+                self._local.connection = connection
+        return connection
+
+    def _closeConnection(self):
+        """
+        Closes and forgets the persistent connection for the current thread.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+
+
+########################################################################
+# UploadStatistics class definition
+########################################################################
+
+
+class UploadStatistics:
+    """
+    Throughput metrics gathered by an :any:`S3Uploader`.
+
+    Counters are updated from the worker threads, so they are protected by a lock.
+    The ``elapsed`` time covers all calls to :any:`S3Uploader.uploadFiles`.
+    """
+
+    def __init__(self):
+        """
+        Constructor for the ``UploadStatistics`` class.
+        """
+        self.objectsUploaded = 0
+        self.objectsSkipped = 0
+        self.partsUploaded = 0
+        self.bytesUploaded = 0
+        self.bytesSkipped = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """
+        Official string representation for class instance.
+        """
+        return "UploadStatistics(%d, %d, %d, %d, %d, %.3f)" % (
+            self.objectsUploaded,
+            self.objectsSkipped,
+            self.partsUploaded,
+            self.bytesUploaded,
+            self.bytesSkipped,
+            self.elapsed,
+        )
+
+    @property
+    def throughput(self):
+        """
+        Upload throughput in bytes per second.
+        """
+        return self.bytesUploaded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def recordSkipped(self, size):
+        """
+        Records an object that was skipped because it was already up to date.
+        """
+        with self._lock:
+            self.objectsSkipped += 1
+            self.bytesSkipped += size
+
+    def recordObject(self):
+        """
+        Records an object whose upload was completed and verified.
+        """
+        with self._lock:
+            self.objectsUploaded += 1
+
+    def recordPart(self, size):
+        """
+        Records a part (or a single-part object) that was uploaded.
+        """
+        with self._lock:
+            self.partsUploaded += 1
+            self.bytesUploaded += size
+
+
+########################################################################
+# S3Uploader class definition
+########################################################################
+
+
+class _Upload:
+    """
+    State for a single file being uploaded by :any:`S3Uploader`.
+    """
+
+    def __init__(self, path, key, size, partSize):
+        self.path = path
+        self.key = key
+        self.size = size
+        self.partSize = partSize
+        self.partCount = max(1, -(-size // partSize))
+        self.remaining = self.partCount
+        self.uploadId = None
+        self.digests = [None] * self.partCount
+        self.etags = [None] * self.partCount
+
+
+class _Batch:
+    """
+    State shared between the threads for one call to :any:`S3Uploader.uploadFiles`.
+    """
+
+    def __init__(self, slots, callback, failed):
+        self.slots = threading.Semaphore(slots)
+        self.callback = callback
+        self.failed = failed
+        self.results = {}
+        self.active = {}
+        self.failures = []
+        self.lock = threading.Lock()
+
+
+class S3Uploader:
+    """
+    Upload engine that writes local files to an S3 bucket.
+
+    Each file larger than the part size is sent as a multipart upload, and parts
+    from all files share a single thread pool.  Parts are read by the workers
+    themselves, and a part is not queued until there is room for it in the
+    memory budget, so no more than ``memoryBudget`` bytes of file data are ever
+    held in memory at once.  Whichever worker finishes the last part of a file
+    also completes and verifies its upload, so files finish as soon as their
+    data is sent, independent of the thread that is queueing new files.
+
+    Every part is sent with the MD5 digest computed while reading it, so S3
+    rejects a part that arrives corrupted.  Unless the bucket encrypts objects
+    with KMS or a customer-provided key, the client also checks each returned
+    ETag against that digest, and checks each multipart object's final ETag
+    against the digest of the part digests.  If anything fails, no further parts
+    are sent, outstanding multipart uploads are aborted and the first exception
+    is raised.
+
+    The worker threads exit once each call to :any:`uploadFiles` is done, so
+    the client's connections are closed at that point rather than being left
+    open for threads that no longer exist.
+    """
+
+    def __init__(self, client, partSize=DEFAULT_PART_SIZE, maxWorkers=MAX_WORKERS, memoryBudget=DEFAULT_MEMORY_BUDGET):
+        """
+        Constructor for the ``S3Uploader`` class.
+
+        Args:
+           client: S3Client to upload with
+           partSize: Nominal part size in bytes
+           maxWorkers: Maximum number of parts to upload concurrently
+           memoryBudget: Maximum bytes of file data to hold in memory at once
+        """
+        self.client = client
+        self.partSize = getPartSize(0, partSize)
+        self.slots = max(1, memoryBudget // self.partSize)
+        self.maxWorkers = max(1, min(maxWorkers, self.slots))
+        self.statistics = UploadStatistics()
+
+    def uploadFiles(self, files, existing=None, callback=None, checksums=None, failed=None):
+        """
+        Uploads a list of files, skipping those that are already present.
+
+        A file is skipped if ``existing`` lists an object with the same key whose
+        size and ETag match the local file.  The local ETag is only computed when
+        the sizes match.  The ETag of an encrypted object is not a digest, so
+        ``checksums`` may also give the local ETag that was recorded when the
+        existing object was uploaded, and the file is skipped if that matches.
+
+        The files may come from any iterable, including a generator that produces
+        them while earlier files are being uploaded.  If a callback is provided,
+        it is called as ``callback(path, key, etag, checksum)`` once each object
+        has been verified or skipped, where ``checksum`` is the ETag computed
+        from the local file.  That is the same as ``etag`` unless the object is
+        encrypted.  The callback may be invoked from a worker thread.
+        If ``failed`` is provided, it is called as ``failed(exception)`` from the
+        worker thread as soon as an upload fails, which lets a generator that is
+        blocked waiting for earlier files to finish give up.
+
+        Args:
+           files: Iterable of (path, key) tuples to upload
+           existing: Dict mapping key to (size, etag), as from :any:`S3Client.listObjects`
+           callback: Function to call when each file is finished, or None
+           checksums: Dict mapping key to the local ETag recorded for the existing object, or None
+           failed: Function to call when an upload fails, or None
+
+        Returns:
+            Dict mapping each key to the (size, etag) of the verified object
+        Raises:
+           IOError: If an upload fails or cannot be verified
+        """
+        existing = existing or {}
+        checksums = checksums or {}
+        batch = _Batch(self.slots, callback, failed)
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+                try:
+                    for path, key in files:
+                        self._submitFile(executor, batch, path, key, existing.get(key), checksums.get(key))
+                    executor.shutdown(wait=True)
+                    if batch.failures:
+                        raise batch.failures[0]
+                except:
+                    executor.shutdown(cancel_futures=True)
+                    self._abortUploads(batch)
+                    raise
+        finally:
+            self.client.close()
+            self.statistics.elapsed += time.perf_counter() - started
+        return batch.results
+
+    def _submitFile(self, executor, batch, path, key, remote, checksum):
+        """
+        Queues the parts of a file for upload, unless the remote object already matches it.
+        """
+        size = os.stat(path).st_size
+        local = getEtag(path, self.partSize) if remote is not None and remote[0] == size else None
+        if local is not None and local in (remote[1], checksum):
+            logger.debug("Object [%s] is already up to date in S3.", key)
+            with batch.lock:
+                batch.results[key] = remote
+            self.statistics.recordSkipped(size)
+            if batch.callback is not None:
+                batch.callback(path, key, remote[1], local)
+            return
+        upload = _Upload(path, key, size, getPartSize(size, self.partSize))
+        if upload.partCount > 1:
+            upload.uploadId = self.client.createMultipartUpload(key)
+            with batch.lock:
+                batch.active[upload.uploadId] = upload
+        for partNumber in range(1, upload.partCount + 1):
+            batch.slots.acquire()
+            if batch.failures:
+                batch.slots.release()
+                raise batch.failures[0]
+            executor.submit(self._uploadPart, batch, upload, partNumber)
+
+    def _uploadPart(self, batch, upload, partNumber):
+        """
+        Uploads a single part on a worker thread, finishing the file if this was its last part.
+
+        Failures are recorded in the batch rather than raised, and once anything
+        has failed, parts that have not started yet are not sent.
+        """
+        try:
+            if not batch.failures:
+                self._transferPart(upload, partNumber)
+                self._countPart(batch, upload)
+        except Exception as e:
+            batch.failures.append(e)
+            if batch.failed is not None:
+                batch.failed(e)
+        finally:
+            batch.slots.release()
+
+    def _countPart(self, batch, upload):
+        """
+        Records that a part of a file is done, finishing the file if it was the last one.
+        """
+        with batch.lock:
+            upload.remaining -= 1
+            last = upload.remaining == 0
+        if last:
+            self._finishUpload(batch, upload)
+
+    def _transferPart(self, upload, partNumber):
+        """
+        Reads, checksums, uploads and verifies a single part.
+        """
+        offset = (partNumber - 1) * upload.partSize
+        length = min(upload.partSize, upload.size - offset)
+        data = _readRange(upload.path, offset, length)
+        digest = hashlib.md5(data).digest()  # noqa: S324
+        if upload.uploadId is None:
+            etag = self.client.putObject(upload.key, data, digest)
+        else:
+            etag = self.client.uploadPart(upload.key, upload.uploadId, partNumber, data, digest)
+        upload.digests[partNumber - 1] = digest
+        upload.etags[partNumber - 1] = etag
+        self.statistics.recordPart(length)
+
+    def _finishUpload(self, batch, upload):
+        """
+        Completes and verifies the upload of a file once all of its parts are done.
+        """
+        if upload.uploadId is None:
+            etag = upload.etags[0]
+            checksum = upload.digests[0].hex()
+        else:
+            etag = self.client.completeMultipartUpload(upload.key, upload.uploadId, upload.etags)
+            checksum = _combineEtags([digest.hex() for digest in upload.digests])
+            with batch.lock:
+                del batch.active[upload.uploadId]
+        logger.debug("Uploaded [%s] to S3 as [%s] with ETag %s.", upload.path, upload.key, etag)
+        with batch.lock:
+            batch.results[upload.key] = (upload.size, etag)
+        self.statistics.recordObject()
+        if batch.callback is not None:
+            batch.callback(upload.path, upload.key, etag, checksum)
+
+    def _abortUploads(self, batch):
+        """
+        Aborts any multipart uploads that were started but not completed.
+        """
+        for upload in batch.active.values():
+            try:
+                self.client.abortMultipartUpload(upload.key, upload.uploadId)
+            except Exception as e:
+                logger.warning("Unable to abort multipart upload of [%s]: %s", upload.key, e)
+
+
+########################################################################
+# Private utility functions
+########################################################################
+
+
+def _readProfile(path, section):
+    """
+    Reads a section from an AWS configuration file, returning an empty dict if it is not available.
+    """
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(path)
+    except configparser.Error as e:
+        logger.warning("Unable to parse AWS configuration [%s]: %s", path, e)
+        return {}
+    return dict(parser.items(section)) if parser.has_section(section) else {}
+
+
+def _readRange(path, offset, length):
+    """
+    Reads a range of bytes from a file.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while length > 0:
+            data = os.pread(fd, length, offset)
+            if not data:
+                raise OSError("File [%s] changed size during upload." % path)
+            chunks.append(data)
+            offset += len(data)
+            length -= len(data)
+        return b"".join(chunks)
+    finally:
+        os.close(fd)
+
+
+def _checkEtag(name, headers, etag, expected):
+    """
+    Checks the ETag returned for an upload, unless the response shows that it is not an MD5 digest.
+
+    S3 returns an opaque ETag for objects encrypted with KMS or with a
+    customer-provided key, so those can't be checked.  The expected value is
+    passed as a function, so it is only worked out when it is needed.
+
+    Returns:
+        The ETag
+    Raises:
+       IOError: If the ETag does not match
+    """
+    if headers.get("x-amz-server-side-encryption", "").startswith("aws:kms"):
+        return etag
+    if "x-amz-server-side-encryption-customer-algorithm" in headers:
+        return etag
+    if etag != expected():
+        raise OSError("Checksum mismatch uploading [%s]: expected %s, got %s" % (name, expected(), etag))
+    return etag
+
+
+def _combineEtags(etags):
+    """
+    Returns the ETag S3 assigns to a multipart object, given the MD5 ETags of its parts.
+    """
+    return "%s-%d" % (hashlib.md5(b"".join(bytes.fromhex(etag) for etag in etags)).hexdigest(), len(etags))  # noqa: S324
+
+
+def _quote(value, safe=""):
+    """
+    URI-encodes a value the way AWS Signature Version 4 requires.
+    """
+    return quote(value, safe="-_.~" + safe)
+
+
+def _parseXml(data):
+    """
+    Parses an XML response document from S3.
+    """
+    return ET.fromstring(data)  # noqa: S314
+
+
+def _localName(tag):
+    """
+    Returns an XML tag name without its namespace.
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def _children(element, name):
+    """
+    Yields the direct children of an element with a given local name.
+    """
+    for child in element:
+        if _localName(child.tag) == name:
+            yield child
+
+
+def _text(element, name):
+    """
+    Returns the text of the first direct child with a given local name, or None.
+    """
+    for child in _children(element, name):
+        return child.text or ""
+    return None
+
+
+def _errorCode(data):
+    """
+    Extracts the error code and message from an S3 error response, if there is one.
+    """
+    try:
+        root = _parseXml(data)
+        return "%s %s" % (_text(root, "Code"), _text(root, "Message"))
+    except ET.ParseError:
+        return "no error details"
@@ -44,3 +44,11 @@ def span():
 
     result = cli()
     sys.exit(result)
+
+
+def journal():
+    """Implementation of the cback3-journal script."""
+    from CedarBackup3.tools.journal import cli
+
+    result = cli()
+    sys.exit(result)
@@ -55,16 +55,26 @@
 # Imported modules
 ########################################################################
 
+import base64
 import getpass
+import hashlib
 import logging
+import operator
 import os
 import platform
 import random
+import stat
 import string
+import struct
 import sys
 import tarfile
+import threading
 import time
+import xml.etree.ElementTree as ET  # noqa: S405
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import StringIO
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
 
 from CedarBackup3.cli import setupPathResolver
 from CedarBackup3.config import Config, OptionsConfig
@@ -527,3 +537,417 @@ def availableLocales():
     for line in output:
         locales.append(line.rstrip())
     return locales
+
+
+############################
+# buildIsoImage() function
+############################
+
+
+def buildIsoImage(imagePath, sourceDir, sessionStart=0, rockRidge=True, maxExtent=None, relocateDepth=None):
+    """
+    Builds a small ISO 9660 image from a directory, in-process, for use in unit tests.
+
+    This is a stand-in for ``mkisofs -r``, good enough to exercise
+    :any:`CedarBackup3.writers.iso9660.IsoReader`.  Names use short generated
+    ISO identifiers, with the real name in a Rock Ridge ``NM`` entry (moved into
+    a continuation area if it doesn't fit in the record).  Soft links are
+    recorded with their Rock Ridge mode and no data.  The image has no path
+    tables, and timestamps are zero.
+
+    Args:
+       imagePath: Path of the image file to write
+       sourceDir: Directory whose contents to put in the image
+       sessionStart: Sector at which the session starts; earlier sectors are left empty
+       rockRidge: Whether to add Rock Ridge entries
+       maxExtent: Maximum extent length in bytes (a multiple of 2048), to build multi-extent files
+       relocateDepth: Relocate directories deeper than this into ``/rr_moved``, like ``mkisofs``
+    """
+    counter = [0]
+
+    def identifier(directory):
+        counter[0] += 1
+        return ("D%07d" % counter[0] if directory else "F%07d.;1" % counter[0]).encode("ascii")
+
+    def scan(path, name, depth):
+        node = {"name": name, "id": identifier(True), "mode": os.lstat(path).st_mode, "children": [], "depth": depth}
+        for entry in sorted(os.listdir(path)):
+            child = os.path.join(path, entry)
+            info = os.lstat(child)
+            if stat.S_ISDIR(info.st_mode):
+                node["children"].append(scan(child, entry, depth + 1))
+            else:
+                size = info.st_size if stat.S_ISREG(info.st_mode) else 0
+                node["children"].append({"name": entry, "id": identifier(False), "mode": info.st_mode, "path": child, "size": size})
+        return node
+
+    root = scan(sourceDir, None, 0)
+    directories = []
+    moved = {"name": "rr_moved", "id": b"RR_MOVED", "mode": stat.S_IFDIR | 0o755, "children": [], "depth": 1}
+
+    def collect(node):
+        directories.append(node)
+        for child in list(node["children"]):
+            if "children" in child:
+                if relocateDepth is not None and child["depth"] > relocateDepth:
+                    node["children"].remove(child)
+                    node["children"].append({"name": child["name"], "id": identifier(False), "mode": child["mode"], "link": child})
+                    child["relocated"] = True
+                    moved["children"].append(child)
+                collect(child)
+
+    collect(root)
+    if moved["children"]:
+        root["children"].append(moved)
+        directories.append(moved)
+
+    def record(extent, flags, ident, systemUse):
+        pad = b"\x00" if len(ident) % 2 == 0 else b""
+        length = 33 + len(ident) + len(pad) + len(systemUse)
+        if length % 2:
+            systemUse += b"\x00"
+            length += 1
+        return (
+            struct.pack("<BB", length, 0)
+            + both(extent[0])
+            + both(extent[1])
+            + bytes(7)
+            + struct.pack("<BBB", flags, 0, 0)
+            + struct.pack("<H", 1)
+            + struct.pack(">H", 1)
+            + struct.pack("<B", len(ident))
+            + ident
+            + pad
+            + systemUse
+        )
+
+    def susp(signature, data):
+        return signature + struct.pack("<BB", 4 + len(data), 1) + data
+
+    def both(value):
+        return struct.pack("<I", value) + struct.pack(">I", value)
+
+    def names(name):
+        encoded = os.fsencode(name)
+        chunks = [encoded[i : i + 250] for i in range(0, len(encoded), 250)]
+        return b"".join(susp(b"NM", bytes([1 if i < len(chunks) - 1 else 0]) + chunk) for i, chunk in enumerate(chunks))
+
+    continuations = []
+
+    def entries(node, extra=b""):
+        if not rockRidge:
+            return (b"", None)
+        attributes = susp(b"PX", both(node["mode"]) + both(1) + both(0) + both(0)) + extra
+        if node.get("relocated"):
+            attributes += susp(b"RE", b"")
+        if node["name"] is None:
+            return (attributes, None)
+        name = names(node["name"])
+        if 33 + len(node["id"]) + 1 + len(attributes) + len(name) <= 254:
+            return (attributes + name, None)
+        continuations.append(name)
+        return (attributes, len(continuations) - 1)
+
+    def directoryRecords(node, lbas):
+        dot = b""
+        if node is root and rockRidge:
+            dot = susp(b"SP", b"\xbe\xef\x00") + entries(node)[0]
+        records = [
+            record((lbas.get(id(node), 0), node.get("size", 0)), 2, b"\x00", dot),
+            record((lbas.get(id(root), 0), root.get("size", 0)), 2, b"\x01", b""),
+        ]
+        for child in sorted(node["children"], key=operator.itemgetter("id")):
+            if "link" in child:
+                (systemUse, ce) = entries(child, susp(b"CL", both(lbas.get(id(child["link"]), 0))))
+                extents = [(0, 0)]
+                flags = 0
+            elif "children" in child:
+                (systemUse, ce) = entries(child)
+                extents = [(lbas.get(id(child), 0), child.get("size", 0))]
+                flags = 2
+            else:
+                (systemUse, ce) = entries(child)
+                extents = lbas.get(id(child), [(0, length) for length in lengths(child["size"])])
+                flags = 0
+            if ce is not None:
+                block = lbas.get("continuation", 0) + ce
+                systemUse += susp(b"CE", both(block) + both(0) + both(len(continuations[ce])))
+            for index, extent in enumerate(extents):
+                more = 0x80 if index < len(extents) - 1 else 0
+                records.append(record(extent, flags | more, child["id"], systemUse))
+        data = b""
+        for item in records:
+            if len(data) % 2048 + len(item) > 2048:
+                data += bytes(2048 - len(data) % 2048)
+            data += item
+        return data
+
+    def sectors(size):
+        return (size + 2047) // 2048
+
+    def lengths(size):
+        if maxExtent is None or size <= maxExtent:
+            return [size]
+        return [min(maxExtent, size - offset) for offset in range(0, size, maxExtent)]
+
+    lbas = {}
+    for node in directories:  # first pass only sizes the directories and finds the continuation areas
+        node["size"] = len(directoryRecords(node, lbas))
+    sector = sessionStart + 18
+    for node in directories:
+        lbas[id(node)] = sector
+        sector += sectors(node["size"])
+    for node in directories:
+        node["size"] = sectors(node["size"]) * 2048
+    lbas["continuation"] = sector
+    sector += len(continuations)
+    files = []
+    for node in directories:
+        for child in node["children"]:
+            if "path" in child:
+                extents = []
+                for length in lengths(child["size"]):
+                    extents.append((sector, length))
+                    sector += sectors(length)
+                lbas[id(child)] = extents
+                files.append(child)
+    continuations.clear()
+    with open(imagePath, "wb") as f:
+        f.seek(sessionStart * 2048 + 16 * 2048)
+        rootRecord = record((lbas[id(root)], root["size"]), 2, b"\x00", b"")
+        descriptor = b"\x01CD001\x01\x00" + bytes(32) + b"CEDAR_TEST".ljust(32) + bytes(8) + both(sector)
+        descriptor = descriptor.ljust(128, b"\x00") + struct.pack("<H", 2048) + struct.pack(">H", 2048)
+        descriptor = descriptor.ljust(156, b"\x00") + rootRecord
+        f.write(descriptor.ljust(2048, b"\x00"))
+        f.write(b"\xffCD001\x01".ljust(2048, b"\x00"))
+        for node in directories:
+            f.seek(lbas[id(node)] * 2048)
+            f.write(directoryRecords(node, lbas))
+        for index, name in enumerate(continuations):
+            f.seek((lbas["continuation"] + index) * 2048)
+            f.write(name)
+        for child in files:
+            if stat.S_ISREG(child["mode"]):
+                with open(child["path"], "rb") as source:
+                    for lba, length in lbas[id(child)]:
+                        f.seek(lba * 2048)
+                        f.write(source.read(length))
+        f.truncate(sector * 2048)
+
+
+########################################################################
+# S3Server class definition
+########################################################################
+
+
+class S3Server:
+    """
+    In-process stand-in for an S3-compatible service, for use in unit tests.
+
+    The server listens on a random local port and holds a single bucket in
+    memory, as a dict mapping key to contents in ``objects``, with the ETags of
+    multipart and encrypted objects in ``etags``.  It implements
+    just the operations used by :any:`CedarBackup3.s3.S3Client`: head, get, put,
+    delete, list (version 2), batch delete and multipart upload.  Requests must
+    carry a Signature Version 4 authorization header and a correct payload
+    hash, and ``Content-MD5`` is checked when provided, but signatures are not
+    verified.
+
+    Every request is appended to ``requests`` as a ``(method, key, query)``
+    tuple.  Setting ``failures`` to a positive number makes that many requests
+    fail with a 500 status, and setting ``corruptEtags`` makes the server
+    return bogus ETags.  Setting ``encryption`` to ``aws:kms`` makes the server
+    behave like a bucket with KMS encryption, returning that value in the
+    ``x-amz-server-side-encryption`` header and ETags that are not MD5 digests.
+    Setting ``pageSize`` controls list pagination.
+    """
+
+    def __init__(self, bucket="bucket"):
+        self.bucket = bucket
+        self.objects = {}
+        self.etags = {}
+        self.uploads = {}
+        self.requests = []
+        self.failures = 0
+        self.corruptEtags = False
+        self.encryption = None
+        self.pageSize = 1000
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _S3Handler)
+        self._server.daemon_threads = True
+        self._server.s3 = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        """Endpoint URL for the server."""
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    def start(self):
+        """Starts serving requests on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops serving requests and closes the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class _S3Handler(BaseHTTPRequestHandler):
+    """
+    Request handler for :any:`S3Server`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        s3 = self.server.s3
+        url = urlsplit(self.path)
+        (bucket, _, key) = unquote(url.path).lstrip("/").partition("/")
+        query = {name: values[0] for (name, values) in parse_qs(url.query, keep_blank_values=True).items()}
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with s3.lock:
+            s3.requests.append((method, key, query))
+            if s3.failures > 0:
+                s3.failures -= 1
+                return self._error(500, "InternalError")
+            if not self.headers.get("Authorization", "").startswith("AWS4-HMAC-SHA256 "):
+                return self._error(403, "AccessDenied")
+            if self.headers.get("x-amz-content-sha256") != hashlib.sha256(body).hexdigest():
+                return self._error(400, "XAmzContentSHA256Mismatch")
+            digest = base64.b64encode(hashlib.md5(body).digest()).decode()  # noqa: S324
+            if self.headers.get("Content-MD5", digest) != digest:
+                return self._error(400, "BadDigest")
+            if bucket != s3.bucket:
+                return self._error(404, "NoSuchBucket")
+            return self._handle(s3, method, key, query, body)
+
+    def _handle(self, s3, method, key, query, body):
+        if method == "GET" and not key:
+            return self._list(s3, query)
+        if method == "POST" and "delete" in query:
+            for element in ET.fromstring(body).iter("Key"):  # noqa: S314
+                s3.objects.pop(element.text, None)
+                s3.etags.pop(element.text, None)
+            return self._reply(200, b"<DeleteResult/>")
+        if method == "POST" and "uploads" in query:
+            uploadId = "upload-%d" % len(s3.requests)
+            s3.uploads[uploadId] = {}
+            return self._reply(
+                200, ("<InitiateMultipartUploadResult><UploadId>%s</UploadId></InitiateMultipartUploadResult>" % uploadId).encode()
+            )
+        if method == "POST" and "uploadId" in query:
+            return self._complete(s3, key, query["uploadId"], body)
+        if method == "PUT" and "uploadId" in query:
+            if query["uploadId"] not in s3.uploads:
+                return self._error(404, "NoSuchUpload")
+            s3.uploads[query["uploadId"]][int(query["partNumber"])] = body
+            return self._reply(200, etag=self._etag(s3, self._encrypted(s3, hashlib.md5(body).hexdigest())))  # noqa: S324
+        if method == "PUT":
+            s3.objects[key] = body
+            s3.etags.pop(key, None)
+            if s3.encryption:
+                s3.etags[key] = self._encrypted(s3, hashlib.md5(body).hexdigest())  # noqa: S324
+            return self._reply(200, etag=self._etag(s3, self._objectEtag(s3, key)))
+        if method == "DELETE":
+            s3.uploads.pop(query.get("uploadId"), None)
+            s3.objects.pop(key, None)
+            s3.etags.pop(key, None)
+            return self._reply(204)
+        if key not in s3.objects:
+            return self._error(404, "NoSuchKey")
+        data = s3.objects[key]
+        etag = self._objectEtag(s3, key)
+        if method == "HEAD":
+            return self._reply(200, etag=etag, length=len(data))
+        return self._reply(200, data, etag=etag)
+
+    def _list(self, s3, query):
+        keys = sorted(key for key in s3.objects if key.startswith(query.get("prefix", "")))
+        token = query.get("continuation-token")
+        if token:
+            keys = [key for key in keys if key > token]
+        page = keys[: s3.pageSize]
+        truncated = len(keys) > len(page)
+        contents = "".join(
+            '<Contents><Key>%s</Key><Size>%d</Size><ETag>"%s"</ETag></Contents>'
+            % (escape(key), len(s3.objects[key]), self._objectEtag(s3, key))
+            for key in page
+        )
+        more = "<NextContinuationToken>%s</NextContinuationToken>" % escape(page[-1]) if truncated else ""
+        document = (
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/"><IsTruncated>%s</IsTruncated>%s%s</ListBucketResult>'
+            % (
+                "true" if truncated else "false",
+                contents,
+                more,
+            )
+        )
+        return self._reply(200, document.encode("utf-8"))
+
+    def _complete(self, s3, key, uploadId, body):
+        parts = s3.uploads.pop(uploadId, None)
+        if parts is None:
+            return self._error(404, "NoSuchUpload")
+        requested = {
+            int(element.find("PartNumber").text): element.find("ETag").text.strip('"')
+            for element in ET.fromstring(body).iter("Part")  # noqa: S314
+        }
+        if requested != {n: self._encrypted(s3, hashlib.md5(data).hexdigest()) for (n, data) in parts.items()}:  # noqa: S324
+            return self._error(400, "InvalidPart")
+        numbers = sorted(requested)
+        s3.objects[key] = b"".join(parts[number] for number in numbers)
+        s3.etags[key] = "%s-%d" % (hashlib.md5(b"".join(hashlib.md5(parts[n]).digest() for n in numbers)).hexdigest(), len(numbers))  # noqa: S324
+        s3.etags[key] = self._encrypted(s3, s3.etags[key])
+        document = '<CompleteMultipartUploadResult><ETag>"%s"</ETag></CompleteMultipartUploadResult>' % self._etag(
+            s3, s3.etags[key]
+        )
+        return self._reply(200, document.encode("utf-8"))
+
+    def _objectEtag(self, s3, key):
+        if key in s3.etags:
+            return s3.etags[key]
+        return hashlib.md5(s3.objects[key]).hexdigest()  # noqa: S324
+
+    def _etag(self, s3, etag):
+        return "0" * len(etag) if s3.corruptEtags else etag
+
+    def _encrypted(self, s3, etag):
+        if not s3.encryption:
+            return etag
+        (digest, dash, count) = etag.partition("-")
+        return hashlib.sha256(digest.encode()).hexdigest()[:32] + dash + count
+
+    def _error(self, status, code):
+        self._reply(status, ("<Error><Code>%s</Code><Message>%s</Message></Error>" % (code, code)).encode())
+
+    def _reply(self, status, data=b"", etag=None, length=None):
+        self.send_response(status)
+        if self.server.s3.encryption:
+            self.send_header("x-amz-server-side-encryption", self.server.s3.encryption)
+        if etag is not None:
+            self.send_header("ETag", '"%s"' % etag)
+        self.send_header("Content-Length", str(len(data) if length is None else length))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
@@ -45,6 +45,7 @@
 # in the __all__ variable.
 
 import CedarBackup3.tools.amazons3
+import CedarBackup3.tools.journal
 import CedarBackup3.tools.span
 
-__all__ = ["span", "amazons3"]
+__all__ = ["span", "amazons3", "journal"]
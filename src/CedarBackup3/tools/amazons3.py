@@ -52,20 +52,27 @@
 # Note: getopt is "soft deprecated" only and is safe to use; see: https://github.com/python/cpython/pull/105735
 
 import getopt
-import json
+import hashlib
 import logging
 import os
+import sqlite3
+import stat
 import sys
+import threading
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from functools import total_ordering
 from pathlib import Path
 
 import chardet
 
 from CedarBackup3.cli import DEFAULT_LOGFILE, DEFAULT_MODE, DEFAULT_OWNERSHIP, setupLogging
-from CedarBackup3.filesystem import FilesystemList
+from CedarBackup3.filesystem import FilesystemList, TraversalCache
+from CedarBackup3.profiler import VALID_PROFILE_MODES, profiled
 from CedarBackup3.release import AUTHOR, EMAIL, VERSION
-from CedarBackup3.util import Diagnostics, encodePath, executeCommand, splitCommandLine
+from CedarBackup3.s3 import MAX_WORKERS, S3Uploader, buildClient
+from CedarBackup3.util import Diagnostics, displayBytes, encodePath, splitCommandLine
 
 ########################################################################
 # Module-wide constants and variables
@@ -73,9 +80,12 @@
 
 logger = logging.getLogger("CedarBackup3.log.tools.amazons3")
 
-AWS_COMMAND = ["aws"]
+DEFAULT_STATE_FILE = "~/.cback3-amazons3-sync.db"
+COMMIT_INTERVAL = 1000
+VERIFY_LIST_THRESHOLD = 1000
+DETECT_POOL_THRESHOLD = 256
 
-SHORT_SWITCHES = "hVbql:o:m:OdsDvuw"
+SHORT_SWITCHES = "hVbql:o:m:OdsDvuwS:r:"
 LONG_SWITCHES = [
     "help",
     "version",
@@ -91,6 +101,9 @@
     "verifyOnly",
     "uploadOnly",
     "ignoreWarnings",
+    "stateFile=",
+    "reconcileDays=",
+    "profile=",
 ]
 
 
@@ -206,6 +219,9 @@ def __init__(self, argumentList=None, argumentString=None, validate=True):
         self._verifyOnly = False
         self._uploadOnly = False
         self._ignoreWarnings = False
+        self._stateFile = None
+        self._reconcileDays = None
+        self._profile = None
         self._sourceDir = None
         self._s3BucketUrl = None
         if argumentList is not None and argumentString is not None:
@@ -330,6 +346,21 @@ def __cmp__(self, other):
                 return -1
             else:
                 return 1
+        if self.stateFile != other.stateFile:
+            if str(self.stateFile or "") < str(other.stateFile or ""):
+                return -1
+            else:
+                return 1
+        if self.reconcileDays != other.reconcileDays:
+            if int(self.reconcileDays or 0) < int(other.reconcileDays or 0):
+                return -1
+            else:
+                return 1
+        if self.profile != other.profile:
+            if str(self.profile or "") < str(other.profile or ""):
+                return -1
+            else:
+                return 1
         if self.sourceDir != other.sourceDir:
             if str(self.sourceDir or "") < str(other.sourceDir or ""):
                 return -1
@@ -590,6 +621,63 @@ def _getIgnoreWarnings(self):
         """
         return self._ignoreWarnings
 
+    def _setStateFile(self, value):
+        """
+        Property target used to set the stateFile parameter.
+        Raises:
+           ValueError: If the value cannot be encoded properly
+        """
+        if value is not None:
+            if len(value) < 1:
+                raise ValueError("The stateFile parameter must be a non-empty string.")
+        self._stateFile = encodePath(value)
+
+    def _getStateFile(self):
+        """
+        Property target used to get the stateFile parameter.
+        """
+        return self._stateFile
+
+    def _setReconcileDays(self, value):
+        """
+        Property target used to set the reconcileDays parameter.
+        Raises:
+           ValueError: If the value is not an integer >= 0
+        """
+        if value is None:
+            self._reconcileDays = None
+        else:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError("Reconcile days must be an integer >= 0.")
+            if value < 0:
+                raise ValueError("Reconcile days must be an integer >= 0.")
+            self._reconcileDays = value
+
+    def _getReconcileDays(self):
+        """
+        Property target used to get the reconcileDays parameter.
+        """
+        return self._reconcileDays
+
+    def _setProfile(self, value):
+        """
+        Property target used to set the profile parameter.
+        Raises:
+           ValueError: If the value is not a valid profile mode
+        """
+        if value is not None:
+            if value not in VALID_PROFILE_MODES:
+                raise ValueError("Profile mode must be one of %s." % VALID_PROFILE_MODES)
+        self._profile = value
+
+    def _getProfile(self):
+        """
+        Property target used to get the profile parameter.
+        """
+        return self._profile
+
     def _setSourceDir(self, value):
         """
         Property target used to set the sourceDir parameter.
@@ -636,6 +724,11 @@ def _getS3BucketUrl(self):
     ignoreWarnings = property(
         _getIgnoreWarnings, _setIgnoreWarnings, None, "Command-line ignoreWarnings (``-w,--ignoreWarnings``) flag"
     )
+    stateFile = property(_getStateFile, _setStateFile, None, "Command-line stateFile (``-S,--stateFile``) parameter.")
+    reconcileDays = property(
+        _getReconcileDays, _setReconcileDays, None, "Command-line reconcileDays (``-r,--reconcileDays``) parameter."
+    )
+    profile = property(_getProfile, _setProfile, None, "Command-line profile (``--profile``) parameter.")
     sourceDir = property(_getSourceDir, _setSourceDir, None, "Command-line sourceDir, source of sync.")
     s3BucketUrl = property(_getS3BucketUrl, _setS3BucketUrl, None, "Command-line s3BucketUrl, target of sync.")
 
@@ -724,6 +817,15 @@ def buildArgumentList(self, validate=True):
             argumentList.append("--uploadOnly")
         if self.ignoreWarnings:
             argumentList.append("--ignoreWarnings")
+        if self.stateFile is not None:
+            argumentList.append("--stateFile")
+            argumentList.append(self.stateFile)
+        if self.reconcileDays is not None:
+            argumentList.append("--reconcileDays")
+            argumentList.append("%d" % self.reconcileDays)
+        if self.profile is not None:
+            argumentList.append("--profile")
+            argumentList.append(self.profile)
         if self.sourceDir is not None:
             argumentList.append(self.sourceDir)
         if self.s3BucketUrl is not None:
@@ -789,6 +891,12 @@ def buildArgumentString(self, validate=True):
             argumentString += "--uploadOnly "
         if self.ignoreWarnings:
             argumentString += "--ignoreWarnings "
+        if self.stateFile is not None:
+            argumentString += '--stateFile "%s" ' % self.stateFile
+        if self.reconcileDays is not None:
+            argumentString += "--reconcileDays %d " % self.reconcileDays
+        if self.profile is not None:
+            argumentString += '--profile "%s" ' % self.profile
         if self.sourceDir is not None:
             argumentString += '"%s" ' % self.sourceDir
         if self.s3BucketUrl is not None:
@@ -854,12 +962,237 @@ def _parseArgumentList(self, argumentList):
             self.uploadOnly = True
         if "-w" in switches or "--ignoreWarnings" in switches:
             self.ignoreWarnings = True
+        if "-S" in switches:
+            self.stateFile = switches["-S"]
+        if "--stateFile" in switches:
+            self.stateFile = switches["--stateFile"]
+        if "-r" in switches:
+            self.reconcileDays = switches["-r"]
+        if "--reconcileDays" in switches:
+            self.reconcileDays = switches["--reconcileDays"]
+        if "--profile" in switches:
+            self.profile = switches["--profile"]
         try:
             (self.sourceDir, self.s3BucketUrl) = remaining
         except ValueError:
             pass
 
 
+#######################################################################
+# SyncState class definition
+#######################################################################
+
+
+class SyncState:
+    """
+    Local state database for the cback3-amazons3-sync script.
+
+    The state database is an SQLite file recording, for every file that has been
+    synchronized, its path relative to the source directory, its size and
+    modification time (in nanoseconds) as of the upload, the checksum computed
+    locally while uploading, and the ETag reported by S3.  The checksum is the
+    ETag that S3 would assign to an unencrypted copy of the file, so it matches
+    the ETag unless the bucket encrypts objects with KMS, in which case it is
+    what lets an unchanged file with a new modification time be recognized.
+    Paths are stored as bytes, so filenames that are not valid in the current
+    locale are tracked correctly.  A single file can hold state for several source directories and
+    bucket URLs, each identified by a ``target`` string.
+
+    Each run loads a scan of the source directory into a temporary table, and
+    the files to upload and remove are worked out as a join against the saved
+    state, so the saved state never needs to be held in memory.  A full
+    reconciliation replaces the saved state with the actual contents of the
+    bucket, keeping the recorded size, modification time and checksum only for
+    objects that still match.
+
+    The state database also caches the results of the filename encoding check
+    for each directory, keyed on the directory's modification time, since the
+    names in a directory cannot change without changing its modification time.
+
+    Updates may be recorded from worker threads.  They are committed every
+    ``COMMIT_INTERVAL`` records, so an interrupted run does not lose track of
+    the files it already uploaded.
+    """
+
+    def __init__(self, path, target):
+        """
+        Constructor for the ``SyncState`` class.
+
+        Args:
+           path: Path of the SQLite state file, which is created if necessary
+           target: String identifying the source directory and bucket URL
+        """
+        self.target = target
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS objects (
+               target TEXT NOT NULL, path BLOB NOT NULL, size INTEGER NOT NULL,
+               mtime INTEGER, checksum TEXT, etag TEXT, PRIMARY KEY (target, path));
+            CREATE TABLE IF NOT EXISTS targets (target TEXT PRIMARY KEY, reconciled REAL);
+            CREATE TABLE IF NOT EXISTS checked (
+               encoding TEXT NOT NULL, directory BLOB NOT NULL, mtime INTEGER NOT NULL,
+               PRIMARY KEY (encoding, directory));
+            CREATE TABLE IF NOT EXISTS inconsistent (
+               encoding TEXT NOT NULL, directory BLOB NOT NULL, name BLOB NOT NULL, detected TEXT,
+               PRIMARY KEY (encoding, directory, name));
+            CREATE TEMP TABLE scan (path BLOB PRIMARY KEY, size INTEGER NOT NULL, mtime INTEGER NOT NULL);
+            """
+        )
+
+    def close(self):
+        """
+        Commits any outstanding updates and closes the database.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def commit(self):
+        """
+        Commits any outstanding updates.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    @property
+    def reconciled(self):
+        """
+        Time of the last full reconciliation, in seconds since the epoch, or None.
+        """
+        row = self._connection.execute("SELECT reconciled FROM targets WHERE target = ?", (self.target,)).fetchone()
+        return row[0] if row else None
+
+    def loadScan(self, entries):
+        """
+        Loads a scan of the source directory, as an iterable of (path, size, mtime) tuples.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM scan")
+            self._connection.executemany("INSERT INTO scan (path, size, mtime) VALUES (?, ?, ?)", entries)
+
+    def reconcile(self, entries):
+        """
+        Replaces the saved state with the contents of the bucket.
+
+        Args:
+           entries: Iterable of (path, size, etag) tuples for the objects in the bucket
+        """
+        with self._lock:
+            self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS remote (path BLOB PRIMARY KEY, size INTEGER, etag TEXT)")
+            self._connection.execute("DELETE FROM remote")
+            self._connection.executemany("INSERT OR REPLACE INTO remote (path, size, etag) VALUES (?, ?, ?)", entries)
+            self._connection.execute(
+                "DELETE FROM objects WHERE target = ? AND NOT EXISTS "
+                "(SELECT 1 FROM remote r WHERE r.path = objects.path AND r.size = objects.size AND r.etag = objects.etag)",
+                (self.target,),
+            )
+            self._connection.execute(
+                "INSERT INTO objects (target, path, size, mtime, checksum, etag) SELECT ?, r.path, r.size, NULL, NULL, r.etag "
+                "FROM remote r WHERE NOT EXISTS (SELECT 1 FROM objects o WHERE o.target = ? AND o.path = r.path)",
+                (self.target, self.target),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO targets (target, reconciled) VALUES (?, ?)", (self.target, time.time())
+            )
+            self._connection.execute("DELETE FROM remote")
+            self._connection.commit()
+
+    def changes(self):
+        """
+        Returns the scanned files that differ from the saved state.
+
+        Returns:
+            List of (path, size, mtime, remoteSize, remoteEtag, checksum) tuples, with the saved values None if not known
+        """
+        return self._connection.execute(
+            "SELECT s.path, s.size, s.mtime, o.size, o.etag, o.checksum FROM scan s "
+            "LEFT JOIN objects o ON o.target = ? AND o.path = s.path "
+            "WHERE o.path IS NULL OR o.size != s.size OR o.mtime IS NULL OR o.mtime != s.mtime",
+            (self.target,),
+        ).fetchall()
+
+    def removals(self):
+        """
+        Returns the paths in the saved state that are no longer in the source directory.
+        """
+        return [
+            row[0]
+            for row in self._connection.execute(
+                "SELECT path FROM objects WHERE target = ? AND path NOT IN (SELECT path FROM scan)", (self.target,)
+            )
+        ]
+
+    def record(self, path, size, mtime, checksum, etag):
+        """
+        Records a file that has been uploaded and verified.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO objects (target, path, size, mtime, checksum, etag) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.target, path, size, mtime, checksum, etag),
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_INTERVAL:
+                self._connection.commit()
+                self._pending = 0
+
+    def checkedNames(self, encoding, directory, mtime):
+        """
+        Returns the cached result of the filename encoding check for a directory.
+
+        Args:
+           encoding: Locale encoding the names were checked against
+           directory: Directory path, as bytes
+           mtime: Current modification time of the directory, in nanoseconds
+        Returns:
+            Dict mapping inconsistent name to detected encoding, or None if there is no current result
+        """
+        row = self._connection.execute(
+            "SELECT mtime FROM checked WHERE encoding = ? AND directory = ?", (encoding, directory)
+        ).fetchone()
+        if row is None or row[0] != mtime:
+            return None
+        return dict(
+            self._connection.execute(
+                "SELECT name, detected FROM inconsistent WHERE encoding = ? AND directory = ?", (encoding, directory)
+            )
+        )
+
+    def recordCheckedNames(self, encoding, directory, mtime, inconsistent):
+        """
+        Records the result of the filename encoding check for a directory.
+
+        Args:
+           encoding: Locale encoding the names were checked against
+           directory: Directory path, as bytes
+           mtime: Modification time of the directory when checked, in nanoseconds
+           inconsistent: Dict mapping inconsistent name to detected encoding
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checked (encoding, directory, mtime) VALUES (?, ?, ?)", (encoding, directory, mtime)
+            )
+            self._connection.execute("DELETE FROM inconsistent WHERE encoding = ? AND directory = ?", (encoding, directory))
+            self._connection.executemany(
+                "INSERT INTO inconsistent (encoding, directory, name, detected) VALUES (?, ?, ?, ?)",
+                [(encoding, directory, name, detected) for (name, detected) in inconsistent.items()],
+            )
+
+    def forget(self, paths):
+        """
+        Removes files that have been deleted from the bucket.
+        """
+        with self._lock:
+            self._connection.executemany(
+                "DELETE FROM objects WHERE target = ? AND path = ?", [(self.target, path) for path in paths]
+            )
+            self._connection.commit()
+
+
 #######################################################################
 # Public functions
 #######################################################################
@@ -937,10 +1270,12 @@ def cli():
     Diagnostics().logDiagnostics(method=logger.info)
 
     if options.stacktrace:
-        _executeAction(options)
+        with profiled("amazons3-sync", options.profile):
+            _executeAction(options)
     else:
         try:
-            _executeAction(options)
+            with profiled("amazons3-sync", options.profile):
+                _executeAction(options)
         except KeyboardInterrupt:
             logger.error("Backup interrupted.")
             logger.info("Cedar Backup Amazon S3 sync run completed with status 5.")
@@ -979,7 +1314,10 @@ def _usage(fd=sys.stderr):
     fd.write(" bucket.  After the sync is complete, a validation step is taken.  An\n")
     fd.write(" error is reported if the contents of the bucket do not match the\n")
     fd.write(" source directory, or if the indicated size for any file differs.\n")
-    fd.write(" This tool is a wrapper over the AWS CLI command-line tool.\n")
+    fd.write(" A local state file remembers what was uploaded, so only files that\n")
+    fd.write(" changed since the last run are transferred and verified.  Directory\n")
+    fd.write(" listings are cached next to the state file, so directories that have\n")
+    fd.write(" not changed since the last run are not read again.\n")
     fd.write("\n")
     fd.write(" The following arguments are required:\n")
     fd.write("\n")
@@ -997,7 +1335,7 @@ def _usage(fd=sys.stderr):
         "   -o, --owner          Logfile ownership, user:group (default: %s:%s)\n" % (DEFAULT_OWNERSHIP[0], DEFAULT_OWNERSHIP[1])
     )
     fd.write("   -m, --mode           Octal logfile permissions mode (default: %o)\n" % DEFAULT_MODE)
-    fd.write("   -O, --output         Record some sub-command (i.e. aws) output to the log\n")
+    fd.write("   -O, --output         Record some sub-command output to the log\n")
     fd.write("   -d, --debug          Write debugging information to the log (implies --output)\n")
     fd.write(
         "   -s, --stack          Dump Python stack trace instead of swallowing exceptions\n"
@@ -1006,6 +1344,9 @@ def _usage(fd=sys.stderr):
     fd.write("   -v, --verifyOnly     Only verify the S3 bucket contents, do not make changes\n")
     fd.write("   -u, --uploadOnly     Only upload new data, do not remove files in the S3 bucket\n")
     fd.write("   -w, --ignoreWarnings Ignore warnings about problematic filename encodings\n")
+    fd.write("   -S, --stateFile      Path to sync state file (default: %s)\n" % DEFAULT_STATE_FILE)
+    fd.write("   -r, --reconcileDays  Reconcile state against the whole bucket every N days\n")
+    fd.write("       --profile        Profile the sync (mode: cprofile, sample or both)\n")
     fd.write("\n")
     fd.write(" Typical usage would be something like:\n")
     fd.write("\n")
@@ -1073,12 +1414,31 @@ def _executeAction(options):
     Raises:
        Exception: Under many generic error conditions
     """
-    sourceFiles = _buildSourceFiles(options.sourceDir)
-    if not options.ignoreWarnings:
-        _checkSourceFiles(options.sourceDir, sourceFiles)
-    if not options.verifyOnly:
-        _synchronizeBucket(options.sourceDir, options.s3BucketUrl, options.uploadOnly)
-    _verifyBucketContents(options.sourceDir, sourceFiles, options.s3BucketUrl)
+    (bucket, prefix) = _parseBucketUrl(options.s3BucketUrl)
+    stateFile = os.path.expanduser(options.stateFile or DEFAULT_STATE_FILE)
+    if options.verifyOnly:
+        sourceFiles = _buildSourceFiles(options.sourceDir)
+    else:
+        traversalCache = TraversalCache(_getTraversalCachePath(stateFile, options.sourceDir))
+        sourceFiles = _buildSourceFiles(options.sourceDir, traversalCache)
+        traversalCache.save()
+    with buildClient(bucket) as client:
+        if options.verifyOnly:
+            if not options.ignoreWarnings:
+                _checkSourceFiles(sourceFiles)
+            _verifyBucketContents(client, prefix, options.sourceDir, sourceFiles)
+            return
+        state = SyncState(stateFile, "%s %s" % (os.path.abspath(options.sourceDir), options.s3BucketUrl))
+        try:
+            if not options.ignoreWarnings:
+                _checkSourceFiles(sourceFiles, state)
+            reconcile = _isReconcileDue(state, options.reconcileDays)
+            (results, removed) = _synchronizeBucket(
+                client, prefix, options.sourceDir, sourceFiles, state, options.uploadOnly, reconcile
+            )
+        finally:
+            state.close()
+        _verifyChanges(client, prefix, results, removed)
 
 
 ################################
@@ -1086,33 +1446,76 @@ def _executeAction(options):
 ################################
 
 
-def _buildSourceFiles(sourceDir):
+def _buildSourceFiles(sourceDir, traversalCache=None):
     """
     Build a list of files in a source directory
     Args:
        sourceDir: Local source directory
+       traversalCache: Traversal cache to list directories through, or ``None``
     Returns:
         FilesystemList with contents of source directory
     """
     if not os.path.isdir(sourceDir):
         raise ValueError("Source directory does not exist on disk.")
     sourceFiles = FilesystemList()
+    sourceFiles.traversalCache = traversalCache
     sourceFiles.addDirContents(sourceDir)
     return sourceFiles
 
 
+#####################################
+# _getTraversalCachePath() function
+#####################################
+
+
+def _getTraversalCachePath(stateFile, sourceDir):
+    """
+    Gets the path of the traversal cache for a source directory.
+
+    The cache lives next to the state file.  A cache only keeps the directories
+    listed by the run that last saved it, so each source directory gets its own
+    cache, named for a digest of its absolute path.
+
+    Args:
+       stateFile: Path of the sync state file
+       sourceDir: Local source directory
+    Returns:
+        Path of the traversal cache file
+    """
+    digest = hashlib.sha256(os.fsencode(os.path.abspath(sourceDir))).hexdigest()
+    return "%s.%s.traversal" % (stateFile, digest[:16])
+
+
 ###############################
 # _checkSourceFiles() function
 ###############################
 
 
-def _checkSourceFiles(sourceDir, sourceFiles):  # noqa: ARG001
+def _checkSourceFiles(sourceFiles, state=None):
     """
     Check source files, trying to guess which ones will have encoding problems.
+
+    Names are checked one directory at a time.  Names that are pure ASCII, or
+    that decode strictly in the locale encoding, are accepted without further
+    checks.  (The strict decode is only trusted when the locale encoding can
+    actually reject some input, which single-byte encodings like Latin-1 can't.)
+    The remaining names are passed to chardet along with their full path, as
+    the check always has done, on a process pool if there are enough of them,
+    and a name is reported if the encoding that chardet detects for its path
+    does not agree with the locale.  The directory part of the path is checked
+    through its own entry in the list.
+
+    If a state is provided, the result for each directory is cached there,
+    keyed on the modification time of the directory, and directories that have
+    not changed since the last check are not checked again.
+
     Args:
-       sourceDir: Local source directory
-       sourceDir: Local source directory
-    @raises ValueError: If a problem file is found
+       sourceFiles: Filesystem list containing contents of source directory
+       state: Optional SyncState used to cache results
+    Returns:
+        Dict with the number of names accepted as ``ascii``, ``locale``, ``cached`` or ``chardet``
+    Raises:
+       ValueError: If a problem file is found
     @see U{http://opensourcehacker.com/2011/09/16/fix-linux-filename-encodings-with-python/}
     @see U{http://serverfault.com/questions/82821/how-to-tell-the-language-encoding-of-a-filename-on-linux}
     @see U{http://randysofia.com/2014/06/06/aws-cli-and-your-locale/}
@@ -1120,41 +1523,214 @@ def _checkSourceFiles(sourceDir, sourceFiles):  # noqa: ARG001
     with warnings.catch_warnings():
         encoding = Diagnostics().encoding
 
-        # Note: this was difficult to fully test.  As of the original Python 2
-        # implementation, I had a bunch of files on disk that had inconsistent
-        # encodings, so I was able to prove that the check warned about these
-        # files initially, and then didn't warn after I fixed them.  I didn't
-        # save off those files for a unit test (ugh) so by the time of the Python
-        # 3 conversion -- which is subtly different because of the different way
-        # Python 3 handles unicode strings -- I had to contrive some tests.  I
-        # think the tests I wrote are consistent with the earlier problems, and I
-        # do get the same result for those tests in both CedarBackup 2 and Cedar
-        # Backup 3.  However, I can't be certain the implementation is
-        # equivalent.  If someone runs into a situation that this code doesn't
-        # handle, you may need to revisit the implementation.
-
-        failed = False
-        for entry in sourceFiles:
-            path = bytes(Path(entry))
-            result = chardet.detect(path)
-            source = path.decode(result["encoding"])
-            try:
-                target = path.decode(encoding)
-                if source != target:
-                    logger.error("Inconsistent encoding for [%s]: got %s, but need %s", path, result["encoding"], encoding)
-                    failed = True
-            except Exception:
-                logger.error("Inconsistent encoding for [%s]: got %s, but need %s", path, result["encoding"], encoding)
-                failed = True
+    # Note: this was difficult to fully test.  As of the original Python 2
+    # implementation, I had a bunch of files on disk that had inconsistent
+    # encodings, so I was able to prove that the check warned about these
+    # files initially, and then didn't warn after I fixed them.  I didn't
+    # save off those files for a unit test (ugh) so by the time of the Python
+    # 3 conversion -- which is subtly different because of the different way
+    # Python 3 handles unicode strings -- I had to contrive some tests.  I
+    # think the tests I wrote are consistent with the earlier problems, and I
+    # do get the same result for those tests in both CedarBackup 2 and Cedar
+    # Backup 3.  However, I can't be certain the implementation is
+    # equivalent.  If someone runs into a situation that this code doesn't
+    # handle, you may need to revisit the implementation.
+
+    directories = {}
+    for entry in sourceFiles:
+        (directory, name) = os.path.split(bytes(Path(entry)))
+        directories.setdefault(directory, []).append(name)
+
+    counts = {"ascii": 0, "locale": 0, "cached": 0, "chardet": 0}
+    inconsistent = {}
+    checked = {}
+    ambiguous = []
+    trustLocale = not _isPermissiveEncoding(encoding)
+    for directory, names in directories.items():
+        mtime = os.stat(directory).st_mtime_ns
+        cached = state.checkedNames(encoding, directory, mtime) if state is not None else None
+        if cached is not None:
+            counts["cached"] += len(names)
+            inconsistent.update((os.path.join(directory, name), detected) for (name, detected) in cached.items())
+            continue
+        checked[directory] = mtime
+        for name in names:
+            if name.isascii():
+                counts["ascii"] += 1
+            elif trustLocale and _decodes(name, encoding):
+                counts["locale"] += 1
+            else:
+                ambiguous.append(os.path.join(directory, name))
+
+    counts["chardet"] = len(ambiguous)
+    for path, detected in zip(ambiguous, _detectEncodings(ambiguous), strict=True):
+        if not _isConsistent(path, detected, encoding):
+            inconsistent[path] = detected
+
+    if state is not None:
+        for directory, mtime in checked.items():
+            failures = {
+                os.path.basename(path): detected for (path, detected) in inconsistent.items() if os.path.dirname(path) == directory
+            }
+            state.recordCheckedNames(encoding, directory, mtime, failures)
+        state.commit()
+
+    logger.info(
+        "Checked %d filenames: %d ASCII, %d valid in %s, %d unchanged since last check, %d checked with chardet.",
+        sum(counts.values()),
+        counts["ascii"],
+        counts["locale"],
+        encoding,
+        counts["cached"],
+        counts["chardet"],
+    )
 
-        if not failed:
-            logger.info("Completed checking source filename encoding (no problems found).")
-        else:
-            logger.error("Some filenames have inconsistent encodings and will likely cause sync problems.")
-            logger.error("You may be able to fix this by setting a more sensible locale in your environment.")
-            logger.error("Aternately, you can rename the problem files to be valid in the indicated locale.")
-            logger.error("To ignore this warning and proceed anyway, use --ignoreWarnings")
-            raise ValueError("Some filenames have inconsistent encodings and will likely cause sync problems.")
+    if not inconsistent:
+        logger.info("Completed checking source filename encoding (no problems found).")
+    else:
+        for path, detected in sorted(inconsistent.items()):
+            logger.error("Inconsistent encoding for [%s]: got %s, but need %s", path, detected, encoding)
+        logger.error("Some filenames have inconsistent encodings and will likely cause sync problems.")
+        logger.error("You may be able to fix this by setting a more sensible locale in your environment.")
+        logger.error("Aternately, you can rename the problem files to be valid in the indicated locale.")
+        logger.error("To ignore this warning and proceed anyway, use --ignoreWarnings")
+        raise ValueError("Some filenames have inconsistent encodings and will likely cause sync problems.")
+
+    return counts
+
+
+def _isPermissiveEncoding(encoding):
+    """
+    Whether an encoding accepts any byte string, so a successful decode says nothing.
+    """
+    return _decodes(bytes(range(128, 256)), encoding)
+
+
+def _decodes(name, encoding):
+    """
+    Whether a name decodes strictly in an encoding.
+    """
+    try:
+        name.decode(encoding)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def _isConsistent(path, detected, encoding):
+    """
+    Whether a path decodes the same way in its detected encoding and the locale encoding.
+    """
+    try:
+        return path.decode(detected) == path.decode(encoding)
+    except Exception:
+        return False
+
+
+def _detectEncoding(path):
+    """
+    Detect the encoding of a path with chardet.
+    """
+    return chardet.detect(path)["encoding"]
+
+
+def _detectEncodings(paths):
+    """
+    Detect the encoding of a list of paths, using a process pool if the list is long.
+    """
+    if len(paths) < DETECT_POOL_THRESHOLD:
+        return [_detectEncoding(path) for path in paths]
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(_detectEncoding, paths, chunksize=64))
+
+
+#############################
+# _parseBucketUrl() function
+#############################
+
+
+def _parseBucketUrl(s3BucketUrl):
+    """
+    Parse an S3 bucket URL like ``s3://bucket/prefix`` into a bucket name and key prefix.
+    Args:
+       s3BucketUrl: Target S3 bucket URL
+    Returns:
+        Tuple of (bucket, prefix), where the prefix is either empty or ends with a slash
+    Raises:
+       ValueError: If the URL is not an S3 URL
+    """
+    if not s3BucketUrl.startswith("s3://"):
+        raise ValueError("S3 bucket URL must start with s3://")
+    (bucket, _, prefix) = s3BucketUrl[len("s3://") :].partition("/")
+    if not bucket:
+        raise ValueError("S3 bucket URL must include a bucket name.")
+    prefix = prefix.strip("/")
+    return (bucket, prefix + "/" if prefix else "")
+
+
+#############################
+# _isReconcileDue() function
+#############################
+
+
+def _isReconcileDue(state, reconcileDays):
+    """
+    Decide whether the saved state should be reconciled against the whole bucket.
+
+    Reconciliation always happens if the state has never been reconciled, which
+    includes the first run against a bucket.  Otherwise, it happens if
+    ``reconcileDays`` is set and at least that many days have passed.
+
+    Args:
+       state: SyncState for the source directory and bucket
+       reconcileDays: Days between full reconciliations, or None
+    Returns:
+        True if a full reconciliation is needed
+    """
+    reconciled = state.reconciled
+    if reconciled is None:
+        logger.info("Sync state has never been reconciled against the bucket, so a full reconciliation is needed.")
+        return True
+    if reconcileDays is not None and time.time() - reconciled >= reconcileDays * 24 * 60 * 60:
+        logger.info("Last full reconciliation was more than %d days ago.", reconcileDays)
+        return True
+    return False
+
+
+#############################
+# _scanSourceFiles() function
+#############################
+
+
+def _scanSourceFiles(sourceDir, sourceFiles, prefix):
+    """
+    Scan the regular files in a source directory.
+
+    Files whose names cannot be represented as S3 keys (i.e. are not valid
+    UTF-8) are logged and left out of the scan.
+
+    Args:
+       sourceDir: Local source directory
+       sourceFiles: Filesystem list containing contents of source directory
+       prefix: S3 key prefix
+    Returns:
+        Tuple of (scan, skipped), where scan maps relative path as bytes to (path, key, size, mtime)
+    """
+    scan = {}
+    skipped = 0
+    for entry in sourceFiles:
+        info = os.lstat(entry)
+        if stat.S_ISREG(info.st_mode):
+            relative = os.path.relpath(entry, sourceDir)
+            key = prefix + relative.replace(os.sep, "/")
+            try:
+                key.encode("utf-8")
+            except UnicodeEncodeError:
+                logger.error("Filename cannot be stored in S3: [%s]", os.fsencode(entry))
+                skipped += 1
+                continue
+            scan[os.fsencode(relative)] = (entry, key, info.st_size, info.st_mtime_ns)
+    return (scan, skipped)
 
 
 ################################
@@ -1162,26 +1738,112 @@ def _checkSourceFiles(sourceDir, sourceFiles):  # noqa: ARG001
 ################################
 
 
-def _synchronizeBucket(sourceDir, s3BucketUrl, uploadOnly):
+def _synchronizeBucket(client, prefix, sourceDir, sourceFiles, state, uploadOnly, reconcile):
     """
     Synchronize a local directory to an Amazon S3 bucket.
+
+    The source directory is compared against the saved state, rather than
+    against a listing of the bucket, so a sync that changes nothing makes no
+    requests at all (unless a full reconciliation is due).  Changed files are
+    uploaded concurrently, skipping any that turn out to be identical to what is
+    already in the bucket, and the state is updated as each upload is verified.
+
     Args:
+       client: S3Client for the bucket
+       prefix: S3 key prefix
        sourceDir: Local source directory
-       s3BucketUrl: Target S3 bucket URL
+       sourceFiles: Filesystem list containing contents of source directory
+       state: SyncState for the source directory and bucket
+       uploadOnly: Only upload new data, never removing files in S3
+       reconcile: Whether to do a full reconciliation against the bucket first
+    Returns:
+        Tuple of (results, removed), the (size, etag) of each uploaded object by key and the list of removed keys
+    Raises:
+       ValueError: If some files could not be synchronized
     """
-    # Since at least early 2015, 'aws s3 sync' is always recursive and the
-    # --recursive option is useless.  They eventually removed it and now using
-    # it causes an error.  See: https://github.com/aws/aws-cli/issues/1170
-    logger.info("Synchronizing local source directory up to Amazon S3.")
-    args = ["s3", "sync", sourceDir, s3BucketUrl]
+    (scan, skipped) = _scanSourceFiles(sourceDir, sourceFiles, prefix)
+    state.loadScan((path, size, mtime) for (path, (_, _, size, mtime)) in scan.items())
+    if reconcile:
+        logger.info("Reconciling sync state against the contents of the bucket.")
+        state.reconcile((key[len(prefix) :].encode("utf-8"), size, etag) for (key, size, etag) in client.iterObjects(prefix))
+    changes = state.changes()
+    logger.info("Found %d new or changed files out of %d in the source directory.", len(changes), len(scan))
+
+    def finished(path, key, etag, checksum):  # noqa: ARG001
+        relative = os.fsencode(os.path.relpath(path, sourceDir))
+        (_, _, size, mtime) = scan[relative]
+        state.record(relative, size, mtime, checksum, etag)
+
+    uploads = [scan[row[0]][:2] for row in changes]
+    existing = {scan[row[0]][1]: (row[3], row[4]) for row in changes if row[4] is not None}
+    checksums = {scan[row[0]][1]: row[5] for row in changes if row[5] is not None}
+    uploader = S3Uploader(client)
+    results = uploader.uploadFiles(uploads, existing, finished, checksums)
+    statistics = uploader.statistics
+    logger.info(
+        "Uploaded %d objects (%s) at %s/s; %d changed files were already up to date.",
+        statistics.objectsUploaded,
+        displayBytes(statistics.bytesUploaded),
+        displayBytes(statistics.throughput),
+        statistics.objectsSkipped,
+    )
+    removed = []
     if uploadOnly:
         logger.info("Sync process will only upload new data, never removing files in S3")
     else:
-        logger.info("This will be a full sync process, removing any S3 files that do not exist in the source")
-        args += ["--delete"]
-    result = executeCommand(AWS_COMMAND, args, returnOutput=False)[0]
-    if result != 0:
-        raise OSError("Error [%d] calling AWS CLI synchronize bucket." % result)
+        paths = state.removals()
+        removed = [prefix + os.fsdecode(path) for path in paths]
+        logger.info("Removing %d files from S3 that no longer exist in the source directory.", len(removed))
+        client.deleteObjects(removed)
+        state.forget(paths)
+    if skipped:
+        raise ValueError("%d files could not be synchronized because their names cannot be stored in S3." % skipped)
+    return (results, removed)
+
+
+############################
+# _verifyChanges() function
+############################
+
+
+def _verifyChanges(client, prefix, results, removed):
+    """
+    Verify that the objects changed by a sync are as expected in an Amazon S3 bucket.
+
+    Each upload was already verified against a checksum, so this only confirms
+    that the bucket agrees about the size and ETag of each uploaded object, and
+    that removed objects are gone.  Objects are checked individually, unless so
+    many changed that listing the bucket is cheaper.
+
+    Args:
+       client: S3Client for the bucket
+       prefix: S3 key prefix
+       results: Dict mapping key to (size, etag) for each uploaded object
+       removed: List of keys for the removed objects
+    Raises:
+       ValueError: If the bucket does not match
+    """
+    keys = list(results) + removed
+    if len(keys) > VERIFY_LIST_THRESHOLD:
+        contents = client.listObjects(prefix)
+        actual = [contents.get(key) for key in keys]
+    else:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            actual = list(executor.map(client.headObject, keys))
+    failed = False
+    for key, found in zip(keys, actual, strict=True):
+        expected = results.get(key)
+        if expected is None and found is not None:
+            logger.error("File was apparently not removed: [%s]", key)
+            failed = True
+        elif expected is not None and found != expected:
+            logger.error("Object differs [%s]: expected %s but got %s", key, expected, found)
+            failed = True
+    if not failed:
+        logger.info("Completed verifying %d changed objects in Amazon S3 (no problems found).", len(keys))
+    else:
+        logger.error("There were differences between source directory and target S3 bucket.")
+        raise ValueError("There were differences between source directory and target S3 bucket.")
 
 
 ###################################
@@ -1189,54 +1851,20 @@ def _synchronizeBucket(sourceDir, s3BucketUrl, uploadOnly):
 ###################################
 
 
-def _verifyBucketContents(sourceDir, sourceFiles, s3BucketUrl):
+def _verifyBucketContents(client, prefix, sourceDir, sourceFiles):
     """
     Verify that a source directory is equivalent to an Amazon S3 bucket.
     Args:
+       client: S3Client for the bucket
+       prefix: S3 key prefix
        sourceDir: Local source directory
        sourceFiles: Filesystem list containing contents of source directory
-       s3BucketUrl: Target S3 bucket URL
     """
-    # As of this writing, the documentation for the S3 API that we're using
-    # below says that up to 1000 elements at a time are returned, and that we
-    # have to manually handle pagination by looking for the IsTruncated element.
-    # However, in practice, this is not true.  I have been testing with
-    # "aws-cli/1.4.4 Python/2.7.3 Linux/3.2.0-4-686-pae", installed through PIP.
-    # No matter how many items exist in my bucket and prefix, I get back a
-    # single JSON result.  I've tested with buckets containing nearly 6000
-    # elements.
-    #
-    # If I turn on debugging, it's clear that underneath, something in the API
-    # is executing multiple list-object requests against AWS, and stiching
-    # results together to give me back the final JSON result.  The debug output
-    # clearly incldues multiple requests, and each XML response (except for the
-    # final one) contains <IsTruncated>true</IsTruncated>.
-    #
-    # This feature is not mentioned in the offical changelog for any of the
-    # releases going back to 1.0.0.  It appears to happen in the botocore
-    # library, but I'll admit I can't actually find the code that implements it.
-    # For now, all I can do is rely on this behavior and hope that the
-    # documentation is out-of-date.  I'm not going to write code that tries to
-    # parse out IsTruncated if I can't actually test that code.
-
-    (bucket, prefix) = s3BucketUrl.replace("s3://", "").split("/", 1)
-
-    query = "Contents[].{Key: Key, Size: Size}"
-    args = ["s3api", "list-objects", "--bucket", bucket, "--prefix", prefix, "--query", query]
-    (result, data) = executeCommand(AWS_COMMAND, args, returnOutput=True)
-    if result != 0:
-        raise OSError("Error [%d] calling AWS CLI verify bucket contents." % result)
-
-    contents = {}
-    for entry in json.loads("".join(data)):
-        key = entry["Key"].replace(prefix, "")
-        size = int(entry["Size"])
-        contents[key] = size
-
+    contents = {key: size for (key, size, _) in client.iterObjects(prefix)}
     failed = False
     for entry in sourceFiles:
         if os.path.isfile(entry):
-            key = entry.replace(sourceDir, "")
+            key = prefix + os.path.relpath(entry, sourceDir).replace(os.sep, "/")
             size = int(os.stat(entry).st_size)
             if key not in contents:
                 logger.error("File was apparently not uploaded: [%s]", entry)
@@ -0,0 +1,323 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Watches collect directories and journals changed paths
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Notes
+########################################################################
+
+"""
+Watches collect directories and journals changed paths.
+
+This is the Cedar Backup change journal tool.  It runs in the background
+alongside ``cback3``, watching the configured collect directories with Linux
+inotify and recording every changed path in a journal in the working directory.
+When the journal is available, the collect action only checks the changed paths
+for collect directories in ``incr`` mode, rather than walking and hashing the
+whole tree.  See :any:`CedarBackup3.journal` for the details.
+
+The tool runs until it is interrupted with CTRL-C or sent ``SIGTERM``.  It
+should run as the backup user, so that it can write to the working directory.
+
+:author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+########################################################################
+# Imported modules and constants
+########################################################################
+
+import logging
+import signal
+import sys
+import threading
+
+from CedarBackup3.cli import (
+    DEFAULT_CONFIG,
+    DEFAULT_LOGFILE,
+    DEFAULT_MODE,
+    DEFAULT_OWNERSHIP,
+    Options,
+    setupLogging,
+    setupPathResolver,
+)
+from CedarBackup3.config import Config
+from CedarBackup3.journal import INOTIFY_AVAILABLE, ChangeWatcher
+from CedarBackup3.profiler import profiled
+from CedarBackup3.release import AUTHOR, EMAIL, VERSION
+from CedarBackup3.util import Diagnostics
+
+########################################################################
+# Module-wide constants and variables
+########################################################################
+
+logger = logging.getLogger("CedarBackup3.log.tools.journal")
+
+
+#######################################################################
+# JournalOptions class
+#######################################################################
+
+
+class JournalOptions(Options):
+    """
+    Tool-specific command-line options.
+
+    Most of the cback3 command-line options are exactly what we need here --
+    logfile path, permissions, verbosity, etc.  However, we need to make a few
+    tweaks since we don't accept any actions.
+    """
+
+    def validate(self):
+        """
+        Validates command-line options represented by the object.
+        There are no validations here, because we don't use any actions.
+        Raises:
+           ValueError: If one of the validations fails
+        """
+
+
+#######################################################################
+# Public functions
+#######################################################################
+
+#################
+# cli() function
+#################
+
+
+def cli():
+    """
+    Implements the command-line interface for the ``cback3-journal`` script.
+
+    Essentially, this is the "main routine" for the cback3-journal script.  It
+    does all of the argument processing for the script, and then also implements
+    the tool functionality.
+
+    A different error code is returned for each type of failure:
+
+       - ``1``: The Python interpreter version is not supported
+       - ``2``: Error processing command-line arguments
+       - ``3``: Error configuring logging
+       - ``4``: Error parsing indicated configuration file
+       - ``5``: The watcher was interrupted with a CTRL-C or similar
+       - ``6``: Error executing other parts of the script
+
+    Returns:
+        Error code as described above
+    """
+    try:
+        if list(map(int, [sys.version_info[0], sys.version_info[1]])) < [3, 8]:
+            sys.stderr.write("Python 3 version 3.8 or greater required.\n")
+            return 1
+    except:
+        # sys.version_info isn't available before 2.0
+        sys.stderr.write("Python 3 version 3.8 or greater required.\n")
+        return 1
+
+    try:
+        options = JournalOptions(argumentList=sys.argv[1:])
+    except Exception as e:
+        _usage()
+        sys.stderr.write(" *** Error: %s\n" % e)
+        return 2
+
+    if options.help:
+        _usage()
+        return 0
+    if options.version:
+        _version()
+        return 0
+    if options.diagnostics:
+        _diagnostics()
+        return 0
+
+    if options.stacktrace:
+        logfile = setupLogging(options)
+    else:
+        try:
+            logfile = setupLogging(options)
+        except Exception as e:
+            sys.stderr.write("Error setting up logging: %s\n" % e)
+            return 3
+
+    logger.info("Cedar Backup 'journal' utility run started.")
+    logger.info("Options were [%s]", options)
+    logger.info("Logfile is [%s]", logfile)
+
+    if options.config is None:
+        logger.debug("Using default configuration file.")
+        configPath = DEFAULT_CONFIG
+    else:
+        logger.debug("Using user-supplied configuration file.")
+        configPath = options.config
+
+    try:
+        logger.info("Configuration path is [%s]", configPath)
+        config = Config(xmlPath=configPath)
+        setupPathResolver(config)
+    except Exception as e:
+        logger.error("Error reading or handling configuration: %s", e)
+        logger.info("Cedar Backup 'journal' utility run completed with status 4.")
+        return 4
+
+    outputDir = config.options.workingDir if config.options is not None else None
+    if options.stacktrace:
+        with profiled("journal", options.profile, outputDir):
+            _executeAction(options, config)
+    else:
+        try:
+            with profiled("journal", options.profile, outputDir):
+                _executeAction(options, config)
+        except KeyboardInterrupt:
+            logger.info("Watcher interrupted.")
+            logger.info("Cedar Backup 'journal' utility run completed with status 5.")
+            return 5
+        except Exception as e:
+            logger.error("Error executing watcher: %s", e)
+            logger.info("Cedar Backup 'journal' utility run completed with status 6.")
+            return 6
+
+    logger.info("Cedar Backup 'journal' utility run completed with status 0.")
+    return 0
+
+
+#######################################################################
+# Utility functions
+#######################################################################
+
+####################
+# _usage() function
+####################
+
+
+def _usage(fd=sys.stderr):
+    """
+    Prints usage information for the cback3-journal script.
+    Args:
+       fd: File descriptor used to print information
+    *Note:* The ``fd`` is used rather than ``print`` to facilitate unit testing.
+    """
+    fd.write("\n")
+    fd.write(" Usage: cback3-journal [switches]\n")
+    fd.write("\n")
+    fd.write(" Cedar Backup 'journal' tool.\n")
+    fd.write("\n")
+    fd.write(" This Cedar Backup utility watches the configured collect directories\n")
+    fd.write(" and journals changed paths, so the collect action can skip unchanged\n")
+    fd.write(" directories.  It runs until it is interrupted or terminated.\n")
+    fd.write("\n")
+    fd.write(" The following switches are accepted, mostly to set up underlying\n")
+    fd.write(" Cedar Backup functionality:\n")
+    fd.write("\n")
+    fd.write("   -h, --help     Display this usage/help listing\n")
+    fd.write("   -V, --version  Display version information\n")
+    fd.write("   -b, --verbose  Print verbose output as well as logging to disk\n")
+    fd.write("   -c, --config   Path to config file (default: %s)\n" % DEFAULT_CONFIG)
+    fd.write("   -l, --logfile  Path to logfile (default: %s)\n" % DEFAULT_LOGFILE)
+    fd.write("   -o, --owner    Logfile ownership, user:group (default: %s:%s)\n" % (DEFAULT_OWNERSHIP[0], DEFAULT_OWNERSHIP[1]))
+    fd.write("   -m, --mode     Octal logfile permissions mode (default: %o)\n" % DEFAULT_MODE)
+    fd.write("   -d, --debug    Write debugging information to the log\n")
+    fd.write("   -s, --stack    Dump a Python stack trace instead of swallowing exceptions\n")
+    fd.write("       --profile  Profile the tool (mode: cprofile, sample or both)\n")
+    fd.write("\n")
+
+
+######################
+# _version() function
+######################
+
+
+def _version(fd=sys.stdout):
+    """
+    Prints version information for the cback3-journal script.
+    Args:
+       fd: File descriptor used to print information
+    *Note:* The ``fd`` is used rather than ``print`` to facilitate unit testing.
+    """
+    fd.write("\n")
+    fd.write(" Cedar Backup 'journal' tool.\n")
+    fd.write(" Included with Cedar Backup version %s.\n" % VERSION)
+    fd.write("\n")
+    fd.write(" Copyright (c) %s <%s>.\n" % (AUTHOR, EMAIL))
+    fd.write(" See NOTICE for a list of included code and other contributors.\n")
+    fd.write(" This is free software; there is NO warranty.  See the\n")
+    fd.write(" GNU General Public License version 2 for copying conditions.\n")
+    fd.write("\n")
+    fd.write(" Use the --help option for usage information.\n")
+    fd.write("\n")
+
+
+##########################
+# _diagnostics() function
+##########################
+
+
+def _diagnostics(fd=sys.stdout):
+    """
+    Prints runtime diagnostics information.
+    Args:
+       fd: File descriptor used to print information
+    *Note:* The ``fd`` is used rather than ``print`` to facilitate unit testing.
+    """
+    fd.write("\n")
+    fd.write("Diagnostics:\n")
+    fd.write("\n")
+    Diagnostics().printDiagnostics(fd=fd, prefix="   ")
+    fd.write("\n")
+
+
+############################
+# _executeAction() function
+############################
+
+
+def _executeAction(options, config):  # noqa: ARG001
+    """
+    Implements the guts of the cback3-journal tool.
+
+    Args:
+       options (JournalOptions object): Program command-line options
+       config (Config object): Program configuration
+    Raises:
+       Exception: Under many generic error conditions
+    """
+    if not INOTIFY_AVAILABLE:
+        raise ValueError("The change journal requires Linux inotify, which is not available on this platform.")
+    if config.options is None or config.collect is None:
+        raise ValueError("Collect configuration is not properly filled in.")
+    if config.collect.collectDirs is None or len(config.collect.collectDirs) < 1:
+        raise ValueError("There must be at least one collect directory to watch.")
+    roots = [collectDir.absolutePath for collectDir in config.collect.collectDirs]
+    watcher = ChangeWatcher(config.options.workingDir, roots)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())  # noqa: ARG005
+    logger.info("Watching %d collect directories; journal is in [%s].", len(roots), config.options.workingDir)
+    watcher.run(stop)
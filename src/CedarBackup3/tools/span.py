@@ -46,6 +46,11 @@
 specifically the store section.  A few pieces of configuration are taken
 directly from the user.
 
+While one disc is being written and checked, the image and digests for the
+next disc are prepared in the background, within a scratch space budget chosen
+by the user.  This way, most of the time spent building images overlaps with
+time spent burning discs.
+
 :author: Kenneth J. Pronovici <pronovic@ieee.org>
 """
 
@@ -55,8 +60,11 @@
 
 import logging
 import os
+import shutil
 import sys
 import tempfile
+import threading
+import time
 
 from CedarBackup3.actions.constants import STORE_INDICATOR
 from CedarBackup3.actions.store import writeIndicatorFile
@@ -71,9 +79,21 @@
     setupPathResolver,
 )
 from CedarBackup3.config import Config
-from CedarBackup3.filesystem import BackupFileList, compareDigestMaps, normalizeDir
+from CedarBackup3.filesystem import DIGEST_THREADS, BackupFileList, compareListContents, normalizeDir
+from CedarBackup3.profiler import profiled
 from CedarBackup3.release import AUTHOR, EMAIL, VERSION
-from CedarBackup3.util import UNIT_BYTES, UNIT_SECTORS, Diagnostics, convertSize, displayBytes, mount, unmount
+from CedarBackup3.util import (
+    UNIT_BYTES,
+    UNIT_MBYTES,
+    UNIT_SECTORS,
+    Diagnostics,
+    convertSize,
+    displayBytes,
+    mount,
+    unmount,
+)
+from CedarBackup3.writers.iso9660 import openMedia
+from CedarBackup3.writers.util import IsoImage, invalidateMediaState
 
 ########################################################################
 # Module-wide constants and variables
@@ -81,6 +101,8 @@
 
 logger = logging.getLogger("CedarBackup3.log.tools.span")
 
+PREPARED_IMAGES = 2  # the image being written, plus the image for the next disc
+
 
 #######################################################################
 # SpanOptions class
@@ -108,6 +130,212 @@ def validate(self):
         """
 
 
+#######################################################################
+# _ImagePipeline class
+#######################################################################
+
+
+class _PreparedImage:
+    """
+    Simple value object to hold an image prepared in advance by ``_ImagePipeline``.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.path = None  # path to the ISO image in the working directory
+        self.reserved = 0  # bytes of scratch space reserved for the image
+        self.digest = None  # digest map for the consistency check, relative to the source directory
+        self.sizes = None  # dict mapping digest map key to size in bytes
+        self.buildTime = 0.0  # seconds spent building the image and digests
+        self.error = None  # exception raised while preparing the image, if any
+        self.done = threading.Event()
+
+
+class _ImagePipeline:
+    """
+    Prepares the images for a span set in the background, one disc ahead.
+
+    A single background thread builds the ISO image for each span item in
+    order, along with the digest map used for its consistency check.  At most
+    :any:`PREPARED_IMAGES` images exist at once, and their total estimated size
+    must fit in the scratch space budget.  The exception is the very first
+    image, which is always built, since even without a pipeline the writer
+    would need scratch space for it.  So, with a budget smaller than two
+    images, there is no overlap and discs are written one after another, as
+    usual.
+
+    The caller gets each image with :any:`get` when it is ready to write the
+    disc, and gives it back with :any:`release` once the disc is complete, which
+    removes the image and allows the next one to be built.
+    """
+
+    def __init__(self, config, spanSet, budget):
+        """
+        Constructor for the ``_ImagePipeline`` class.
+        Args:
+           config: Cedar Backup configuration
+           spanSet: List of span items to prepare images for, in order
+           budget: Scratch space budget for images, in bytes
+        """
+        self._config = config
+        self._spanSet = list(spanSet)
+        self._budget = budget
+        self._images = [_PreparedImage(index) for index in range(len(self._spanSet))]
+        self._condition = threading.Condition()
+        self._reserved = 0
+        self._held = 0
+        self._stopped = False
+        self._waitTime = 0.0
+        self._thread = None
+
+    def start(self):
+        """
+        Starts preparing images in a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="cback3-span-images", daemon=True)
+        self._thread.start()
+
+    def get(self, index):
+        """
+        Gets the prepared image for a span item, waiting for it to be built if necessary.
+        Args:
+           index: Index of the span item in the span set
+        Returns:
+            ``_PreparedImage`` for the span item, whose ``error`` is set if it could not be built
+        """
+        image = self._images[index]
+        started = time.perf_counter()
+        image.done.wait()
+        self._waitTime += time.perf_counter() - started
+        return image
+
+    def release(self, image):
+        """
+        Removes a prepared image once its disc is complete, freeing its scratch space.
+        Args:
+           image: Image returned from :any:`get`
+        """
+        _removeImage(image)
+        with self._condition:
+            if image.reserved > 0:
+                self._reserved -= image.reserved
+                self._held -= 1
+                image.reserved = 0
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Stops the background thread and removes any images that are left over.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for image in self._images:
+            _removeImage(image)
+
+    def _getBuildTime(self):
+        """
+        Property target to get the total time spent preparing images, in seconds.
+        """
+        return sum(image.buildTime for image in self._images)
+
+    def _getSavedTime(self):
+        """
+        Property target to get the time saved by preparing images in the background, in seconds.
+        """
+        return max(0.0, self.buildTime - self._waitTime)
+
+    buildTime = property(_getBuildTime, None, None, "Total time spent preparing images, in seconds.")
+    savedTime = property(_getSavedTime, None, None, "Time saved by preparing images in the background, in seconds.")
+
+    def _run(self):
+        """
+        Body of the background thread, which prepares each image in turn.
+        """
+        try:
+            for image in self._images:
+                if not self._prepare(image):
+                    break
+        finally:
+            for image in self._images:
+                image.done.set()  # never leave the caller waiting, even if we were stopped
+
+    def _prepare(self, image):
+        """
+        Prepares one image, once there is room for it in the scratch space budget.
+        Args:
+           image: Image to prepare
+        Returns:
+            True if the image was prepared (or failed), False if the pipeline was stopped
+        """
+        spanItem = self._spanSet[image.index]
+        try:
+            isoImage = IsoImage()
+            for path in spanItem.fileList:
+                graftPoint = os.path.dirname(path.replace(self._config.store.sourceDir, "", 1))
+                isoImage.addEntry(path, graftPoint, override=False, contentsOnly=True)
+            estimate = isoImage.getEstimatedSize()
+        except Exception as e:
+            image.error = e
+            image.done.set()
+            return True
+        with self._condition:
+            while (
+                not self._stopped and self._held > 0 and (self._held >= PREPARED_IMAGES or self._reserved + estimate > self._budget)
+            ):
+                self._condition.wait()
+            if self._stopped:
+                return False
+            self._reserved += estimate
+            self._held += 1
+            image.reserved = estimate
+        logger.debug("Preparing image for disc %d in the background.", image.index + 1)
+        started = time.perf_counter()
+        try:
+            self._build(image, isoImage, spanItem.fileList)
+            logger.debug("Prepared image [%s] for disc %d.", image.path, image.index + 1)
+        except Exception as e:
+            logger.error("Failed to prepare image for disc %d: %s", image.index + 1, e)
+            image.error = e
+            _removeImage(image)
+        finally:
+            image.buildTime = time.perf_counter() - started
+            image.done.set()
+        return True
+
+    def _build(self, image, isoImage, fileList):
+        """
+        Builds an image file and the digests for its consistency check.
+        Args:
+           image: Image to fill in
+           isoImage: ``IsoImage`` containing the files for the image
+           fileList: ``BackupFileList`` containing the same files
+        """
+        (handle, image.path) = tempfile.mkstemp(dir=self._config.options.workingDir, suffix=".iso")
+        os.close(handle)
+        isoImage.writeImage(image.path)
+        prefix = normalizeDir(self._config.store.sourceDir)
+        image.digest = fileList.generateDigestMap(stripPrefix=prefix, threads=DIGEST_THREADS)
+        image.sizes = {path.replace(prefix, "", 1): os.path.getsize(path) for path in fileList if os.path.isfile(path)}
+
+
+def _removeImage(image):
+    """
+    Removes the image file for a prepared image, if it exists.
+    Args:
+       image: Prepared image whose file to remove
+    """
+    if image.path is not None:
+        try:
+            os.unlink(image.path)
+        except OSError:
+            pass
+        image.path = None
+
+
 #######################################################################
 # Public functions
 #######################################################################
@@ -200,11 +428,14 @@ def cli():
         logger.info("Cedar Backup 'span' utility run completed with status 4.")
         return 4
 
+    outputDir = config.options.workingDir if config.options is not None else None
     if options.stacktrace:
-        _executeAction(options, config)
+        with profiled("span", options.profile, outputDir):
+            _executeAction(options, config)
     else:
         try:
-            _executeAction(options, config)
+            with profiled("span", options.profile, outputDir):
+                _executeAction(options, config)
         except KeyboardInterrupt:
             logger.error("Backup interrupted.")
             logger.info("Cedar Backup 'span' utility run completed with status 5.")
@@ -255,6 +486,7 @@ def _usage(fd=sys.stderr):
     fd.write("   -O, --output   Record some sub-command (i.e. tar) output to the log\n")
     fd.write("   -d, --debug    Write debugging information to the log (implies --output)\n")
     fd.write("   -s, --stack    Dump a Python stack trace instead of swallowing exceptions\n")
+    fd.write("       --profile  Profile the tool (mode: cprofile, sample or both)\n")
     fd.write("\n")
 
 
@@ -432,23 +664,49 @@ def _executeAction(options, config):  # noqa: ARG001
             happy = True
         print("===")
 
-    counter = 0
-    for spanItem in spanSet:
-        counter += 1
-        if counter == 1:
-            print()
-            _getReturn("Please place the first disc in your backup device.\nPress return when ready.")
-            print("===")
-        else:
-            print()
-            _getReturn("Please replace the disc in your backup device.\nPress return when ready.")
-            print("===")
-        _writeDisc(config, writer, spanItem)
+    print()
+    print("While one disc is being written, the image for the next disc can be")
+    print("built in the background, so there is less waiting between discs.")
+    print("This takes scratch space in the working directory for two images at")
+    print("once, about %s.  With less scratch space than that, discs are written" % displayBytes(2 * mediaCapacity))
+    print("one after another.")
+    print()
+    budget = _getFloat("How much scratch space may be used, in MB?", default=_getDefaultBudget(config, mediaCapacity))
+    budget = convertSize(budget, UNIT_MBYTES, UNIT_BYTES)
+    print("===")
+
+    pipeline = _ImagePipeline(config, spanSet, budget)
+    pipeline.start()
+    try:
+        counter = 0
+        for spanItem in spanSet:
+            counter += 1
+            if counter == 1:
+                print()
+                _getReturn("Please place the first disc in your backup device.\nPress return when ready.")
+                print("===")
+            else:
+                print()
+                _getReturn("Please replace the disc in your backup device.\nPress return when ready.")
+                print("===")
+            image = pipeline.get(counter - 1)
+            try:
+                _writeDisc(config, writer, spanItem, image)
+            finally:
+                pipeline.release(image)
+    finally:
+        pipeline.close()
 
     _writeStoreIndicator(config, dailyDirs)
 
     print()
     print("Completed writing all discs.")
+    print("Preparing images in the background saved about %.0f seconds." % pipeline.savedTime)
+    logger.info(
+        "Spent %.1f seconds preparing images, of which %.1f seconds overlapped with writing discs.",
+        pipeline.buildTime,
+        pipeline.savedTime,
+    )
 
 
 ############################
@@ -519,23 +777,60 @@ def _getWriter(config):
     return (writer, mediaCapacity)
 
 
+###############################
+# _getDefaultBudget() function
+###############################
+
+
+def _getDefaultBudget(config, mediaCapacity):
+    """
+    Gets the default scratch space budget for prepared images, in MB.
+    This is enough for two images, unless the working directory has less free space than that.
+    Args:
+       config: Cedar Backup configuration
+       mediaCapacity: Media capacity in bytes
+    Returns:
+        Default scratch space budget, in MB
+    """
+    budget = 2 * mediaCapacity
+    try:
+        budget = min(budget, shutil.disk_usage(config.options.workingDir).free)
+    except OSError:
+        pass
+    return convertSize(budget, UNIT_BYTES, UNIT_MBYTES)
+
+
 ########################
 # _writeDisc() function
 ########################
 
 
-def _writeDisc(config, writer, spanItem):
+def _writeDisc(config, writer, spanItem, image=None):
     """
     Writes a span item to disc.
+
+    If an image was prepared in advance, it is written directly and its digest
+    map is used for the consistency check.  Otherwise (or if it could not be
+    prepared), the image is built by the writer as usual.
+
     Args:
        config: Cedar Backup configuration
        writer: Writer to use
        spanItem: Span item to write
+       image: Image prepared in advance by ``_ImagePipeline``, or ``None``
     """
     print()
-    _discInitializeImage(config, writer, spanItem)
-    _discWriteImage(config, writer)
-    _discConsistencyCheck(config, writer, spanItem)
+    invalidateMediaState(writer.device)  # the user has just swapped in a new disc
+    if image is not None and image.error is None:
+        print("Using image prepared in advance.")
+        _discWriteImage(config, writer, image)
+        _discConsistencyCheck(config, writer, spanItem, image)
+    else:
+        if image is not None:
+            logger.warning("Image prepared in advance is not available, so it will be built now: %s", image.error)
+        _discInitializeImage(config, writer, spanItem)
+        _discWriteImage(config, writer)
+        _discConsistencyCheck(config, writer, spanItem)
     print("Write process is complete.")
     print("===")
 
@@ -568,18 +863,20 @@ def _discInitializeImage(config, writer, spanItem):
     print("Completed initializing image.")
 
 
-def _discWriteImage(config, writer):  # noqa: ARG001
+def _discWriteImage(config, writer, image=None):  # noqa: ARG001
     """
     Writes a ISO image for a span item.
     Args:
        config: Cedar Backup configuration
        writer: Writer to use
+       image: Image prepared in advance, or ``None`` to write the writer's own image
     """
+    imagePath = None if image is None else image.path
     complete = False
     while not complete:
         try:
             print("Writing image to disc...")
-            writer.writeImage()
+            writer.writeImage(imagePath, newDisc=True)  # newDisc is ignored when writing the writer's own image
             complete = True
         except KeyboardInterrupt as e:
             raise e
@@ -593,20 +890,22 @@ def _discWriteImage(config, writer):  # noqa: ARG001
     print("Completed writing image.")
 
 
-def _discConsistencyCheck(config, writer, spanItem):
+def _discConsistencyCheck(config, writer, spanItem, image=None):
     """
     Run a consistency check on an ISO image for a span item.
     Args:
        config: Cedar Backup configuration
        writer: Writer to use
        spanItem: Span item to write
+       image: Image prepared in advance, or ``None``
     """
     if config.store.checkData:
+        (digest, sizes) = (None, None) if image is None else (image.digest, image.sizes)
         complete = False
         while not complete:
             try:
                 print("Running consistency check...")
-                _consistencyCheck(config, spanItem.fileList)
+                _consistencyCheck(config, spanItem.fileList, digest, sizes)
                 complete = True
             except KeyboardInterrupt as e:
                 raise e
@@ -618,7 +917,7 @@ def _discConsistencyCheck(config, writer, spanItem):
                     print("Ok, attempting retry.")
                     _getReturn("Please replace the disc in your backup device.\nPress return when ready.")
                     print("===")
-                    _discWriteImage(config, writer)
+                    _discWriteImage(config, writer, image)
                 else:
                     print("Ok, attempting retry.")
                     print("===")
@@ -630,13 +929,20 @@ def _discConsistencyCheck(config, writer, spanItem):
 ###############################
 
 
-def _consistencyCheck(config, fileList):
+def _consistencyCheck(config, fileList, digest=None, sizes=None):
     """
     Runs a consistency check against media in the backup device.
 
-    The function mounts the device at a temporary mount point in the working
-    directory, and then compares the passed-in file list's digest map with the
-    one generated from the disc.  The two lists should be identical.
+    The function compares the passed-in file list with the contents of the
+    disc.  The two should be identical.  If possible, the disc is read
+    directly from the device using :any:`writers.iso9660.openMedia`, in one
+    sequential sweep.  Otherwise, the device is mounted at a temporary mount
+    point in the working directory, and the comparison is done via
+    functionality in ``filesystem.py``.
+
+    When reading directly from the device, a digest map and sizes computed
+    in advance can be passed in, so the source files don't need to be read
+    again.
 
     If no exceptions are thrown, there were no problems with the consistency
     check.
@@ -646,22 +952,28 @@ def _consistencyCheck(config, fileList):
     Args:
        config: Config object
        fileList: BackupFileList whose contents to check against
+       digest: Digest map for the file list, relative to the source directory, if already known
+       sizes: Dictionary mapping digest map key to size in bytes, if already known
 
     Raises:
        ValueError: If the check fails
        IOError: If there is a problem working with the media
     """
     logger.debug("Running consistency check.")
+    reader = openMedia(config.store.devicePath)
+    if reader is not None:
+        if digest is None:
+            prefix = normalizeDir(config.store.sourceDir)
+            digest = fileList.generateDigestMap(stripPrefix=prefix, threads=DIGEST_THREADS)
+            sizes = {path.replace(prefix, "", 1): os.path.getsize(path) for path in fileList if os.path.isfile(path)}
+        with reader:
+            reader.verifyContents("/", digest, sizes=sizes)
+        logger.info("Consistency check completed.  No problems found.")
+        return
     mountPoint = tempfile.mkdtemp(dir=config.options.workingDir)
     try:
         mount(config.store.devicePath, mountPoint, "iso9660")
-        discList = BackupFileList()
-        discList.addDirContents(mountPoint)
-        sourceList = BackupFileList()
-        sourceList.extend(fileList)
-        discListDigest = discList.generateDigestMap(stripPrefix=normalizeDir(mountPoint))
-        sourceListDigest = sourceList.generateDigestMap(stripPrefix=normalizeDir(config.store.sourceDir))
-        compareDigestMaps(sourceListDigest, discListDigest, verbose=True)
+        compareListContents(fileList, normalizeDir(config.store.sourceDir), mountPoint, verbose=True)
         logger.info("Consistency check completed.  No problems found.")
     finally:
         unmount(mountPoint, True, 5, 1)  # try 5 times, and remove mount point when done
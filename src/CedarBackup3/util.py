@@ -76,13 +76,16 @@
 import platform
 import posixpath
 import re
+import shutil
 import sys
+import threading
 import time
 from decimal import Decimal
 from functools import total_ordering
 from numbers import Real
 from subprocess import PIPE, STDOUT, Popen
 
+from CedarBackup3.metrics import finishCommand, startCommand
 from CedarBackup3.release import VERSION
 
 try:
@@ -931,19 +934,20 @@ class Pipe(Popen):
     Specialized pipe class for use by ``executeCommand``.
 
     The :any:`executeCommand` function needs a specialized way of interacting
-    with a pipe.  First, ``executeCommand`` only reads from the pipe, and
-    never writes to it.  Second, ``executeCommand`` needs a way to discard all
-    output written to ``stderr``, as a means of simulating the shell
-    ``2>/dev/null`` construct.
+    with a pipe.  First, ``executeCommand`` normally only reads from the pipe,
+    and only writes to it when the caller asks for ``stdin`` to be fed from a
+    file.  Second, ``executeCommand`` needs a way to discard all output written
+    to ``stderr``, as a means of simulating the shell ``2>/dev/null`` construct.
     """
 
     # noinspection PyArgumentList
-    def __init__(self, cmd, bufsize=-1, ignoreStderr=False):
+    def __init__(self, cmd, bufsize=-1, ignoreStderr=False, writeStdin=False):
         stderr = STDOUT
         if ignoreStderr:
             devnull = nullDevice()
             stderr = os.open(devnull, os.O_RDWR)
-        Popen.__init__(self, shell=False, args=cmd, bufsize=bufsize, stdin=None, stdout=PIPE, stderr=stderr)
+        stdin = PIPE if writeStdin else None
+        Popen.__init__(self, shell=False, args=cmd, bufsize=bufsize, stdin=stdin, stdout=PIPE, stderr=stderr)
 
 
 ########################################################################
@@ -1490,7 +1494,7 @@ def resolveCommand(command):
 ############################
 
 
-def executeCommand(command, args, returnOutput=False, ignoreStderr=False, doNotLog=False, outputFile=None):
+def executeCommand(command, args, returnOutput=False, ignoreStderr=False, doNotLog=False, outputFile=None, inputFile=None):
     """
     Executes a shell command, hopefully in a safe way.
 
@@ -1530,6 +1534,15 @@ class implemented using either ``subprocess.Popen`` or ``popen2.Popen4``.
     descriptor will be flushed using ``outputFile.flush()``.  The caller
     maintains responsibility for closing the file object appropriately.
 
+    The ``inputFile`` parameter is the equivalent for ``stdin``, i.e. a
+    substitute for redirection from a file.  If this value is passed in, its
+    contents are copied (via ``inputFile.read()``) to the command's ``stdin`` on
+    a separate thread, and ``stdin`` is closed once the input is exhausted.  If
+    the command exits without consuming all of its input, the rest is
+    discarded.  The thread is always finished before this function returns,
+    so the caller can safely close the file object once the call completes,
+    and maintains responsibility for doing so.
+
     *Note:* I know that it's a bit confusing that the command and the arguments
     are both lists.  I could have just required the caller to pass in one big
     list.  However, I think it makes some sense to keep the command (the
@@ -1552,6 +1565,7 @@ class implemented using either ``subprocess.Popen`` or ``popen2.Popen4``.
        ignoreStderr (Boolean True or False): Whether stderr should be discarded
        doNotLog (Boolean ``True`` or ``False``): Indicates that output should not be logged
        outputFile (File as from ``open`` or ``file``, binary write): File that all output should be written to
+       inputFile (File as from ``open`` or ``file``, binary read): File that input should be read from
     Returns:
         Tuple of ``(result, output)`` as described above
     """
@@ -1575,9 +1589,14 @@ class implemented using either ``subprocess.Popen`` or ``popen2.Popen4``.
     output = []
     fields = command[:]  # make sure to copy it so we don't destroy it
     fields.extend(args)
+    token = startCommand(fields[0])
     try:
         sanitizeEnvironment()  # make sure we have a consistent environment
-        with Pipe(fields, ignoreStderr=ignoreStderr) as pipe:
+        with Pipe(fields, ignoreStderr=ignoreStderr, writeStdin=inputFile is not None) as pipe:
+            feeder = None
+            if inputFile is not None:
+                feeder = threading.Thread(target=_feedInput, args=(inputFile, pipe.stdin), daemon=True)
+                feeder.start()
             try:
                 while True:
                     line = pipe.stdout.readline()
@@ -1607,12 +1626,39 @@ class implemented using either ``subprocess.Popen`` or ``popen2.Popen4``.
                         return (pipe.wait(), [e])
                 else:
                     return (pipe.wait(), None)
+            finally:
+                if feeder is not None:
+                    # Once the command exits, the feeder either finishes or gets a broken pipe.  Close
+                    # stdout first, like Popen.__exit__ does, so a command still writing output can't block.
+                    pipe.stdout.close()
+                    pipe.wait()
+                    feeder.join()
     except OSError as e:
         logger.debug("Command returned OSError: %s", e)
         if returnOutput:
             return (256, output)
         else:
             return (256, None)
+    finally:
+        finishCommand(token)
+
+
+def _feedInput(inputFile, stdin):
+    """
+    Copies an input file to a command's ``stdin``, for use by :any:`executeCommand`.
+    Args:
+       inputFile: File-like object opened in binary mode to read from
+       stdin: Pipe connected to the command's ``stdin``
+    """
+    try:
+        shutil.copyfileobj(inputFile, stdin)
+    except OSError as e:  # includes BrokenPipeError, if the command does not consume all of its input
+        logger.debug("Stopped writing command input: %s", e)
+    finally:
+        try:
+            stdin.close()
+        except OSError:
+            pass
 
 
 ##############################
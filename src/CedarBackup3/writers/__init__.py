@@ -38,6 +38,7 @@
 
 import CedarBackup3.writers.cdwriter
 import CedarBackup3.writers.dvdwriter
+import CedarBackup3.writers.iso9660
 import CedarBackup3.writers.util
 
-__all__ = ["util", "cdwriter", "dvdwriter"]
+__all__ = ["util", "cdwriter", "dvdwriter", "iso9660"]
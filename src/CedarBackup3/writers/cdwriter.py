@@ -58,8 +58,10 @@
 import posixpath
 import re
 import tempfile
+import threading
 import time
 
+from CedarBackup3.metrics import increment, timer
 from CedarBackup3.util import (
     UNIT_BYTES,
     UNIT_KBYTES,
@@ -71,7 +73,16 @@
     executeCommand,
     resolveCommand,
 )
-from CedarBackup3.writers.util import IsoImage, validateDevice, validateDriveSpeed, validateScsiId
+from CedarBackup3.writers.util import (
+    IsoImage,
+    RingBuffer,
+    cachedDeviceProperties,
+    cachedMediaState,
+    invalidateMediaState,
+    validateDevice,
+    validateDriveSpeed,
+    validateScsiId,
+)
 
 ########################################################################
 # Module-wide constants and variables
@@ -88,6 +99,8 @@
 EJECT_COMMAND = ["eject"]
 MKISOFS_COMMAND = ["mkisofs"]
 
+STREAM_BUFFER_SIZE = 64 * 1024 * 1024  # size of the ring buffer between mkisofs and cdrecord, in bytes
+
 
 ########################################################################
 # MediaDefinition class definition
@@ -285,6 +298,7 @@ def __init__(self):
         self.tmpdir = None
         self.mediaLabel = None
         self.entries = None  # dict mapping path to graft point
+        self.isoImage = None  # IsoImage used for size estimates, which caches its directory walk
 
 
 ########################################################################
@@ -415,6 +429,7 @@ def __init__(
         noEject=False,
         refreshMediaDelay=0,
         ejectDelay=0,
+        streamImage=False,
         unittest=False,
     ):
         """
@@ -429,6 +444,8 @@ def __init__(
         The various instance variables such as ``deviceType``, ``deviceVendor``,
         etc. might be ``None``, if we're unable to parse this specific information
         from the ``cdrecord`` output.  This information is just for reference.
+        The properties are only read from ``cdrecord`` once per hardware id, and
+        are shared by any other writer created for the same device.
 
         The SCSI id is optional, but the device path is required.  If the SCSI id
         is passed in, then the hardware id attribute will be taken from the SCSI
@@ -438,6 +455,11 @@ def __init__(
         can be safely opened and closed, then pass in ``noEject=False``.  This
         will override the properties and the device will never be ejected.
 
+        If ``streamImage`` is ``True``, then when :any:`writeImage` is called
+        with no image path, the output of ``mkisofs`` is piped directly into
+        ``cdrecord`` through a bounded in-memory ring buffer, rather than being
+        written to a temporary ISO image in ``tmpdir`` first.
+
         *Note:* The ``unittest`` parameter should never be set to ``True``
         outside of Cedar Backup code.  It is intended for use in unit testing
         Cedar Backup internals and has no other sensible purpose.
@@ -450,6 +472,7 @@ def __init__(
            noEject (Boolean true/false): Overrides properties to indicate that the device does not support eject
            refreshMediaDelay (Number of seconds, an integer >= 0): Refresh media delay to use, if any
            ejectDelay (Number of seconds, an integer >= 0): Eject delay to use, if any
+           streamImage (Boolean true/false): Stream the image into ``cdrecord`` rather than using a temporary file
            unittest (Boolean true/false): Turns off certain validations, for use in unit testing
         Raises:
            ValueError: If the device is not valid for some reason
@@ -465,6 +488,7 @@ def __init__(
         self._noEject = noEject
         self._refreshMediaDelay = refreshMediaDelay
         self._ejectDelay = ejectDelay
+        self._streamImage = streamImage
         if not unittest:
             (
                 self._deviceType,
@@ -474,7 +498,7 @@ def __init__(
                 self._deviceSupportsMulti,
                 self._deviceHasTray,
                 self._deviceCanEject,
-            ) = self._retrieveProperties()
+            ) = cachedDeviceProperties(self.hardwareId, self._retrieveProperties)
 
     #############
     # Properties
@@ -566,6 +590,12 @@ def _getEjectDelay(self):
         """
         return self._ejectDelay
 
+    def _getStreamImage(self):
+        """
+        Property target used to get the stream image flag.
+        """
+        return self._streamImage
+
     device = property(_getDevice, None, None, doc="Filesystem device name for this writer.")
     scsiId = property(_getScsiId, None, None, doc="SCSI id for the device, in the form ``[<method>:]scsibus,target,lun``.")
     hardwareId = property(_getHardwareId, None, None, doc="Hardware id for this writer, either SCSI id or device path.")
@@ -580,6 +610,7 @@ def _getEjectDelay(self):
     deviceCanEject = property(_getDeviceCanEject, None, None, doc="Indicates whether the device supports ejecting its media.")
     refreshMediaDelay = property(_getRefreshMediaDelay, None, None, doc="Refresh media delay, in seconds.")
     ejectDelay = property(_getEjectDelay, None, None, doc="Eject delay, in seconds.")
+    streamImage = property(_getStreamImage, None, None, doc="Indicates whether images are streamed into ``cdrecord``.")
 
     #################################################
     # Methods related to device and media attributes
@@ -625,6 +656,9 @@ def retrieveCapacity(self, entireDisc=False, useMulti=True):
         represent whatever space remains on the disc to be filled by future
         sessions.
 
+        The boundaries are only read from the disc once per media, as described
+        in :any:`writers.util.cachedMediaState`.
+
         Args:
            entireDisc (Boolean true/false): Indicates whether to return capacity for entire disc
            useMulti (Boolean true/false): Indicates whether a multisession disc should be assumed, if possible
@@ -670,20 +704,28 @@ def _getBoundaries(self, entireDisc=False, useMulti=True):
             logger.debug("Entire disc flag is True; returning boundaries None.")
             return None
         else:
-            args = CdWriter._buildBoundariesArgs(self.hardwareId)
-            command = resolveCommand(CDRECORD_COMMAND)
-            (result, output) = executeCommand(command, args, returnOutput=True, ignoreStderr=True)
-            if result != 0:
-                logger.debug("Error (%d) executing cdrecord command to get capacity.", result)
-                logger.warning("Unable to read disc (might not be initialized); returning boundaries of None.")
-                return None
-            boundaries = CdWriter._parseBoundariesOutput(output)
+            boundaries = cachedMediaState(self._device, "boundaries", self._readBoundaries)
             if boundaries is None:
                 logger.debug("Returning disc boundaries: None")
             else:
                 logger.debug("Returning disc boundaries: (%d, %d)", boundaries[0], boundaries[1])
             return boundaries
 
+    def _readBoundaries(self):
+        """
+        Reads the ISO boundaries for the media from ``cdrecord``.
+        Returns:
+            Boundaries tuple, or ``None`` if the disc can't be read
+        """
+        args = CdWriter._buildBoundariesArgs(self.hardwareId)
+        command = resolveCommand(CDRECORD_COMMAND)
+        (result, output) = executeCommand(command, args, returnOutput=True, ignoreStderr=True)
+        if result != 0:
+            logger.debug("Error (%d) executing cdrecord command to get capacity.", result)
+            logger.warning("Unable to read disc (might not be initialized); returning boundaries of None.")
+            return None
+        return CdWriter._parseBoundariesOutput(output)
+
     @staticmethod
     def _calculateCapacity(media, boundaries):
         """
@@ -787,10 +829,11 @@ def getEstimatedImageSize(self):
         """
         if self._image is None:
             raise ValueError("Must call initializeImage() before using this method.")
-        image = IsoImage()
+        if self._image.isoImage is None:
+            self._image.isoImage = IsoImage()
         for path in list(self._image.entries.keys()):
-            image.addEntry(path, self._image.entries[path], override=False, contentsOnly=True)
-        return image.getEstimatedSize()
+            self._image.isoImage.addEntry(path, self._image.entries[path], override=True, contentsOnly=True)
+        return self._image.isoImage.getEstimatedSize()
 
     ######################################
     # Methods which expose device actions
@@ -827,6 +870,7 @@ def openTray(self):
         """
         if not self._noEject:
             if self._deviceHasTray and self._deviceCanEject:
+                invalidateMediaState(self._device)
                 args = CdWriter._buildOpenTrayArgs(self._device)
                 result = executeCommand(EJECT_COMMAND, args)[0]
                 if result != 0:
@@ -900,6 +944,7 @@ def refreshMedia(self):
         self.openTray()
         self.closeTray()
         self.unlockTray()  # on some systems, writing a disc leaves the tray locked, yikes!
+        invalidateMediaState(self._device)
         if self.refreshMediaDelay is not None:
             logger.debug("Per configuration, sleeping %d seconds to stabilize media state.", self.refreshMediaDelay)
             time.sleep(self.refreshMediaDelay)
@@ -919,7 +964,9 @@ def writeImage(self, imagePath=None, newDisc=False, writeMulti=True):
 
         if ``imagePath`` is passed in as ``None``, then the existing image
         configured with ``initializeImage`` will be used.  Under these
-        circumstances, the passed-in ``newDisc`` flag will be ignored.
+        circumstances, the passed-in ``newDisc`` flag will be ignored.  If the
+        writer was created with ``streamImage=True``, the image is streamed
+        directly into ``cdrecord`` rather than written to a temporary file.
 
         By default, we assume that the disc can be written multisession and that
         we should append to the current contents of the disc.  In any case, the
@@ -939,6 +986,9 @@ def writeImage(self, imagePath=None, newDisc=False, writeMulti=True):
         if imagePath is None:
             if self._image is None:
                 raise ValueError("Must call initializeImage() before using this method with no image path.")
+            if self._streamImage:
+                self._writeStreamedImage(writeMulti)
+                return
             try:
                 imagePath = self._createImage()
                 self._writeImage(imagePath, writeMulti, self._image.newDisc)
@@ -965,25 +1015,15 @@ def _createImage(self):
            ValueError: If a path cannot be encoded properly
         """
         path = None
-        capacity = self.retrieveCapacity(entireDisc=self._image.newDisc)
-        image = IsoImage(self.device, capacity.boundaries)
-        image.volumeId = self._image.mediaLabel  # may be None, which is also valid
-        for key in list(self._image.entries.keys()):
-            image.addEntry(key, self._image.entries[key], override=False, contentsOnly=True)
-        size = image.getEstimatedSize()
-        logger.info("Image size will be %s.", displayBytes(size))
-        available = capacity.bytesAvailable
-        logger.debug("Media capacity: %s", displayBytes(available))
-        if size > available:
-            logger.error("Image [%s] does not fit in available capacity [%s].", displayBytes(size), displayBytes(available))
-            raise OSError("Media does not contain enough capacity to store image.")
+        image = self._buildImage()
         try:
             (handle, path) = tempfile.mkstemp(dir=self._image.tmpdir)
             try:
                 os.close(handle)
             except:
                 pass
-            image.writeImage(path)
+            with timer("writer.image"):
+                image.writeImage(path)
             logger.debug("Completed creating image [%s].", path)
             return path
         except Exception as e:
@@ -994,6 +1034,94 @@ def _createImage(self):
                     pass
             raise e
 
+    def _buildImage(self):
+        """
+        Builds an ISO image based on configuration in self._image, checking that it fits on the media.
+        Returns:
+            ``IsoImage`` ready to be written
+        Raises:
+           IOError: If the image does not fit in the available capacity
+           ValueError: If there are no filesystem entries in the image
+        """
+        capacity = self.retrieveCapacity(entireDisc=self._image.newDisc)
+        image = IsoImage(self.device, capacity.boundaries)
+        image.volumeId = self._image.mediaLabel  # may be None, which is also valid
+        for key in list(self._image.entries.keys()):
+            image.addEntry(key, self._image.entries[key], override=False, contentsOnly=True)
+        size = image.getEstimatedSize() if capacity.boundaries is not None else self.getEstimatedImageSize()
+        logger.info("Image size will be %s.", displayBytes(size))
+        available = capacity.bytesAvailable
+        logger.debug("Media capacity: %s", displayBytes(available))
+        if size > available:
+            logger.error("Image [%s] does not fit in available capacity [%s].", displayBytes(size), displayBytes(available))
+            raise OSError("Media does not contain enough capacity to store image.")
+        return image
+
+    def _writeStreamedImage(self, writeMulti):
+        """
+        Streams the ISO image configured in self._image directly into cdrecord.
+
+        A producer thread runs ``mkisofs`` and writes its output into a
+        :any:`RingBuffer`, and ``cdrecord`` reads the image from its ``stdin``.
+        Since ``cdrecord`` can't find the size of a track on ``stdin`` by
+        itself, the exact size is taken from ``mkisofs -print-size`` first.
+        ``cdrecord`` isn't started until the buffer has been primed, and if the
+        buffer ever runs empty while writing, a warning is logged.
+
+        Args:
+           writeMulti: Indicates whether a multisession disc should be written, if possible
+        Raises:
+           IOError: If the image could not be built or the media could not be written to
+           ValueError: If there are no filesystem entries in the image
+        """
+        image = self._buildImage()
+        size = image.getExactSize()
+        if self._image.newDisc:
+            self._blankMedia()
+        buffer = RingBuffer(STREAM_BUFFER_SIZE)
+        errors = []
+
+        def produce():
+            try:
+                image.streamImage(buffer)
+            except Exception as e:
+                errors.append(e)
+                buffer.abort()
+            finally:
+                buffer.close()
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            buffer.waitPrimed()
+            if errors:
+                raise errors[0]
+            logger.debug("Streaming %s image through a %s buffer.", displayBytes(size), displayBytes(buffer.capacity))
+            args = CdWriter._buildWriteArgs(self.hardwareId, "-", self._driveSpeed, writeMulti and self._deviceSupportsMulti, size)
+            command = resolveCommand(CDRECORD_COMMAND)
+            invalidateMediaState(self._device)
+            with timer("writer.write"):
+                result = executeCommand(command, args, inputFile=buffer)[0]
+        finally:
+            buffer.abort()
+            producer.join()
+        if errors:
+            raise errors[0]
+        if result != 0:
+            raise OSError("Error (%d) executing command to write disc." % result)
+        lowWater = buffer.lowWater if buffer.lowWater is not None else buffer.capacity
+        logger.debug(
+            "Stream buffer low water mark was %s (%.1f%% full).", displayBytes(lowWater), 100.0 * lowWater / buffer.capacity
+        )
+        increment("writer.bytes", size)
+        increment("writer.underruns", buffer.underruns)
+        if buffer.underruns > 0:
+            logger.warning(
+                "Stream buffer ran empty %d time(s) while writing disc; consider writing through a temporary image.",
+                buffer.underruns,
+            )
+        self.refreshMedia()
+
     def _writeImage(self, imagePath, writeMulti, newDisc):
         """
         Write an ISO image to disc using cdrecord.
@@ -1007,9 +1135,12 @@ def _writeImage(self, imagePath, writeMulti, newDisc):
             self._blankMedia()
         args = CdWriter._buildWriteArgs(self.hardwareId, imagePath, self._driveSpeed, writeMulti and self._deviceSupportsMulti)
         command = resolveCommand(CDRECORD_COMMAND)
-        result = executeCommand(command, args)[0]
+        invalidateMediaState(self._device)
+        with timer("writer.write"):
+            result = executeCommand(command, args)[0]
         if result != 0:
             raise OSError("Error (%d) executing command to write disc." % result)
+        increment("writer.bytes", os.path.getsize(imagePath))
         self.refreshMedia()
 
     def _blankMedia(self):
@@ -1021,7 +1152,9 @@ def _blankMedia(self):
         if self.isRewritable():
             args = CdWriter._buildBlankArgs(self.hardwareId)
             command = resolveCommand(CDRECORD_COMMAND)
-            result = executeCommand(command, args)[0]
+            invalidateMediaState(self._device)
+            with timer("writer.blank"):
+                result = executeCommand(command, args)[0]
             if result != 0:
                 raise OSError("Error (%d) executing command to blank disc." % result)
             self.refreshMedia()
@@ -1282,7 +1415,7 @@ def _buildBlankArgs(hardwareId, driveSpeed=None):
         return args
 
     @staticmethod
-    def _buildWriteArgs(hardwareId, imagePath, driveSpeed=None, writeMulti=True):
+    def _buildWriteArgs(hardwareId, imagePath, driveSpeed=None, writeMulti=True, trackSize=None):
         """
         Builds a list of arguments to be passed to a ``cdrecord`` command.
 
@@ -1293,11 +1426,16 @@ def _buildWriteArgs(hardwareId, imagePath, driveSpeed=None, writeMulti=True):
         the action makes sense (i.e. to whether the device even can write
         multisession discs, for instance).
 
+        An image path of ``-`` reads the image from ``stdin``, in which case
+        ``trackSize`` should be set, since ``cdrecord`` can't work out the size
+        of the track on its own.
+
         Args:
            hardwareId: Hardware id for the device (either SCSI id or device path)
-           imagePath: Path to an ISO image on disk
+           imagePath: Path to an ISO image on disk, or ``-`` for ``stdin``
            driveSpeed: Speed at which the drive writes
            writeMulti: Indicates whether to write a multisession disc
+           trackSize: Size of the track in bytes, or ``None`` to let ``cdrecord`` work it out
 
         Returns:
             List suitable for passing to :any:`util.executeCommand` as ``args``
@@ -1309,6 +1447,8 @@ def _buildWriteArgs(hardwareId, imagePath, driveSpeed=None, writeMulti=True):
         args.append("dev=%s" % hardwareId)
         if writeMulti:
             args.append("-multi")
+        if trackSize is not None:
+            args.append("tsize=%d" % trackSize)
         args.append("-data")
         args.append(imagePath)
         return args
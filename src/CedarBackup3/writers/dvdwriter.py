@@ -59,6 +59,7 @@
 import tempfile
 import time
 
+from CedarBackup3.metrics import timer
 from CedarBackup3.util import (
     UNIT_BYTES,
     UNIT_GBYTES,
@@ -69,7 +70,7 @@
     executeCommand,
     resolveCommand,
 )
-from CedarBackup3.writers.util import IsoImage, validateDevice, validateDriveSpeed
+from CedarBackup3.writers.util import IsoImage, cachedMediaState, invalidateMediaState, validateDevice, validateDriveSpeed
 
 ########################################################################
 # Module-wide constants and variables
@@ -240,6 +241,7 @@ def __init__(self):
         self.tmpdir = None
         self.mediaLabel = None
         self.entries = None  # dict mapping path to graft point
+        self.isoImage = None  # IsoImage used for size estimates, which caches its directory walk
 
 
 ########################################################################
@@ -505,7 +507,9 @@ def retrieveCapacity(self, entireDisc=False):
         entire disc, as if it were to be rewritten from scratch.  The same will
         happen if the disc can't be read for some reason. Otherwise, the capacity
         will be calculated by subtracting the sectors currently used on the disc,
-        as reported by ``growisofs`` itself.
+        as reported by ``growisofs`` itself.  The sectors used are only read
+        from the disc once per media, as described in
+        :any:`writers.util.cachedMediaState`.
 
         Args:
            entireDisc (Boolean true/false): Indicates whether to return capacity for entire disc
@@ -518,7 +522,7 @@ def retrieveCapacity(self, entireDisc=False):
         """
         sectorsUsed = 0.0
         if not entireDisc:
-            sectorsUsed = self._retrieveSectorsUsed()
+            sectorsUsed = cachedMediaState(self._device, "sectors used", self._retrieveSectorsUsed)
         sectorsAvailable = self._media.capacity - sectorsUsed  # both are in sectors
         bytesUsed = convertSize(sectorsUsed, UNIT_SECTORS, UNIT_BYTES)
         bytesAvailable = convertSize(sectorsAvailable, UNIT_SECTORS, UNIT_BYTES)
@@ -599,7 +603,9 @@ def getEstimatedImageSize(self):
         """
         if self._image is None:
             raise ValueError("Must call initializeImage() before using this method.")
-        return DvdWriter._getEstimatedImageSize(self._image.entries)
+        if self._image.isoImage is None:
+            self._image.isoImage = IsoImage()
+        return DvdWriter._getEstimatedImageSize(self._image.entries, self._image.isoImage)
 
     ######################################
     # Methods which expose device actions
@@ -633,6 +639,7 @@ def openTray(self):
            IOError: If there is an error talking to the device
         """
         if self._deviceHasTray and self._deviceCanEject:
+            invalidateMediaState(self._device)
             command = resolveCommand(EJECT_COMMAND)
             args = [self.device]
             result = executeCommand(command, args)[0]
@@ -702,6 +709,7 @@ def refreshMedia(self):
         self.openTray()
         self.closeTray()
         self.unlockTray()  # on some systems, writing a disc leaves the tray locked, yikes!
+        invalidateMediaState(self._device)
         if self.refreshMediaDelay is not None:
             logger.debug("Per configuration, sleeping %d seconds to stabilize media state.", self.refreshMediaDelay)
             time.sleep(self.refreshMediaDelay)
@@ -779,14 +787,16 @@ def _writeImage(self, newDisc, imagePath, entries, mediaLabel=None):
         """
         command = resolveCommand(GROWISOFS_COMMAND)
         args = DvdWriter._buildWriteArgs(newDisc, self.hardwareId, self._driveSpeed, imagePath, entries, mediaLabel, dryRun=False)
-        (result, output) = executeCommand(command, args, returnOutput=True)
+        invalidateMediaState(self._device)
+        with timer("writer.write"):
+            (result, output) = executeCommand(command, args, returnOutput=True)
         if result != 0:
             DvdWriter._searchForOverburn(output)  # throws own exception if overburn condition is found
             raise OSError("Error (%d) executing command to write disc." % result)
         self.refreshMedia()
 
     @staticmethod
-    def _getEstimatedImageSize(entries):
+    def _getEstimatedImageSize(entries, image=None):
         """
         Gets the estimated size of a set of image entries.
 
@@ -798,6 +808,7 @@ def _getEstimatedImageSize(entries):
 
         Args:
            entries: Dictionary mapping path to graft point
+           image: IsoImage to reuse, so its cached directory walk can be shared across calls
 
         Returns:
             Total estimated size of image, in bytes
@@ -810,9 +821,10 @@ def _getEstimatedImageSize(entries):
         fudgeFactor = convertSize(2500.0, UNIT_SECTORS, UNIT_BYTES)  # determined through experimentation
         if len(list(entries.keys())) == 0:
             raise ValueError("Must add at least one entry with addImageEntry().")
-        image = IsoImage()
+        if image is None:
+            image = IsoImage()
         for path in list(entries.keys()):
-            image.addEntry(path, entries[path], override=False, contentsOnly=True)
+            image.addEntry(path, entries[path], override=True, contentsOnly=True)
         return image.getEstimatedSize() + fudgeFactor
 
     def _retrieveSectorsUsed(self):
@@ -0,0 +1,655 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Reads ISO 9660 images directly from a device or file.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Reads ISO 9660 images directly from a device or file.
+
+Summary
+=======
+
+   This module reads the directory structure of an ISO 9660 image, with Rock
+   Ridge extensions, straight from a device or an image file, without mounting
+   it.  It exists so that written media can be verified without root access,
+   without ``mount`` and ``umount``, and without reading the disc through the
+   VFS one file at a time.
+
+   Only the directory extents are read in random order.  File data is read in
+   a single sequential sweep, in order of logical block address, using large
+   reads.  On optical media, this avoids the seeks that dominate the time taken
+   to read many files through a mounted filesystem.
+
+   The reader understands what ``mkisofs -r`` writes: the Rock Ridge ``NM``
+   (name), ``PX`` (mode), ``CE`` (continuation), ``CL`` and ``RE``
+   (relocated directory) entries, and multi-extent files.  For a multisession
+   disc in a block device, the last session is read, just like the kernel
+   would mount it.
+
+Module Attributes
+=================
+
+Attributes:
+   READ_SIZE: Size of each sequential read when reading file data, in bytes
+
+:author: Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+########################################################################
+# Imported modules
+########################################################################
+
+import hashlib
+import logging
+import os
+import stat
+import struct
+import sys
+
+from CedarBackup3.metrics import increment
+
+try:
+    import fcntl
+
+    _IOCTL_AVAILABLE = sys.platform.startswith("linux")
+except ImportError:
+    _IOCTL_AVAILABLE = False
+
+########################################################################
+# Module-wide constants and variables
+########################################################################
+
+logger = logging.getLogger("CedarBackup3.log.writers.iso9660")
+
+SECTOR_SIZE = 2048
+DESCRIPTOR_START = 16  # first volume descriptor, relative to the start of the session
+READ_SIZE = 4 * 1024 * 1024
+
+CDROMMULTISESSION = 0x5310  # Linux ioctl returning the start of the last session
+CDROM_LBA = 0x01
+
+FLAG_HIDDEN = 0x01
+FLAG_DIRECTORY = 0x02
+FLAG_ASSOCIATED = 0x04
+FLAG_MULTI_EXTENT = 0x80
+
+
+########################################################################
+# IsoFile class definition
+########################################################################
+
+
+class IsoFile:
+    """
+    A file in an ISO 9660 image.
+
+    The ``extents`` attribute is a list of ``(lba, length)`` tuples, one per
+    extent, in file order.  Most files have exactly one extent.  The ``mode``
+    attribute is the Rock Ridge mode, or ``None`` if the image does not use
+    Rock Ridge.
+    """
+
+    def __init__(self, path, extents, mode=None):
+        """
+        Constructor for the ``IsoFile`` class.
+        Args:
+           path: Absolute path of the file within the image
+           extents: List of ``(lba, length)`` tuples
+           mode: Rock Ridge mode, or ``None``
+        """
+        self.path = path
+        self.extents = extents
+        self.mode = mode
+
+    def __repr__(self):
+        """
+        Official string representation for class instance.
+        """
+        return "IsoFile(%s, %s, %s)" % (self.path, self.extents, self.mode)
+
+    def _getSize(self):
+        """
+        Property target to get the size of the file, in bytes.
+        """
+        return sum(length for (_, length) in self.extents)
+
+    def _getLba(self):
+        """
+        Property target to get the logical block address of the first extent.
+        """
+        return self.extents[0][0] if self.extents else 0
+
+    def _getRegular(self):
+        """
+        Property target to get whether this is a regular file.
+        """
+        return self.mode is None or stat.S_ISREG(self.mode)
+
+    size = property(_getSize, None, None, "Size of the file, in bytes.")
+    lba = property(_getLba, None, None, "Logical block address of the first extent.")
+    regular = property(_getRegular, None, None, "Whether this is a regular file (always true without Rock Ridge).")
+
+
+########################################################################
+# IsoReader class definition
+########################################################################
+
+
+class IsoReader:
+    """
+    Reads an ISO 9660 image from a device or an image file.
+
+    Use the reader as a context manager, or call :any:`close` when done::
+
+       with IsoReader("/dev/cdrom") as reader:
+          files = reader.listFiles("/2026/10/18")
+          digests = reader.generateDigests(files.values())
+
+    Paths within the image always start with ``/``.  With Rock Ridge, names are
+    the original filenames, decoded like any other filesystem path.  Without
+    Rock Ridge, names are the ISO 9660 identifiers, minus their version number.
+    """
+
+    def __init__(self, devicePath, sessionStart=None):
+        """
+        Constructor for the ``IsoReader`` class.
+
+        If ``sessionStart`` is ``None``, then the start of the last session is
+        found via the ``CDROMMULTISESSION`` ioctl for a block device, and is
+        assumed to be zero for an image file.
+
+        Args:
+           devicePath: Path to a device or image file
+           sessionStart: Logical block address of the session to read, or ``None``
+        Raises:
+           ValueError: If the device or file does not contain an ISO 9660 image
+           IOError: If the device or file cannot be read
+        """
+        self._devicePath = devicePath
+        self._sessionStart = None
+        self._volumeId = None
+        self._root = None
+        self._skip = 0
+        self._rockRidge = False
+        self._file = open(devicePath, "rb", buffering=0)
+        try:
+            self._readRoot(sessionStart)
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Closes the underlying device or file.
+        """
+        self._file.close()
+
+    def _getVolumeId(self):
+        """
+        Property target to get the volume identifier.
+        """
+        return self._volumeId
+
+    def _getSessionStart(self):
+        """
+        Property target to get the logical block address of the session being read.
+        """
+        return self._sessionStart
+
+    def _getRockRidge(self):
+        """
+        Property target to get whether the image uses Rock Ridge extensions.
+        """
+        return self._rockRidge
+
+    volumeId = property(_getVolumeId, None, None, "Volume identifier of the image.")
+    sessionStart = property(_getSessionStart, None, None, "Logical block address of the session being read.")
+    rockRidge = property(_getRockRidge, None, None, "Whether the image uses Rock Ridge extensions.")
+
+    def listFiles(self, path="/"):
+        """
+        Lists the files below a directory in the image.
+
+        Every file below the directory is listed, recursively.  Directories
+        themselves are not listed.  Keys are relative to the directory and start
+        with ``/``, like the keys in a relative digest map.
+
+        Args:
+           path: Absolute path of a directory within the image
+        Returns:
+            Dictionary mapping relative key to :any:`IsoFile`
+        Raises:
+           ValueError: If the directory does not exist in the image
+        """
+        directory = self._findDirectory(path)
+        files = {}
+        self._walk(directory, path.rstrip("/"), "", files, set())
+        return files
+
+    def generateDigests(self, files):
+        """
+        Generates an SHA digest for each of the indicated files.
+
+        The files are read in a single sweep, in order of logical block address,
+        using large sequential reads.  The digests are the same as those generated
+        by :any:`filesystem.BackupFileList.generateDigestMap`.
+
+        Args:
+           files: Iterable of :any:`IsoFile` objects
+        Returns:
+            Dictionary mapping each :any:`IsoFile` to its digest
+        Raises:
+           IOError: If the image cannot be read
+        """
+        digests = {}
+        reader = _SequentialReader(self._file)
+        for isoFile in sorted(files, key=lambda item: item.extents):
+            s = hashlib.sha1()  # noqa: S324 # we're not using SHA-1 for cryptographic purposes, only to identify file changes
+            for lba, length in isoFile.extents:
+                for chunk in reader.read(lba * SECTOR_SIZE, length):
+                    s.update(chunk)
+            digests[isoFile] = s.hexdigest()
+        increment("iso.files", len(digests))
+        increment("iso.bytes", reader.bytesRead)
+        logger.debug("Generated %d digests from [%s], reading %d bytes.", len(digests), self._devicePath, reader.bytesRead)
+        return digests
+
+    def verifyContents(self, path, digest, ignore=None, sizes=None):
+        """
+        Verifies the contents of a directory in the image against a digest map.
+
+        This is the equivalent of :any:`filesystem.verifyContents` for an image
+        that isn't mounted.  Files whose size differs from ``sizes`` (if passed
+        in) are reported without being read, and the remaining files are hashed
+        in a single sequential sweep by :any:`generateDigests`.
+
+        Every file that is missing, unexpected or has different contents is
+        logged individually before an exception is raised.  If no exception is
+        thrown, the directory matches the digest map.
+
+        Args:
+           path: Absolute path of a directory within the image
+           digest: Expected digest map, relative to the directory
+           ignore: Keys of files in the directory to skip, if any
+           sizes: Dictionary mapping key to expected size in bytes, if known
+        Raises:
+           ValueError: If the directory does not exist in the image
+           ValueError: If the directory does not match the digest map
+           IOError: If the image cannot be read
+        """
+        ignore = set(ignore or [])
+        sizes = sizes or {}
+        files = {key: isoFile for key, isoFile in self.listFiles(path).items() if key not in ignore}
+        missing = [key for key in digest if key not in files]
+        unexpected = [key for key in files if key not in digest]
+        changed = [key for key in digest if key in files and sizes.get(key) not in (None, files[key].size)]
+        candidates = [key for key in digest if key in files and key not in changed]
+        digests = self.generateDigests(files[key] for key in candidates)
+        changed.extend(key for key in candidates if digests[files[key]] != digest[key])
+        for key in sorted(missing, key=_canonicalKey):
+            logger.error("File [%s] is missing from [%s].", key, path)
+        for key in sorted(unexpected, key=_canonicalKey):
+            logger.error("File [%s] in [%s] is unexpected.", key, path)
+        for key in sorted(changed, key=_canonicalKey):
+            logger.error("File contents for [%s] in [%s] vary from the expected digest.", key, path)
+        if missing or unexpected or changed:
+            raise ValueError(
+                "Consistency check failed: %d missing, %d unexpected and %d changed files."
+                % (len(missing), len(unexpected), len(changed))
+            )
+
+    def _readRoot(self, sessionStart):
+        """
+        Reads the volume descriptor and root directory, and checks for Rock Ridge.
+        """
+        self._sessionStart = _findSessionStart(self._file) if sessionStart is None else sessionStart
+        (self._volumeId, rootRecord) = self._readVolumeDescriptor()
+        self._root = _parseRecord(rootRecord, 0)
+        dot = next(self._readRecords(*self._root["extent"]), None)
+        if dot is not None and dot["sharingProtocol"] is not None:
+            self._rockRidge = True
+            self._skip = dot["sharingProtocol"]
+        logger.debug(
+            "Opened ISO image [%s] at session %d: volume [%s], Rock Ridge %s.",
+            self._devicePath,
+            self._sessionStart,
+            self._volumeId,
+            self._rockRidge,
+        )
+
+    def _readVolumeDescriptor(self):
+        """
+        Finds the primary volume descriptor.
+        Returns:
+            Tuple of (volume identifier, root directory record)
+        Raises:
+           ValueError: If there is no primary volume descriptor
+        """
+        sector = self._sessionStart + DESCRIPTOR_START
+        while True:
+            data = self._readSectors(sector, 1)
+            if len(data) < SECTOR_SIZE or data[1:6] != b"CD001":
+                raise ValueError("No ISO 9660 volume descriptor found in [%s]." % self._devicePath)
+            if data[0] == 1:
+                if struct.unpack_from("<H", data, 128)[0] != SECTOR_SIZE:
+                    raise ValueError("Unsupported logical block size in [%s]." % self._devicePath)
+                volumeId = data[40:72].decode("ascii", "replace").rstrip()
+                return (volumeId, data[156:190])
+            if data[0] == 255:
+                raise ValueError("No primary volume descriptor found in [%s]." % self._devicePath)
+            sector += 1
+
+    def _readSectors(self, lba, count):
+        """
+        Reads a run of sectors.
+        """
+        self._file.seek(lba * SECTOR_SIZE)
+        return _readFully(self._file, count * SECTOR_SIZE)
+
+    def _readRecords(self, lba, length):
+        """
+        Yields the parsed directory records in a directory extent.
+        """
+        data = self._readSectors(lba, (length + SECTOR_SIZE - 1) // SECTOR_SIZE)[:length]
+        offset = 0
+        while offset < len(data):
+            recordLength = data[offset]
+            if recordLength == 0:
+                offset = (offset // SECTOR_SIZE + 1) * SECTOR_SIZE  # records never cross a sector boundary
+                continue
+            record = _parseRecord(data[offset : offset + recordLength], self._skip)
+            if record["continuation"] is not None:
+                (block, start, size) = record["continuation"]
+                area = self._readSectors(block, (start + size + SECTOR_SIZE - 1) // SECTOR_SIZE)
+                _parseSystemUse(area[start : start + size], record)
+            record["name"] = _recordName(record)
+            yield record
+            offset += recordLength
+
+    def _findDirectory(self, path):
+        """
+        Returns the record for a directory in the image.
+        Raises:
+           ValueError: If the directory does not exist in the image
+        """
+        record = self._root
+        for component in [component for component in path.split("/") if component]:
+            for child in self._readChildren(record):
+                if child["name"] == component and child["directory"]:
+                    record = child
+                    break
+            else:
+                raise ValueError("Directory [%s] does not exist in [%s]." % (path, self._devicePath))
+        return record
+
+    def _readChildren(self, record):
+        """
+        Yields the records for the entries in a directory, following relocated directories.
+        """
+        (lba, length) = record["extent"]
+        for child in self._readRecords(lba, length):
+            if child["name"] is None or child["relocated"] or child["flags"] & FLAG_ASSOCIATED:
+                continue
+            if child["childLink"] is not None:
+                relocated = next(self._readRecords(child["childLink"], SECTOR_SIZE), None)
+                if relocated is None:
+                    continue
+                child["extent"] = relocated["extent"]
+                child["directory"] = True
+            yield child
+
+    def _walk(self, record, path, key, files, visited):
+        """
+        Recursive implementation of :any:`listFiles`.
+        """
+        if record["extent"][0] in visited:
+            return
+        visited.add(record["extent"][0])
+        pending = None
+        for child in self._readChildren(record):
+            if child["directory"]:
+                self._walk(child, "%s/%s" % (path, child["name"]), "%s/%s" % (key, child["name"]), files, visited)
+                continue
+            if pending is None:
+                pending = IsoFile("%s/%s" % (path, child["name"]), [], child["mode"])
+            pending.extents.append(child["extent"])
+            if not child["flags"] & FLAG_MULTI_EXTENT:
+                if pending.regular:
+                    files["%s/%s" % (key, child["name"])] = pending
+                pending = None
+
+
+########################################################################
+# Public functions
+########################################################################
+
+########################
+# openMedia() function
+########################
+
+
+def openMedia(devicePath):
+    """
+    Opens the media in a device for verification without mounting it, if possible.
+
+    Media can only be verified this way if it contains an ISO 9660 image with
+    Rock Ridge extensions, since otherwise the names on the media don't match
+    the original filenames.  If this function returns ``None``, the caller
+    should fall back to mounting the media.
+
+    Args:
+       devicePath: Path to the device (or image file) to read
+    Returns:
+        :any:`IsoReader` for the media, or ``None`` if it must be mounted instead
+    """
+    try:
+        reader = IsoReader(devicePath)
+    except (ValueError, OSError) as e:
+        logger.info("Unable to read media in [%s] directly, so it will be mounted: %s", devicePath, e)
+        return None
+    if not reader.rockRidge:
+        logger.info("Media in [%s] does not use Rock Ridge extensions, so it will be mounted.", devicePath)
+        reader.close()
+        return None
+    return reader
+
+
+########################################################################
+# Private utility functions and classes
+########################################################################
+
+
+class _SequentialReader:
+    """
+    Reads byte ranges from a file in large sequential reads.
+
+    Ranges are expected to be requested in increasing order.  Small gaps
+    between ranges are read through rather than seeked over, so a device sees
+    one long sequential read.  Data is returned in chunks of at most
+    ``READ_SIZE`` bytes, so memory use is bounded.
+    """
+
+    def __init__(self, file):
+        self._file = file
+        self._buffer = b""
+        self._start = 0
+        self._end = 0
+        self.bytesRead = 0
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+
+    def read(self, offset, length):
+        """
+        Yields the data in a byte range, as a series of chunks.
+        Raises:
+           IOError: If the range extends past the end of the file
+        """
+        while length > 0:
+            if not self._start <= offset < self._end:
+                if not self._end <= offset < self._end + READ_SIZE:
+                    self._end = offset
+                self._file.seek(self._end)  # the file is shared with directory reads
+                self._start = self._end
+                self._buffer = _readFully(self._file, READ_SIZE)
+                self._end = self._start + len(self._buffer)
+                self.bytesRead += len(self._buffer)
+                if not self._start <= offset < self._end:
+                    raise OSError("Unexpected end of image at offset %d." % offset)
+            begin = offset - self._start
+            chunk = memoryview(self._buffer)[begin : begin + length]
+            offset += len(chunk)
+            length -= len(chunk)
+            yield chunk
+
+
+def _canonicalKey(key):
+    """
+    Returns the sort key used to put relative paths in canonical order, as in ``filesystem.py``.
+    """
+    return key.split("/")
+
+
+def _readFully(file, size):
+    """
+    Reads up to ``size`` bytes from an unbuffered file, stopping early only at end of file.
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        data = file.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b"".join(chunks)
+
+
+def _findSessionStart(file):
+    """
+    Returns the logical block address of the last session on a device, or zero for an image file.
+    """
+    if not _IOCTL_AVAILABLE or not stat.S_ISBLK(os.fstat(file.fileno()).st_mode):
+        return 0
+    try:
+        request = struct.pack("iBBxx", 0, 0, CDROM_LBA)
+        (lba, _, _) = struct.unpack("iBBxx", fcntl.ioctl(file.fileno(), CDROMMULTISESSION, request))
+        logger.debug("Last session on device starts at sector %d.", lba)
+        return lba
+    except OSError as e:
+        logger.debug("Unable to find last session on device, assuming sector 0: %s", e)
+        return 0
+
+
+def _parseRecord(data, skip):
+    """
+    Parses a directory record, including its Rock Ridge entries.
+
+    Returns a dictionary with the name, extent (as ``(lba, length)``), flags
+    and directory indicator for the record, along with any Rock Ridge mode,
+    continuation area, child link, relocation marker and SUSP skip length
+    (``sharingProtocol``, only set on the root directory's ``.`` record).
+    The name is filled in by :any:`_recordName`, once any continuation area
+    has been parsed.
+    """
+    (lba,) = struct.unpack_from("<I", data, 2)
+    (length,) = struct.unpack_from("<I", data, 10)
+    flags = data[25]
+    nameLength = data[32]
+    identifier = bytes(data[33 : 33 + nameLength])
+    record = {
+        "extent": (lba, length),
+        "flags": flags,
+        "directory": bool(flags & FLAG_DIRECTORY),
+        "identifier": identifier,
+        "name": None,
+        "alternateName": None,
+        "mode": None,
+        "continuation": None,
+        "childLink": None,
+        "relocated": False,
+        "sharingProtocol": None,
+    }
+    systemUse = 33 + nameLength + (1 - nameLength % 2)  # padding byte after an even-length identifier
+    _parseSystemUse(data[systemUse + skip :], record)
+    return record
+
+
+def _recordName(record):
+    """
+    Returns the name for a directory record, or ``None`` for the ``.`` and ``..`` records.
+    The Rock Ridge name is used if there is one, and otherwise the ISO 9660 identifier minus its version.
+    """
+    if record["identifier"] in (b"\x00", b"\x01"):
+        return None
+    if record["alternateName"] is not None:
+        return os.fsdecode(record["alternateName"])
+    name = record["identifier"].decode("ascii", "replace").split(";", 1)[0]
+    return name if record["directory"] else name.rstrip(".")
+
+
+def _parseSystemUse(data, record):
+    """
+    Parses the SUSP and Rock Ridge entries in a system use area into a directory record.
+    """
+    offset = 0
+    while offset + 4 <= len(data):
+        signature = bytes(data[offset : offset + 2])
+        length = data[offset + 2]
+        if length < 4 or offset + length > len(data):
+            break
+        entry = data[offset : offset + length]
+        if signature == b"SP" and length >= 7 and entry[4:6] == b"\xbe\xef":
+            record["sharingProtocol"] = entry[6]
+        elif signature == b"NM" and not entry[4] & 0x06:  # ignore the CURRENT and PARENT flags
+            record["alternateName"] = (record["alternateName"] or b"") + bytes(entry[5:])
+        elif signature == b"PX":
+            (record["mode"],) = struct.unpack_from("<I", entry, 4)
+        elif signature == b"CE":
+            record["continuation"] = struct.unpack_from("<I4xI4xI", entry, 4)  # block, offset and length, each both-endian
+        elif signature == b"CL":
+            (record["childLink"],) = struct.unpack_from("<I", entry, 4)
+        elif signature == b"RE":
+            record["relocated"] = True
+        elif signature == b"ST":
+            break
+        offset += length
@@ -48,8 +48,30 @@
 import os
 import posixpath
 import re
-
-from CedarBackup3.util import UNIT_BYTES, UNIT_SECTORS, convertSize, encodePath, executeCommand, pathJoin, resolveCommand
+import shutil
+import stat
+import sys
+import threading
+
+from CedarBackup3.metrics import finishCommand, startCommand
+from CedarBackup3.util import (
+    UNIT_BYTES,
+    UNIT_SECTORS,
+    Pipe,
+    convertSize,
+    encodePath,
+    executeCommand,
+    pathJoin,
+    resolveCommand,
+    sanitizeEnvironment,
+)
+
+try:
+    import fcntl
+
+    _MEDIA_CHANGED_AVAILABLE = sys.platform.startswith("linux")
+except ImportError:
+    _MEDIA_CHANGED_AVAILABLE = False
 
 ########################################################################
 # Module-wide constants and variables
@@ -60,6 +82,28 @@
 MKISOFS_COMMAND = ["mkisofs"]
 VOLNAME_COMMAND = ["volname"]
 
+SECTOR_SIZE = 2048
+SYSTEM_AREA_SECTORS = 16  # system area at the start of every image
+DESCRIPTOR_SECTORS = 3  # primary volume descriptor, set terminator, mkisofs version descriptor
+PAD_SECTORS = 150  # padding added by mkisofs -pad, on by default
+PAD_ALIGNMENT = 16  # mkisofs rounds the image up to this many sectors before padding
+MAX_RECORD_LENGTH = 254  # longest even directory record length
+RR_ATTRIBUTES_LENGTH = 5 + 36 + 26  # RR, PX and TF entries on every Rock Ridge record
+RR_ROOT_LENGTH = 7 + 28  # SP and CE entries on the root directory's "." record
+RR_CONTINUATION_LENGTH = 28  # CE entry pointing at a continuation area
+RR_DEVICE_LENGTH = 20  # PN entry for a device file
+ESTIMATE_MARGIN_PERCENT = 1  # margin added to in-process estimates, as a percentage of the image
+ESTIMATE_MARGIN_SECTORS = 64  # fixed margin added to in-process estimates
+
+STREAM_CHUNK_SIZE = 64 * 1024  # size of each read from mkisofs when streaming an image
+
+CDROM_MEDIA_CHANGED = 0x5325  # Linux ioctl to check whether media changed since the last check
+CDSL_CURRENT = 0x7FFFFFFF  # slot argument for CDROM_MEDIA_CHANGED meaning the current slot
+
+_MEDIA_STATE = {}  # mapping from device path to dictionary of cached media state
+_DEVICE_PROPERTIES = {}  # mapping from hardware id to cached device properties
+_MEDIA_STATE_LOCK = threading.Lock()
+
 
 ########################################################################
 # Functions used to portably validate certain kinds of values
@@ -163,12 +207,19 @@ def validateDriveSpeed(driveSpeed):
 def readMediaLabel(devicePath):
     """
     Reads the media label (volume name) from the indicated device.
-    The volume name is read using the ``volname`` command.
+    The volume name is read using the ``volname`` command, once per media.
     Args:
        devicePath: Device path to read from
     Returns:
         Media label as a string, or None if there is no name or it could not be read
     """
+    return cachedMediaState(devicePath, "media label", lambda: _readMediaLabel(devicePath))
+
+
+def _readMediaLabel(devicePath):
+    """
+    Reads the media label using the ``volname`` command, without caching.
+    """
     args = [devicePath]
     command = resolveCommand(VOLNAME_COMMAND)
     (result, output) = executeCommand(command, args, returnOutput=True, ignoreStderr=True)
@@ -179,6 +230,496 @@ def readMediaLabel(devicePath):
     return output[0].rstrip()
 
 
+########################################################################
+# Functions used to cache media state
+########################################################################
+
+# Querying the drive is slow: cdrecord and growisofs have to spin up the media
+# and read its table of contents.  Within a single run, the same values are
+# needed several times (the store action, the capacity extension, blanking
+# calculations, etc.), and each of those creates its own writer.  So, values
+# are cached here at module level, keyed by device, and are discarded whenever
+# the media might have changed: when a writer opens the tray, refreshes the
+# media or writes an image, when an interactive tool asks for a new disc, or
+# when the kernel reports a media change for the device.
+
+###############################
+# cachedMediaState() function
+###############################
+
+
+def cachedMediaState(device, name, function):
+    """
+    Returns a cached value describing the media in a device, computing it if needed.
+
+    The value is computed by calling ``function`` with no arguments, the first
+    time that ``name`` is requested for the current media in ``device``.  Later
+    requests return the same value until :any:`invalidateMediaState` is called
+    for the device, or until the kernel reports that the media has changed.  If
+    ``function`` raises an exception, nothing is cached.
+
+    Args:
+       device: Filesystem device path, i.e. ``/dev/cdrw``
+       name: Name of the value, unique for each kind of query
+       function: Function that queries the device for the value
+    Returns:
+        Value as returned by ``function``
+    """
+    with _MEDIA_STATE_LOCK:
+        if _mediaChanged(device) and _MEDIA_STATE.pop(device, None) is not None:
+            logger.debug("Media in [%s] has changed; discarding cached media state.", device)
+        state = _MEDIA_STATE.setdefault(device, {})
+        if name in state:
+            logger.debug("Using cached %s for media in [%s].", name, device)
+            return state[name]
+        state[name] = function()
+        return state[name]
+
+
+####################################
+# cachedDeviceProperties() function
+####################################
+
+
+def cachedDeviceProperties(hardwareId, function):
+    """
+    Returns cached properties for a device, computing them if needed.
+
+    Device properties describe the drive rather than the media, so they are
+    computed at most once per hardware id, no matter how often the media changes.
+
+    Args:
+       hardwareId: Hardware id for the device
+       function: Function that queries the device for its properties
+    Returns:
+        Properties as returned by ``function``
+    """
+    with _MEDIA_STATE_LOCK:
+        if hardwareId not in _DEVICE_PROPERTIES:
+            _DEVICE_PROPERTIES[hardwareId] = function()
+        return _DEVICE_PROPERTIES[hardwareId]
+
+
+###################################
+# invalidateMediaState() function
+###################################
+
+
+def invalidateMediaState(device):
+    """
+    Discards the cached media state for a device, because the media might have changed.
+    Args:
+       device: Filesystem device path, i.e. ``/dev/cdrw``
+    """
+    with _MEDIA_STATE_LOCK:
+        _MEDIA_STATE.pop(device, None)
+
+
+##############################
+# clearMediaState() function
+##############################
+
+
+def clearMediaState():
+    """
+    Discards all cached media state and device properties.
+    """
+    with _MEDIA_STATE_LOCK:
+        _MEDIA_STATE.clear()
+        _DEVICE_PROPERTIES.clear()
+
+
+def _mediaChanged(device):
+    """
+    Asks the kernel whether the media in a device has changed since the last check.
+
+    This is only possible on Linux, for a CD or DVD block device.  Anywhere
+    else, the answer is always ``False``, and we rely on explicit invalidation.
+
+    Args:
+       device: Filesystem device path
+    Returns:
+        Boolean indicating whether the media is known to have changed
+    """
+    if not _MEDIA_CHANGED_AVAILABLE:
+        return False
+    try:
+        fd = os.open(device, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return False
+    try:
+        return fcntl.ioctl(fd, CDROM_MEDIA_CHANGED, CDSL_CURRENT) == 1
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+########################################################################
+# Functions used to estimate the size of ISO images
+########################################################################
+
+# The estimate models the layout written by ``mkisofs -graft-points [-r]``, as
+# used by IsoImage: the system area and volume descriptors, an L and an M path
+# table, one extent per directory (directory records never cross a sector
+# boundary, and Rock Ridge entries that don't fit in a record spill into a
+# continuation area), the Rock Ridge extension record, one extent per file
+# (shared between hard links), and finally the default padding.  File names use
+# ISO level 1 (8.3) identifiers.  The only thing not modelled is the relocation
+# of directories nested more than 8 levels deep, which adds a few records.
+# Since the model can drift from what a particular ``mkisofs`` version writes,
+# IsoImage pads the estimate with a margin, so it errs on the side of too large.
+
+
+class _IsoDirectory:
+    """
+    Directory in the tree used to estimate the size of an ISO image.
+
+    Files are stored as a mapping from name to ``(size, inode, special)``, where
+    ``inode`` identifies files with multiple hard links (or is ``None``), and
+    ``special`` is the target of a soft link, ``True`` for a device, or ``None``.
+    """
+
+    def __init__(self):
+        self.directories = {}
+        self.files = {}
+
+    def getDirectory(self, path):
+        """
+        Returns the directory at a relative path, creating it if necessary.
+        """
+        directory = self
+        for name in (path or "").split("/"):
+            if name:
+                directory = directory.directories.setdefault(name, _IsoDirectory())
+        return directory
+
+    def addEntry(self, path, graftPoint):
+        """
+        Adds an IsoImage entry to the tree, using the ``mkisofs`` graft point semantics.
+        """
+        if os.path.isdir(path):
+            self.getDirectory(graftPoint).addContents(path)
+        else:
+            self.getDirectory(graftPoint).addFile(os.path.basename(path), os.lstat(path), path)
+
+    def addContents(self, path):
+        """
+        Recursively adds the contents of a directory on disk to this directory.
+        """
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    self.directories.setdefault(entry.name, _IsoDirectory()).addContents(entry.path)
+                else:
+                    self.addFile(entry.name, entry.stat(follow_symlinks=False), entry.path)
+
+    def addFile(self, name, info, path):
+        """
+        Adds a non-directory entry to this directory, ignoring sockets like ``mkisofs`` does.
+        """
+        if stat.S_ISREG(info.st_mode):
+            inode = (info.st_dev, info.st_ino) if info.st_nlink > 1 else None
+            self.files[name] = (info.st_size, inode, None)
+        elif stat.S_ISLNK(info.st_mode):
+            self.files[name] = (0, None, os.readlink(path))
+        elif not stat.S_ISSOCK(info.st_mode):
+            self.files[name] = (0, None, stat.S_ISBLK(info.st_mode) or stat.S_ISCHR(info.st_mode) or None)
+
+    def walk(self):
+        """
+        Yields every directory in the tree, including this one, with its name.
+        """
+        pending = [("", self)]
+        while pending:
+            (name, directory) = pending.pop()
+            yield (name, directory)
+            pending.extend(directory.directories.items())
+
+
+def _estimateImageSectors(tree, useRockRidge):
+    """
+    Estimates the number of sectors in an ISO image built from a tree.
+    Args:
+       tree: Root ``_IsoDirectory`` for the image
+       useRockRidge: Whether the image uses Rock Ridge extensions
+    Returns:
+        Estimated size of the image, in sectors
+    """
+    sectors = SYSTEM_AREA_SECTORS + DESCRIPTOR_SECTORS
+    pathTable = 0
+    inodes = set()
+    for name, directory in tree.walk():
+        identifier = _isoNameLength(name, True) if name else 1
+        pathTable += 8 + identifier + (identifier & 1)
+        sectors += _directorySectors(directory, not name, useRockRidge)
+        for size, inode, special in directory.files.values():
+            if special is None and (inode is None or inode not in inodes):
+                sectors += _sectors(size)
+                inodes.add(inode)
+    sectors += 2 * _sectors(pathTable)
+    if useRockRidge:
+        sectors += 1  # the ER entry, in the root directory's continuation area
+    return -(-sectors // PAD_ALIGNMENT) * PAD_ALIGNMENT + PAD_SECTORS
+
+
+def _directorySectors(directory, root, useRockRidge):
+    """
+    Returns the number of sectors used by the extent for a directory.
+    """
+    attributes = RR_ATTRIBUTES_LENGTH if useRockRidge else 0
+    records = [34 + attributes + (RR_ROOT_LENGTH if root and useRockRidge else 0), 34 + attributes]
+    for name in directory.directories:
+        records.append(_recordLength(_isoNameLength(name, True), _rockRidgeLength(name, None) if useRockRidge else 0))
+    for name, (_, _, special) in directory.files.items():
+        if useRockRidge:
+            records.append(_recordLength(_isoNameLength(name, False), _rockRidgeLength(name, special)))
+        elif not isinstance(special, str):
+            records.append(_recordLength(_isoNameLength(name, False), 0))  # soft links are skipped without Rock Ridge
+    size = 0
+    continuation = 0
+    for record in records:
+        length = min(record, MAX_RECORD_LENGTH)
+        if record > MAX_RECORD_LENGTH:
+            continuation += record - MAX_RECORD_LENGTH + RR_CONTINUATION_LENGTH
+        if size % SECTOR_SIZE + length > SECTOR_SIZE:
+            size = _sectors(size) * SECTOR_SIZE
+        size += length
+    return _sectors(size) + _sectors(continuation)
+
+
+def _recordLength(identifier, systemUse):
+    """
+    Returns the length of a directory record, padded to an even length.
+    """
+    length = 33 + identifier + (0 if identifier & 1 else 1) + systemUse
+    return length + (length & 1)
+
+
+def _rockRidgeLength(name, special):
+    """
+    Returns the length of the Rock Ridge entries for a named record.
+    """
+    length = RR_ATTRIBUTES_LENGTH + 5 + len(os.fsencode(name))  # NM entry
+    if isinstance(special, str):
+        length += 5 + sum(2 + len(os.fsencode(component)) for component in special.split("/"))  # SL entry
+    elif special:
+        length += RR_DEVICE_LENGTH
+    return length
+
+
+def _isoNameLength(name, directory):
+    """
+    Returns the length of the ISO level 1 identifier ``mkisofs`` generates for a name.
+    """
+    if directory:
+        return min(len(name), 8)
+    (base, dot, extension) = name.rpartition(".")
+    if not dot or not base:
+        (base, extension) = (name, "")
+    return min(len(base), 8) + 1 + min(len(extension), 3) + 2  # NAME.EXT;1
+
+
+def _sectors(size):
+    """
+    Returns the number of sectors needed to hold a number of bytes.
+    """
+    return -(-size // SECTOR_SIZE)
+
+
+########################################################################
+# RingBuffer class definition
+########################################################################
+
+
+class RingBuffer:
+    """
+    Bounded in-memory buffer used to stream an image from a producer to a writer.
+
+    The producer (i.e. ``mkisofs``) calls :any:`write` and the consumer (i.e. the
+    thread feeding ``cdrecord``) calls :any:`read`, so the buffer can be passed
+    as the ``outputFile`` of one command and the ``inputFile`` of another.
+    Writes block while the buffer is full, so memory use never exceeds the
+    capacity.
+
+    The buffer guards against underrun by holding back the consumer until it
+    has been primed, i.e. until it has filled completely or the producer has
+    closed it.  After that, the buffer tracks its fill level: ``lowWater`` is
+    the lowest level seen by the consumer before the producer finished, and
+    ``underruns`` counts the number of times the consumer found it empty and
+    had to wait.  A burn with a non-zero underrun count relied on the drive's
+    own buffer (and on buffer underrun protection, if any) to survive.
+
+    If either side fails, call :any:`abort`.  After that, writes raise
+    ``IOError`` and reads return end-of-file, so neither side stays blocked.
+    """
+
+    def __init__(self, capacity):
+        """
+        Constructor for the ``RingBuffer`` class.
+        Args:
+           capacity: Capacity of the buffer, in bytes
+        Raises:
+           ValueError: If the capacity is not a positive integer
+        """
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be a positive integer.")
+        self._data = bytearray(capacity)
+        self._capacity = capacity
+        self._start = 0
+        self._fill = 0
+        self._primed = False
+        self._closed = False
+        self._aborted = False
+        self._lowWater = None
+        self._underruns = 0
+        self._bytesWritten = 0
+        self._bytesRead = 0
+        self._condition = threading.Condition()
+
+    def _getCapacity(self):
+        """
+        Property target used to get the capacity of the buffer.
+        """
+        return self._capacity
+
+    def _getFill(self):
+        """
+        Property target used to get the current fill level.
+        """
+        with self._condition:
+            return self._fill
+
+    def _getLowWater(self):
+        """
+        Property target used to get the lowest fill level seen after priming.
+        """
+        with self._condition:
+            return self._lowWater
+
+    def _getUnderruns(self):
+        """
+        Property target used to get the number of times the buffer ran empty.
+        """
+        with self._condition:
+            return self._underruns
+
+    def _getBytesWritten(self):
+        """
+        Property target used to get the number of bytes written by the producer.
+        """
+        with self._condition:
+            return self._bytesWritten
+
+    def _getBytesRead(self):
+        """
+        Property target used to get the number of bytes read by the consumer.
+        """
+        with self._condition:
+            return self._bytesRead
+
+    capacity = property(_getCapacity, None, None, "Capacity of the buffer, in bytes.")
+    fill = property(_getFill, None, None, "Number of bytes currently held in the buffer.")
+    lowWater = property(_getLowWater, None, None, "Lowest fill level seen by the consumer after priming, or ``None``.")
+    underruns = property(_getUnderruns, None, None, "Number of times the consumer found the buffer empty after priming.")
+    bytesWritten = property(_getBytesWritten, None, None, "Total number of bytes written into the buffer.")
+    bytesRead = property(_getBytesRead, None, None, "Total number of bytes read out of the buffer.")
+
+    def write(self, data):
+        """
+        Writes data into the buffer, blocking while the buffer is full.
+        Args:
+           data: Bytes-like object to write
+        Returns:
+            Number of bytes written, which is always the length of the data
+        Raises:
+           IOError: If the buffer has been aborted or closed
+        """
+        view = memoryview(data).cast("B")
+        offset = 0
+        while offset < len(view):
+            with self._condition:
+                while self._fill == self._capacity and not self._aborted:
+                    self._condition.wait()
+                if self._aborted or self._closed:
+                    raise OSError("Ring buffer is no longer accepting data.")
+                end = (self._start + self._fill) % self._capacity
+                length = min(len(view) - offset, self._capacity - self._fill, self._capacity - end)
+                self._data[end : end + length] = view[offset : offset + length]
+                offset += length
+                self._fill += length
+                self._bytesWritten += length
+                if self._fill == self._capacity:
+                    self._primed = True
+                self._condition.notify_all()
+        return len(view)
+
+    def read(self, size=-1):
+        """
+        Reads data from the buffer, blocking until data is available.
+
+        Nothing is returned until the buffer has been primed.  After that, a
+        read returns whatever is available, up to ``size`` bytes.
+        Args:
+           size: Maximum number of bytes to return, or a negative value for no limit
+        Returns:
+            Bytes read, or an empty bytes object at end-of-file
+        """
+        with self._condition:
+            while not (self._primed or self._closed or self._aborted):
+                self._condition.wait()
+            if not self._closed and not self._aborted:
+                if self._lowWater is None or self._fill < self._lowWater:
+                    self._lowWater = self._fill
+                if self._fill == 0:
+                    self._underruns += 1
+            while self._fill == 0 and not (self._closed or self._aborted):
+                self._condition.wait()
+            if self._aborted or self._fill == 0:
+                return b""
+            length = self._fill if size is None or size < 0 else min(size, self._fill)
+            length = min(length, self._capacity - self._start)
+            data = bytes(self._data[self._start : self._start + length])
+            self._start = (self._start + length) % self._capacity
+            self._fill -= length
+            self._bytesRead += length
+            self._condition.notify_all()
+            return data
+
+    def flush(self):
+        """
+        Does nothing; provided so the buffer can be used as an output file.
+        """
+
+    def waitPrimed(self):
+        """
+        Blocks until the buffer has been primed, closed or aborted.
+        Returns:
+            Boolean indicating whether the buffer is ready to be read from
+        """
+        with self._condition:
+            while not (self._primed or self._closed or self._aborted):
+                self._condition.wait()
+            return not self._aborted
+
+    def close(self):
+        """
+        Indicates that the producer is finished writing to the buffer.
+        Data remaining in the buffer can still be read.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def abort(self):
+        """
+        Aborts the buffer, releasing both the producer and the consumer.
+        """
+        with self._condition:
+            self._aborted = True
+            self._condition.notify_all()
+
+
 ########################################################################
 # IsoImage class definition
 ########################################################################
@@ -276,6 +817,7 @@ def __init__(self, device=None, boundaries=None, graftPoint=None):
         self._preparerId = None
         self._volumeId = None
         self.entries = {}
+        self._tree = None  # cached (entries, tree) used for size estimates
         self.device = device
         self.boundaries = boundaries
         self.graftPoint = graftPoint
@@ -554,10 +1096,17 @@ def getEstimatedSize(self):
         """
         Returns the estimated size (in bytes) of the ISO image.
 
-        This is implemented via the ``-print-size`` option to ``mkisofs``, so it
-        might take a bit of time to execute.  However, the result is as accurate
-        as we can get, since it takes into account all of the ISO overhead, the
-        true cost of directories in the structure, etc, etc.
+        The size is calculated in-process, by modelling the layout that
+        ``mkisofs`` uses, so it takes into account all of the ISO overhead, the
+        true cost of directories in the structure, etc.  The entries are walked
+        once, and the walk is cached until the entries change, so repeated
+        estimates are cheap.  The modelled size is padded by
+        ``ESTIMATE_MARGIN_PERCENT`` percent plus ``ESTIMATE_MARGIN_SECTORS``
+        sectors, so that capacity checks never underestimate the real image.
+
+        A multisession image has to be merged with the previous session on the
+        disc, so in that case the estimate falls back to the ``-print-size``
+        option to ``mkisofs``.
 
         Returns:
             Estimated size of the image, in bytes
@@ -568,11 +1117,21 @@ def getEstimatedSize(self):
         """
         if len(list(self.entries.keys())) == 0:
             raise ValueError("Image does not contain any entries.")
-        return self._getEstimatedSize(self.entries)
+        if self.device is not None and self.boundaries is not None:
+            return self._getEstimatedSize(self.entries)
+        key = tuple(self.entries.items())
+        if self._tree is None or self._tree[0] != key:
+            tree = _IsoDirectory()
+            for path, graftPoint in key:
+                tree.addEntry(path, graftPoint)
+            self._tree = (key, tree)
+        sectors = _estimateImageSectors(self._tree[1], self.useRockRidge)
+        sectors += -(-sectors * ESTIMATE_MARGIN_PERCENT // 100) + ESTIMATE_MARGIN_SECTORS
+        return convertSize(sectors, UNIT_SECTORS, UNIT_BYTES)
 
     def _getEstimatedSize(self, entries):
         """
-        Returns the estimated size (in bytes) for the passed-in entries dictionary.
+        Returns the estimated size (in bytes) for the passed-in entries dictionary, using ``mkisofs``.
         Returns:
             Estimated size of the image, in bytes
         Raises:
@@ -611,6 +1170,56 @@ def writeImage(self, imagePath):
         if result != 0:
             raise OSError("Error (%d) executing mkisofs command to build image." % result)
 
+    def streamImage(self, outputFile):
+        """
+        Writes this image to an open file-like object, rather than to disk.
+
+        The output of ``mkisofs`` is copied to the file as it is produced, so
+        the file can be a pipe or a :any:`RingBuffer` feeding some other
+        process.  Anything ``mkisofs`` writes to ``stderr`` is discarded, since
+        it would otherwise be mixed into the image.
+
+        Args:
+           outputFile (File-like object opened in binary mode): File that the image should be written to
+        Raises:
+           IOError: If there is an error building the image or writing it to the file
+           ValueError: If there are no filesystem entries in the image
+           ValueError: If a path cannot be encoded properly
+        """
+        if len(list(self.entries.keys())) == 0:
+            raise ValueError("Image does not contain any entries.")
+        args = self._buildWriteArgs(self.entries, None)
+        command = resolveCommand(MKISOFS_COMMAND)
+        logger.debug("Streaming image with command %s and args %s.", command, args)
+        sanitizeEnvironment()  # make sure we have a consistent environment
+        token = startCommand(command[0])
+        try:
+            with Pipe(command + args, ignoreStderr=True) as pipe:
+                shutil.copyfileobj(pipe.stdout, outputFile, STREAM_CHUNK_SIZE)
+                result = pipe.wait()
+        finally:
+            finishCommand(token)
+        if result != 0:
+            raise OSError("Error (%d) executing mkisofs command to stream image." % result)
+
+    def getExactSize(self):
+        """
+        Returns the exact size (in bytes) of the ISO image, as reported by ``mkisofs``.
+
+        Unlike :any:`getEstimatedSize`, this always uses the ``-print-size``
+        option to ``mkisofs``.  It's needed when the image is streamed to a
+        writer that must be told the size of the track before it starts.
+
+        Returns:
+            Size of the image, in bytes
+        Raises:
+           IOError: If there is a problem calling ``mkisofs``
+           ValueError: If there are no filesystem entries in the image
+        """
+        if len(list(self.entries.keys())) == 0:
+            raise ValueError("Image does not contain any entries.")
+        return self._getEstimatedSize(self.entries)
+
     #########################################
     # Methods used to build mkisofs commands
     #########################################
@@ -709,7 +1318,7 @@ def _buildWriteArgs(self, entries, imagePath):
 
         The various instance variables (``applicationId``, etc.) are filled into
         the list of arguments if they are set.  The command will be built to write
-        an image to disk.
+        an image to disk, or to ``stdout`` if the image path is ``None``.
 
         By default, we will build a RockRidge disc.  If you decide to change
         this, think hard about whether you know what you're doing.  This option
@@ -718,7 +1327,7 @@ def _buildWriteArgs(self, entries, imagePath):
         Args:
            entries: Dictionary of image entries (i.e. self.entries)
 
-           imagePath (String representing a path on disk): Path to write image out as
+           imagePath (String representing a path on disk): Path to write image out as, or ``None`` for ``stdout``
         Returns:
             List suitable for passing to :any:`util.executeCommand` as ``args``
         """
@@ -726,8 +1335,9 @@ def _buildWriteArgs(self, entries, imagePath):
         args.append("-graft-points")
         if self.useRockRidge:
             args.append("-r")
-        args.append("-o")
-        args.append(imagePath)
+        if imagePath is not None:
+            args.append("-o")
+            args.append(imagePath)
         if self.device is not None and self.boundaries is not None:
             args.append("-C")
             args.append("%d,%d" % (self.boundaries[0], self.boundaries[1]))
@@ -53,6 +53,7 @@
    TRUE_BOOLEAN_VALUES: List of boolean values in XML representing ``True``
    FALSE_BOOLEAN_VALUES: List of boolean values in XML representing ``False``
    VALID_BOOLEAN_VALUES: List of valid boolean values in XML
+   DOM_CACHE_SIZE: Maximum number of parsed documents kept by :any:`readInputDom`
 
 :author: Kenneth J. Pronovici <pronovic@ieee.org>
 """
@@ -62,8 +63,10 @@
 ########################################################################
 
 import logging
+import os
 import re
 import sys
+import threading
 from io import StringIO
 from xml.dom.minidom import Node, getDOMImplementation, parseString  # noqa: S408 # we assume trusted data, so xml.dom is ok
 from xml.parsers.expat import ExpatError
@@ -78,6 +81,11 @@
 FALSE_BOOLEAN_VALUES = ["N", "n"]
 VALID_BOOLEAN_VALUES = TRUE_BOOLEAN_VALUES + FALSE_BOOLEAN_VALUES
 
+DOM_CACHE_SIZE = 16
+
+_DOM_CACHE = {}
+_DOM_CACHE_LOCK = threading.Lock()
+
 
 ########################################################################
 # Functions for creating and parsing DOM trees
@@ -100,6 +108,54 @@ def createInputDom(xmlData, name="cb_config"):
         raise ValueError("Unable to parse XML document: %s" % e)
 
 
+def readInputDom(xmlPath, name="cb_config"):
+    """
+    Creates a DOM tree based on reading an XML file on disk, parsing it at most once.
+
+    The parsed document is cached by absolute path, and is reused as long as
+    the file's modification time, size and inode are unchanged.  This way,
+    the configuration file is parsed once per run, even though the core
+    configuration and the configuration of every extension are each read
+    from the same path.  A changed file is parsed again.
+
+    Callers share the cached DOM tree, so they must treat it as read-only.
+
+    Args:
+       xmlPath: Path to an XML file on disk
+       name: Base name of the document (root node name)
+    Returns:
+        Tuple (xmlDom, parentNode) for the parsed document
+    Raises:
+       ValueError: If the document can't be parsed
+       OSError: If the file can't be read
+    """
+    key = (os.path.abspath(xmlPath), name)
+    with open(xmlPath) as f:
+        info = os.fstat(f.fileno())
+        stamp = (info.st_mtime_ns, info.st_size, info.st_ino)
+        with _DOM_CACHE_LOCK:
+            cached = _DOM_CACHE.get(key)
+        if cached is not None and cached[0] == stamp:
+            logger.debug("Using cached parse of XML document [%s].", xmlPath)
+            return cached[1]
+        xmlData = f.read()
+    result = createInputDom(xmlData, name)
+    with _DOM_CACHE_LOCK:
+        _DOM_CACHE.pop(key, None)
+        while len(_DOM_CACHE) >= DOM_CACHE_SIZE:
+            del _DOM_CACHE[next(iter(_DOM_CACHE))]
+        _DOM_CACHE[key] = (stamp, result)
+    return result
+
+
+def clearDomCache():
+    """
+    Discards all of the documents cached by :any:`readInputDom`.
+    """
+    with _DOM_CACHE_LOCK:
+        _DOM_CACHE.clear()
+
+
 def createOutputDom(name="cb_config"):
     """
     Creates a DOM tree used for writing an XML document.
@@ -81,22 +81,41 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import gzip
+import os
+import shutil
+import sys
 import tempfile
+import time
 import unittest
-
-from CedarBackup3.config import ByteQuantity
-from CedarBackup3.extend.amazons3 import AmazonS3Config, LocalConfig
+from unittest.mock import patch
+
+from CedarBackup3.config import ByteQuantity, Config, OptionsConfig
+from CedarBackup3.extend import amazons3
+from CedarBackup3.extend.amazons3 import (
+    AmazonS3Config,
+    LocalConfig,
+    _ScratchSpace,
+    _uploadEncryptedStagingDir,
+    _uploadStagingDir,
+    _verifyUpload,
+    _writeToAmazonS3,
+)
+from CedarBackup3.s3 import S3Client
 from CedarBackup3.testutil import (
+    S3Server,
     buildPath,
     configureLogging,
     extractTar,
     failUnlessAssignRaises,
     findResources,
+    getLogin,
     platformMacOsX,
     removedir,
 )
-from CedarBackup3.tools.amazons3 import _buildSourceFiles, _checkSourceFiles
-from CedarBackup3.util import UNIT_BYTES, UNIT_GBYTES, UNIT_MBYTES
+from CedarBackup3.tools import amazons3 as synctool
+from CedarBackup3.tools.amazons3 import SyncState, _buildSourceFiles, _checkSourceFiles
+from CedarBackup3.util import UNIT_BYTES, UNIT_GBYTES, UNIT_MBYTES, isRunningAsRoot
 from CedarBackup3.xmlutil import createOutputDom, serializeDom
 
 #######################################################################
@@ -907,6 +926,236 @@ def testAddConfig_002(self):
         self.validateAddConfig(config)
 
 
+#####################
+# TestFunctions class
+#####################
+
+
+class TestFunctions(unittest.TestCase):
+    """Tests for the private upload functions in amazons3.py."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        try:
+            self.tmpdir = tempfile.mkdtemp()
+            self.resources = findResources(RESOURCES, DATA_DIRS)
+            self.server = S3Server()
+            self.server.start()
+            self.client = S3Client("bucket", "key", "secret", endpoint=self.server.endpoint)
+        except Exception as e:
+            self.fail(e)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        try:
+            removedir(self.tmpdir)
+        except:
+            pass
+
+    ##################
+    # Utility methods
+    ##################
+
+    def extractTar(self, tarname):
+        """Extracts a tarfile with a particular name."""
+        extractTar(self.tmpdir, self.resources["%s.tar.gz" % tarname])
+
+    def buildPath(self, components):
+        """Builds a complete search path from a list of components."""
+        components.insert(0, self.tmpdir)
+        return buildPath(components)
+
+    ###########################
+    # Test _uploadStagingDir()
+    ###########################
+
+    def testUploadStagingDir_001(self):
+        """
+        Test an upload of a staging directory with nested files, excluding indicator files.
+        """
+        self.extractTar("tree4")
+        stagingDir = self.buildPath(["tree4"])
+        with open(self.buildPath(["tree4", "cback.stage"]), "w"):
+            pass
+        results = _uploadStagingDir(self.client, stagingDir, "2005/02/10/")
+        self.assertTrue(len(results) > 0)
+        self.assertNotIn("2005/02/10/cback.stage", self.server.objects)
+        for key in results:
+            with open(self.buildPath(["tree4", key[len("2005/02/10/") :]]), "rb") as f:
+                self.assertEqual(f.read(), self.server.objects[key])
+        _verifyUpload(self.client, "2005/02/10/", results)
+
+    def testUploadStagingDir_002(self):
+        """
+        Test that a second upload skips unchanged files and removes stale objects, leaving other prefixes alone.
+        """
+        self.extractTar("tree4")
+        stagingDir = self.buildPath(["tree4"])
+        self.server.objects["2005/02/10/stale"] = b"stale"
+        self.server.objects["2005/02/11/other"] = b"other"
+        first = _uploadStagingDir(self.client, stagingDir, "2005/02/10/")
+        self.assertNotIn("2005/02/10/stale", self.server.objects)
+        self.assertIn("2005/02/11/other", self.server.objects)
+        self.server.requests.clear()
+        second = _uploadStagingDir(self.client, stagingDir, "2005/02/10/")
+        self.assertEqual(first, second)
+        self.assertEqual([], [request for request in self.server.requests if request[0] != "GET"])
+
+    ####################################
+    # Test _uploadEncryptedStagingDir()
+    ####################################
+
+    def testUploadEncryptedStagingDir_001(self):
+        """
+        Test a pipelined upload with scratch space for only a couple of files at a time.
+
+        The "encryption" just compresses each file, so we can check what arrived.
+        The encrypt command is run through su, so this only works as root.
+        """
+        if isRunningAsRoot():
+            self.extractTar("tree4")
+            stagingDir = self.buildPath(["tree4"])
+            encryptedDir = self.buildPath(["encrypted"])
+            os.mkdir(encryptedDir)
+            config = Config()
+            config.options = OptionsConfig(backupUser=getLogin(), backupGroup=getLogin())
+            local = LocalConfig()
+            local.amazons3 = AmazonS3Config(s3Bucket="bucket", encryptCommand="gzip -n -c ${input} > ${output}")
+            limit = 2 * max(os.stat(os.path.join(root, name)).st_size for (root, _, names) in os.walk(stagingDir) for name in names)
+            with patch.object(amazons3, "SCRATCH_SIZE", limit):
+                results = _uploadEncryptedStagingDir(config, local, self.client, stagingDir, encryptedDir, "2005/02/10/")
+            self.assertTrue(len(results) > 0)
+            for key in results:
+                with open(self.buildPath(["tree4", key[len("2005/02/10/") :]]), "rb") as f:
+                    contents = f.read()
+                self.assertEqual(contents, gzip.decompress(self.server.objects[key]) if contents else b"")
+            self.assertEqual([], [files for (_, _, files) in os.walk(encryptedDir) if files])
+            _verifyUpload(self.client, "2005/02/10/", results)
+
+    def testUploadEncryptedStagingDir_002(self):
+        """
+        Test that a failed encryption stops the upload and is reported.
+        """
+        if isRunningAsRoot():
+            self.extractTar("tree4")
+            stagingDir = self.buildPath(["tree4"])
+            encryptedDir = self.buildPath(["encrypted"])
+            os.mkdir(encryptedDir)
+            config = Config()
+            config.options = OptionsConfig(backupUser=getLogin(), backupGroup=getLogin())
+            local = LocalConfig()
+            local.amazons3 = AmazonS3Config(s3Bucket="bucket", encryptCommand="false ${input} ${output}")
+            self.assertRaises(
+                OSError, _uploadEncryptedStagingDir, config, local, self.client, stagingDir, encryptedDir, "2005/02/10/"
+            )
+
+    def testUploadEncryptedStagingDir_003(self):
+        """
+        Test that a failed upload is reported, rather than hanging, while the scratch space is full.
+
+        The "encryption" just copies each file, so this does not need to run as root.
+        """
+        self.extractTar("tree4")
+        stagingDir = self.buildPath(["tree4"])
+        encryptedDir = self.buildPath(["encrypted"])
+        os.mkdir(encryptedDir)
+        config = Config()
+        config.options = OptionsConfig(backupUser=getLogin(), backupGroup=getLogin())
+
+        def copyFile(config, local, cleartext, encrypted, key):  # noqa: ARG001
+            shutil.copyfile(cleartext, encrypted)
+            return (encrypted, key)
+
+        self.server.corruptEtags = True
+        with (
+            patch.object(amazons3, "SCRATCH_SIZE", 1),
+            patch.object(amazons3, "SCRATCH_WAIT", 60),
+            patch.object(amazons3, "_encryptFile", copyFile),
+        ):
+            started = time.monotonic()
+            self.assertRaises(
+                OSError, _uploadEncryptedStagingDir, config, LocalConfig(), self.client, stagingDir, encryptedDir, "2005/02/10/"
+            )
+            self.assertTrue(time.monotonic() - started < 30)
+
+    ########################
+    # Test _ScratchSpace
+    ########################
+
+    def testScratchSpace_001(self):
+        """
+        Test reservations against the limit, including an oversized file when nothing else is reserved.
+        """
+        scratch = _ScratchSpace(100)
+        path = self.buildPath(["file"])
+        for name in ("a", "b", "c"):
+            with open(path + name, "w"):
+                pass
+        self.assertTrue(scratch.reserve(path + "a", 60))
+        self.assertFalse(scratch.reserve(path + "b", 60))
+        self.assertTrue(scratch.reserve(path + "b", 40))
+        scratch.release(path + "a", "key", "etag", "checksum")
+        scratch.release(path + "b", "key", "etag", "checksum")
+        self.assertFalse(os.path.exists(path + "a"))
+        self.assertEqual(0, scratch.used)
+        self.assertTrue(scratch.reserve(path + "c", 500))
+        self.assertEqual(500, scratch.peak)
+
+    ##########################
+    # Test _writeToAmazonS3()
+    ##########################
+
+    def testWriteToAmazonS3_001(self):
+        """
+        Test a write to a bucket configured with a subdirectory, which becomes part of the key prefix.
+        """
+        self.extractTar("tree4")
+        stagingDir = self.buildPath(["tree4"])
+        config = Config()
+        config.options = OptionsConfig(backupUser=getLogin(), backupGroup=getLogin())
+        local = LocalConfig()
+        local.amazons3 = AmazonS3Config(s3Bucket="bucket/staging/")
+        buckets = []
+
+        def buildClient(bucket, user=None):  # noqa: ARG001
+            buckets.append(bucket)
+            return S3Client(bucket, "key", "secret", endpoint=self.server.endpoint)
+
+        with patch.object(amazons3, "buildClient", buildClient):
+            _writeToAmazonS3(config, local, {stagingDir: "2005/02/10"})
+        self.assertEqual(["bucket"], buckets)
+        self.assertTrue(len(self.server.objects) > 0)
+        for key in self.server.objects:
+            self.assertTrue(key.startswith("staging/2005/02/10/"))
+            with open(self.buildPath(["tree4", key[len("staging/2005/02/10/") :]]), "rb") as f:
+                self.assertEqual(f.read(), self.server.objects[key])
+
+    ########################
+    # Test _verifyUpload()
+    ########################
+
+    def testVerifyUpload_001(self):
+        """
+        Test _verifyUpload() when an object has gone missing or changed.
+        """
+        self.extractTar("tree4")
+        stagingDir = self.buildPath(["tree4"])
+        results = _uploadStagingDir(self.client, stagingDir, "2005/02/10/")
+        key = min(results)
+        self.server.objects[key] = b"changed"
+        self.assertRaises(OSError, _verifyUpload, self.client, "2005/02/10/", results)
+        del self.server.objects[key]
+        self.assertRaises(OSError, _verifyUpload, self.client, "2005/02/10/", results)
+
+
 #################
 # TestTool class
 #################
@@ -959,7 +1208,7 @@ def testCheckSourceFiles_001(self):
             self.extractTar("tree13")
             sourceDir = self.buildPath(["tree13"])
             sourceFiles = _buildSourceFiles(sourceDir)
-            self.assertRaises(ValueError, _checkSourceFiles, sourceDir=sourceDir, sourceFiles=sourceFiles)
+            self.assertRaises(ValueError, _checkSourceFiles, sourceFiles=sourceFiles)
 
     def testCheckSourceFiles_002(self):
         """
@@ -968,4 +1217,81 @@ def testCheckSourceFiles_002(self):
         self.extractTar("tree4")
         sourceDir = self.buildPath(["tree4", "dir006"])
         sourceFiles = _buildSourceFiles(sourceDir)
-        _checkSourceFiles(sourceDir=sourceDir, sourceFiles=sourceFiles)
+        counts = _checkSourceFiles(sourceFiles=sourceFiles)
+        self.assertEqual({"ascii": len(sourceFiles), "locale": 0, "cached": 0, "chardet": 0}, counts)
+
+    def testCheckSourceFiles_003(self):
+        """
+        Test _checkSourceFiles() with a state, where unchanged directories are cached.
+        """
+        self.extractTar("tree4")
+        sourceDir = self.buildPath(["tree4", "dir006"])
+        sourceFiles = _buildSourceFiles(sourceDir)
+        state = SyncState(self.buildPath(["state.db"]), "target")
+        try:
+            _checkSourceFiles(sourceFiles=sourceFiles, state=state)
+            counts = _checkSourceFiles(sourceFiles=sourceFiles, state=state)
+            self.assertEqual({"ascii": 0, "locale": 0, "cached": len(sourceFiles), "chardet": 0}, counts)
+            os.mkdir(os.path.join(sourceDir, "new"))
+            counts = _checkSourceFiles(sourceFiles=sourceFiles, state=state)
+            self.assertEqual(1, counts["cached"])  # only the entry for sourceDir itself, in its unchanged parent
+        finally:
+            state.close()
+
+    def testCheckSourceFiles_004(self):
+        """
+        Test _checkSourceFiles() with a state, where cached problem files are still reported.
+        """
+        if not platformMacOsX():
+            self.extractTar("tree13")
+            sourceDir = self.buildPath(["tree13"])
+            sourceFiles = _buildSourceFiles(sourceDir)
+            state = SyncState(self.buildPath(["state.db"]), "target")
+            try:
+                self.assertRaises(ValueError, _checkSourceFiles, sourceFiles=sourceFiles, state=state)
+                mtime = os.stat(os.fsencode(sourceDir)).st_mtime_ns
+                self.assertEqual(10, len(state.checkedNames(sys.getfilesystemencoding(), os.fsencode(sourceDir), mtime)))
+                self.assertRaises(ValueError, _checkSourceFiles, sourceFiles=sourceFiles, state=state)
+            finally:
+                state.close()
+
+    def testCheckSourceFiles_005(self):
+        """
+        Test _checkSourceFiles() where names are valid in the locale, which should not need chardet.
+        """
+        if sys.getfilesystemencoding() == "utf-8":
+            sourceDir = self.buildPath(["source"])
+            os.mkdir(sourceDir)
+            for name in ["r\u00e9sum\u00e9", "\u65e5\u672c\u8a9e"]:
+                with open(os.path.join(sourceDir, name), "w"):
+                    pass
+            sourceFiles = _buildSourceFiles(sourceDir)
+            with patch.object(synctool, "_detectEncoding", side_effect=AssertionError("chardet was called")):
+                counts = _checkSourceFiles(sourceFiles=sourceFiles)
+            self.assertEqual({"ascii": 1, "locale": 2, "cached": 0, "chardet": 0}, counts)
+
+    def testCheckSourceFiles_006(self):
+        """
+        Test _checkSourceFiles() where problem files are checked on a process pool.
+        """
+        if not platformMacOsX():
+            self.extractTar("tree13")
+            sourceDir = self.buildPath(["tree13"])
+            sourceFiles = _buildSourceFiles(sourceDir)
+            with patch.object(synctool, "DETECT_POOL_THRESHOLD", 1):
+                self.assertRaises(ValueError, _checkSourceFiles, sourceFiles=sourceFiles)
+
+    def testCheckSourceFiles_007(self):
+        """
+        Test _checkSourceFiles() where a name needs chardet, which should see the full path rather than just the name.
+        """
+        if sys.getfilesystemencoding() == "utf-8":
+            sourceDir = self.buildPath(["source"])
+            os.mkdir(sourceDir)
+            path = os.path.join(os.fsencode(sourceDir), b"caf\xe9")
+            with open(path, "w"):
+                pass
+            sourceFiles = _buildSourceFiles(sourceDir)
+            with patch.object(synctool, "_detectEncoding", return_value="ISO-8859-1") as detectEncoding:
+                self.assertRaises(ValueError, _checkSourceFiles, sourceFiles=sourceFiles)
+            detectEncoding.assert_called_once_with(path)
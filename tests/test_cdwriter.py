@@ -97,9 +97,13 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import os
+import sys
+import tempfile
 import unittest
+from unittest.mock import patch
 
-from CedarBackup3.testutil import configureLogging
+from CedarBackup3.testutil import configureLogging, removedir
 from CedarBackup3.writers.cdwriter import (
     MEDIA_CDR_74,
     MEDIA_CDR_80,
@@ -109,6 +113,7 @@
     MediaCapacity,
     MediaDefinition,
 )
+from CedarBackup3.writers.util import clearMediaState
 
 #######################################################################
 # Module-wide configuration and constants
@@ -136,6 +141,30 @@
 
 INVALID_FILE = "bogus"  # This file name should never exist
 
+# Stand-in for mkisofs: prints a size of 300 sectors, or writes that many sectors to stdout
+MKISOFS_STANDIN = """
+import sys
+if "-print-size" in sys.argv:
+    print(300)
+else:
+    for i in range(300):
+        sys.stdout.buffer.write(bytes([i % 256]) * 2048)
+"""
+
+# Stand-in for cdrecord: records its arguments and the image it was asked to write
+CDRECORD_STANDIN = """
+import sys
+with open(sys.argv[1], "w") as f:
+    f.write(" ".join(sys.argv[2:]))
+with open(sys.argv[1] + ".iso", "wb") as f:
+    if sys.argv[-1] == "-":
+        f.write(sys.stdin.buffer.read())
+    else:
+        with open(sys.argv[-1], "rb") as image:
+            f.write(image.read())
+"""
+IMAGE = b"".join(bytes([i % 256]) * 2048 for i in range(300))
+
 
 #######################################################################
 # Test Case Classes
@@ -243,10 +272,10 @@ def setUpClass(cls):
         configureLogging()
 
     def setUp(self):
-        pass
+        clearMediaState()
 
     def tearDown(self):
-        pass
+        clearMediaState()
 
     ###################
     # Test constructor
@@ -502,6 +531,17 @@ def testConstructor_021(self):
         self.assertEqual(True, writer.isRewritable())
         self.assertEqual(True, writer._noEject)
 
+    def testConstructor_022(self):
+        """
+        Test the constructor with device ``/dev/null``, which is writable and
+        exists.  Use defaults for the remaining arguments, and make sure that
+        images are not streamed by default.  Then use ``streamImage=True``.
+        """
+        writer = CdWriter(device="/dev/null", unittest=True)
+        self.assertEqual(False, writer.streamImage)
+        writer = CdWriter(device="/dev/null", streamImage=True, unittest=True)
+        self.assertEqual(True, writer.streamImage)
+
     ####################################
     # Test the capacity-related methods
     ####################################
@@ -792,6 +832,32 @@ def testCapacity_024(self):
         self.assertEqual(expectedAvailable, capacity.bytesAvailable)
         self.assertEqual((0, 330042), capacity.boundaries)
 
+    def testCapacity_025(self):
+        """
+        Test that _getBoundaries only reads the disc once for the same media, even across writers.
+        """
+        writer = CdWriter(device="/dev/cdrw", scsiId="0,0,0", unittest=True)
+        writer._deviceSupportsMulti = True
+        other = CdWriter(device="/dev/cdrw", scsiId="0,0,0", unittest=True)
+        other._deviceSupportsMulti = True
+        with patch("CedarBackup3.writers.cdwriter.executeCommand", return_value=(0, ["1000,2000"])) as executeCommand:
+            self.assertEqual((1000, 2000), writer._getBoundaries())
+            self.assertEqual((1000, 2000), other._getBoundaries())
+        self.assertEqual(1, executeCommand.call_count)
+
+    def testCapacity_026(self):
+        """
+        Test that _getBoundaries reads the disc again after the media is refreshed.
+        """
+        writer = CdWriter(device="/dev/cdrw", scsiId="0,0,0", noEject=True, refreshMediaDelay=None, unittest=True)
+        writer._deviceSupportsMulti = True
+        with patch("CedarBackup3.writers.cdwriter.executeCommand", return_value=(0, ["1000,2000"])) as executeCommand:
+            self.assertEqual((1000, 2000), writer._getBoundaries())
+            writer.refreshMedia()
+            executeCommand.return_value = (0, ["2000,3000"])
+            self.assertEqual((2000, 3000), writer._getBoundaries())
+        self.assertEqual(3, executeCommand.call_count)  # boundaries, unlock tray, boundaries
+
     #########################################
     # Test methods that build argument lists
     #########################################
@@ -929,6 +995,13 @@ def testBuildArgs_019(self):
         args = CdWriter._buildWriteArgs(hardwareId="ATAPI:1,2,3", imagePath="/whatever", driveSpeed=5, writeMulti=False)
         self.assertEqual(["-v", "speed=5", "dev=ATAPI:1,2,3", "-data", "/whatever"], args)
 
+    def testBuildArgs_020(self):
+        """
+        Test _buildWriteArgs(), image read from stdin with a track size.
+        """
+        args = CdWriter._buildWriteArgs(hardwareId="0,0,0", imagePath="-", driveSpeed=None, writeMulti=True, trackSize=614400)
+        self.assertEqual(["-v", "dev=0,0,0", "-multi", "tsize=614400", "-data", "-"], args)
+
     ##########################################
     # Test methods that parse cdrecord output
     ##########################################
@@ -1875,3 +1948,103 @@ def testParseOutput_021(self):
         self.assertEqual(False, deviceSupportsMulti)
         self.assertEqual(False, deviceHasTray)
         self.assertEqual(False, deviceCanEject)
+
+
+#########################
+# TestStreamImage class
+#########################
+
+
+class TestStreamImage(unittest.TestCase):
+    """Tests for writing a streamed image, using stand-ins for mkisofs and cdrecord."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "source")
+        os.mkdir(self.source)
+        with open(os.path.join(self.source, "file"), "w") as f:
+            f.write("contents")
+        self.record = os.path.join(self.tmpdir, "cdrecord")
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def buildWriter(self, streamImage=True):
+        """Builds a writer for a drive that doesn't support multisession discs."""
+        writer = CdWriter(
+            device="/dev/null", scsiId="0,0,0", mediaType=MEDIA_CDR_74, noEject=True, streamImage=streamImage, unittest=True
+        )
+        writer._deviceSupportsMulti = False
+        writer.initializeImage(False, self.tmpdir)
+        writer.addImageEntry(self.source, "base")
+        return writer
+
+    def writeImage(self, writer, mkisofs=MKISOFS_STANDIN, cdrecord=CDRECORD_STANDIN):
+        """Writes the writer's image, with the stand-in commands in place."""
+        with (
+            patch("CedarBackup3.writers.util.MKISOFS_COMMAND", [sys.executable, "-c", mkisofs]),
+            patch("CedarBackup3.writers.cdwriter.CDRECORD_COMMAND", [sys.executable, "-c", cdrecord, self.record]),
+            patch("CedarBackup3.writers.cdwriter.STREAM_BUFFER_SIZE", 100 * 1024),
+            patch.object(writer, "refreshMedia") as refreshMedia,
+        ):
+            writer.writeImage()
+        return refreshMedia
+
+    ####################
+    # Test writeImage()
+    ####################
+
+    def testWriteImage_001(self):
+        """
+        Stream an image into cdrecord, and check that it arrives intact with the right track size.
+        """
+        writer = self.buildWriter()
+        refreshMedia = self.writeImage(writer)
+        with open(self.record) as f:
+            self.assertEqual("-v dev=0,0,0 tsize=614400 -data -", f.read())
+        with open(self.record + ".iso", "rb") as f:
+            self.assertEqual(IMAGE, f.read())
+        refreshMedia.assert_called_once_with()
+        self.assertEqual(["cdrecord", "cdrecord.iso", "source"], sorted(os.listdir(self.tmpdir)))
+
+    def testWriteImage_002(self):
+        """
+        Write an image without streaming, and check that the temporary image is used and removed.
+        """
+        writer = self.buildWriter(streamImage=False)
+        mkisofs = MKISOFS_STANDIN.replace("sys.stdout.buffer", 'open(sys.argv[sys.argv.index("-o") + 1], "ab")')
+        self.writeImage(writer, mkisofs=mkisofs)
+        with open(self.record) as f:
+            args = f.read().split(" ")
+        self.assertEqual(["-v", "dev=0,0,0", "-data"], args[:-1])
+        self.assertEqual(self.tmpdir, os.path.dirname(args[-1]))
+        self.assertFalse(os.path.exists(args[-1]))
+        with open(self.record + ".iso", "rb") as f:
+            self.assertEqual(IMAGE, f.read())
+
+    def testWriteImage_003(self):
+        """
+        Stream an image when mkisofs fails, and check that the error is raised.
+        """
+        writer = self.buildWriter()
+        mkisofs = MKISOFS_STANDIN + "\nif '-print-size' not in sys.argv:\n    sys.exit(3)\n"
+        self.assertRaises(IOError, self.writeImage, writer, mkisofs=mkisofs)
+
+    def testWriteImage_004(self):
+        """
+        Stream an image when cdrecord fails without reading its input, and check that nothing hangs.
+        """
+        writer = self.buildWriter()
+        self.assertRaises(IOError, self.writeImage, writer, cdrecord="import sys; sys.exit(1)")
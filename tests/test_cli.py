@@ -3286,6 +3286,128 @@ def testConstructor_212(self):
         self.assertEqual(True, options.diagnostics)
         self.assertEqual([], options.actions)
 
+    def testConstructor_213(self):
+        """
+        Test constructor with argumentList=["--metrics", "/tmp/metrics.prom", "collect"], validate=False.
+        """
+        options = Options(argumentList=["--metrics", "/tmp/metrics.prom", "collect"], validate=False)
+        self.assertEqual(False, options.help)
+        self.assertEqual(False, options.version)
+        self.assertEqual(False, options.verbose)
+        self.assertEqual(False, options.quiet)
+        self.assertEqual(None, options.config)
+        self.assertEqual(False, options.full)
+        self.assertEqual(False, options.managed)
+        self.assertEqual(False, options.managedOnly)
+        self.assertEqual(None, options.logfile)
+        self.assertEqual(None, options.owner)
+        self.assertEqual(None, options.mode)
+        self.assertEqual(False, options.output)
+        self.assertEqual(False, options.debug)
+        self.assertEqual(False, options.stacktrace)
+        self.assertEqual(False, options.diagnostics)
+        self.assertEqual("/tmp/metrics.prom", options.metrics)
+        self.assertEqual(["collect"], options.actions)
+
+    def testConstructor_214(self):
+        """
+        Test constructor with argumentString="--metrics /tmp/metrics.prom collect", validate=False.
+        """
+        options = Options(argumentString="--metrics /tmp/metrics.prom collect", validate=False)
+        self.assertEqual(False, options.help)
+        self.assertEqual(False, options.version)
+        self.assertEqual(False, options.verbose)
+        self.assertEqual(False, options.quiet)
+        self.assertEqual(None, options.config)
+        self.assertEqual(False, options.full)
+        self.assertEqual(False, options.managed)
+        self.assertEqual(False, options.managedOnly)
+        self.assertEqual(None, options.logfile)
+        self.assertEqual(None, options.owner)
+        self.assertEqual(None, options.mode)
+        self.assertEqual(False, options.output)
+        self.assertEqual(False, options.debug)
+        self.assertEqual(False, options.stacktrace)
+        self.assertEqual(False, options.diagnostics)
+        self.assertEqual("/tmp/metrics.prom", options.metrics)
+        self.assertEqual(["collect"], options.actions)
+
+    def testConstructor_215(self):
+        """
+        Test constructor with argumentList=["--metrics", "/tmp/metrics.prom", "collect"], validate=True.
+        """
+        options = Options(argumentList=["--metrics", "/tmp/metrics.prom", "collect"], validate=True)
+        self.assertEqual(False, options.help)
+        self.assertEqual(False, options.version)
+        self.assertEqual(False, options.verbose)
+        self.assertEqual(False, options.quiet)
+        self.assertEqual(None, options.config)
+        self.assertEqual(False, options.full)
+        self.assertEqual(False, options.managed)
+        self.assertEqual(False, options.managedOnly)
+        self.assertEqual(None, options.logfile)
+        self.assertEqual(None, options.owner)
+        self.assertEqual(None, options.mode)
+        self.assertEqual(False, options.output)
+        self.assertEqual(False, options.debug)
+        self.assertEqual(False, options.stacktrace)
+        self.assertEqual(False, options.diagnostics)
+        self.assertEqual("/tmp/metrics.prom", options.metrics)
+        self.assertEqual(["collect"], options.actions)
+
+    def testConstructor_216(self):
+        """
+        Test constructor with argumentString="--metrics /tmp/metrics.prom collect", validate=True.
+        """
+        options = Options(argumentString="--metrics /tmp/metrics.prom collect", validate=True)
+        self.assertEqual(False, options.help)
+        self.assertEqual(False, options.version)
+        self.assertEqual(False, options.verbose)
+        self.assertEqual(False, options.quiet)
+        self.assertEqual(None, options.config)
+        self.assertEqual(False, options.full)
+        self.assertEqual(False, options.managed)
+        self.assertEqual(False, options.managedOnly)
+        self.assertEqual(None, options.logfile)
+        self.assertEqual(None, options.owner)
+        self.assertEqual(None, options.mode)
+        self.assertEqual(False, options.output)
+        self.assertEqual(False, options.debug)
+        self.assertEqual(False, options.stacktrace)
+        self.assertEqual(False, options.diagnostics)
+        self.assertEqual("/tmp/metrics.prom", options.metrics)
+        self.assertEqual(["collect"], options.actions)
+
+    def testConstructor_217(self):
+        """
+        Test constructor with argumentList=["--metrics", "", "collect"], validate=False.
+        """
+        self.assertRaises(ValueError, Options, argumentList=["--metrics", "", "collect"], validate=False)
+
+    def testConstructor_218(self):
+        """
+        Test constructor with argumentList=["--profile", "sample", "collect"], validate=True.
+        """
+        options = Options(argumentList=["--profile", "sample", "collect"], validate=True)
+        self.assertEqual(None, options.metrics)
+        self.assertEqual("sample", options.profile)
+        self.assertEqual(["collect"], options.actions)
+
+    def testConstructor_219(self):
+        """
+        Test constructor with argumentString="--profile both collect", validate=True.
+        """
+        options = Options(argumentString="--profile both collect", validate=True)
+        self.assertEqual(None, options.metrics)
+        self.assertEqual("both", options.profile)
+        self.assertEqual(["collect"], options.actions)
+
+    def testConstructor_220(self):
+        """
+        Test constructor with argumentList=["--profile", "bogus", "collect"], validate=False.
+        """
+        self.assertRaises(ValueError, Options, argumentList=["--profile", "bogus", "collect"], validate=False)
+
     ############################
     # Test comparison operators
     ############################
@@ -4152,6 +4274,37 @@ def testComparison_017(self):
         self.assertTrue(not options1 >= options2)
         self.assertTrue(options1 != options2)
 
+    def testComparison_018(self):
+        """
+        Test comparison of two identical objects, all attributes filled in, metrics different.
+        """
+        options1 = Options()
+        options2 = Options()
+
+        options1.verbose = True
+        options1.config = "config"
+        options1.logfile = "logfile"
+        options1.metrics = "metrics1"
+        options1.actions = [
+            "collect",
+        ]
+
+        options2.verbose = True
+        options2.config = "config"
+        options2.logfile = "logfile"
+        options2.metrics = "metrics2"
+        options2.actions = [
+            "collect",
+        ]
+
+        self.assertNotEqual(options1, options2)
+        self.assertTrue(not options1 == options2)
+        self.assertTrue(options1 < options2)
+        self.assertTrue(options1 <= options2)
+        self.assertTrue(not options1 > options2)
+        self.assertTrue(not options1 >= options2)
+        self.assertTrue(options1 != options2)
+
     ###########################
     # Test buildArgumentList()
     ###########################
@@ -4642,6 +4795,36 @@ def testBuildArgumentList_042(self):
         argumentList = options.buildArgumentList(validate=True)
         self.assertEqual(["--diagnostics"], argumentList)
 
+    def testBuildArgumentList_043(self):
+        """Test with metrics set, validate=False."""
+        options = Options()
+        options.metrics = "/tmp/metrics.json"
+        argumentList = options.buildArgumentList(validate=False)
+        self.assertEqual(["--metrics", "/tmp/metrics.json"], argumentList)
+
+    def testBuildArgumentList_044(self):
+        """Test with metrics set, validate=True."""
+        options = Options()
+        options.metrics = "/tmp/metrics.json"
+        options.actions = ["collect"]
+        argumentList = options.buildArgumentList(validate=True)
+        self.assertEqual(["--metrics", "/tmp/metrics.json", "collect"], argumentList)
+
+    def testBuildArgumentList_045(self):
+        """Test with profile set, validate=False."""
+        options = Options()
+        options.profile = "cprofile"
+        argumentList = options.buildArgumentList(validate=False)
+        self.assertEqual(["--profile", "cprofile"], argumentList)
+
+    def testBuildArgumentList_046(self):
+        """Test with profile set, validate=True."""
+        options = Options()
+        options.profile = "cprofile"
+        options.actions = ["collect"]
+        argumentList = options.buildArgumentList(validate=True)
+        self.assertEqual(["--profile", "cprofile", "collect"], argumentList)
+
     #############################
     # Test buildArgumentString()
     #############################
@@ -5048,6 +5231,36 @@ def testBuildArgumentString_042(self):
         argumentString = options.buildArgumentString(validate=True)
         self.assertEqual("--diagnostics ", argumentString)
 
+    def testBuildArgumentString_043(self):
+        """Test with metrics set, validate=False."""
+        options = Options()
+        options.metrics = "/tmp/metrics.json"
+        argumentString = options.buildArgumentString(validate=False)
+        self.assertEqual('--metrics "/tmp/metrics.json" ', argumentString)
+
+    def testBuildArgumentString_044(self):
+        """Test with metrics set, validate=True."""
+        options = Options()
+        options.metrics = "/tmp/metrics.json"
+        options.actions = ["collect"]
+        argumentString = options.buildArgumentString(validate=True)
+        self.assertEqual('--metrics "/tmp/metrics.json" "collect" ', argumentString)
+
+    def testBuildArgumentString_045(self):
+        """Test with profile set, validate=False."""
+        options = Options()
+        options.profile = "sample"
+        argumentString = options.buildArgumentString(validate=False)
+        self.assertEqual('--profile "sample" ', argumentString)
+
+    def testBuildArgumentString_046(self):
+        """Test with profile set, validate=True."""
+        options = Options()
+        options.profile = "sample"
+        options.actions = ["collect"]
+        argumentString = options.buildArgumentString(validate=True)
+        self.assertEqual('--profile "sample" "collect" ', argumentString)
+
 
 ######################
 # TestActionSet class
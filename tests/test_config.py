@@ -96,6 +96,9 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from CedarBackup3.config import (
@@ -124,6 +127,7 @@
 )
 from CedarBackup3.testutil import configureLogging, failUnlessAssignRaises, findResources
 from CedarBackup3.util import UNIT_BYTES, UNIT_GBYTES, UNIT_KBYTES, UNIT_MBYTES
+from CedarBackup3.xmlutil import clearDomCache, readInputDom
 
 #######################################################################
 # Module-wide configuration and constants
@@ -157,6 +161,7 @@
     "cback.conf.21",
     "cback.conf.22",
     "cback.conf.23",
+    "cback.conf.24",
 ]
 
 
@@ -2694,6 +2699,8 @@ def testConstructor_012(self):
         self.assertEqual("targz", collectFile.archiveMode)
         collectFile.archiveMode = "tarbz2"
         self.assertEqual("tarbz2", collectFile.archiveMode)
+        collectFile.archiveMode = "adaptive"
+        self.assertEqual("adaptive", collectFile.archiveMode)
 
     def testConstructor_013(self):
         """
@@ -2881,6 +2888,7 @@ def testConstructor_001(self):
         self.assertEqual(None, collectDir.linkDepth)
         self.assertEqual(False, collectDir.dereference)
         self.assertEqual(None, collectDir.recursionLevel)
+        self.assertEqual(None, collectDir.maxArchiveSize)
         self.assertEqual(None, collectDir.absoluteExcludePaths)
         self.assertEqual(None, collectDir.relativeExcludePaths)
         self.assertEqual(None, collectDir.excludePatterns)
@@ -2998,6 +3006,8 @@ def testConstructor_012(self):
         self.assertEqual("targz", collectDir.archiveMode)
         collectDir.archiveMode = "tarbz2"
         self.assertEqual("tarbz2", collectDir.archiveMode)
+        collectDir.archiveMode = "adaptive"
+        self.assertEqual("adaptive", collectDir.archiveMode)
 
     def testConstructor_013(self):
         """
@@ -3330,6 +3340,37 @@ def testConstructor_044(self):
         self.failUnlessAssignRaises(ValueError, collectDir, "recursionLevel", "ken")
         self.assertEqual(None, collectDir.recursionLevel)
 
+    def testConstructor_045(self):
+        """
+        Test assignment of maxArchiveSize attribute, None value after a valid value.
+        """
+        collectDir = CollectDir(maxArchiveSize=ByteQuantity("650", UNIT_MBYTES))
+        self.assertEqual(ByteQuantity("650", UNIT_MBYTES), collectDir.maxArchiveSize)
+        collectDir.maxArchiveSize = None
+        self.assertEqual(None, collectDir.maxArchiveSize)
+
+    def testConstructor_046(self):
+        """
+        Test assignment of maxArchiveSize attribute, valid value.
+        """
+        collectDir = CollectDir()
+        self.assertEqual(None, collectDir.maxArchiveSize)
+        collectDir.maxArchiveSize = ByteQuantity("1", UNIT_MBYTES)
+        self.assertEqual(ByteQuantity("1", UNIT_MBYTES), collectDir.maxArchiveSize)
+        collectDir.maxArchiveSize = ByteQuantity("4.5", UNIT_GBYTES)
+        self.assertEqual(ByteQuantity("4.5", UNIT_GBYTES), collectDir.maxArchiveSize)
+
+    def testConstructor_047(self):
+        """
+        Test assignment of maxArchiveSize attribute, invalid value (not a ByteQuantity or too small).
+        """
+        collectDir = CollectDir()
+        self.assertEqual(None, collectDir.maxArchiveSize)
+        self.failUnlessAssignRaises(ValueError, collectDir, "maxArchiveSize", 650)
+        self.assertEqual(None, collectDir.maxArchiveSize)
+        self.failUnlessAssignRaises(ValueError, collectDir, "maxArchiveSize", ByteQuantity("1023", UNIT_KBYTES))
+        self.assertEqual(None, collectDir.maxArchiveSize)
+
     ############################
     # Test comparison operators
     ############################
@@ -3752,6 +3793,34 @@ def testComparison_029(self):
         self.assertTrue(collectDir1 >= collectDir2)
         self.assertTrue(collectDir1 != collectDir2)
 
+    def testComparison_030(self):
+        """
+        Test comparison of two differing objects, maxArchiveSize differs (one None).
+        """
+        collectDir1 = CollectDir()
+        collectDir2 = CollectDir(maxArchiveSize=ByteQuantity("650", UNIT_MBYTES))
+        self.assertNotEqual(collectDir1, collectDir2)
+        self.assertTrue(not collectDir1 == collectDir2)
+        self.assertTrue(collectDir1 < collectDir2)
+        self.assertTrue(collectDir1 <= collectDir2)
+        self.assertTrue(not collectDir1 > collectDir2)
+        self.assertTrue(not collectDir1 >= collectDir2)
+        self.assertTrue(collectDir1 != collectDir2)
+
+    def testComparison_031(self):
+        """
+        Test comparison of two differing objects, maxArchiveSize differs.
+        """
+        collectDir1 = CollectDir("/etc/whatever", maxArchiveSize=ByteQuantity("1", UNIT_GBYTES))
+        collectDir2 = CollectDir("/etc/whatever", maxArchiveSize=ByteQuantity("650", UNIT_MBYTES))
+        self.assertNotEqual(collectDir1, collectDir2)
+        self.assertTrue(not collectDir1 == collectDir2)
+        self.assertTrue(not collectDir1 < collectDir2)
+        self.assertTrue(not collectDir1 <= collectDir2)
+        self.assertTrue(collectDir1 > collectDir2)
+        self.assertTrue(collectDir1 >= collectDir2)
+        self.assertTrue(collectDir1 != collectDir2)
+
 
 #####################
 # TestPurgeDir class
@@ -7312,6 +7381,8 @@ def testConstructor_013(self):
         self.assertEqual("targz", collect.archiveMode)
         collect.archiveMode = "tarbz2"
         self.assertEqual("tarbz2", collect.archiveMode)
+        collect.archiveMode = "adaptive"
+        self.assertEqual("adaptive", collect.archiveMode)
 
     def testConstructor_014(self):
         """
@@ -7644,6 +7715,70 @@ def testConstructor_043(self):
         self.failUnlessAssignRaises(ValueError, collect, "collectFiles", ["hello", CollectFile()])
         self.assertEqual(None, collect.collectFiles)
 
+    def testConstructor_044(self):
+        """
+        Test assignment of traversalCache attribute, None value.
+        """
+        collect = CollectConfig(traversalCache=True)
+        self.assertEqual(True, collect.traversalCache)
+        collect.traversalCache = None
+        self.assertEqual(False, collect.traversalCache)
+
+    def testConstructor_045(self):
+        """
+        Test assignment of traversalCache attribute, valid value (real boolean).
+        """
+        collect = CollectConfig()
+        self.assertEqual(False, collect.traversalCache)
+        collect.traversalCache = True
+        self.assertEqual(True, collect.traversalCache)
+        collect.traversalCache = False
+        self.assertEqual(False, collect.traversalCache)
+
+    def testConstructor_046(self):
+        """
+        Test assignment of traversalCache attribute, valid value (expression).
+        """
+        collect = CollectConfig()
+        self.assertEqual(False, collect.traversalCache)
+        collect.traversalCache = 1
+        self.assertEqual(True, collect.traversalCache)
+        collect.traversalCache = []
+        self.assertEqual(False, collect.traversalCache)
+
+    def testConstructor_047(self):
+        """
+        Test assignment of digestAlgorithm attribute, None value.
+        """
+        collect = CollectConfig(digestAlgorithm="blake2b")
+        self.assertEqual("blake2b", collect.digestAlgorithm)
+        collect.digestAlgorithm = None
+        self.assertEqual(None, collect.digestAlgorithm)
+
+    def testConstructor_048(self):
+        """
+        Test assignment of digestAlgorithm attribute, valid values.
+        """
+        collect = CollectConfig()
+        self.assertEqual(None, collect.digestAlgorithm)
+        collect.digestAlgorithm = "sha1"
+        self.assertEqual("sha1", collect.digestAlgorithm)
+        collect.digestAlgorithm = "blake2b"
+        self.assertEqual("blake2b", collect.digestAlgorithm)
+        collect.digestAlgorithm = "blake2s"
+        self.assertEqual("blake2s", collect.digestAlgorithm)
+        collect.digestAlgorithm = "xxh3_128"
+        self.assertEqual("xxh3_128", collect.digestAlgorithm)
+
+    def testConstructor_049(self):
+        """
+        Test assignment of digestAlgorithm attribute, invalid value (not in list).
+        """
+        collect = CollectConfig()
+        self.assertEqual(None, collect.digestAlgorithm)
+        self.failUnlessAssignRaises(ValueError, collect, "digestAlgorithm", "md5")
+        self.assertEqual(None, collect.digestAlgorithm)
+
     ############################
     # Test comparison operators
     ############################
@@ -8036,6 +8171,48 @@ def testComparison_026(self):
         self.assertTrue(collect1 >= collect2)
         self.assertTrue(collect1 != collect2)
 
+    def testComparison_027(self):
+        """
+        Test comparison of two differing objects, traversalCache differs.
+        """
+        collect1 = CollectConfig(traversalCache=False)
+        collect2 = CollectConfig(traversalCache=True)
+        self.assertNotEqual(collect1, collect2)
+        self.assertTrue(not collect1 == collect2)
+        self.assertTrue(collect1 < collect2)
+        self.assertTrue(collect1 <= collect2)
+        self.assertTrue(not collect1 > collect2)
+        self.assertTrue(not collect1 >= collect2)
+        self.assertTrue(collect1 != collect2)
+
+    def testComparison_028(self):
+        """
+        Test comparison of two differing objects, digestAlgorithm differs (one None).
+        """
+        collect1 = CollectConfig()
+        collect2 = CollectConfig(digestAlgorithm="blake2b")
+        self.assertNotEqual(collect1, collect2)
+        self.assertTrue(not collect1 == collect2)
+        self.assertTrue(collect1 < collect2)
+        self.assertTrue(collect1 <= collect2)
+        self.assertTrue(not collect1 > collect2)
+        self.assertTrue(not collect1 >= collect2)
+        self.assertTrue(collect1 != collect2)
+
+    def testComparison_029(self):
+        """
+        Test comparison of two differing objects, digestAlgorithm differs.
+        """
+        collect1 = CollectConfig(digestAlgorithm="blake2b")
+        collect2 = CollectConfig(digestAlgorithm="sha1")
+        self.assertNotEqual(collect1, collect2)
+        self.assertTrue(not collect1 == collect2)
+        self.assertTrue(collect1 < collect2)
+        self.assertTrue(collect1 <= collect2)
+        self.assertTrue(not collect1 > collect2)
+        self.assertTrue(not collect1 >= collect2)
+        self.assertTrue(collect1 != collect2)
+
 
 ########################
 # TestStageConfig class
@@ -9028,6 +9205,37 @@ def testConstructor_046(self):
         self.failUnlessAssignRaises(ValueError, store, "ejectDelay", CollectDir())
         self.assertEqual(None, store.ejectDelay)
 
+    def testConstructor_047(self):
+        """
+        Test assignment of streamImage attribute, None value.
+        """
+        store = StoreConfig(streamImage=True)
+        self.assertEqual(True, store.streamImage)
+        store.streamImage = None
+        self.assertEqual(False, store.streamImage)
+
+    def testConstructor_048(self):
+        """
+        Test assignment of streamImage attribute, valid value (real boolean).
+        """
+        store = StoreConfig()
+        self.assertEqual(False, store.streamImage)
+        store.streamImage = True
+        self.assertEqual(True, store.streamImage)
+        store.streamImage = False
+        self.assertEqual(False, store.streamImage)
+
+    def testConstructor_049(self):
+        """
+        Test assignment of streamImage attribute, valid value (expression).
+        """
+        store = StoreConfig()
+        self.assertEqual(False, store.streamImage)
+        store.streamImage = 1
+        self.assertEqual(True, store.streamImage)
+        store.streamImage = []
+        self.assertEqual(False, store.streamImage)
+
     ############################
     # Test comparison operators
     ############################
@@ -9381,6 +9589,20 @@ def testComparison_023(self):
         self.assertTrue(not store1 >= store2)
         self.assertTrue(store1 != store2)
 
+    def testComparison_024(self):
+        """
+        Test comparison of two differing objects, streamImage differs.
+        """
+        store1 = StoreConfig(streamImage=False)
+        store2 = StoreConfig(streamImage=True)
+        self.assertNotEqual(store1, store2)
+        self.assertTrue(not store1 == store2)
+        self.assertTrue(store1 < store2)
+        self.assertTrue(store1 <= store2)
+        self.assertTrue(not store1 > store2)
+        self.assertTrue(not store1 >= store2)
+        self.assertTrue(store1 != store2)
+
 
 ########################
 # TestPurgeConfig class
@@ -13336,6 +13558,70 @@ def testParse_040(self):
         path = self.resources["cback.conf.23"]
         self.assertRaises(ValueError, Config, xmlPath=path, validate=True)
 
+    def testParse_041(self):
+        """
+        Parse the same document by path twice; the DOM is parsed only once and
+        the shared tree is not changed by parsing it.
+        """
+        clearDomCache()
+        path = self.resources["cback.conf.21"]
+        config1 = Config(xmlPath=path, validate=True)
+        (xmlDom, _) = readInputDom(path)
+        config2 = Config(xmlPath=path, validate=True)
+        self.assertTrue(xmlDom is readInputDom(path)[0])
+        self.assertEqual(config1, config2)
+        with open(path) as f:
+            self.assertEqual(Config(xmlData=f.read(), validate=True), config2)
+
+    def testParse_042(self):
+        """
+        Parse a document by path, change it, and parse it again; the changed
+        document must be parsed again rather than taken from the cache.
+        """
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "cback3.conf")
+            config = Config()
+            config.reference = ReferenceConfig(author="one")
+            with open(path, "w") as f:
+                f.write(config.extractXml(validate=False))
+            os.utime(path, ns=(0, 0))
+            self.assertEqual("one", Config(xmlPath=path, validate=False).reference.author)
+            config.reference = ReferenceConfig(author="two")
+            with open(path, "w") as f:
+                f.write(config.extractXml(validate=False))
+            os.utime(path, ns=(1000000000, 1000000000))  # same size, so only the time differs
+            self.assertEqual("two", Config(xmlPath=path, validate=False).reference.author)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def testParse_043(self):
+        """
+        Parse config document containing only a collect section, with collect
+        directories that set a maximum archive size, validate=False.
+        """
+        path = self.resources["cback.conf.24"]
+        config = Config(xmlPath=path, validate=False)
+        expected = Config()
+        expected.collect = CollectConfig("/opt/backup/collect", "daily", "targz")
+        expected.collect.collectDirs = []
+        expected.collect.collectDirs.append(
+            CollectDir(absolutePath="/tmp", linkDepth=3, maxArchiveSize=ByteQuantity("650", UNIT_MBYTES))
+        )
+        expected.collect.collectDirs.append(
+            CollectDir(absolutePath="/opt", archiveMode="tar", maxArchiveSize=ByteQuantity("4.5", UNIT_GBYTES))
+        )
+        expected.collect.collectDirs.append(CollectDir(absolutePath="/ken"))
+        self.assertEqual(expected, config)
+
+    def testParse_044(self):
+        """
+        Parse config document containing only a collect section, with collect
+        directories that set a maximum archive size, validate=True.
+        """
+        path = self.resources["cback.conf.24"]
+        self.assertRaises(ValueError, Config, xmlPath=path, validate=True)
+
     #########################
     # Test the extract logic
     #########################
@@ -13983,3 +14269,14 @@ def testExtractXml_041(self):
         beforeXml = before.extractXml(validate=True)
         after = Config(xmlData=beforeXml, validate=True)
         self.assertEqual(before, after)
+
+    def testExtractXml_042(self):
+        """
+        Extract document containing only a collect section, with collect
+        directories that set a maximum archive size, validate=False.
+        """
+        path = self.resources["cback.conf.24"]
+        before = Config(xmlPath=path, validate=False)
+        beforeXml = before.extractXml(validate=False)
+        after = Config(xmlData=beforeXml, validate=False)
+        self.assertEqual(before, after)
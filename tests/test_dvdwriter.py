@@ -89,9 +89,11 @@
 import os
 import tempfile
 import unittest
+from unittest.mock import patch
 
 from CedarBackup3.testutil import buildPath, configureLogging, extractTar, findResources, removedir
 from CedarBackup3.writers.dvdwriter import MEDIA_DVDPLUSR, MEDIA_DVDPLUSRW, DvdWriter, MediaCapacity, MediaDefinition
+from CedarBackup3.writers.util import clearMediaState
 
 #######################################################################
 # Module-wide configuration and constants
@@ -213,9 +215,11 @@ def setUp(self):
             self.resources = findResources(RESOURCES, DATA_DIRS)
         except Exception as e:
             self.fail(e)
+        clearMediaState()
 
     def tearDown(self):
         removedir(self.tmpdir)
+        clearMediaState()
 
     ##################
     # Utility methods
@@ -434,6 +438,36 @@ def testInitializeImage_002(self):
         self.assertEqual("/path/to/somewhere", dvdwriter._image.tmpdir)
         self.assertEqual({}, dvdwriter._image.entries)
 
+    ##########################
+    # Test retrieveCapacity()
+    ##########################
+
+    def testRetrieveCapacity_001(self):
+        """
+        Test that the sectors used are only read once for the same media, even across writers.
+        """
+        writer = DvdWriter(device="/dev/dvd", mediaType=MEDIA_DVDPLUSR, unittest=True)
+        other = DvdWriter(device="/dev/dvd", mediaType=MEDIA_DVDPLUSR, unittest=True)
+        with patch.object(DvdWriter, "_retrieveSectorsUsed", return_value=1000.0) as retrieveSectorsUsed:
+            self.assertEqual(1000.0 * 2048.0, writer.retrieveCapacity().bytesUsed)
+            self.assertEqual(1000.0 * 2048.0, other.retrieveCapacity().bytesUsed)
+            self.assertEqual(0.0, writer.retrieveCapacity(entireDisc=True).bytesUsed)
+        self.assertEqual(1, retrieveSectorsUsed.call_count)
+
+    def testRetrieveCapacity_002(self):
+        """
+        Test that the sectors used are read again after the media is refreshed.
+        """
+        writer = DvdWriter(device="/dev/dvd", mediaType=MEDIA_DVDPLUSR, noEject=True, refreshMediaDelay=None, unittest=True)
+        with (
+            patch.object(DvdWriter, "_retrieveSectorsUsed", return_value=1000.0) as retrieveSectorsUsed,
+            patch.object(DvdWriter, "unlockTray"),
+        ):
+            writer.retrieveCapacity()
+            writer.refreshMedia()
+            writer.retrieveCapacity()
+        self.assertEqual(2, retrieveSectorsUsed.call_count)
+
     #######################
     # Test addImageEntry()
     #######################
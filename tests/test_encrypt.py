@@ -100,7 +100,14 @@
 import tempfile
 import unittest
 
-from CedarBackup3.extend.encrypt import EncryptConfig, LocalConfig, _encryptDailyDir, _encryptFile, _encryptFileWithGpg
+from CedarBackup3.extend.encrypt import (
+    EncryptConfig,
+    LocalConfig,
+    _encryptDailyDir,
+    _encryptFile,
+    _encryptFileWithGpg,
+    recordEncryptedFiles,
+)
 from CedarBackup3.filesystem import FilesystemList
 from CedarBackup3.testutil import buildPath, configureLogging, extractTar, failUnlessAssignRaises, findResources, removedir
 from CedarBackup3.xmlutil import createOutputDom, serializeDom
@@ -1120,3 +1127,20 @@ def testEncryptDailyDir_005(self):
         self.assertTrue(self.buildPath(["tree16", "cback.collect"]) in fsList)
         self.assertTrue(self.buildPath(["tree16", "cback.stage"]) in fsList)
         self.assertTrue(self.buildPath(["tree16", "cback.store"]) in fsList)
+
+    def testEncryptDailyDir_006(self):
+        """
+        Test that files recorded as encrypted by the split extension are skipped.
+        """
+        dailyDir = self.buildPath(["daily"])
+        os.makedirs(os.path.join(dailyDir, "peer"))
+        chunks = [os.path.join(dailyDir, "peer", "file_00000.gpg"), os.path.join(dailyDir, "peer", "file_00001.gpg")]
+        for chunk in chunks:
+            with open(chunk, "wb") as f:
+                f.write(b"encrypted")
+        recordEncryptedFiles(dailyDir, chunks, None, None)
+        with open(os.path.join(dailyDir, "cback.encrypted")) as f:
+            self.assertEqual(["peer/file_00000.gpg\n", "peer/file_00001.gpg\n"], f.readlines())
+        _encryptDailyDir(dailyDir, "gpg", VALID_GPG_RECIPIENT, None, None)
+        self.assertEqual(["cback.encrypted", "peer"], sorted(os.listdir(dailyDir)))
+        self.assertEqual(["file_00000.gpg", "file_00001.gpg"], sorted(os.listdir(os.path.join(dailyDir, "peer"))))
@@ -97,9 +97,26 @@
 import os
 import tarfile
 import tempfile
+import time
 import unittest
-
-from CedarBackup3.filesystem import BackupFileList, FilesystemList, PurgeItemList, compareContents, normalizeDir
+from unittest.mock import patch
+
+from CedarBackup3.filesystem import (
+    MIN_VOLUME_SIZE,
+    VALID_DIGEST_ALGORITHMS,
+    XXHASH_AVAILABLE,
+    BackupFileList,
+    FilesystemList,
+    PurgeItemList,
+    TraversalCache,
+    compareContents,
+    compareDigestMaps,
+    compareListContents,
+    normalizeDir,
+    tagDigestMap,
+    untagDigestMap,
+    verifyContents,
+)
 from CedarBackup3.testutil import (
     buildPath,
     changeFileAge,
@@ -13431,6 +13448,257 @@ def testTotalSize_006(self):
         size = backupList.totalSize()
         self.assertEqual(1116, size)
 
+    ##############################
+    # Test partitionDirContents()
+    ##############################
+
+    def testPartitionDirContents_001(self):
+        """
+        Attempt to partition a directory that doesn't exist.
+        """
+        path = self.buildPath([INVALID_FILE])
+        backupList = BackupFileList()
+        self.assertRaises(ValueError, backupList.partitionDirContents, path, 1)
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_002(self):
+        """
+        Partition a directory with a depth of zero, which yields a single partition.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        partitions = backupList.partitionDirContents(path, 0)
+        self.assertEqual(0, len(backupList))
+        self.assertEqual([path], list(partitions.keys()))
+        expected = BackupFileList()
+        expected.addDirContents(path)
+        self.assertEqual(sorted(expected), sorted(partitions[path]))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_003(self):
+        """
+        Partition a directory with a depth of one.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        partitions = backupList.partitionDirContents(path, 1)
+        self.assertEqual(0, len(backupList))
+        self.assertEqual(3, len(partitions))
+        self.assertEqual(
+            sorted([
+                self.buildPath(["tree9", "file001"]),
+                self.buildPath(["tree9", "file002"]),
+                self.buildPath(["tree9", "link001"]),
+                self.buildPath(["tree9", "link002"]),
+            ]),
+            sorted(partitions[path]),
+        )
+        for subdir in ["dir001", "dir002"]:
+            expected = BackupFileList()
+            expected.addDirContents(self.buildPath(["tree9", subdir]))
+            self.assertEqual(sorted(expected), sorted(partitions[self.buildPath(["tree9", subdir])]))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_004(self):
+        """
+        Partition a directory with a depth of two, including empty subdirectories.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        partitions = backupList.partitionDirContents(path, 2)
+        self.assertEqual(7, len(partitions))
+        self.assertEqual(4, len(partitions[path]))
+        self.assertEqual(5, len(partitions[self.buildPath(["tree9", "dir001"])]))
+        self.assertEqual(6, len(partitions[self.buildPath(["tree9", "dir002"])]))
+        self.assertEqual(0, len(partitions[self.buildPath(["tree9", "dir001", "dir001"])]))
+        self.assertEqual(0, len(partitions[self.buildPath(["tree9", "dir001", "dir002"])]))
+        self.assertEqual(0, len(partitions[self.buildPath(["tree9", "dir002", "dir001"])]))
+        self.assertEqual(0, len(partitions[self.buildPath(["tree9", "dir002", "dir002"])]))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_005(self):
+        """
+        Partition a directory with a link depth, which counts from the top of each partition.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        partitions = backupList.partitionDirContents(path, 1, linkDepth=1)
+        self.assertTrue(self.buildPath(["tree9", "link001", "file001"]) in partitions[path])
+        self.assertTrue(self.buildPath(["tree9", "link002", "file001"]) in partitions[path])
+        for subdir in ["dir001", "dir002"]:
+            expected = BackupFileList()
+            expected.addDirContents(self.buildPath(["tree9", subdir]), linkDepth=1)
+            self.assertEqual(sorted(expected), sorted(partitions[self.buildPath(["tree9", subdir])]))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_006(self):
+        """
+        Partition a directory with an excluded subdirectory, which gets no partition.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        backupList.excludePaths = [self.buildPath(["tree9", "dir001"])]
+        partitions = backupList.partitionDirContents(path, 1)
+        self.assertEqual(sorted([path, self.buildPath(["tree9", "dir002"])]), sorted(partitions.keys()))
+        self.assertEqual(4, len(partitions[path]))
+        self.assertEqual(6, len(partitions[self.buildPath(["tree9", "dir002"])]))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_007(self):
+        """
+        Partition a directory containing the ignore file, which only excludes its own entries.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        with open(self.buildPath(["tree9", "ignore"]), "w") as f:
+            f.write("")
+        backupList = BackupFileList()
+        backupList.ignoreFile = "ignore"
+        partitions = backupList.partitionDirContents(path, 1)
+        self.assertEqual(3, len(partitions))
+        self.assertEqual(0, len(partitions[path]))
+        self.assertEqual(5, len(partitions[self.buildPath(["tree9", "dir001"])]))
+        self.assertEqual(6, len(partitions[self.buildPath(["tree9", "dir002"])]))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testPartitionDirContents_008(self):
+        """
+        Partition a directory with a negative depth, which partitions every subdirectory.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        partitions = backupList.partitionDirContents(path, -1)
+        self.assertEqual(sorted(backupList.partitionDirContents(path, 2).keys()), sorted(partitions.keys()))
+
+    ##########################
+    # Test addChangedPaths()
+    ##########################
+
+    def testAddChangedPaths_001(self):
+        """
+        Attempt to add changed paths within a directory that doesn't exist.
+        """
+        path = self.buildPath([INVALID_FILE])
+        backupList = BackupFileList()
+        self.assertRaises(ValueError, backupList.addChangedPaths, path, set())
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_002(self):
+        """
+        Add an empty set of changed paths.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        self.assertEqual(0, backupList.addChangedPaths(path, set()))
+        self.assertEqual(0, len(backupList))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_003(self):
+        """
+        Add changed files and soft links, which are added but not followed.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        changed = {
+            self.buildPath(["tree9", "file001"]),
+            self.buildPath(["tree9", "dir001", "link001"]),
+            self.buildPath(["tree9", "dir002", "link001"]),
+        }
+        backupList = BackupFileList()
+        self.assertEqual(3, backupList.addChangedPaths(path, changed))
+        self.assertEqual(sorted(changed), sorted(backupList))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_004(self):
+        """
+        Add a changed directory, along with a changed path within it, which is only added once.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        changed = {self.buildPath(["tree9", "dir001"]), self.buildPath(["tree9", "dir001", "file001"])}
+        backupList = BackupFileList()
+        self.assertEqual(5, backupList.addChangedPaths(path, changed))
+        expected = BackupFileList()
+        expected.addDirContents(self.buildPath(["tree9", "dir001"]))
+        self.assertEqual(sorted(expected), sorted(backupList))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_005(self):
+        """
+        Add changed paths that no longer exist or are outside the directory, which are ignored.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        changed = {
+            path,
+            self.buildPath(["tree9", "file003"]),
+            self.buildPath(["tree9", "dir001", "dir003", "file001"]),
+            "/etc/hosts",
+        }
+        backupList = BackupFileList()
+        self.assertEqual(0, backupList.addChangedPaths(path, changed))
+        self.assertEqual(0, len(backupList))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_006(self):
+        """
+        Add changed paths beneath an excluded directory or matching an exclude pattern, which are ignored.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        changed = {
+            self.buildPath(["tree9", "file001"]),
+            self.buildPath(["tree9", "file002"]),
+            self.buildPath(["tree9", "dir001", "file001"]),
+            self.buildPath(["tree9", "dir002", "file001"]),
+        }
+        backupList = BackupFileList()
+        backupList.excludePaths = [self.buildPath(["tree9", "dir001"])]
+        backupList.excludePatterns = [r".*/file002"]
+        self.assertEqual(2, backupList.addChangedPaths(path, changed))
+        self.assertEqual(
+            sorted([self.buildPath(["tree9", "file001"]), self.buildPath(["tree9", "dir002", "file001"])]),
+            sorted(backupList),
+        )
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_007(self):
+        """
+        Add changed paths beneath a directory containing the ignore file, which are ignored.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        with open(self.buildPath(["tree9", "dir001", "ignore"]), "w") as f:
+            f.write("")
+        changed = {self.buildPath(["tree9", "dir001", "file001"]), self.buildPath(["tree9", "dir002", "file001"])}
+        backupList = BackupFileList()
+        backupList.ignoreFile = "ignore"
+        self.assertEqual(1, backupList.addChangedPaths(path, changed))
+        self.assertEqual([self.buildPath(["tree9", "dir002", "file001"])], list(backupList))
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testAddChangedPaths_008(self):
+        """
+        Add every path in a directory as changed, which adds the same entries as addDirContents().
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        changed = set()
+        for root, dirs, files in os.walk(path):
+            changed.update(os.path.join(root, name) for name in dirs + files)
+        backupList = BackupFileList()
+        backupList.addChangedPaths(path, changed)
+        expected = BackupFileList()
+        expected.addDirContents(path)
+        self.assertEqual(sorted(expected), sorted(backupList))
+
     #########################
     # Test generateSizeMap()
     #########################
@@ -13950,6 +14218,50 @@ def testGenerateDigestMap_010(self):
         self.assertEqual("3ef0b16a6237af9200b7a46c1987d6a555973847", digestMap[buildPath(["/", "file001"])])
         self.assertEqual("fae89085ee97b57ccefa7e30346c573bb0a769db", digestMap[buildPath(["/", "file002"])])
 
+    def testGenerateDigestMap_011(self):
+        """
+        Test on a non-empty list, hashing files concurrently.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        backupList.addDirContents(path)
+        prefix = normalizeDir(path)
+        self.assertEqual(
+            backupList.generateDigestMap(stripPrefix=prefix), backupList.generateDigestMap(stripPrefix=prefix, threads=4)
+        )
+        self.assertEqual(backupList.generateDigestMap(), backupList.generateDigestMap(threads=4))
+
+    def testGenerateDigestMap_012(self):
+        """
+        Test on a non-empty list, with each of the digest algorithms.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        backupList.addDirContents(path)
+        digests = []
+        for algorithm in VALID_DIGEST_ALGORITHMS:
+            if algorithm == "xxh3_128" and not XXHASH_AVAILABLE:
+                continue
+            digestMap = backupList.generateDigestMap(algorithm=algorithm)
+            self.assertEqual(6, len(digestMap))
+            self.assertEqual(digestMap, backupList.generateDigestMap(threads=4, algorithm=algorithm))
+            digests.append(digestMap[self.buildPath(["tree9", "file001"])])
+        self.assertEqual(len(digests), len(set(digests)))
+        self.assertEqual("3ef0b16a6237af9200b7a46c1987d6a555973847", digests[0])
+
+    def testGenerateDigestMap_013(self):
+        """
+        Test with an invalid digest algorithm, and with xxh3_128 if xxhash is not installed.
+        """
+        self.extractTar("tree9")
+        backupList = BackupFileList()
+        backupList.addDirContents(self.buildPath(["tree9"]))
+        self.assertRaises(ValueError, backupList.generateDigestMap, algorithm="md5")
+        if not XXHASH_AVAILABLE:
+            self.assertRaises(ValueError, backupList.generateDigestMap, algorithm="xxh3_128")
+
     ########################
     # Test generateFitted()
     ########################
@@ -15026,6 +15338,178 @@ def testGenerateTarfile_014(self):
         self.assertTrue("file002" in tarList)
         self.assertTrue("file003" in tarList)
 
+    ############################
+    # Test generateTarVolumes()
+    ############################
+
+    def testGenerateTarVolumes_001(self):
+        """
+        Test on an empty list, and with an invalid mode or maximum size.
+        """
+        backupList = BackupFileList()
+        tarPath = self.buildPath(["file.tar"])
+        self.assertRaises(ValueError, backupList.generateTarVolumes, tarPath, MIN_VOLUME_SIZE)
+        backupList.addFile(self.writeFile("file001", b"contents"))
+        self.assertRaises(ValueError, backupList.generateTarVolumes, tarPath, MIN_VOLUME_SIZE, "zip")
+        self.assertRaises(ValueError, backupList.generateTarVolumes, tarPath, MIN_VOLUME_SIZE - 1)
+        self.assertEqual(["file001"], os.listdir(self.tmpdir))
+
+    def testGenerateTarVolumes_002(self):
+        """
+        Test that files are packed into volumes without being split, in tar mode.
+        """
+        backupList = BackupFileList()
+        for i in range(5):
+            backupList.addFile(self.writeFile("file%03d" % i, os.urandom(400 * 1024)))
+        tarPath = self.buildPath(["file.tar"])
+        paths = backupList.generateTarVolumes(tarPath, MIN_VOLUME_SIZE)
+        self.assertEqual(
+            [
+                self.buildPath(["file.00001.tar"]),
+                self.buildPath(["file.00002.tar"]),
+                self.buildPath(["file.00003.tar"]),
+                self.buildPath(["file.tar.manifest"]),
+            ],
+            paths,
+        )
+        tarLists = []
+        for path in paths[:-1]:
+            self.assertTrue(os.path.getsize(path) <= MIN_VOLUME_SIZE)
+            with tarfile.open(path) as tarFile:
+                tarLists.append(tarFile.getnames())
+        self.assertEqual(
+            [
+                [self.tarPath(["file000"]), self.tarPath(["file001"])],
+                [self.tarPath(["file002"]), self.tarPath(["file003"])],
+                [self.tarPath(["file004"])],
+            ],
+            tarLists,
+        )
+        with open(paths[-1]) as f:
+            lines = f.read().splitlines()
+        self.assertEqual("file.00002.tar 0 409600 %s" % self.buildPath(["file003"]), lines[3])
+        self.assertEqual(5, len(lines))
+
+    def testGenerateTarVolumes_003(self):
+        """
+        Test that a file bigger than a volume is split into pieces, in targz mode.
+        """
+        data = os.urandom(2 * MIN_VOLUME_SIZE + 12345)
+        backupList = BackupFileList()
+        backupList.addFile(self.writeFile("small", b"contents"))
+        backupList.addFile(self.writeFile("big", data))
+        tarPath = self.buildPath(["file.tar.gz"])
+        paths = backupList.generateTarVolumes(tarPath, MIN_VOLUME_SIZE, "targz")
+        self.assertEqual(5, len(paths))
+        pieces = []
+        for path in paths[:-1]:
+            self.assertTrue(path.endswith(".tar.gz"))
+            self.assertTrue(os.path.getsize(path) <= MIN_VOLUME_SIZE)
+            with tarfile.open(path) as tarFile:
+                for member in tarFile.getmembers():
+                    if os.path.basename(member.name).startswith("big_"):
+                        pieces.append((member.name, tarFile.extractfile(member).read()))
+        self.assertEqual(["big_00001", "big_00002", "big_00003"], [os.path.basename(name) for (name, _) in pieces])
+        self.assertEqual(data, b"".join(contents for (_, contents) in pieces))
+        with open(paths[-1]) as f:
+            lines = f.read().splitlines()
+        self.assertEqual("file.00001.tar.gz 0 8 %s" % self.buildPath(["small"]), lines[0])
+        expected = []
+        offset = 0
+        for volume, (_, contents) in enumerate(pieces, 2):
+            expected.append("file.%05d.tar.gz %d %d %s" % (volume, offset, len(contents), self.buildPath(["big"])))
+            offset += len(contents)
+        self.assertEqual(expected, lines[1:])
+
+    def testGenerateTarVolumes_004(self):
+        """
+        Test on a list containing a non-existent file, with and without ignore, in tarbz2 mode.
+        """
+        backupList = BackupFileList()
+        backupList.addFile(self.writeFile("file001", b"contents"))
+        backupList.append(self.buildPath([INVALID_FILE]))  # file won't exist on disk
+        tarPath = self.buildPath(["file.tar.bz2"])
+        self.assertRaises(tarfile.TarError, backupList.generateTarVolumes, tarPath, MIN_VOLUME_SIZE, "tarbz2")
+        self.assertEqual(["file001"], os.listdir(self.tmpdir))
+        paths = backupList.generateTarVolumes(tarPath, MIN_VOLUME_SIZE, "tarbz2", ignore=True)
+        self.assertEqual([self.buildPath(["file.00001.tar.bz2"]), self.buildPath(["file.tar.bz2.manifest"])], paths)
+        with tarfile.open(paths[0]) as tarFile:
+            self.assertEqual([self.tarPath(["file001"])], tarFile.getnames())
+
+    ###########################
+    # Test splitCompressible()
+    ###########################
+
+    def writeFile(self, name, contents):
+        """Writes a file into the temporary directory, returning its path."""
+        path = self.buildPath([name])
+        with open(path, "wb") as f:
+            f.write(contents)
+        return path
+
+    def testSplitCompressible_001(self):
+        """
+        Test on an empty list.
+        """
+        backupList = BackupFileList()
+        (compressible, incompressible) = backupList.splitCompressible()
+        self.assertTrue(isinstance(compressible, BackupFileList))
+        self.assertTrue(isinstance(incompressible, BackupFileList))
+        self.assertEqual([], compressible)
+        self.assertEqual([], incompressible)
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testSplitCompressible_002(self):
+        """
+        Test on a list of small text files and soft links, which are all compressible.
+        """
+        self.extractTar("tree9")
+        backupList = BackupFileList()
+        backupList.addDirContents(self.buildPath(["tree9"]))
+        (compressible, incompressible) = backupList.splitCompressible()
+        self.assertEqual(list(backupList), list(compressible))
+        self.assertEqual([], incompressible)
+
+    def testSplitCompressible_003(self):
+        """
+        Test that files are classified by extension, regardless of case and size.
+        """
+        text = b"the quick brown fox jumps over the lazy dog\n" * 4096
+        backupList = BackupFileList()
+        backupList.addFile(self.writeFile("photo.jpg", b"small"))
+        backupList.addFile(self.writeFile("PHOTO2.JPG", text))
+        backupList.addFile(self.writeFile("syslog.1.gz", text))
+        backupList.addFile(self.writeFile("notes.txt", text))
+        backupList.addFile(self.writeFile("gz", text))
+        (compressible, incompressible) = backupList.splitCompressible()
+        self.assertEqual([self.buildPath(["notes.txt"]), self.buildPath(["gz"])], compressible)
+        self.assertEqual(
+            [self.buildPath(["photo.jpg"]), self.buildPath(["PHOTO2.JPG"]), self.buildPath(["syslog.1.gz"])], incompressible
+        )
+
+    def testSplitCompressible_004(self):
+        """
+        Test that larger files are classified by sampling their contents.
+        """
+        data = os.urandom(128 * 1024)
+        backupList = BackupFileList()
+        backupList.addFile(self.writeFile("random", data))
+        backupList.addFile(self.writeFile("small-random", data[:1024]))
+        backupList.addFile(self.writeFile("zeros", bytes(128 * 1024)))
+        backupList.addFile(self.writeFile("random-tail", bytes(8192) + data))
+        backupList.append(self.buildPath([INVALID_FILE]))  # file won't exist on disk
+        (compressible, incompressible) = backupList.splitCompressible()
+        self.assertEqual(
+            [
+                self.buildPath(["small-random"]),
+                self.buildPath(["zeros"]),
+                self.buildPath(["random-tail"]),
+                self.buildPath([INVALID_FILE]),
+            ],
+            compressible,
+        )
+        self.assertEqual([self.buildPath(["random"])], incompressible)
+
     #########################
     # Test removeUnchanged()
     #########################
@@ -15873,6 +16357,23 @@ def testRemoveUnchanged_018(self):
         self.assertEqual("3ef0b16a6237af9200b7a46c1987d6a555973847", newDigest[self.buildPath(["tree9", "file001"])])
         self.assertEqual("fae89085ee97b57ccefa7e30346c573bb0a769db", newDigest[self.buildPath(["tree9", "file002"])])
 
+    def testRemoveUnchanged_019(self):
+        """
+        Test with a digest map generated with another algorithm, with and without
+        passing that algorithm in.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        backupList = BackupFileList()
+        backupList.addDirContents(path)
+        digestMap = backupList.generateDigestMap(algorithm="blake2b")
+        self.assertEqual(0, backupList.removeUnchanged(digestMap))
+        self.assertEqual(15, len(backupList))
+        (count, newDigest) = backupList.removeUnchanged(digestMap, captureDigest=True, algorithm="blake2b")
+        self.assertEqual(6, count)
+        self.assertEqual(9, len(backupList))
+        self.assertEqual(digestMap, newDigest)
+
     #########################
     # Test _generateDigest()
     #########################
@@ -15889,6 +16390,18 @@ def testGenerateDigest_001(self):
             digest2 = BackupFileList._generateDigest(path)
             self.assertEqual(digest1, digest2, "Digest for %s varies: [%s] vs [%s]." % (path, digest1, digest2))
 
+    def testGenerateDigest_002(self):
+        """
+        Test that _generateDigest gives back the same result as hashlib for the
+        BLAKE2 algorithms, which are truncated to 160 bits.
+        """
+        for key in list(self.resources.keys()):
+            path = self.resources[key]
+            with open(path, mode="rb") as f:
+                contents = f.read()
+            self.assertEqual(hashlib.blake2b(contents, digest_size=20).hexdigest(), BackupFileList._generateDigest(path, "blake2b"))
+            self.assertEqual(hashlib.blake2s(contents, digest_size=20).hexdigest(), BackupFileList._generateDigest(path, "blake2s"))
+
 
 ##########################
 # TestPurgeItemList class
@@ -20233,6 +20746,249 @@ def testPurgeItems_009(self):
         self.assertTrue(self.buildPath(["tree11", "dir with spaces", "link with spaces"]) in fsList)
 
 
+###########################
+# TestTraversalCache class
+###########################
+
+
+class TestTraversalCache(unittest.TestCase):
+    """Tests for the TraversalCache class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        try:
+            self.tmpdir = tempfile.mkdtemp()
+            self.resources = findResources(RESOURCES, DATA_DIRS)
+        except Exception as e:
+            self.fail(e)
+
+    def tearDown(self):
+        try:
+            removedir(self.tmpdir)
+        except:
+            pass
+
+    ##################
+    # Utility methods
+    ##################
+
+    def extractTar(self, tarname):
+        """Extracts a tarfile with a particular name."""
+        extractTar(self.tmpdir, self.resources["%s.tar.gz" % tarname])
+
+    def buildPath(self, components):
+        """Builds a complete search path from a list of components."""
+        components.insert(0, self.tmpdir)
+        return buildPath(components)
+
+    ##################
+    # Test listDir()
+    ##################
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    def testListDir_001(self):
+        """
+        Test that a listing identifies files, directories and links without following links.
+        """
+        self.extractTar("tree9")
+        cache = TraversalCache()
+        self.assertEqual(None, cache.hitRate)
+        listing = cache.listDir(self.buildPath(["tree9"]))
+        self.assertEqual(
+            [("dir001", "d"), ("dir002", "d"), ("file001", "f"), ("file002", "f"), ("link001", "l"), ("link002", "l")],
+            sorted(listing),
+        )
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testListDir_002(self):
+        """
+        Test that the listing of an unchanged directory is replayed from the cache.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        cache = TraversalCache()
+        listing = cache.listDir(path)
+        self.assertEqual(listing, cache.listDir(path))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(0.5, cache.hitRate)
+
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testListDir_003(self):
+        """
+        Test that a directory is read again once an entry is added to it.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        cache = TraversalCache()
+        cache.listDir(path)
+        with open(self.buildPath(["tree9", "file003"]), "w") as f:
+            f.write("new")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000000000))  # don't rely on timestamp granularity
+        self.assertTrue(("file003", "f") in cache.listDir(path))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def testListDir_004(self):
+        """
+        Test that the listing of a recently changed directory is not cached.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        cache = TraversalCache()
+        cache.listDir(path)
+        cache.listDir(path)
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testListDir_005(self):
+        """
+        Test that the listing of a directory with a timestamp in the future is not cached.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        future = time.time_ns() + AGE_1_HOUR * 1000000000
+        os.utime(path, ns=(future, future))
+        cache = TraversalCache()
+        cache.listDir(path)
+        cache.listDir(path)
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+    def testListDir_006(self):
+        """
+        Test that listing a directory that doesn't exist raises an exception.
+        """
+        cache = TraversalCache()
+        self.assertRaises(OSError, cache.listDir, self.buildPath([INVALID_FILE]))
+
+    ###############
+    # Test save()
+    ###############
+
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testSave_001(self):
+        """
+        Test that a saved cache is replayed when it is loaded again.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        cachePath = self.buildPath(["traversal.cache"])
+        cache = TraversalCache(cachePath)
+        listing = cache.listDir(path)
+        cache.save()
+        cache = TraversalCache(cachePath)
+        self.assertEqual(listing, cache.listDir(path))
+        self.assertEqual(1, cache.hits)
+
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testSave_002(self):
+        """
+        Test that saving only keeps the directories listed during this run.
+        """
+        self.extractTar("tree9")
+        cachePath = self.buildPath(["traversal.cache"])
+        cache = TraversalCache(cachePath)
+        cache.listDir(self.buildPath(["tree9"]))
+        cache.listDir(self.buildPath(["tree9", "dir001"]))
+        cache.save()
+        cache = TraversalCache(cachePath)
+        cache.listDir(self.buildPath(["tree9"]))
+        cache.save()
+        cache = TraversalCache(cachePath)
+        cache.listDir(self.buildPath(["tree9", "dir001"]))
+        self.assertEqual(0, cache.hits)
+
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testSave_003(self):
+        """
+        Test that a cache saved in the future is discarded.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        cachePath = self.buildPath(["traversal.cache"])
+        cache = TraversalCache(cachePath)
+        cache.listDir(path)
+        with patch("CedarBackup3.filesystem.time.time_ns", return_value=time.time_ns() + AGE_1_HOUR * 1000000000):
+            cache.save()
+        cache = TraversalCache(cachePath)
+        cache.listDir(path)
+        self.assertEqual(0, cache.hits)
+
+    def testSave_004(self):
+        """
+        Test that a cache file that can't be read is ignored.
+        """
+        self.extractTar("tree9")
+        cachePath = self.buildPath(["traversal.cache"])
+        with open(cachePath, "w") as f:
+            f.write("garbage")
+        cache = TraversalCache(cachePath)
+        cache.listDir(self.buildPath(["tree9"]))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    ################################
+    # Test use with FilesystemList
+    ################################
+
+    def testFilesystemList_001(self):
+        """
+        Test that the traversal cache must be a TraversalCache.
+        """
+        fsList = FilesystemList()
+        failUnlessAssignRaises(self, ValueError, fsList, "traversalCache", "cache")
+        fsList.traversalCache = TraversalCache()
+        fsList.traversalCache = None
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testFilesystemList_002(self):
+        """
+        Test that addDirContents() finds the same entries with a cold and a warm cache.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        expected = FilesystemList()
+        expected.addDirContents(path, linkDepth=1, dereference=True)
+        cache = TraversalCache()
+        for _ in range(2):
+            fsList = FilesystemList()
+            fsList.traversalCache = cache
+            fsList.addDirContents(path, linkDepth=1, dereference=True)
+            self.assertEqual(sorted(expected), sorted(fsList))
+        self.assertTrue(cache.hits > 0)
+
+    @unittest.skipUnless(platformSupportsLinks(), "Requires soft links")
+    @patch("CedarBackup3.filesystem.TRAVERSAL_CACHE_MARGIN", 0)
+    def testFilesystemList_003(self):
+        """
+        Test that partitionDirContents() finds the same entries with a cold and a warm cache.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        expected = BackupFileList().partitionDirContents(path, 1, linkDepth=1)
+        cache = TraversalCache()
+        for _ in range(2):
+            backupList = BackupFileList()
+            backupList.traversalCache = cache
+            partitions = backupList.partitionDirContents(path, 1, linkDepth=1)
+            self.assertEqual(sorted(expected.keys()), sorted(partitions.keys()))
+            for key in expected:
+                self.assertEqual(sorted(expected[key]), sorted(partitions[key]))
+        self.assertTrue(cache.hits > 0)
+
+
 ######################
 # TestFunctions class
 ######################
@@ -20408,3 +21164,210 @@ def testCompareContents_011(self):
         path2 = self.buildPath(["path2", "tree6"])
         self.assertRaises(ValueError, compareContents, path1, path2)
         self.assertRaises(ValueError, compareContents, path1, path2, verbose=True)
+
+    def writeFiles(self, within, files):
+        """Writes a set of files, given as a mapping from relative path to contents."""
+        for name, contents in files.items():
+            path = self.buildPath([within, *name.split("/")])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(contents)
+        return self.buildPath([within])
+
+    def testCompareContents_012(self):
+        """
+        Compare two directories whose names sort differently as paths and as components.
+        """
+        files = {"a/b": "1", "a.txt": "2", "a-b": "3", "a/c/d": "4", "b": "5"}
+        path1 = self.writeFiles("path1", files)
+        path2 = self.writeFiles("path2", files)
+        compareContents(path1, path2)
+        compareContents(path1, path2, verbose=True, threads=1)
+
+    def testCompareContents_013(self):
+        """
+        Compare two directories where a file on one side is a directory on the other.
+        """
+        path1 = self.writeFiles("path1", {"a": "1", "b": "2"})
+        path2 = self.writeFiles("path2", {"a/b": "1", "b": "2"})
+        with self.assertRaisesRegex(ValueError, r"different set of files, starting with \[/a\]"):
+            compareContents(path1, path2, verbose=True)
+        with self.assertRaisesRegex(ValueError, "Consistency check failed"):
+            compareContents(path1, path2)
+
+    def testCompareContents_014(self):
+        """
+        Compare two directories containing a file of differing size, which should fail without hashing it.
+        """
+        path1 = self.writeFiles("path1", {"a": "1", "b": "22"})
+        path2 = self.writeFiles("path2", {"a": "1", "b": "222"})
+        with patch.object(BackupFileList, "_generateDigest", wraps=BackupFileList._generateDigest) as digest:
+            with self.assertRaisesRegex(ValueError, r"contents for \[/b\] vary"):
+                compareContents(path1, path2, verbose=True, threads=1)
+            for call in digest.call_args_list:
+                self.assertFalse(call.args[0].endswith("/b"))
+
+    def testCompareContents_015(self):
+        """
+        Compare two directories containing a file of the same size with differing contents.
+        """
+        files = {"file%03d" % i: "%d" % i for i in range(100)}
+        path1 = self.writeFiles("path1", files)
+        files["file050"] = "xx"
+        path2 = self.writeFiles("path2", files)
+        with self.assertRaisesRegex(ValueError, r"contents for \[/file050\] vary"):
+            compareContents(path1, path2, verbose=True)
+
+    def testCompareContents_016(self):
+        """
+        Compare a directory that doesn't exist.
+        """
+        path1 = self.writeFiles("path1", {"a": "1"})
+        self.assertRaises(ValueError, compareContents, path1, self.buildPath([INVALID_FILE]))
+        self.assertRaises(ValueError, compareContents, self.buildPath([INVALID_FILE]), path1)
+
+    #############################
+    # Test compareListContents()
+    #############################
+
+    def testCompareListContents_001(self):
+        """
+        Compare a list containing a subset of a directory with a copy of that subset.
+        """
+        self.extractTar("tree9", within="path1")
+        path1 = self.buildPath(["path1", "tree9"])
+        path2 = self.writeFiles("path2", {"dir001/file001": "", "dir001/file002": ""})
+        fileList = BackupFileList()
+        fileList.addDirContents(self.buildPath(["path1", "tree9", "dir001"]))
+        fileList.removeMatch(r".*file002.*")
+        fileList.removeMatch(r".*link.*")
+        for name in ("file001", "file002"):
+            with open(self.buildPath(["path1", "tree9", "dir001", name]), "rb") as f:
+                with open(self.buildPath(["path2", "dir001", name]), "wb") as g:
+                    g.write(f.read())
+        self.assertRaises(ValueError, compareListContents, fileList, normalizeDir(path1), path2)
+        fileList.append(self.buildPath(["path1", "tree9", "dir001", "file002"]))
+        compareListContents(fileList, normalizeDir(path1), path2, verbose=True)
+
+    ###########################
+    # Test compareDigestMaps()
+    ###########################
+
+    def testCompareDigestMaps_001(self):
+        """
+        Compare equivalent digest maps.
+        """
+        compareDigestMaps({"/a": "1", "/b": "2"}, {"/b": "2", "/a": "1"})
+        compareDigestMaps({"/a": "1", "/b": "2"}, {"/b": "2", "/a": "1"}, verbose=True)
+
+    def testCompareDigestMaps_002(self):
+        """
+        Compare digest maps with a different set of files, and with different contents.
+        """
+        with self.assertRaisesRegex(ValueError, "different set of files"):
+            compareDigestMaps({"/a": "1", "/b": "2"}, {"/a": "1", "/c": "2"}, verbose=True)
+        with self.assertRaisesRegex(ValueError, r"\[/b\] vary"):
+            compareDigestMaps({"/a": "1", "/b": "2"}, {"/a": "1", "/b": "3"}, verbose=True)
+        self.assertRaises(ValueError, compareDigestMaps, {"/a": "1"}, {"/a": "2"})
+
+    def testCompareDigestMaps_003(self):
+        """
+        Compare tagged digest maps, with the same and different algorithms.
+        """
+        compareDigestMaps(tagDigestMap({"/a": "1"}, "blake2b"), tagDigestMap({"/a": "1"}, "blake2b"), verbose=True)
+        compareDigestMaps(tagDigestMap({"/a": "1"}), {"/a": "1"})
+        with self.assertRaisesRegex(ValueError, "different algorithms"):
+            compareDigestMaps(tagDigestMap({"/a": "1"}, "blake2b"), {"/a": "1"})
+        with self.assertRaisesRegex(ValueError, "different algorithms"):
+            compareDigestMaps(tagDigestMap({"/a": "1"}, "blake2b"), tagDigestMap({"/a": "1"}, "blake2s"), verbose=True)
+
+    ##########################################
+    # Test tagDigestMap() and untagDigestMap()
+    ##########################################
+
+    def testTagDigestMap_001(self):
+        """
+        Test that a tagged digest map can be untagged, and that untagged maps are SHA-1.
+        """
+        self.assertEqual(("blake2s", {"/a": "1"}), untagDigestMap(tagDigestMap({"/a": "1"}, "blake2s")))
+        self.assertEqual(("sha1", {"/a": "1"}), untagDigestMap(tagDigestMap({"/a": "1"})))
+        self.assertEqual(("sha1", {"/a": "1"}), untagDigestMap({"/a": "1"}))
+        self.assertEqual(("sha1", {}), untagDigestMap({}))
+        self.assertEqual(("sha1", {"version": "1"}), untagDigestMap({"version": "1"}))
+
+    def testTagDigestMap_002(self):
+        """
+        Test that a digest map with an unknown format version is rejected.
+        """
+        self.assertRaises(ValueError, untagDigestMap, {"version": 3, "algorithm": "sha1", "digest": {}})
+
+    ########################
+    # Test verifyContents()
+    ########################
+
+    def buildDigest(self, path):
+        """Builds the relative digest map for a directory."""
+        backupList = BackupFileList()
+        backupList.addDirContents(path)
+        return backupList.generateDigestMap(stripPrefix=normalizeDir(path))
+
+    def testVerifyContents_001(self):
+        """
+        Verify a directory against its own digest map.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        digest = self.buildDigest(path)
+        verifyContents(path, digest)
+        verifyContents(path, digest, threads=1)
+
+    def testVerifyContents_002(self):
+        """
+        Verify a directory against a digest map for a different set of files.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        digest = self.buildDigest(path)
+        del digest[buildPath(["/", "file001"])]
+        self.assertRaises(ValueError, verifyContents, path, digest)
+        digest = self.buildDigest(path)
+        digest[buildPath(["/", "file003"])] = digest[buildPath(["/", "file001"])]
+        self.assertRaises(ValueError, verifyContents, path, digest)
+
+    def testVerifyContents_003(self):
+        """
+        Verify a directory against a digest map with differing contents, and check that every file is reported.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        digest = self.buildDigest(path)
+        digest[buildPath(["/", "file001"])] = "bogus"
+        digest[buildPath(["/", "dir001", "file002"])] = "bogus"
+        with self.assertLogs("CedarBackup3.log.filesystem", level="ERROR") as logs:
+            self.assertRaises(ValueError, verifyContents, path, digest)
+        self.assertEqual(2, len([line for line in logs.output if "vary" in line]))
+
+    def testVerifyContents_004(self):
+        """
+        Verify a directory with an extra file, which is ignored.
+        """
+        self.extractTar("tree9")
+        path = self.buildPath(["tree9"])
+        digest = self.buildDigest(path)
+        with open(self.buildPath(["tree9", "extra"]), "w") as f:
+            f.write("extra")
+        self.assertRaises(ValueError, verifyContents, path, digest)
+        verifyContents(path, digest, ignore=[buildPath(["/", "extra"])])
+        os.remove(self.buildPath(["tree9", "extra"]))
+        verifyContents(path, digest, ignore=[buildPath(["/", "extra"])])
+
+    def testVerifyContents_005(self):
+        """
+        Verify a directory against a digest map with sizes, where a size differs.
+        """
+        path = self.writeFiles("path", {"a": "1", "b": "22"})
+        digest = self.buildDigest(path)
+        verifyContents(path, digest, sizes={"/a": 1, "/b": 2})
+        with self.assertLogs("CedarBackup3.log.filesystem", level="ERROR") as logs:
+            self.assertRaises(ValueError, verifyContents, path, digest, sizes={"/a": 1, "/b": 3})
+        self.assertEqual(1, len([line for line in logs.output if "[/b]" in line]))
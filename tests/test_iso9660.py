@@ -0,0 +1,313 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Tests ISO 9660 reader functionality.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Unit tests for CedarBackup3/writers/iso9660.py.
+
+Code Coverage
+=============
+
+   This module contains individual tests for the ``IsoReader`` class and the
+   ``openMedia`` function.  The images are built in-process by
+   ``testutil.buildIsoImage``, so no external tools are required.
+
+Naming Conventions
+==================
+
+   I prefer to avoid large unit tests which validate more than one piece of
+   functionality, and I prefer to avoid using overly descriptive (read: long)
+   test names, as well.  Instead, I use lots of very small tests that each
+   validate one specific thing.  These small tests are then named with an index
+   number, yielding something like ``testAddDir_001`` or ``testValidate_010``.
+   Each method has a docstring describing what it's supposed to accomplish.  I
+   feel that this makes it easier to judge how important a given failure is,
+   and also makes it somewhat easier to diagnose and fix individual problems.
+
+Full vs. Reduced Tests
+======================
+
+   All of the tests in this module are considered safe to be run in an average
+   build environment.  There is a no need to use an ISO9660TESTS_FULL
+   environment variable to provide a "reduced feature set" test suite as for
+   some of the other test modules.
+
+@author Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Import modules and do runtime validations
+########################################################################
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from CedarBackup3.testutil import buildIsoImage, configureLogging, removedir
+from CedarBackup3.writers.iso9660 import IsoReader, openMedia
+
+#######################################################################
+# Test Case Classes
+#######################################################################
+
+
+######################
+# TestIsoReader class
+######################
+
+
+class TestIsoReader(unittest.TestCase):
+    """Tests for the IsoReader class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "source")
+        self.image = os.path.join(self.tmpdir, "image.iso")
+        self.contents = {
+            "/file001": b"one",
+            "/file002": b"",
+            "/dir001/file003": b"x" * 10000,
+            "/dir001/%s" % ("long" * 50): b"long name",
+            "/dir001/dir002/dir003/file004": b"deep",
+        }
+        for key, data in self.contents.items():
+            path = os.path.join(self.source, key[1:])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def buildImage(self, **kwargs):
+        """Builds the image from the source directory."""
+        buildIsoImage(self.image, self.source, **kwargs)
+
+    def expectedDigest(self, prefix=""):
+        """Returns the expected digest map for the source directory, relative to a prefix."""
+        return {
+            key[len(prefix) :]: hashlib.sha1(data).hexdigest()  # noqa: S324
+            for key, data in self.contents.items()
+            if key.startswith(prefix + "/")
+        }
+
+    def readDigests(self, path="/", **kwargs):
+        """Reads the digest map for a directory in the image."""
+        with IsoReader(self.image, **kwargs) as reader:
+            files = reader.listFiles(path)
+            digests = reader.generateDigests(files.values())
+            return {key: digests[isoFile] for key, isoFile in files.items()}
+
+    #####################
+    # Test the structure
+    #####################
+
+    def testStructure_001(self):
+        """
+        Test that an image with Rock Ridge extensions is recognized as such.
+        """
+        self.buildImage()
+        with IsoReader(self.image) as reader:
+            self.assertTrue(reader.rockRidge)
+            self.assertEqual(0, reader.sessionStart)
+
+    def testStructure_002(self):
+        """
+        Test that listFiles() returns the original names, including names held in a continuation area.
+        """
+        self.buildImage()
+        with IsoReader(self.image) as reader:
+            self.assertEqual(sorted(self.contents.keys()), sorted(reader.listFiles("/").keys()))
+
+    def testStructure_003(self):
+        """
+        Test that listFiles() returns keys relative to a subdirectory, with sizes.
+        """
+        self.buildImage()
+        with IsoReader(self.image) as reader:
+            files = reader.listFiles("/dir001")
+        self.assertEqual(sorted(self.expectedDigest("/dir001").keys()), sorted(files.keys()))
+        self.assertEqual(10000, files["/file003"].size)
+        self.assertTrue(files["/file003"].regular)
+
+    def testStructure_004(self):
+        """
+        Test that listFiles() raises ValueError for a directory that does not exist.
+        """
+        self.buildImage()
+        with IsoReader(self.image) as reader:
+            self.assertRaises(ValueError, reader.listFiles, "/missing")
+
+    def testStructure_005(self):
+        """
+        Test that the constructor raises ValueError for a file that is not an ISO image.
+        """
+        with open(self.image, "wb") as f:
+            f.write(b"\0" * 65536)
+        self.assertRaises(ValueError, IsoReader, self.image)
+
+    def testStructure_006(self):
+        """
+        Test that ISO 9660 identifiers are used for an image without Rock Ridge extensions.
+        """
+        self.buildImage(rockRidge=False)
+        with IsoReader(self.image) as reader:
+            self.assertFalse(reader.rockRidge)
+            keys = list(reader.listFiles("/").keys())
+        self.assertEqual(len(self.contents), len(keys))
+        self.assertFalse("/file001" in keys)
+
+    ###################
+    # Test the digests
+    ###################
+
+    def testDigest_001(self):
+        """
+        Test that generateDigests() matches the SHA-1 digest of the original files.
+        """
+        self.buildImage()
+        self.assertEqual(self.expectedDigest(), self.readDigests())
+
+    def testDigest_002(self):
+        """
+        Test that files split across several extents are read completely.
+        """
+        self.buildImage(maxExtent=4096)
+        self.assertEqual(self.expectedDigest(), self.readDigests())
+
+    def testDigest_003(self):
+        """
+        Test that relocated directories are found in their original location.
+        """
+        self.buildImage(relocateDepth=1)
+        self.assertEqual(self.expectedDigest(), self.readDigests())
+
+    def testDigest_004(self):
+        """
+        Test that a session which does not start at sector zero is read when its start is passed in.
+        """
+        self.buildImage(sessionStart=100)
+        self.assertEqual(self.expectedDigest(), self.readDigests(sessionStart=100))
+
+    #######################
+    # Test verifyContents()
+    #######################
+
+    def testVerify_001(self):
+        """
+        Test that verifyContents() succeeds when the directory matches the digest map.
+        """
+        self.buildImage()
+        with IsoReader(self.image) as reader:
+            reader.verifyContents("/dir001", self.expectedDigest("/dir001"))
+
+    def testVerify_002(self):
+        """
+        Test that verifyContents() fails when a file is missing from the image.
+        """
+        self.buildImage()
+        digest = self.expectedDigest()
+        digest["/file005"] = digest["/file001"]
+        with IsoReader(self.image) as reader:
+            self.assertRaises(ValueError, reader.verifyContents, "/", digest)
+
+    def testVerify_003(self):
+        """
+        Test that verifyContents() fails when the image has an unexpected file, unless it is ignored.
+        """
+        self.buildImage()
+        digest = self.expectedDigest()
+        del digest["/file001"]
+        with IsoReader(self.image) as reader:
+            self.assertRaises(ValueError, reader.verifyContents, "/", digest)
+            reader.verifyContents("/", digest, ignore=["/file001"])
+
+    def testVerify_004(self):
+        """
+        Test that verifyContents() fails when a file's contents differ.
+        """
+        self.buildImage()
+        digest = self.expectedDigest()
+        digest["/file001"] = digest["/file002"]
+        with IsoReader(self.image) as reader:
+            self.assertRaises(ValueError, reader.verifyContents, "/", digest)
+
+    def testVerify_005(self):
+        """
+        Test that verifyContents() fails when a file's size differs, even if the digest matches.
+        """
+        self.buildImage()
+        with IsoReader(self.image) as reader:
+            self.assertRaises(ValueError, reader.verifyContents, "/", self.expectedDigest(), sizes={"/file001": 4})
+
+    ###################
+    # Test openMedia()
+    ###################
+
+    def testOpen_001(self):
+        """
+        Test that openMedia() returns a reader for an image with Rock Ridge extensions.
+        """
+        self.buildImage()
+        reader = openMedia(self.image)
+        self.assertNotEqual(None, reader)
+        reader.close()
+
+    def testOpen_002(self):
+        """
+        Test that openMedia() returns None for an image without Rock Ridge extensions.
+        """
+        self.buildImage(rockRidge=False)
+        self.assertEqual(None, openMedia(self.image))
+
+    def testOpen_003(self):
+        """
+        Test that openMedia() returns None for media that can't be read.
+        """
+        self.assertEqual(None, openMedia(os.path.join(self.tmpdir, "missing")))
@@ -0,0 +1,466 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Tests change journal functionality.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Unit tests for CedarBackup3/journal.py.
+
+Code Coverage
+=============
+
+   This module contains individual tests for reading, writing and compacting
+   the change journal, and for the ``ChangeWatcher`` class running against
+   real inotify.
+
+Naming Conventions
+==================
+
+   I prefer to avoid large unit tests which validate more than one piece of
+   functionality, and I prefer to avoid using overly descriptive (read: long)
+   test names, as well.  Instead, I use lots of very small tests that each
+   validate one specific thing.  These small tests are then named with an index
+   number, yielding something like ``testAddDir_001`` or ``testValidate_010``.
+   Each method has a docstring describing what it's supposed to accomplish.  I
+   feel that this makes it easier to judge how important a given failure is,
+   and also makes it somewhat easier to diagnose and fix individual problems.
+
+Full vs. Reduced Tests
+======================
+
+   All of the tests in this module are considered safe to be run in an average
+   build environment.  The tests for the ``ChangeWatcher`` class are skipped
+   on platforms without inotify.
+
+@author Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Import modules and do runtime validations
+########################################################################
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from CedarBackup3.journal import (
+    IN_DELETE_SELF,
+    IN_Q_OVERFLOW,
+    INOTIFY_AVAILABLE,
+    JOURNAL_FILE,
+    RECORD_BARRIER,
+    RECORD_CHANGED,
+    RECORD_OVERFLOW,
+    RECORD_START,
+    RECORD_WATCHED,
+    ChangeWatcher,
+    JournalChanges,
+    _encodeRecords,
+    _readRecords,
+    mergeDigest,
+    readChanges,
+    readJournal,
+    requestBarrier,
+    saveJournalState,
+)
+from CedarBackup3.testutil import configureLogging, removedir
+
+#######################################################################
+# Utility functions
+#######################################################################
+
+
+def _appendRecords(workingDir, records):
+    """Appends records to the journal in a working directory, returning the new size."""
+    with open(os.path.join(workingDir, JOURNAL_FILE), "ab") as f:
+        f.write(_encodeRecords(records))
+        return f.tell()
+
+
+#######################################################################
+# Test Case Classes
+#######################################################################
+
+
+######################
+# TestJournal class
+######################
+
+
+class TestJournal(unittest.TestCase):
+    """Tests for reading, writing and compacting the change journal."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, "root")
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def collect(self, records, token, fingerprints=None):
+        """Appends records ending with a barrier, then reads and saves the journal like a collect."""
+        _appendRecords(self.tmpdir, [*records, (RECORD_BARRIER, token)])
+        changes = readJournal(self.tmpdir, token)
+        saveJournalState(self.tmpdir, changes, fingerprints if fingerprints is not None else {self.root: "x"})
+        return changes
+
+    ######################
+    # Test record format
+    ######################
+
+    def testRecords_001(self):
+        """
+        Check that records survive a round trip, including non-ASCII paths.
+        """
+        records = [(RECORD_START, "abc"), (RECORD_CHANGED, "/tmp/été"), (RECORD_OVERFLOW, "")]
+        path = os.path.join(self.tmpdir, JOURNAL_FILE)
+        _appendRecords(self.tmpdir, records)
+        with open(path, "rb") as f:
+            result = list(_readRecords(f, 0))
+        self.assertEqual(records, [(code, payload) for (code, payload, _) in result])
+        self.assertEqual(os.path.getsize(path), result[-1][2])
+
+    def testRecords_002(self):
+        """
+        Check that a trailing partial record is ignored.
+        """
+        path = os.path.join(self.tmpdir, JOURNAL_FILE)
+        _appendRecords(self.tmpdir, [(RECORD_CHANGED, "/one")])
+        with open(path, "ab") as f:
+            f.write(b"C/tw")
+        with open(path, "rb") as f:
+            result = list(_readRecords(f, 0))
+        self.assertEqual([(RECORD_CHANGED, "/one", 6)], result)
+
+    ####################
+    # Test readJournal()
+    ####################
+
+    def testReadJournal_001(self):
+        """
+        Check that None is returned if there is no journal, or the barrier has not been reached.
+        """
+        self.assertEqual(None, readJournal(self.tmpdir, "token"))
+        _appendRecords(self.tmpdir, [(RECORD_START, "s"), (RECORD_BARRIER, "other")])
+        self.assertEqual(None, readJournal(self.tmpdir, "token"))
+
+    def testReadJournal_002(self):
+        """
+        Check that the journal is not trusted without a saved position.
+        """
+        changes = self.collect([(RECORD_START, "s"), (RECORD_WATCHED, self.root)], "t1")
+        self.assertFalse(changes.trusted)
+        self.assertEqual(None, changes.getChanges(self.root, "x"))
+
+    def testReadJournal_003(self):
+        """
+        Check that changes since the saved position are read, up to the barrier.
+        """
+        self.collect([(RECORD_START, "s"), (RECORD_WATCHED, self.root)], "t1")
+        changed = [os.path.join(self.root, "a"), os.path.join(self.root, "b"), os.path.join(self.tmpdir, "other")]
+        changes = self.collect([(RECORD_CHANGED, path) for path in changed] + [(RECORD_WATCHED, self.root)], "t2")
+        _appendRecords(self.tmpdir, [(RECORD_CHANGED, os.path.join(self.root, "later"))])
+        self.assertTrue(changes.trusted)
+        self.assertEqual(set(changed), changes.changed)
+        self.assertEqual(set(changed[:2]), changes.getChanges(self.root, "x"))
+        self.assertEqual(set(changed[:2]), changes.getChanges(self.root + "/", "x"))
+
+    def testReadJournal_004(self):
+        """
+        Check that the journal is not trusted if the watcher was restarted since the saved position.
+        """
+        self.collect([(RECORD_START, "s"), (RECORD_WATCHED, self.root)], "t1")
+        changes = self.collect([(RECORD_START, "s2"), (RECORD_WATCHED, self.root)], "t2")
+        self.assertFalse(changes.trusted)
+        self.assertEqual(None, changes.getChanges(self.root, "x"))
+
+    def testReadJournal_005(self):
+        """
+        Check that a collect directory is not watched unless the barrier says so.
+        """
+        self.collect([(RECORD_START, "s"), (RECORD_WATCHED, self.root)], "t1")
+        _appendRecords(self.tmpdir, [(RECORD_WATCHED, self.root), (RECORD_BARRIER, "someone-else")])
+        changes = self.collect([(RECORD_OVERFLOW, self.root)], "t2")
+        self.assertTrue(changes.trusted)
+        self.assertEqual(set(), changes.watched)
+        self.assertEqual(None, changes.getChanges(self.root, "x"))
+
+    def testReadJournal_006(self):
+        """
+        Check that an overflow prevents use of the journal for all collect directories.
+        """
+        self.collect([(RECORD_START, "s"), (RECORD_WATCHED, self.root)], "t1")
+        changes = self.collect([(RECORD_OVERFLOW, ""), (RECORD_WATCHED, self.root)], "t2")
+        self.assertEqual(None, changes.getChanges(self.root, "x"))
+
+    def testReadJournal_007(self):
+        """
+        Check that a changed fingerprint prevents use of the journal.
+        """
+        self.collect([(RECORD_START, "s"), (RECORD_WATCHED, self.root)], "t1")
+        changes = self.collect([(RECORD_WATCHED, self.root)], "t2")
+        self.assertEqual(set(), changes.getChanges(self.root, "x"))
+        self.assertEqual(None, changes.getChanges(self.root, "y"))
+        self.assertEqual(None, changes.getChanges(os.path.join(self.tmpdir, "unknown"), "x"))
+
+    #####################
+    # Test compaction
+    #####################
+
+    def testCompact_001(self):
+        """
+        Check that compaction keeps unconsumed changes once each, and the saved position stays usable.
+        """
+        self.collect([(RECORD_START, "s"), (RECORD_CHANGED, "/consumed"), (RECORD_WATCHED, self.root)], "t1")
+        before = _appendRecords(self.tmpdir, [(RECORD_CHANGED, "/a"), (RECORD_CHANGED, "/b"), (RECORD_CHANGED, "/a")])
+        watcher = ChangeWatcher(self.tmpdir, [self.root])
+        watcher._journal = os.open(os.path.join(self.tmpdir, JOURNAL_FILE), os.O_WRONLY | os.O_APPEND)
+        try:
+            watcher._compact()
+            after = os.path.getsize(os.path.join(self.tmpdir, JOURNAL_FILE))
+            self.assertTrue(after < before)
+            changes = self.collect([(RECORD_WATCHED, self.root)], "t2")
+            self.assertTrue(changes.trusted)
+            self.assertEqual({"/a", "/b"}, changes.changed)
+            watcher._compact()  # the consumer's position is now in the compacted journal
+            changes = self.collect([(RECORD_CHANGED, "/c"), (RECORD_WATCHED, self.root)], "t3")
+            self.assertTrue(changes.trusted)
+            self.assertEqual({"/c"}, changes.changed)
+        finally:
+            os.close(watcher._journal)
+
+    def testCompact_002(self):
+        """
+        Check that compaction without a saved position leaves a journal that is not trusted.
+        """
+        _appendRecords(self.tmpdir, [(RECORD_START, "s"), (RECORD_CHANGED, "/a")])
+        watcher = ChangeWatcher(self.tmpdir, [self.root])
+        watcher._journal = os.open(os.path.join(self.tmpdir, JOURNAL_FILE), os.O_WRONLY | os.O_APPEND)
+        try:
+            watcher._compact()
+            changes = self.collect([(RECORD_WATCHED, self.root)], "t1")
+            self.assertFalse(changes.trusted)
+            self.assertEqual(set(), changes.changed)
+        finally:
+            os.close(watcher._journal)
+
+    #######################
+    # Test requestBarrier()
+    #######################
+
+    def testRequestBarrier_001(self):
+        """
+        Check that no barrier is requested if the watcher has never run.
+        """
+        self.assertEqual(None, requestBarrier(self.tmpdir))
+        self.assertEqual(None, readChanges(self.tmpdir, timeout=0))
+
+    def testRequestBarrier_002(self):
+        """
+        Check that no barrier is requested if the watcher is not running anymore.
+        """
+        with open(os.path.join(self.tmpdir, "change.journal.lock"), "w") as f:
+            f.write("1\n")
+        self.assertEqual(None, requestBarrier(self.tmpdir))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "change.journal.barrier")))
+
+    ####################
+    # Test mergeDigest()
+    ####################
+
+    def testMergeDigest_001(self):
+        """
+        Check that changed files are replaced, removed or added, and other entries are kept.
+        """
+        oldDigest = {"/r/a": "1", "/r/b": "2", "/r/c": "3"}
+        captured = {"/r/a": "9", "/r/d": "4"}
+        self.assertEqual({"/r/a": "9", "/r/c": "3", "/r/d": "4"}, mergeDigest(oldDigest, captured, {"/r/a", "/r/b", "/r/d"}))
+
+    def testMergeDigest_002(self):
+        """
+        Check that entries beneath a changed directory are replaced, but not entries that only share a prefix.
+        """
+        oldDigest = {"/r/dir/a": "1", "/r/dir/sub/b": "2", "/r/dir2/c": "3", "/r/dirx": "4"}
+        captured = {"/r/dir/a": "1"}
+        self.assertEqual({"/r/dir/a": "1", "/r/dir2/c": "3", "/r/dirx": "4"}, mergeDigest(oldDigest, captured, {"/r/dir"}))
+
+    def testMergeDigest_003(self):
+        """
+        Check that the old digest is not modified.
+        """
+        oldDigest = {"/r/a": "1"}
+        mergeDigest(oldDigest, {}, {"/r/a"})
+        self.assertEqual({"/r/a": "1"}, oldDigest)
+
+    ######################
+    # Test JournalChanges
+    ######################
+
+    def testJournalChanges_001(self):
+        """
+        Check that a changed path is only reported for the collect directory it is within.
+        """
+        changes = JournalChanges(True, {"/r1/a", "/r10/b"}, set(), {"/r1", "/r10"}, 1, 0, {"/r1": "x", "/r10": "x"})
+        self.assertEqual({"/r1/a"}, changes.getChanges("/r1", "x"))
+        self.assertEqual({"/r10/b"}, changes.getChanges("/r10", "x"))
+
+
+###########################
+# TestChangeWatcher class
+###########################
+
+
+@unittest.skipUnless(INOTIFY_AVAILABLE, "Requires inotify")
+class TestChangeWatcher(unittest.TestCase):
+    """Tests for the ChangeWatcher class, against real inotify."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.workingDir = os.path.join(self.tmpdir, "work")
+        self.root = os.path.join(self.tmpdir, "root")
+        os.makedirs(self.workingDir)
+        os.makedirs(os.path.join(self.root, "sub"))
+        self.watcher = ChangeWatcher(self.workingDir, [self.root])
+        self.stop = threading.Event()
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def start(self):
+        """Starts the watcher in a background thread, and waits until it is watching."""
+        self.thread = threading.Thread(target=self.watcher.run, args=(self.stop,))
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while self.watcher.watches < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def collect(self):
+        """Reads and saves the journal like a collect."""
+        changes = readChanges(self.workingDir, timeout=10)
+        saveJournalState(self.workingDir, changes, {self.root: "x"})
+        return changes
+
+    ##################
+    # Test watching
+    ##################
+
+    def testWatch_001(self):
+        """
+        Check that changed files and new directories are journaled, and the working directory is not.
+        """
+        self.start()
+        self.assertFalse(self.collect().trusted)
+        with open(os.path.join(self.root, "sub", "file"), "w") as f:
+            f.write("data")
+        os.makedirs(os.path.join(self.root, "new", "deep"))
+        changes = self.collect()
+        self.assertTrue(changes.trusted)
+        changed = changes.getChanges(self.root, "x")
+        changed.discard(os.path.join(self.root, "new", "deep"))  # also reported if created after the watch on new
+        self.assertEqual({os.path.join(self.root, "sub", "file"), os.path.join(self.root, "new")}, changed)
+        with open(os.path.join(self.root, "new", "deep", "file"), "w") as f:
+            f.write("data")
+        self.assertEqual({os.path.join(self.root, "new", "deep", "file")}, self.collect().getChanges(self.root, "x"))
+
+    def testWatch_002(self):
+        """
+        Check that a second watcher can't run against the same working directory.
+        """
+        self.start()
+        other = ChangeWatcher(self.workingDir, [self.root])
+        self.assertRaises(ValueError, other.open)
+
+    def testWatch_003(self):
+        """
+        Check that an overflow of the event queue is journaled.
+        """
+        self.start()
+        self.collect()
+        self.watcher._handleEvent(-1, IN_Q_OVERFLOW, 0, "")
+        changes = self.collect()
+        self.assertEqual({""}, changes.overflow)
+        self.assertEqual(None, changes.getChanges(self.root, "x"))
+
+    def testWatch_004(self):
+        """
+        Check that a collect directory that is removed is no longer watched.
+        """
+        self.start()
+        self.collect()
+        wd = next(wd for (wd, path) in self.watcher._paths.items() if path == self.root)
+        self.watcher._handleEvent(wd, IN_DELETE_SELF, 0, "")
+        changes = self.collect()
+        self.assertEqual({self.root}, self.watcher.degraded)
+        self.assertEqual(None, changes.getChanges(self.root, "x"))
+
+    def testWatch_005(self):
+        """
+        Check that readChanges() returns None once the watcher has stopped.
+        """
+        self.start()
+        self.stop.set()
+        self.thread.join()
+        self.thread = None
+        self.assertEqual(None, readChanges(self.workingDir, timeout=1))
@@ -89,10 +89,26 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import datetime
+import os
+import tarfile
+import tempfile
 import unittest
-
-from CedarBackup3.extend.mbox import LocalConfig, MboxConfig, MboxDir, MboxFile
-from CedarBackup3.testutil import configureLogging, failUnlessAssignRaises, findResources
+from unittest.mock import patch
+
+from CedarBackup3.config import CollectConfig, Config, OptionsConfig
+from CedarBackup3.extend.mbox import (
+    LocalConfig,
+    MboxConfig,
+    MboxDir,
+    MboxFile,
+    _backupMboxDir,
+    _backupMboxFile,
+    _extractMailbox,
+    _extractMessages,
+    _getResumeOffset,
+)
+from CedarBackup3.testutil import configureLogging, failUnlessAssignRaises, findResources, removedir
 from CedarBackup3.xmlutil import createOutputDom, serializeDom
 
 #######################################################################
@@ -110,6 +126,17 @@
     "mbox.conf.4",
 ]
 
+MESSAGE = (
+    "From sender@example.com Sat Jun 24 12:00:00 2006\n"
+    "Received: from mail.example.com by host.example.com; %(date)s\n"
+    "Message-ID: <%(id)s@example.com>\n"
+    "Subject: message %(id)s\n"
+    "\n"
+    "Body of message %(id)s.\n"
+    ">From the body, escaped.\n"
+    "\n"
+)
+
 
 #######################################################################
 # Test Case Classes
@@ -2276,3 +2303,326 @@ def testAddConfig_022(self):
         config = LocalConfig()
         config.mbox = mbox
         self.validateAddConfig(config)
+
+
+######################
+# TestFunctions class
+######################
+
+
+class TestFunctions(unittest.TestCase):
+    """Tests for the functions in mbox.py."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        try:
+            self.tmpdir = tempfile.mkdtemp()
+        except Exception as e:
+            self.fail(e)
+
+    def tearDown(self):
+        try:
+            removedir(self.tmpdir)
+        except:
+            pass
+
+    ##################
+    # Utility methods
+    ##################
+
+    def writeMailbox(self, name, messages, mode="w"):
+        """Writes (or appends) messages, a list of (id, date) tuples, to a mailbox."""
+        path = os.path.join(self.tmpdir, name)
+        with open(path, mode) as f:
+            f.writelines(MESSAGE % {"id": message, "date": date} for message, date in messages)
+        return path
+
+    def extract(self, path, **kwargs):
+        """Extracts messages from a mailbox, returning (result, output)."""
+        outputPath = os.path.join(self.tmpdir, "output")
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            with open(outputPath, "wb") as outputFile:
+                result = _extractMessages(fd, outputFile, **kwargs)
+        finally:
+            os.close(fd)
+        with open(outputPath) as f:
+            return (result, f.read())
+
+    def buildConfig(self):
+        """Builds a Cedar Backup configuration that works within the temporary directory."""
+        for name in ("working", "target"):
+            if not os.path.exists(os.path.join(self.tmpdir, name)):
+                os.mkdir(os.path.join(self.tmpdir, name))
+        config = Config()
+        config.options = OptionsConfig(workingDir=os.path.join(self.tmpdir, "working"))
+        config.collect = CollectConfig(targetDir=os.path.join(self.tmpdir, "target"))
+        return config
+
+    def readTarfile(self, path):
+        """Reads a tarfile, returning a dictionary mapping member name to contents."""
+        with tarfile.open(path) as tar:
+            return {member.name: tar.extractfile(member).read().decode() for member in tar.getmembers()}
+
+    def backup(self, path, lastRevision, index):
+        """Runs an incremental backup of a mailbox into the temporary directory, returning the output."""
+        targetDir = os.path.join(self.tmpdir, "target")
+        if not os.path.exists(targetDir):
+            os.mkdir(targetDir)
+        newRevision = datetime.datetime(2006, 6, 30)
+        backupPath = _backupMboxFile(None, path, False, "incr", "none", lastRevision, newRevision, targetDir=targetDir, index=index)
+        with open(backupPath) as f:
+            return f.read()
+
+    ##########################
+    # Test _extractMessages()
+    ##########################
+
+    def testExtractMessages_001(self):
+        """
+        Test with an empty mailbox.
+        """
+        path = self.writeMailbox("mbox", [])
+        (result, output) = self.extract(path)
+        self.assertEqual((0, None, 0), result)
+        self.assertEqual("", output)
+
+    def testExtractMessages_002(self):
+        """
+        Test with several messages and no date filter.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Sun, 25 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", messages)
+        (result, output) = self.extract(path)
+        self.assertEqual(2, result[0])
+        self.assertEqual(len(MESSAGE % {"id": "1", "date": messages[0][1]}), result[1])
+        self.assertEqual(os.stat(path).st_size, result[2])
+        with open(path) as f:
+            self.assertEqual(f.read(), output)
+
+    def testExtractMessages_003(self):
+        """
+        Test that messages received before the date filter are skipped.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Sun, 25 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", messages)
+        since = datetime.datetime(2006, 6, 25, tzinfo=datetime.UTC).timestamp()
+        (result, output) = self.extract(path, since=since)
+        self.assertEqual(1, result[0])
+        self.assertEqual(MESSAGE % {"id": "2", "date": messages[1][1]}, output)
+
+    def testExtractMessages_004(self):
+        """
+        Test that duplicate messages are only written once.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("1", "Sat, 24 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", messages)
+        (result, output) = self.extract(path)
+        self.assertEqual(1, result[0])
+        self.assertEqual(MESSAGE % {"id": "1", "date": messages[0][1]}, output)
+
+    def testExtractMessages_005(self):
+        """
+        Test that messages with no usable date are never skipped.
+        """
+        messages = [("1", "not a date")]
+        path = self.writeMailbox("mbox", messages)
+        with open(path, "r+") as f:
+            content = f.read().replace("Sat Jun 24 12:00:00 2006", "garbage")
+            f.seek(0)
+            f.write(content)
+        since = datetime.datetime(2006, 6, 25, tzinfo=datetime.UTC).timestamp()
+        (result, _) = self.extract(path, since=since)
+        self.assertEqual(1, result[0])
+
+    def testExtractMessages_006(self):
+        """
+        Test that content past the end offset is left alone.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Sun, 25 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", messages)
+        length = len(MESSAGE % {"id": "1", "date": messages[0][1]})
+        (result, output) = self.extract(path, endOffset=length + 10)
+        self.assertEqual((1, 0, length), result)
+        self.assertEqual(MESSAGE % {"id": "1", "date": messages[0][1]}, output)
+
+    #########################
+    # Test _backupMboxFile()
+    #########################
+
+    def testBackupMboxFile_001(self):
+        """
+        Test that an appended mailbox is extracted from the old end of file.
+        """
+        old = [("1", "Sat, 24 Jun 2006 12:00:00 +0000")]
+        new = [("2", "Fri, 23 Jun 2006 12:00:00 +0000")]  # older date, but appended since last backup
+        path = self.writeMailbox("mbox", old)
+        index = {}
+        lastRevision = datetime.datetime(2006, 6, 1)
+        self.assertEqual(MESSAGE % {"id": "1", "date": old[0][1]}, self.backup(path, lastRevision, index))
+        self.assertEqual(os.stat(path).st_size, index[path]["size"])
+        self.writeMailbox("mbox", new, mode="a")
+        lastRevision = datetime.datetime(2006, 6, 28)
+        self.assertEqual(MESSAGE % {"id": "2", "date": new[0][1]}, self.backup(path, lastRevision, index))
+        self.assertEqual(os.stat(path).st_size, index[path]["size"])
+
+    def testBackupMboxFile_002(self):
+        """
+        Test that a rewritten mailbox falls back to a full scan by date.
+        """
+        old = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Sat, 24 Jun 2006 13:00:00 +0000")]
+        new = [("3", "Sat, 24 Jun 2006 12:00:00 +0000"), ("4", "Thu, 29 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", old)
+        index = {}
+        self.backup(path, datetime.datetime(2006, 6, 1), index)
+        self.writeMailbox("mbox", new)
+        lastRevision = datetime.datetime(2006, 6, 28)
+        self.assertEqual(MESSAGE % {"id": "4", "date": new[1][1]}, self.backup(path, lastRevision, index))
+
+    def testBackupMboxFile_003(self):
+        """
+        Test that a mailbox with no index entry gets a full scan by date.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Thu, 29 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", messages)
+        index = {}
+        lastRevision = datetime.datetime(2006, 6, 28)
+        self.assertEqual(MESSAGE % {"id": "2", "date": messages[1][1]}, self.backup(path, lastRevision, index))
+        self.assertIn(path, index)
+
+    def testBackupMboxFile_004(self):
+        """
+        Test that a message still being delivered during the last backup is backed up in full.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Sun, 25 Jun 2006 12:00:00 +0000")]
+        first = MESSAGE % {"id": "1", "date": messages[0][1]}
+        second = MESSAGE % {"id": "2", "date": messages[1][1]}
+        split = second.index(">From")
+        path = os.path.join(self.tmpdir, "mbox")
+        with open(path, "w") as f:
+            f.write(first + second[:split])
+        index = {}
+        self.assertEqual(first + second[:split], self.backup(path, datetime.datetime(2006, 6, 1), index))
+        with open(path, "a") as f:
+            f.write(second[split:])
+        self.assertEqual(second, self.backup(path, datetime.datetime(2006, 6, 28), index))
+        self.assertEqual(os.stat(path).st_size, index[path]["size"])
+
+    ###########################
+    # Test _getResumeOffset()
+    ###########################
+
+    def testGetResumeOffset_001(self):
+        """
+        Test with no index entry, a truncated mailbox and a replaced mailbox.
+        """
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000"), ("2", "Sun, 25 Jun 2006 12:00:00 +0000")]
+        path = self.writeMailbox("mbox", messages)
+        index = {}
+        self.backup(path, datetime.datetime(2006, 6, 1), index)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self.assertEqual(None, _getResumeOffset(fd, os.fstat(fd), None))
+            self.assertEqual(os.stat(path).st_size, _getResumeOffset(fd, os.fstat(fd), index[path]))
+            os.truncate(path, 10)
+            self.assertEqual(None, _getResumeOffset(fd, os.fstat(fd), index[path]))
+        finally:
+            os.close(fd)
+        os.remove(path)
+        self.writeMailbox("mbox", messages)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            entry = dict(index[path], inode=-1)
+            self.assertEqual(None, _getResumeOffset(fd, os.fstat(fd), entry))
+        finally:
+            os.close(fd)
+
+    ########################
+    # Test _backupMboxDir()
+    ########################
+
+    def testBackupMboxDir_001(self):
+        """
+        Test with an empty directory.
+        """
+        config = self.buildConfig()
+        os.mkdir(os.path.join(self.tmpdir, "mail"))
+        path = os.path.join(self.tmpdir, "mail")
+        newRevision = datetime.datetime(2006, 6, 30)
+        self.assertRaises(ValueError, _backupMboxDir, config, path, True, "daily", "none", None, newRevision, [], [])
+
+    def testBackupMboxDir_002(self):
+        """
+        Test with several mailboxes, one excluded, and gzip compression.
+        """
+        config = self.buildConfig()
+        os.mkdir(os.path.join(self.tmpdir, "mail"))
+        expected = {}
+        for i in range(20):
+            name = "mbox%02d" % i
+            messages = [("%d-%d" % (i, j), "Sat, 24 Jun 2006 12:00:00 +0000") for j in range(i + 1)]
+            self.writeMailbox(os.path.join("mail", name), messages)
+            expected[name] = "".join(MESSAGE % {"id": message, "date": date} for message, date in messages)
+        del expected["mbox05"]
+        path = os.path.join(self.tmpdir, "mail")
+        excludePaths = [os.path.join(path, "mbox05")]
+        newRevision = datetime.datetime(2006, 6, 30)
+        index = {}
+        _backupMboxDir(config, path, True, "incr", "gzip", None, newRevision, excludePaths, [], index=index)
+        tarfilePath = os.path.join(self.tmpdir, "target", "mbox-20060630-%s.tar.gz" % path.strip("/").replace("/", "-"))
+        self.assertEqual(expected, self.readTarfile(tarfilePath))
+        self.assertEqual({os.path.join(path, name) for name in expected}, set(index.keys()))
+        self.assertEqual([], os.listdir(os.path.join(self.tmpdir, "working")))
+
+    def testBackupMboxDir_003(self):
+        """
+        Test an incremental backup after mail is appended, with a stale index entry.
+        """
+        config = self.buildConfig()
+        os.mkdir(os.path.join(self.tmpdir, "mail"))
+        old = [("1", "Sat, 24 Jun 2006 12:00:00 +0000")]
+        new = [("2", "Sun, 25 Jun 2006 12:00:00 +0000")]
+        mbox1 = self.writeMailbox(os.path.join("mail", "mbox1"), old)
+        mbox2 = self.writeMailbox(os.path.join("mail", "mbox2"), old)
+        path = os.path.join(self.tmpdir, "mail")
+        index = {}
+        _backupMboxDir(config, path, True, "incr", "none", None, datetime.datetime(2006, 6, 24), [], [], index=index)
+        self.writeMailbox(os.path.join("mail", "mbox1"), new, mode="a")
+        index[os.path.join(path, "gone")] = index[mbox2]
+        lastRevision = datetime.datetime(2006, 6, 28)
+        _backupMboxDir(config, path, False, "incr", "none", lastRevision, datetime.datetime(2006, 6, 30), [], [], index=index)
+        tarfilePath = os.path.join(self.tmpdir, "target", "mbox-20060630-%s.tar" % path.strip("/").replace("/", "-"))
+        expected = {"mbox1": MESSAGE % {"id": "2", "date": new[0][1]}, "mbox2": ""}
+        self.assertEqual(expected, self.readTarfile(tarfilePath))
+        self.assertEqual({mbox1, mbox2}, set(index.keys()))
+
+    def testBackupMboxDir_004(self):
+        """
+        Test that a mailbox that can't be read is skipped, keeping its old index entry.
+        """
+        config = self.buildConfig()
+        os.mkdir(os.path.join(self.tmpdir, "mail"))
+        messages = [("1", "Sat, 24 Jun 2006 12:00:00 +0000")]
+        self.writeMailbox(os.path.join("mail", "mbox1"), messages)
+        broken = self.writeMailbox(os.path.join("mail", "mbox2"), messages)
+        path = os.path.join(self.tmpdir, "mail")
+        index = {broken: {"size": 0}}
+        newRevision = datetime.datetime(2006, 6, 30)
+
+        def extractMailbox(absolutePath, *args):
+            if absolutePath == broken:
+                raise PermissionError("Permission denied: [%s]" % absolutePath)
+            return _extractMailbox(absolutePath, *args)
+
+        with patch("CedarBackup3.extend.mbox._extractMailbox", side_effect=extractMailbox):
+            _backupMboxDir(config, path, True, "incr", "none", None, newRevision, [], [], index=index)
+        tarfilePath = os.path.join(self.tmpdir, "target", "mbox-20060630-%s.tar" % path.strip("/").replace("/", "-"))
+        self.assertEqual({"mbox1": MESSAGE % {"id": "1", "date": messages[0][1]}}, self.readTarfile(tarfilePath))
+        self.assertEqual({"size": 0}, index[broken])
@@ -0,0 +1,286 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Tests metrics functionality.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Unit tests for CedarBackup3/metrics.py.
+
+Code Coverage
+=============
+
+   This module contains individual tests for the ``MetricsSingleton`` class
+   and the module-level functions that act on it.
+
+Naming Conventions
+==================
+
+   I prefer to avoid large unit tests which validate more than one piece of
+   functionality, and I prefer to avoid using overly descriptive (read: long)
+   test names, as well.  Instead, I use lots of very small tests that each
+   validate one specific thing.  These small tests are then named with an index
+   number, yielding something like ``testAddDir_001`` or ``testValidate_010``.
+   Each method has a docstring describing what it's supposed to accomplish.  I
+   feel that this makes it easier to judge how important a given failure is,
+   and also makes it somewhat easier to diagnose and fix individual problems.
+
+Full vs. Reduced Tests
+======================
+
+   All of the tests in this module are considered safe to be run in an average
+   build environment.  There is a no need to use a METRICSTESTS_FULL
+   environment variable to provide a "reduced feature set" test suite as for
+   some of the other test modules.
+
+@author Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Import modules and do runtime validations
+########################################################################
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from CedarBackup3.metrics import MetricsSingleton, finishCommand, increment, recordCommand, startCommand, timer
+from CedarBackup3.testutil import configureLogging, removedir
+from CedarBackup3.util import executeCommand
+
+#######################################################################
+# Test Case Classes
+#######################################################################
+
+
+#############################
+# TestMetricsSingleton class
+#############################
+
+
+class TestMetricsSingleton(unittest.TestCase):
+    """Tests for the MetricsSingleton class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        MetricsSingleton._instance = None
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+        MetricsSingleton._instance = None
+
+    ##########################
+    # Test singleton behavior
+    ##########################
+
+    def testBehavior_001(self):
+        """
+        Check that getInstance() returns the same instance until it is cleared.
+        """
+        instance1 = MetricsSingleton.getInstance()
+        instance2 = MetricsSingleton.getInstance()
+        self.assertTrue(instance1 is instance2)
+        MetricsSingleton._instance = None
+        instance3 = MetricsSingleton.getInstance()
+        self.assertTrue(instance1 is not instance3)
+
+    def testBehavior_002(self):
+        """
+        Check that reset() discards everything that was recorded.
+        """
+        increment("test.counter")
+        with timer("test.timer"):
+            pass
+        recordCommand("/bin/true", 0.5)
+        MetricsSingleton.getInstance().reset()
+        report = MetricsSingleton.getInstance().buildReport()
+        self.assertEqual({}, report["counters"])
+        self.assertEqual({}, report["timers"])
+        self.assertEqual({}, report["commands"])
+
+    ##################
+    # Test recording
+    ##################
+
+    def testRecord_001(self):
+        """
+        Check that counters accumulate, starting from zero.
+        """
+        self.assertEqual(0, MetricsSingleton.getInstance().getCounter("test.counter"))
+        increment("test.counter")
+        increment("test.counter", 5)
+        self.assertEqual(6, MetricsSingleton.getInstance().getCounter("test.counter"))
+
+    def testRecord_002(self):
+        """
+        Check that timers accumulate a count, wall time and CPU time.
+        """
+        self.assertEqual(None, MetricsSingleton.getInstance().getTimer("test.timer"))
+        with timer("test.timer"):
+            sum(range(100000))
+        with timer("test.timer"):
+            pass
+        entry = MetricsSingleton.getInstance().getTimer("test.timer")
+        self.assertEqual(2, entry["count"])
+        self.assertTrue(entry["wall"] > 0.0)
+        self.assertTrue(entry["cpu"] >= 0.0)
+
+    def testRecord_003(self):
+        """
+        Check that a timer is recorded even if the timed block raises an exception.
+        """
+        with self.assertRaises(ValueError), timer("test.timer"):
+            raise ValueError("failed")
+        self.assertEqual(1, MetricsSingleton.getInstance().getTimer("test.timer")["count"])
+
+    def testRecord_004(self):
+        """
+        Check that counters are safe to increment from many threads at once.
+        """
+
+        def work():
+            for _ in range(1000):
+                increment("test.counter")
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8000, MetricsSingleton.getInstance().getCounter("test.counter"))
+
+    def testRecord_005(self):
+        """
+        Check that executeCommand() records each command by basename.
+        """
+        executeCommand(["true"], [])
+        executeCommand(["true"], [])
+        report = MetricsSingleton.getInstance().buildReport()
+        self.assertEqual(2, report["commands"]["true"]["count"])
+        self.assertTrue(report["commands"]["true"]["wall"] > 0.0)
+
+    def testRecord_006(self):
+        """
+        Check that a command is active between startCommand() and finishCommand().
+        """
+        token = startCommand("/usr/bin/gpg")
+        self.assertEqual({threading.get_ident(): "gpg"}, MetricsSingleton.getInstance().getActiveCommands())
+        finishCommand(token)
+        self.assertEqual({}, MetricsSingleton.getInstance().getActiveCommands())
+        self.assertEqual(1, MetricsSingleton.getInstance().getCommands()["gpg"]["count"])
+
+    ##################
+    # Test reporting
+    ##################
+
+    def testReport_001(self):
+        """
+        Check that buildReport() includes run-level values and the status.
+        """
+        report = MetricsSingleton.getInstance().buildReport(status=6)
+        self.assertEqual(1, report["version"])
+        self.assertEqual(6, report["status"])
+        self.assertTrue(report["wall"] >= 0.0)
+        self.assertTrue(report["cpu"] >= 0.0)
+        self.assertTrue(report["childCpu"] >= 0.0)
+
+    def testReport_002(self):
+        """
+        Check that buildReport() omits the status if it isn't known.
+        """
+        report = MetricsSingleton.getInstance().buildReport()
+        self.assertFalse("status" in report)
+
+    def testReport_003(self):
+        """
+        Check that writeReport() writes JSON for an ordinary path.
+        """
+        increment("test.counter", 3)
+        with timer("test.timer"):
+            pass
+        path = os.path.join(self.tmpdir, "metrics.json")
+        MetricsSingleton.getInstance().writeReport(path, status=0)
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(0, report["status"])
+        self.assertEqual(3, report["counters"]["test.counter"])
+        self.assertEqual(1, report["timers"]["test.timer"]["count"])
+        self.assertEqual(["metrics.json"], os.listdir(self.tmpdir))
+
+    def testReport_004(self):
+        """
+        Check that writeReport() writes the Prometheus text format for a .prom path.
+        """
+        increment("test.counter", 3)
+        with timer("test.timer"):
+            pass
+        recordCommand("/usr/bin/mkisofs", 1.5)
+        path = os.path.join(self.tmpdir, "cback3.prom")
+        MetricsSingleton.getInstance().writeReport(path, status=0)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue("# TYPE cback3_run_wall_seconds gauge" in lines)
+        self.assertTrue("cback3_run_status 0" in lines)
+        self.assertTrue('cback3_counter{counter="test.counter"} 3' in lines)
+        self.assertTrue('cback3_timer_count{timer="test.timer"} 1' in lines)
+        self.assertTrue('cback3_command_wall_seconds{command="mkisofs"} 1.5' in lines)
+        self.assertTrue('cback3_command_count{command="mkisofs"} 1' in lines)
+
+    def testReport_005(self):
+        """
+        Check that label values are escaped in the Prometheus text format.
+        """
+        increment('test."quoted"\\name')
+        path = os.path.join(self.tmpdir, "cback3.prom")
+        MetricsSingleton.getInstance().writeReport(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue('cback3_counter{counter="test.\\"quoted\\"\\\\name"} 1' in lines)
+
+    def testReport_006(self):
+        """
+        Check that writeReport() raises OSError if the report can't be written.
+        """
+        path = os.path.join(self.tmpdir, "missing", "metrics.json")
+        self.assertRaises(OSError, MetricsSingleton.getInstance().writeReport, path)
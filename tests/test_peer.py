@@ -89,11 +89,15 @@
 ########################################################################
 
 # Import standard modules
+import errno
+import filecmp
 import os
 import stat
 import tempfile
 import unittest
+from unittest.mock import patch
 
+from CedarBackup3.metrics import MetricsSingleton
 from CedarBackup3.peer import DEF_COLLECT_INDICATOR, DEF_RCP_COMMAND, DEF_RSH_COMMAND, DEF_STAGE_INDICATOR, LocalPeer, RemotePeer
 from CedarBackup3.testutil import (
     buildPath,
@@ -688,6 +692,50 @@ def testStagePeer_011(self):
         self.assertEqual(permissions, self.getFileMode(["target", "file006"]))
         self.assertEqual(permissions, self.getFileMode(["target", "file007"]))
 
+    def testStagePeer_012(self):
+        """
+        Attempt to stage files on the same filesystem; contents and permission
+        bits must match the source, and bytes staged must be recorded.
+        """
+        self.extractTar("tree1")
+        collectDir = self.buildPath(["tree1"])
+        targetDir = self.buildPath(["target"])
+        os.mkdir(targetDir)
+        os.chmod(pathJoin(collectDir, "file001"), 0o604)
+        MetricsSingleton._instance = None
+        try:
+            peer = LocalPeer("peer1", collectDir)
+            count = peer.stagePeer(targetDir=targetDir)
+            self.assertEqual(7, count)
+            for fileName in os.listdir(collectDir):
+                self.assertTrue(filecmp.cmp(pathJoin(collectDir, fileName), pathJoin(targetDir, fileName), shallow=False))
+                self.assertNotEqual(os.stat(pathJoin(collectDir, fileName)).st_ino, os.stat(pathJoin(targetDir, fileName)).st_ino)
+            self.assertEqual(0o604, self.getFileMode(["target", "file001"]))
+            total = sum(os.path.getsize(pathJoin(collectDir, fileName)) for fileName in os.listdir(collectDir))
+            metrics = MetricsSingleton.getInstance()
+            self.assertEqual(total, metrics.getCounter("peer.bytes"))
+            self.assertTrue(metrics.getCounter("peer.bytesCopied") <= total)
+        finally:
+            MetricsSingleton._instance = None
+
+    @unittest.skipIf(platformWindows(), "Behavior differs on Windows")
+    def testStagePeer_013(self):
+        """
+        Attempt to stage files on the same filesystem where neither cloning nor
+        copy_file_range() is supported; the files must be copied instead.
+        """
+        self.extractTar("tree1")
+        collectDir = self.buildPath(["tree1"])
+        targetDir = self.buildPath(["target"])
+        os.mkdir(targetDir)
+        unsupported = OSError(errno.EOPNOTSUPP, "Operation not supported")
+        with patch("fcntl.ioctl", side_effect=unsupported), patch("os.copy_file_range", side_effect=unsupported, create=True):
+            sourceFile = pathJoin(collectDir, "file001")
+            targetFile = pathJoin(targetDir, "file001")
+            copied = LocalPeer._cloneLocalFile(sourceFile, targetFile)
+        self.assertEqual(os.path.getsize(sourceFile), copied)
+        self.assertTrue(filecmp.cmp(sourceFile, targetFile, shallow=False))
+
 
 ######################
 # TestRemotePeer class
@@ -0,0 +1,249 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Tests profiler functionality.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Unit tests for CedarBackup3/profiler.py.
+
+Code Coverage
+=============
+
+   This module contains individual tests for the ``StackSampler`` class and
+   the ``profiled`` context manager.
+
+Naming Conventions
+==================
+
+   I prefer to avoid large unit tests which validate more than one piece of
+   functionality, and I prefer to avoid using overly descriptive (read: long)
+   test names, as well.  Instead, I use lots of very small tests that each
+   validate one specific thing.  These small tests are then named with an index
+   number, yielding something like ``testAddDir_001`` or ``testValidate_010``.
+   Each method has a docstring describing what it's supposed to accomplish.  I
+   feel that this makes it easier to judge how important a given failure is,
+   and also makes it somewhat easier to diagnose and fix individual problems.
+
+Full vs. Reduced Tests
+======================
+
+   All of the tests in this module are considered safe to be run in an average
+   build environment.  There is a no need to use a PROFILERTESTS_FULL
+   environment variable to provide a "reduced feature set" test suite as for
+   some of the other test modules.
+
+@author Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Import modules and do runtime validations
+########################################################################
+
+import glob
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from CedarBackup3.metrics import MetricsSingleton
+from CedarBackup3.profiler import StackSampler, profiled
+from CedarBackup3.testutil import configureLogging, removedir
+from CedarBackup3.util import executeCommand
+
+#######################################################################
+# Test Case Classes
+#######################################################################
+
+
+########################
+# TestStackSampler class
+########################
+
+
+class TestStackSampler(unittest.TestCase):
+    """Tests for the StackSampler class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        MetricsSingleton._instance = None
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+        MetricsSingleton._instance = None
+
+    ##################
+    # Test sampling
+    ##################
+
+    def testSample_001(self):
+        """
+        Check that a sample records the stack of another thread, rooted at the thread name.
+        """
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait, name="worker")
+        thread.start()
+        try:
+            sampler = StackSampler()
+            sampler.sample()
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(1, sampler.samples)
+        stacks = [stack for stack in sampler.stacks if stack.startswith("worker;")]
+        self.assertEqual(1, len(stacks))
+        self.assertTrue("wait (threading.py:" in stacks[0])
+
+    def testSample_002(self):
+        """
+        Check that a thread running an external command gets a leaf frame naming the command.
+        """
+        sampler = StackSampler(interval=0.005)
+        sampler.start()
+        try:
+            executeCommand(["sleep"], ["0.2"])
+        finally:
+            sampler.stop()
+        self.assertTrue(sampler.samples > 0)
+        self.assertTrue(any(stack.endswith(";[sleep]") for stack in sampler.stacks))
+
+    def testSample_003(self):
+        """
+        Check that writeCollapsed() writes one stack and count per line.
+        """
+        sampler = StackSampler()
+        sampler.sample()
+        sampler.sample()
+        path = os.path.join(self.tmpdir, "stacks.folded")
+        sampler.writeCollapsed(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(sampler.stacks), len(lines))
+        for line in lines:
+            (stack, count) = line.rsplit(" ", 1)
+            self.assertEqual(sampler.stacks[stack], int(count))
+
+
+####################
+# TestProfiled class
+####################
+
+
+class TestProfiled(unittest.TestCase):
+    """Tests for the profiled() context manager."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        MetricsSingleton._instance = None
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+        MetricsSingleton._instance = None
+
+    ##################
+    # Test profiling
+    ##################
+
+    def testProfiled_001(self):
+        """
+        Check that no files are written if the mode is None.
+        """
+        with profiled("collect", None, self.tmpdir):
+            pass
+        self.assertEqual([], os.listdir(self.tmpdir))
+
+    def testProfiled_002(self):
+        """
+        Check that an invalid mode is rejected.
+        """
+        with self.assertRaises(ValueError), profiled("collect", "bogus", self.tmpdir):
+            pass
+
+    def testProfiled_003(self):
+        """
+        Check that cprofile mode writes a summary and a .prof dump, with commands listed.
+        """
+        with profiled("collect", "cprofile", self.tmpdir):
+            executeCommand(["true"], [])
+        files = sorted(path.rsplit(".", 1)[1] for path in glob.glob(os.path.join(self.tmpdir, "cback3-profile-*-collect.*")))
+        self.assertEqual(["prof", "txt"], files)
+        with open(glob.glob(os.path.join(self.tmpdir, "*.txt"))[0]) as f:
+            summary = f.read()
+        self.assertTrue("Profile of [collect]" in summary)
+        self.assertTrue("Child process CPU time:" in summary)
+        self.assertTrue("true" in summary)
+        self.assertTrue("Python functions by cumulative time:" in summary)
+
+    def testProfiled_004(self):
+        """
+        Check that sample mode writes a summary and a .folded file.
+        """
+        with profiled("stage", "sample", self.tmpdir):
+            time.sleep(0.05)
+        files = sorted(os.path.basename(path).rsplit(".", 1)[1] for path in glob.glob(os.path.join(self.tmpdir, "*")))
+        self.assertEqual(["folded", "txt"], files)
+
+    def testProfiled_005(self):
+        """
+        Check that profiles are written even if the block raises an exception.
+        """
+        with self.assertRaises(ValueError), profiled("store", "both", self.tmpdir):
+            raise ValueError("failed")
+        files = sorted(os.path.basename(path).rsplit(".", 1)[1] for path in glob.glob(os.path.join(self.tmpdir, "*")))
+        self.assertEqual(["folded", "prof", "txt"], files)
+
+    def testProfiled_006(self):
+        """
+        Check that a failure to write the profile does not raise an exception.
+        """
+        with profiled("purge", "cprofile", os.path.join(self.tmpdir, "missing")):
+            pass
+        self.assertEqual([], os.listdir(self.tmpdir))
@@ -0,0 +1,504 @@
+# vim: set ft=python ts=4 sw=4 expandtab:
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+#              C E D A R
+#          S O L U T I O N S       "Software done right."
+#           S O F T W A R E
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Copyright (c) 2026 Kenneth J. Pronovici.
+# All rights reserved.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License,
+# Version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+# Copies of the GNU General Public License are available from
+# the Free Software Foundation website, http://www.gnu.org/.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+#
+# Author   : Kenneth J. Pronovici <pronovic@ieee.org>
+# Language : Python 3
+# Project  : Cedar Backup, release 3
+# Purpose  : Tests Amazon S3 client functionality.
+#
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+
+########################################################################
+# Module documentation
+########################################################################
+
+"""
+Unit tests for CedarBackup3/s3.py.
+
+Code Coverage
+=============
+
+   This module contains individual tests for the public functions and classes
+   implemented in s3.py.  The client and uploader are exercised against the
+   in-process S3 stand-in from testutil, so no network access or AWS account is
+   required.
+
+Naming Conventions
+==================
+
+   I prefer to avoid large unit tests which validate more than one piece of
+   functionality, and I prefer to avoid using overly descriptive (read: long)
+   test names, as well.  Instead, I use lots of very small tests that each
+   validate one specific thing.  These small tests are then named with an index
+   number, yielding something like ``testAddDir_001`` or ``testValidate_010``.
+   Each method has a docstring describing what it's supposed to accomplish.  I
+   feel that this makes it easier to judge how important a given failure is,
+   and also makes it somewhat easier to diagnose and fix individual problems.
+
+Full vs. Reduced Tests
+======================
+
+   All of the tests in this module are always run, because there are no
+   external dependencies.
+
+@author Kenneth J. Pronovici <pronovic@ieee.org>
+"""
+
+
+########################################################################
+# Import modules and do runtime validations
+########################################################################
+
+import hashlib
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from CedarBackup3 import s3
+from CedarBackup3.s3 import MIN_PART_SIZE, S3Client, S3Uploader, buildClient, getEtag, getPartSize
+from CedarBackup3.testutil import S3Server, configureLogging, removedir
+from CedarBackup3.util import pathJoin
+
+#######################################################################
+# Utility functions
+#######################################################################
+
+
+def writeFile(path, size, seed=0):
+    """Writes a file of a given size with deterministic contents."""
+    block = hashlib.sha256(str(seed).encode()).digest() * 4096
+    with open(path, "wb") as f:
+        while size > 0:
+            f.write(block[:size])
+            size -= len(block[:size])
+
+
+#######################################################################
+# Test Case Classes
+#######################################################################
+
+
+######################
+# TestFunctions class
+######################
+
+
+class TestFunctions(unittest.TestCase):
+    """Tests for the public functions in s3.py."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        removedir(self.tmpdir)
+
+    ######################
+    # Test getPartSize()
+    ######################
+
+    def testGetPartSize_001(self):
+        """
+        Test getPartSize() for a part size below the S3 minimum.
+        """
+        self.assertEqual(MIN_PART_SIZE, getPartSize(100, 1024))
+
+    def testGetPartSize_002(self):
+        """
+        Test getPartSize() for a file that would need more than 10000 parts.
+        """
+        partSize = getPartSize(20000 * MIN_PART_SIZE + 1, MIN_PART_SIZE)
+        self.assertEqual(2 * MIN_PART_SIZE + 1, partSize)
+        self.assertTrue(partSize * 10000 >= 20000 * MIN_PART_SIZE + 1)
+
+    ##################
+    # Test getEtag()
+    ##################
+
+    def testGetEtag_001(self):
+        """
+        Test getEtag() for an empty file.
+        """
+        path = pathJoin(self.tmpdir, "empty")
+        writeFile(path, 0)
+        self.assertEqual(hashlib.md5(b"").hexdigest(), getEtag(path))  # noqa: S324
+
+    def testGetEtag_002(self):
+        """
+        Test getEtag() for a file that fits in a single part.
+        """
+        path = pathJoin(self.tmpdir, "small")
+        writeFile(path, 12345)
+        with open(path, "rb") as f:
+            self.assertEqual(hashlib.md5(f.read()).hexdigest(), getEtag(path))  # noqa: S324
+
+    def testGetEtag_003(self):
+        """
+        Test getEtag() for a file that needs several parts, including an exact multiple of the part size.
+        """
+        for size in (2 * MIN_PART_SIZE + 7, 2 * MIN_PART_SIZE):
+            path = pathJoin(self.tmpdir, "large")
+            writeFile(path, size)
+            with open(path, "rb") as f:
+                data = f.read()
+            parts = [hashlib.md5(data[i : i + MIN_PART_SIZE]).digest() for i in range(0, size, MIN_PART_SIZE)]  # noqa: S324
+            expected = "%s-%d" % (hashlib.md5(b"".join(parts)).hexdigest(), len(parts))  # noqa: S324
+            self.assertEqual(expected, getEtag(path, MIN_PART_SIZE))
+
+    ######################
+    # Test buildClient()
+    ######################
+
+    def testBuildClient_001(self):
+        """
+        Test buildClient() with credentials and endpoint in the environment.
+        """
+        environ = {
+            "AWS_ACCESS_KEY_ID": "key",
+            "AWS_SECRET_ACCESS_KEY": "secret",
+            "AWS_REGION": "eu-west-1",
+            "AWS_ENDPOINT_URL": "http://localhost:9000",
+            "AWS_SHARED_CREDENTIALS_FILE": pathJoin(self.tmpdir, "missing"),
+            "AWS_CONFIG_FILE": pathJoin(self.tmpdir, "missing"),
+        }
+        with patch.dict(os.environ, environ, clear=True):
+            client = buildClient("bucket")
+        self.assertEqual("bucket", client.bucket)
+        self.assertEqual("eu-west-1", client.region)
+        self.assertEqual("S3Client(bucket, http://localhost:9000/bucket)", repr(client))
+
+    def testBuildClient_002(self):
+        """
+        Test buildClient() with credentials and region in AWS CLI configuration files for a named profile.
+        """
+        credentials = pathJoin(self.tmpdir, "credentials")
+        config = pathJoin(self.tmpdir, "config")
+        with open(credentials, "w") as f:
+            f.write("[default]\naws_access_key_id = wrong\naws_secret_access_key = wrong\n")
+            f.write("[backup]\naws_access_key_id = key\naws_secret_access_key = secret\n")
+        with open(config, "w") as f:
+            f.write("[profile backup]\nregion = ca-central-1\n")
+        environ = {"AWS_PROFILE": "backup", "AWS_SHARED_CREDENTIALS_FILE": credentials, "AWS_CONFIG_FILE": config}
+        with patch.dict(os.environ, environ, clear=True):
+            client = buildClient("bucket")
+        self.assertEqual("ca-central-1", client.region)
+        self.assertEqual("S3Client(bucket, https://bucket.s3.ca-central-1.amazonaws.com)", repr(client))
+        self.assertEqual("key", client._accessKey)
+
+    def testBuildClient_003(self):
+        """
+        Test buildClient() with no credentials available.
+        """
+        environ = {
+            "AWS_SHARED_CREDENTIALS_FILE": pathJoin(self.tmpdir, "missing"),
+            "AWS_CONFIG_FILE": pathJoin(self.tmpdir, "missing"),
+        }
+        with patch.dict(os.environ, environ, clear=True):
+            self.assertRaises(ValueError, buildClient, "bucket")
+
+
+#####################
+# TestS3Client class
+#####################
+
+
+class TestS3Client(unittest.TestCase):
+    """Tests for the S3Client class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.server = S3Server()
+        self.server.start()
+        self.client = S3Client("bucket", "key", "secret", endpoint=self.server.endpoint)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    ############################
+    # Test individual requests
+    ############################
+
+    def testRequest_001(self):
+        """
+        Test putObject(), headObject() and getObject() for a key that needs quoting.
+        """
+        key = "2005/02/10/file with spaces+plus.tar"
+        etag = self.client.putObject(key, b"contents")
+        self.assertEqual(hashlib.md5(b"contents").hexdigest(), etag)  # noqa: S324
+        self.assertEqual(b"contents", self.server.objects[key])
+        self.assertEqual((8, etag), self.client.headObject(key))
+        self.assertEqual(b"contents", self.client.getObject(key))
+
+    def testRequest_002(self):
+        """
+        Test headObject() for a key that does not exist.
+        """
+        self.assertEqual(None, self.client.headObject("missing"))
+
+    def testRequest_003(self):
+        """
+        Test listObjects() across several pages, restricted to a prefix.
+        """
+        self.server.pageSize = 2
+        for i in range(5):
+            self.server.objects["2005/02/10/file%d" % i] = b"x" * i
+        self.server.objects["2005/02/11/other"] = b"y"
+        contents = self.client.listObjects("2005/02/10/")
+        self.assertEqual(5, len(contents))
+        self.assertEqual((3, hashlib.md5(b"xxx").hexdigest()), contents["2005/02/10/file3"])  # noqa: S324
+        self.assertEqual(3, len([request for request in self.server.requests if request[0] == "GET"]))
+
+    def testRequest_004(self):
+        """
+        Test deleteObjects().
+        """
+        for key in ("a", "b&c", "d"):
+            self.server.objects[key] = b"x"
+        self.client.deleteObjects(["a", "b&c"])
+        self.assertEqual(["d"], list(self.server.objects))
+
+    def testRequest_005(self):
+        """
+        Test that server errors are retried.
+        """
+        self.server.failures = 2
+        with patch.object(s3, "RETRY_DELAY", 0):
+            self.client.putObject("key", b"contents")
+        self.assertEqual(b"contents", self.server.objects["key"])
+        self.assertEqual(3, len(self.server.requests))
+
+    def testRequest_006(self):
+        """
+        Test that client errors are not retried.
+        """
+        self.assertRaises(OSError, self.client.putObject, "key", b"contents", hashlib.md5(b"other").digest())  # noqa: S324
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual({}, self.server.objects)
+
+    def testRequest_007(self):
+        """
+        Test that persistent failures are eventually reported.
+        """
+        self.server.failures = 10
+        with patch.object(s3, "RETRY_DELAY", 0):
+            self.assertRaises(OSError, self.client.getObject, "key")
+        self.assertEqual(s3.MAX_ATTEMPTS, len(self.server.requests))
+
+    def testClose_001(self):
+        """
+        Test that close() closes the connections opened by every thread, and that the client can still be used.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(self.client.headObject, ["a", "b", "c", "d"]))
+        connections = list(self.client._connections)
+        self.assertTrue(connections)
+        self.client.close()
+        self.assertEqual([], self.client._connections)
+        self.assertTrue(all(connection.sock is None for connection in connections))
+        self.assertEqual(None, self.client.headObject("a"))
+        self.assertEqual(1, len(self.client._connections))
+
+
+#######################
+# TestS3Uploader class
+#######################
+
+
+class TestS3Uploader(unittest.TestCase):
+    """Tests for the S3Uploader class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = S3Server()
+        self.server.start()
+        self.client = S3Client("bucket", "key", "secret", endpoint=self.server.endpoint)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def buildFiles(self, sizes):
+        """Writes files of the given sizes, returning a list of (path, key) tuples."""
+        files = []
+        for i, size in enumerate(sizes):
+            path = pathJoin(self.tmpdir, "file%d" % i)
+            writeFile(path, size, seed=i)
+            files.append((path, "prefix/file%d" % i))
+        return files
+
+    def checkObjects(self, files):
+        """Checks that the contents of each file made it to the server."""
+        for path, key in files:
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.server.objects[key])
+
+    ######################
+    # Test uploadFiles()
+    ######################
+
+    def testUploadFiles_001(self):
+        """
+        Test an upload of small and empty files.
+        """
+        files = self.buildFiles([0, 1, 1000, 100000])
+        uploader = S3Uploader(self.client)
+        results = uploader.uploadFiles(files)
+        self.checkObjects(files)
+        self.assertEqual(self.client.listObjects("prefix/"), results)
+        self.assertEqual(4, uploader.statistics.objectsUploaded)
+        self.assertEqual(101001, uploader.statistics.bytesUploaded)
+        self.assertTrue(uploader.statistics.throughput > 0)
+
+    def testUploadFiles_002(self):
+        """
+        Test a multipart upload with a memory budget that allows only two parts in flight.
+        """
+        files = self.buildFiles([2 * MIN_PART_SIZE + 12345, MIN_PART_SIZE + 1])
+        uploader = S3Uploader(self.client, partSize=MIN_PART_SIZE, memoryBudget=2 * MIN_PART_SIZE)
+        self.assertEqual(2, uploader.maxWorkers)
+        results = uploader.uploadFiles(files)
+        self.checkObjects(files)
+        self.assertEqual(getEtag(files[0][0], MIN_PART_SIZE), results["prefix/file0"][1])
+        self.assertTrue(results["prefix/file0"][1].endswith("-3"))
+        self.assertEqual(self.client.listObjects("prefix/"), results)
+        self.assertEqual(5, uploader.statistics.partsUploaded)
+        self.assertEqual({}, self.server.uploads)
+
+    def testUploadFiles_003(self):
+        """
+        Test that unchanged objects are skipped and changed objects are uploaded again.
+        """
+        files = self.buildFiles([1000, 2000, MIN_PART_SIZE + 1])
+        S3Uploader(self.client, partSize=MIN_PART_SIZE).uploadFiles(files)
+        writeFile(files[1][0], 2000, seed=99)
+        self.server.requests.clear()
+        uploader = S3Uploader(self.client, partSize=MIN_PART_SIZE)
+        results = uploader.uploadFiles(files, self.client.listObjects("prefix/"))
+        self.checkObjects(files)
+        self.assertEqual(self.client.listObjects("prefix/"), results)
+        self.assertEqual(1, uploader.statistics.objectsUploaded)
+        self.assertEqual(2, uploader.statistics.objectsSkipped)
+        self.assertEqual(1000 + MIN_PART_SIZE + 1, uploader.statistics.bytesSkipped)
+        self.assertEqual([("PUT", "prefix/file1")], [request[:2] for request in self.server.requests if request[0] == "PUT"])
+
+    def testUploadFiles_004(self):
+        """
+        Test that a checksum mismatch on a single-part upload is reported.
+        """
+        files = self.buildFiles([1000])
+        self.server.corruptEtags = True
+        self.assertRaises(OSError, S3Uploader(self.client).uploadFiles, files)
+
+    def testUploadFiles_005(self):
+        """
+        Test that a checksum mismatch on a multipart upload is reported and the upload is aborted.
+        """
+        files = self.buildFiles([2 * MIN_PART_SIZE + 1])
+        self.server.corruptEtags = True
+        self.assertRaises(OSError, S3Uploader(self.client, partSize=MIN_PART_SIZE).uploadFiles, files)
+        self.assertEqual({}, self.server.uploads)
+        self.assertEqual({}, self.server.objects)
+
+    def testUploadFiles_006(self):
+        """
+        Test that files can come from a generator and the callback is called once per file, including skipped files.
+        """
+        files = self.buildFiles([1000, MIN_PART_SIZE + 1, 0])
+        self.server.objects["prefix/file2"] = b""
+        finished = []
+        uploader = S3Uploader(self.client, partSize=MIN_PART_SIZE)
+        results = uploader.uploadFiles(
+            (entry for entry in files), self.client.listObjects("prefix/"), lambda *args: finished.append(args)
+        )
+        self.checkObjects(files)
+        self.assertEqual(sorted(files), sorted(entry[:2] for entry in finished))
+        self.assertEqual(sorted(results.items()), sorted((key, self.client.headObject(key)) for (_, key, _, _) in finished))
+        self.assertEqual([etag for (_, _, etag, _) in finished], [checksum for (_, _, _, checksum) in finished])
+        self.assertEqual(3, len(results))
+        self.assertEqual(1, uploader.statistics.objectsSkipped)
+
+    def testUploadFiles_007(self):
+        """
+        Test uploads to a bucket with KMS encryption, whose ETags are not MD5 digests.
+        """
+        files = self.buildFiles([1000, 2 * MIN_PART_SIZE + 1])
+        self.server.encryption = "aws:kms"
+        finished = []
+        uploader = S3Uploader(self.client, partSize=MIN_PART_SIZE)
+        results = uploader.uploadFiles(files, callback=lambda *args: finished.append(args))
+        self.checkObjects(files)
+        for path, key, etag, checksum in finished:
+            self.assertEqual(results[key][1], etag)
+            self.assertEqual(getEtag(path, MIN_PART_SIZE), checksum)
+        self.assertEqual(self.client.listObjects("prefix/"), results)
+        self.assertNotEqual(getEtag(files[0][0]), results["prefix/file0"][1])
+        self.assertTrue(results["prefix/file1"][1].endswith("-3"))
+        self.assertEqual(2, uploader.statistics.objectsUploaded)
+
+    def testUploadFiles_008(self):
+        """
+        Test that objects in a bucket with KMS encryption are only skipped given the recorded local checksums.
+        """
+        files = self.buildFiles([1000, MIN_PART_SIZE + 1])
+        self.server.encryption = "aws:kms"
+        S3Uploader(self.client, partSize=MIN_PART_SIZE).uploadFiles(files)
+        uploader = S3Uploader(self.client, partSize=MIN_PART_SIZE)
+        uploader.uploadFiles(files, self.client.listObjects("prefix/"))
+        self.assertEqual(2, uploader.statistics.objectsUploaded)
+        checksums = {key: getEtag(path, MIN_PART_SIZE) for (path, key) in files}
+        uploader = S3Uploader(self.client, partSize=MIN_PART_SIZE)
+        uploader.uploadFiles(files, self.client.listObjects("prefix/"), checksums=checksums)
+        self.assertEqual(0, uploader.statistics.objectsUploaded)
+        self.assertEqual(2, uploader.statistics.objectsSkipped)
@@ -74,10 +74,27 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import os
+import sys
+import tempfile
 import unittest
+from unittest.mock import patch
 
-from CedarBackup3.testutil import captureOutput, configureLogging
-from CedarBackup3.tools.span import Options, _usage, _version
+from CedarBackup3.config import Config, OptionsConfig, StoreConfig
+from CedarBackup3.filesystem import BackupFileList, SpanItem
+from CedarBackup3.testutil import captureOutput, configureLogging, removedir
+from CedarBackup3.tools.span import Options, _ImagePipeline, _usage, _version
+
+#######################################################################
+# Module-wide configuration and constants
+#######################################################################
+
+# Stand-in for mkisofs: writes a small image at the path given by -o
+MKISOFS_STANDIN = """
+import sys
+with open(sys.argv[sys.argv.index("-o") + 1], "wb") as f:
+    f.write(b"image")
+"""
 
 #######################################################################
 # Test Case Classes
@@ -157,3 +174,129 @@ def testStringFuncs_001(self):
         obj = Options()
         obj.__repr__()
         obj.__str__()
+
+
+##########################
+# TestImagePipeline class
+##########################
+
+
+class TestImagePipeline(unittest.TestCase):
+    """Tests for the _ImagePipeline class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, "source")
+        self.working = os.path.join(self.tmpdir, "working")
+        os.mkdir(self.source)
+        os.mkdir(self.working)
+        self.config = Config()
+        self.config.options = OptionsConfig(workingDir=self.working)
+        self.config.store = StoreConfig(sourceDir=self.source)
+        self.patcher = patch("CedarBackup3.writers.util.MKISOFS_COMMAND", [sys.executable, "-c", MKISOFS_STANDIN])
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def buildSpanSet(self, discs):
+        """Builds a span set with one file in its own directory per disc."""
+        spanSet = []
+        for disc in range(discs):
+            path = os.path.join(self.source, "dir%03d" % disc, "file%03d" % disc)
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write("disc %d" % disc)
+            fileList = BackupFileList()
+            fileList.addFile(path)
+            spanSet.append(SpanItem(fileList, 6, 100, 6.0))
+        return spanSet
+
+    ##################
+    # Test pipelining
+    ##################
+
+    def testPipeline_001(self):
+        """
+        Test that an image and digests are prepared for every disc, and removed when released.
+        """
+        pipeline = _ImagePipeline(self.config, self.buildSpanSet(3), 1024 * 1024 * 1024)
+        pipeline.start()
+        try:
+            for disc in range(3):
+                image = pipeline.get(disc)
+                self.assertEqual(None, image.error)
+                self.assertTrue(os.path.exists(image.path))
+                self.assertEqual(["/dir%03d/file%03d" % (disc, disc)], list(image.digest.keys()))
+                self.assertEqual({"/dir%03d/file%03d" % (disc, disc): 6}, image.sizes)
+                pipeline.release(image)
+                self.assertEqual(None, image.path)
+        finally:
+            pipeline.close()
+        self.assertEqual([], os.listdir(self.working))
+        self.assertTrue(pipeline.buildTime > 0.0)
+        self.assertTrue(0.0 <= pipeline.savedTime <= pipeline.buildTime)
+
+    def testPipeline_002(self):
+        """
+        Test that the next image is not prepared while the budget is used up by the current one.
+        """
+        pipeline = _ImagePipeline(self.config, self.buildSpanSet(2), 0)
+        pipeline.start()
+        try:
+            image = pipeline.get(0)
+            self.assertEqual(None, image.error)
+            self.assertFalse(pipeline._images[1].done.wait(0.2))
+            pipeline.release(image)
+            image = pipeline.get(1)
+            self.assertEqual(None, image.error)
+            pipeline.release(image)
+        finally:
+            pipeline.close()
+
+    def testPipeline_003(self):
+        """
+        Test that the next image is prepared while the current one is held, if the budget allows.
+        """
+        pipeline = _ImagePipeline(self.config, self.buildSpanSet(3), 1024 * 1024 * 1024)
+        pipeline.start()
+        try:
+            image = pipeline.get(0)
+            self.assertTrue(pipeline._images[1].done.wait(10.0))
+            self.assertFalse(pipeline._images[2].done.wait(0.2))  # no more than two images at once
+            pipeline.release(image)
+        finally:
+            pipeline.close()
+        self.assertEqual([], os.listdir(self.working))
+
+    def testPipeline_004(self):
+        """
+        Test that an image which can't be prepared is returned with its error, without stopping the pipeline.
+        """
+        spanSet = self.buildSpanSet(2)
+        os.unlink(spanSet[0].fileList[0])
+        pipeline = _ImagePipeline(self.config, spanSet, 1024 * 1024 * 1024)
+        pipeline.start()
+        try:
+            image = pipeline.get(0)
+            self.assertNotEqual(None, image.error)
+            self.assertEqual(None, image.path)
+            pipeline.release(image)
+            image = pipeline.get(1)
+            self.assertEqual(None, image.error)
+            pipeline.release(image)
+        finally:
+            pipeline.close()
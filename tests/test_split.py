@@ -128,10 +128,12 @@
     "split.conf.3",
     "split.conf.4",
     "split.conf.5",
+    "split.conf.6",
     "tree21.tar.gz",
 ]
 
 INVALID_PATH = "bogus"  # This path name should never exist
+INVALID_GPG_RECIPIENT = "Bogus J. User"  # GPG should not have a public key for this user
 
 
 #######################################################################
@@ -279,6 +281,26 @@ def testConstructor_010(self):
         self.failUnlessAssignRaises(ValueError, split, "splitSize", 12)
         self.assertEqual(None, split.splitSize)
 
+    def testConstructor_011(self):
+        """
+        Test assignment of encryptChunks attribute, None value.
+        """
+        split = SplitConfig(encryptChunks=True)
+        self.assertEqual(True, split.encryptChunks)
+        split.encryptChunks = None
+        self.assertEqual(False, split.encryptChunks)
+
+    def testConstructor_012(self):
+        """
+        Test assignment of encryptChunks attribute, valid values.
+        """
+        split = SplitConfig()
+        self.assertEqual(False, split.encryptChunks)
+        split.encryptChunks = True
+        self.assertEqual(True, split.encryptChunks)
+        split.encryptChunks = 0
+        self.assertEqual(False, split.encryptChunks)
+
     ############################
     # Test comparison operators
     ############################
@@ -367,6 +389,20 @@ def testComparison_006(self):
         self.assertTrue(not split1 >= split2)
         self.assertTrue(split1 != split2)
 
+    def testComparison_007(self):
+        """
+        Test comparison of two differing objects, encryptChunks differs.
+        """
+        split1 = SplitConfig(ByteQuantity("99", UNIT_KBYTES), ByteQuantity("0.5", UNIT_MBYTES), False)
+        split2 = SplitConfig(ByteQuantity("99", UNIT_KBYTES), ByteQuantity("0.5", UNIT_MBYTES), True)
+        self.assertNotEqual(split1, split2)
+        self.assertTrue(not split1 == split2)
+        self.assertTrue(split1 < split2)
+        self.assertTrue(split1 <= split2)
+        self.assertTrue(not split1 > split2)
+        self.assertTrue(not split1 >= split2)
+        self.assertTrue(split1 != split2)
+
 
 ########################
 # TestLocalConfig class
@@ -681,6 +717,24 @@ def testParse_005(self):
         self.assertEqual(ByteQuantity("1.25", UNIT_GBYTES), config.split.sizeLimit)
         self.assertEqual(ByteQuantity("0.6", UNIT_GBYTES), config.split.splitSize)
 
+    def testParse_006(self):
+        """
+        Parse config document with filled-in values, encrypt chunks enabled.
+        """
+        path = self.resources["split.conf.6"]
+        with open(path) as f:
+            contents = f.read()
+        config = LocalConfig(xmlPath=path, validate=False)
+        self.assertNotEqual(None, config.split)
+        self.assertEqual(ByteQuantity("1.25", UNIT_GBYTES), config.split.sizeLimit)
+        self.assertEqual(ByteQuantity("0.6", UNIT_GBYTES), config.split.splitSize)
+        self.assertEqual(True, config.split.encryptChunks)
+        config = LocalConfig(xmlData=contents, validate=False)
+        self.assertNotEqual(None, config.split)
+        self.assertEqual(ByteQuantity("1.25", UNIT_GBYTES), config.split.sizeLimit)
+        self.assertEqual(ByteQuantity("0.6", UNIT_GBYTES), config.split.splitSize)
+        self.assertEqual(True, config.split.encryptChunks)
+
     ###################
     # Test addConfig()
     ###################
@@ -730,6 +784,15 @@ def testAddConfig_005(self):
         config.split = split
         self.validateAddConfig(config)
 
+    def testAddConfig_006(self):
+        """
+        Test with values set, encrypt chunks enabled.
+        """
+        split = SplitConfig(ByteQuantity("12", UNIT_GBYTES), ByteQuantity("63352", UNIT_GBYTES), True)
+        config = LocalConfig()
+        config.split = split
+        self.validateAddConfig(config)
+
 
 ######################
 # TestFunctions class
@@ -886,6 +949,35 @@ def testSplitFile_005(self):
             self.assertFalse(os.path.exists(sourcePath))
             self.checkSplit(sourcePath, 3200, 320)
 
+    def testSplitFile_006(self):
+        """
+        Test that the chunks are returned in order and reassemble to the original file.
+        """
+        self.extractTar("tree21")
+        sourcePath = self.buildPath(["tree21", "2007", "01", "01", "system3", "file003"])
+        with open(sourcePath, "rb") as f:
+            original = f.read()
+        splitSize = ByteQuantity("1000", UNIT_BYTES)
+        chunks = _splitFile(sourcePath, splitSize, None, None, removeSource=True)
+        self.assertEqual(["%s_%05d" % (sourcePath, i) for i in range(101)], chunks)
+        contents = b""
+        for chunk in chunks:
+            with open(chunk, "rb") as f:
+                contents += f.read()
+        self.assertEqual(original, contents)
+
+    def testSplitFile_007(self):
+        """
+        Test with chunk encryption and an invalid recipient, removeSource=True.
+        """
+        self.extractTar("tree21")
+        sourcePath = self.buildPath(["tree21", "2007", "01", "01", "system1", "file001.a.b"])
+        splitSize = ByteQuantity("320", UNIT_BYTES)
+        self.assertRaises(
+            IOError, _splitFile, sourcePath, splitSize, None, None, removeSource=True, encryptTarget=INVALID_GPG_RECIPIENT
+        )
+        self.assertTrue(os.path.exists(sourcePath))
+
     ##########################
     # Test _splitDailyDir()
     ##########################
@@ -74,11 +74,21 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import glob
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
 import unittest
+from contextlib import closing
 from getopt import GetoptError
+from unittest.mock import patch
 
-from CedarBackup3.testutil import captureOutput, configureLogging, failUnlessAssignRaises
-from CedarBackup3.tools.amazons3 import Options, _usage, _version
+from CedarBackup3 import filesystem
+from CedarBackup3.filesystem import TraversalCache
+from CedarBackup3.testutil import S3Server, captureOutput, configureLogging, failUnlessAssignRaises, removedir
+from CedarBackup3.tools.amazons3 import Options, SyncState, _executeAction, _usage, _version
 
 #######################################################################
 # Test Case Classes
@@ -2467,6 +2477,51 @@ def testConstructor_173(self):
         self.assertEqual(None, options.sourceDir)
         self.assertEqual(None, options.s3BucketUrl)
 
+    def testConstructor_174(self):
+        """
+        Test constructor with argumentList=["--stateFile", "state.db", "--reconcileDays", "7", ], validate=False.
+        """
+        options = Options(argumentList=["--stateFile", "state.db", "--reconcileDays", "7"], validate=False)
+        self.assertEqual(False, options.uploadOnly)
+        self.assertEqual("state.db", options.stateFile)
+        self.assertEqual(7, options.reconcileDays)
+        self.assertEqual(None, options.sourceDir)
+        self.assertEqual(None, options.s3BucketUrl)
+
+    def testConstructor_175(self):
+        """
+        Test constructor with argumentString="-S state.db -r 0", validate=False.
+        """
+        options = Options(argumentString="-S state.db -r 0", validate=False)
+        self.assertEqual("state.db", options.stateFile)
+        self.assertEqual(0, options.reconcileDays)
+
+    def testConstructor_176(self):
+        """
+        Test constructor with argumentList=["--reconcileDays", "-1", ], validate=False.
+        """
+        self.assertRaises(ValueError, Options, argumentList=["--reconcileDays", "-1"], validate=False)
+
+    def testConstructor_177(self):
+        """
+        Test constructor with argumentList=["--reconcileDays", "weekly", ], validate=False.
+        """
+        self.assertRaises(ValueError, Options, argumentList=["--reconcileDays", "weekly"], validate=False)
+
+    def testConstructor_178(self):
+        """
+        Test assignment of stateFile and reconcileDays attributes.
+        """
+        options = Options()
+        options.stateFile = "state.db"
+        self.assertEqual("state.db", options.stateFile)
+        options.stateFile = None
+        self.assertEqual(None, options.stateFile)
+        self.failUnlessAssignRaises(ValueError, options, "stateFile", "")
+        options.reconcileDays = "14"
+        self.assertEqual(14, options.reconcileDays)
+        self.failUnlessAssignRaises(ValueError, options, "reconcileDays", -1)
+
     ############################
     # Test comparison operators
     ############################
@@ -3565,6 +3620,27 @@ def testBuildArgumentList_033(self):
         argumentList = options.buildArgumentList(validate=False)
         self.assertEqual(["--uploadOnly"], argumentList)
 
+    def testBuildArgumentList_034(self):
+        """Test with stateFile and reconcileDays set, validate=False."""
+        options = Options()
+        options.stateFile = "state.db"
+        options.reconcileDays = 0
+        argumentList = options.buildArgumentList(validate=False)
+        self.assertEqual(["--stateFile", "state.db", "--reconcileDays", "0"], argumentList)
+
+    def testBuildArgumentList_035(self):
+        """Test with profile set, validate=False."""
+        options = Options()
+        options.profile = "both"
+        argumentList = options.buildArgumentList(validate=False)
+        self.assertEqual(["--profile", "both"], argumentList)
+
+    def testBuildArgumentList_036(self):
+        """Test parsing the profile switch, and rejecting an invalid mode."""
+        options = Options(argumentList=["--profile", "sample", "source", "bucket"])
+        self.assertEqual("sample", options.profile)
+        self.assertRaises(ValueError, Options, argumentList=["--profile", "bogus", "source", "bucket"])
+
     #############################
     # Test buildArgumentString()
     #############################
@@ -3822,3 +3898,205 @@ def testBuildArgumentString_033(self):
         options.uploadOnly = True
         argumentString = options.buildArgumentString(validate=False)
         self.assertEqual("--uploadOnly ", argumentString)
+
+    def testBuildArgumentString_034(self):
+        """Test with stateFile and reconcileDays set, validate=False."""
+        options = Options()
+        options.stateFile = "state.db"
+        options.reconcileDays = 0
+        argumentString = options.buildArgumentString(validate=False)
+        self.assertEqual('--stateFile "state.db" --reconcileDays 0 ', argumentString)
+
+    def testBuildArgumentString_035(self):
+        """Test with profile set, validate=False."""
+        options = Options()
+        options.profile = "both"
+        argumentString = options.buildArgumentString(validate=False)
+        self.assertEqual('--profile "both" ', argumentString)
+
+
+#######################
+# TestSyncAction class
+#######################
+
+
+class TestSyncAction(unittest.TestCase):
+    """Tests for the sync engine, run against an in-process S3 stand-in."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.sourceDir = os.path.join(self.tmpdir, "source")
+        self.stateFile = os.path.join(self.tmpdir, "state.db")
+        self.server = S3Server()
+        self.server.start()
+        self.environ = patch.dict(
+            os.environ,
+            {
+                "AWS_ACCESS_KEY_ID": "key",
+                "AWS_SECRET_ACCESS_KEY": "secret",
+                "AWS_ENDPOINT_URL": self.server.endpoint,
+                "AWS_SHARED_CREDENTIALS_FILE": os.path.join(self.tmpdir, "missing"),
+                "AWS_CONFIG_FILE": os.path.join(self.tmpdir, "missing"),
+            },
+            clear=True,
+        )
+        self.environ.start()
+        self.writeFile("one", b"one")
+        self.writeFile("dir/two", b"two")
+        self.writeFile("dir/sub/three", b"three")
+
+    def tearDown(self):
+        self.environ.stop()
+        self.server.stop()
+        removedir(self.tmpdir)
+
+    ##################
+    # Utility methods
+    ##################
+
+    def writeFile(self, name, data):
+        """Writes a file in the source directory, with a modification time distinct from any earlier write."""
+        path = os.path.join(self.sourceDir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        mtime = time.time_ns() + 1_000_000_000
+        os.utime(path, ns=(mtime, mtime))
+
+    def sync(self, *switches):
+        """Runs the sync action with the given extra switches, returning the requests made."""
+        self.server.requests.clear()
+        argumentList = ["--stateFile", self.stateFile, *switches, self.sourceDir, "s3://bucket/backup"]
+        _executeAction(Options(argumentList=argumentList))
+        return self.server.requests
+
+    def puts(self, requests):
+        """Returns the sorted keys written by a list of requests."""
+        return sorted(key for (method, key, _) in requests if method == "PUT")
+
+    ###################
+    # Test sync action
+    ###################
+
+    def testSync_001(self):
+        """
+        Test a first sync, which uploads everything and reconciles the state.
+        """
+        requests = self.sync()
+        self.assertEqual(["backup/dir/sub/three", "backup/dir/two", "backup/one"], self.puts(requests))
+        self.assertEqual({"backup/one": b"one", "backup/dir/two": b"two", "backup/dir/sub/three": b"three"}, self.server.objects)
+        state = SyncState(self.stateFile, "%s s3://bucket/backup" % os.path.abspath(self.sourceDir))
+        self.assertIsNotNone(state.reconciled)
+        state.close()
+
+    def testSync_002(self):
+        """
+        Test that a sync with no changes makes no requests at all.
+        """
+        self.sync()
+        self.assertEqual([], self.sync())
+
+    def testSync_003(self):
+        """
+        Test that a sync uploads only changed and new files.
+        """
+        self.sync()
+        self.writeFile("dir/two", b"changed")
+        self.writeFile("four", b"four")
+        requests = self.sync()
+        self.assertEqual(["backup/dir/two", "backup/four"], self.puts(requests))
+        self.assertEqual(b"changed", self.server.objects["backup/dir/two"])
+        self.assertEqual(b"four", self.server.objects["backup/four"])
+
+    def testSync_004(self):
+        """
+        Test that a sync removes files no longer in the source directory.
+        """
+        self.sync()
+        os.remove(os.path.join(self.sourceDir, "one"))
+        requests = self.sync()
+        self.assertEqual([], self.puts(requests))
+        self.assertNotIn("backup/one", self.server.objects)
+        self.assertEqual({"backup/dir/two", "backup/dir/sub/three"}, set(self.server.objects))
+
+    def testSync_005(self):
+        """
+        Test that an upload-only sync does not remove files.
+        """
+        self.sync()
+        os.remove(os.path.join(self.sourceDir, "one"))
+        self.sync("--uploadOnly")
+        self.assertIn("backup/one", self.server.objects)
+
+    def testSync_006(self):
+        """
+        Test that a lost state file is rebuilt from the bucket without uploading anything again.
+        """
+        self.sync()
+        os.remove(self.stateFile)
+        self.server.objects["backup/stale"] = b"stale"
+        requests = self.sync()
+        self.assertEqual([], self.puts(requests))
+        self.assertNotIn("backup/stale", self.server.objects)
+        self.assertEqual([], self.sync())
+
+    def testSync_007(self):
+        """
+        Test that a change made behind the state's back is only noticed when reconciliation is due.
+        """
+        self.sync()
+        self.server.objects["backup/one"] = b"bad"
+        self.sync("--reconcileDays", "7")
+        self.assertEqual(b"bad", self.server.objects["backup/one"])
+        requests = self.sync("--reconcileDays", "0")
+        self.assertEqual(["backup/one"], self.puts(requests))
+        self.assertEqual(b"one", self.server.objects["backup/one"])
+
+    def testSync_008(self):
+        """
+        Test verify-only mode, which compares the source directory to the bucket.
+        """
+        self.sync()
+        self.sync("--verifyOnly")
+        self.writeFile("four", b"four")
+        self.assertRaises(ValueError, self.sync, "--verifyOnly")
+
+    def testSync_009(self):
+        """
+        Test that a touched but unchanged file is not uploaded again to a bucket with KMS encryption.
+        """
+        self.server.encryption = "aws:kms"
+        self.sync()
+        self.writeFile("one", b"one")
+        self.writeFile("dir/two", b"changed")
+        requests = self.sync()
+        self.assertEqual(["backup/dir/two"], self.puts(requests))
+        with closing(sqlite3.connect(self.stateFile)) as connection:
+            checksums = {row[0] for row in connection.execute("SELECT checksum FROM objects")}
+        self.assertEqual({hashlib.md5(data).hexdigest() for data in (b"one", b"changed", b"three")}, checksums)  # noqa: S324
+
+    def testSync_010(self):
+        """
+        Test that verify-only mode does not create a state file.
+        """
+        self.server.objects.update({"backup/one": b"one", "backup/dir/two": b"two", "backup/dir/sub/three": b"three"})
+        self.sync("--verifyOnly")
+        self.assertEqual([], glob.glob("%s*" % self.stateFile))
+
+    def testSync_011(self):
+        """
+        Test that directory listings are cached next to the state file and replayed for unchanged directories.
+        """
+        with patch.object(filesystem, "TRAVERSAL_CACHE_MARGIN", 0):
+            self.sync()
+        self.assertEqual(1, len(glob.glob("%s.*.traversal" % self.stateFile)))
+        with patch.object(TraversalCache, "_scanDir", side_effect=AssertionError("directory was read")):
+            self.assertEqual([], self.sync())
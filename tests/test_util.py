@@ -76,6 +76,7 @@
 import os
 import sys
 import tempfile
+import threading
 import time
 import unittest
 from os.path import isdir
@@ -3666,6 +3667,68 @@ def testExecuteCommand_070(self):
 
         self.assertEqual(100000 * 2, length)
 
+    def testExecuteCommand_071(self):
+        """
+        Execute a command that reads a large amount of input from an input file,
+        and make sure the output matches the input.
+        """
+        command = [sys.executable, "-c", "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)"]
+        args = []
+
+        inputName = self.getTempfile()
+        with open(inputName, "wb") as f:
+            f.write(b"line of input\n" * 100000)
+
+        outputName = self.getTempfile()
+        with open(inputName, "rb") as inputFile, open(outputName, "wb") as outputFile:
+            result = executeCommand(command, args, doNotLog=True, outputFile=outputFile, inputFile=inputFile)[0]
+        self.assertEqual(0, result)
+
+        with open(inputName, "rb") as expected, open(outputName, "rb") as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def testExecuteCommand_072(self):
+        """
+        Execute a command that exits without reading its input file.  The
+        command should not hang.
+        """
+        command = [sys.executable, "-c", "print('done')"]
+        args = []
+
+        inputName = self.getTempfile()
+        with open(inputName, "wb") as f:
+            f.write(b"x" * (10 * 1024 * 1024))
+
+        with open(inputName, "rb") as inputFile:
+            (result, output) = executeCommand(command, args, returnOutput=True, inputFile=inputFile)
+        self.assertEqual(0, result)
+        self.assertEqual(["done" + os.linesep], output)
+
+    def testExecuteCommand_073(self):
+        """
+        Execute a command that exits without reading its input file, while the
+        input is still being read.  The input file must not be in use once the
+        call returns.
+        """
+
+        class SlowReader:
+            def __init__(self):
+                self.threads = set()
+
+            def read(self, size=-1):  # noqa: ARG002
+                self.threads.add(threading.current_thread())
+                time.sleep(0.05)
+                return b"x" * 65536
+
+        command = [sys.executable, "-c", "print('done')"]
+        args = []
+        inputFile = SlowReader()
+        (result, output) = executeCommand(command, args, returnOutput=True, inputFile=inputFile)
+        self.assertEqual(0, result)
+        self.assertEqual(["done" + os.linesep], output)
+        self.assertEqual(1, len(inputFile.threads))
+        self.assertTrue(not any(thread.is_alive() for thread in inputFile.threads))
+
     ####################
     # Test encodePath()
     ####################
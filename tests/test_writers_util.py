@@ -89,10 +89,14 @@
 # Import modules and do runtime validations
 ########################################################################
 
+import io
 import os
+import sys
 import tempfile
+import threading
 import time
 import unittest
+from unittest.mock import patch
 
 from CedarBackup3.filesystem import FilesystemList
 from CedarBackup3.testutil import (
@@ -106,7 +110,16 @@
     setupOverrides,
 )
 from CedarBackup3.util import executeCommand, pathJoin
-from CedarBackup3.writers.util import IsoImage, validateDriveSpeed, validateScsiId
+from CedarBackup3.writers.util import (
+    IsoImage,
+    RingBuffer,
+    cachedDeviceProperties,
+    cachedMediaState,
+    clearMediaState,
+    invalidateMediaState,
+    validateDriveSpeed,
+    validateScsiId,
+)
 
 #######################################################################
 # Module-wide configuration and constants
@@ -161,10 +174,10 @@ def setUpClass(cls):
         setupOverrides()
 
     def setUp(self):
-        pass
+        clearMediaState()
 
     def tearDown(self):
-        pass
+        clearMediaState()
 
     ########################
     # Test validateScsiId()
@@ -331,6 +344,60 @@ def testValidateDriveSpeed_005(self):
         speed = "ken"
         self.assertRaises(ValueError, validateDriveSpeed, speed)
 
+    ##########################
+    # Test cachedMediaState()
+    ##########################
+
+    def testCachedMediaState_001(self):
+        """
+        Test that a value is computed once, and then returned from the cache.
+        """
+        calls = []
+        function = lambda: calls.append(1) or len(calls)  # ruff: ignore[lambda-assignment]
+        self.assertEqual(1, cachedMediaState("/dev/cdrw", "value", function))
+        self.assertEqual(1, cachedMediaState("/dev/cdrw", "value", function))
+        self.assertEqual(1, len(calls))
+
+    def testCachedMediaState_002(self):
+        """
+        Test that values are cached separately per device and per name.
+        """
+        self.assertEqual(1, cachedMediaState("/dev/cdrw", "one", lambda: 1))
+        self.assertEqual(2, cachedMediaState("/dev/cdrw", "two", lambda: 2))
+        self.assertEqual(3, cachedMediaState("/dev/dvd", "one", lambda: 3))
+        self.assertEqual(1, cachedMediaState("/dev/cdrw", "one", lambda: 4))
+
+    def testCachedMediaState_003(self):
+        """
+        Test that invalidateMediaState() discards values for only the one device.
+        """
+        cachedMediaState("/dev/cdrw", "value", lambda: 1)
+        cachedMediaState("/dev/dvd", "value", lambda: 1)
+        invalidateMediaState("/dev/cdrw")
+        self.assertEqual(2, cachedMediaState("/dev/cdrw", "value", lambda: 2))
+        self.assertEqual(1, cachedMediaState("/dev/dvd", "value", lambda: 2))
+
+    def testCachedMediaState_004(self):
+        """
+        Test that nothing is cached if the function raises an exception.
+        """
+
+        def fail():
+            raise OSError("failed")
+
+        self.assertRaises(IOError, cachedMediaState, "/dev/cdrw", "value", fail)
+        self.assertEqual(1, cachedMediaState("/dev/cdrw", "value", lambda: 1))
+
+    def testCachedMediaState_005(self):
+        """
+        Test that device properties survive invalidateMediaState() but not clearMediaState().
+        """
+        self.assertEqual(1, cachedDeviceProperties("0,0,0", lambda: 1))
+        invalidateMediaState("/dev/cdrw")
+        self.assertEqual(1, cachedDeviceProperties("0,0,0", lambda: 2))
+        clearMediaState()
+        self.assertEqual(3, cachedDeviceProperties("0,0,0", lambda: 3))
+
 
 #####################
 # TestIsoImage class
@@ -883,6 +950,16 @@ def testUtilityMethods_022(self):
             ["-graft-points", "-o", "/tmp/file.iso", "-C", "3,4", "-M", "/dev/cdrw", "backup1/=/one/two/three"], result
         )
 
+    def testUtilityMethods_023(self):
+        """
+        Test _buildWriteArgs() with no image path, writing to stdout.
+        """
+        entries = {}
+        entries["/one/two/three"] = "backup1"
+        isoImage = IsoImage()
+        result = isoImage._buildWriteArgs(entries, None)
+        self.assertEqual(["-graft-points", "-r", "backup1/=/one/two/three"], result)
+
     ##################
     # Test addEntry()
     ##################
@@ -1201,6 +1278,114 @@ def testGetEstimatedSize_002(self):
         result = isoImage.getEstimatedSize()
         self.assertTrue(result > 0)
 
+    def testGetEstimatedSize_003(self):
+        """
+        Test the in-process estimate for an empty directory with a graft point.
+        """
+        dir1 = self.buildPath(["empty"])
+        os.mkdir(dir1)
+        isoImage = IsoImage()
+        isoImage.addEntry(dir1, graftPoint="base")
+        # 16 system area + 3 descriptors + 2 path tables + 2 directories + ER = 24, aligned to 32, plus 150 padding
+        # is 182, and then the margin of 1% (rounded up) plus 64 sectors
+        self.assertEqual((182 + 2 + 64) * 2048, isoImage.getEstimatedSize())
+
+    def testGetEstimatedSize_004(self):
+        """
+        Test that file data is counted in whole sectors, and that hard links share their data.
+        """
+        dir1 = self.buildPath(["files"])
+        os.mkdir(dir1)
+        with open(os.path.join(dir1, "data"), "wb") as f:
+            f.write(b"x" * 40000)  # 20 sectors
+        isoImage = IsoImage()
+        isoImage.addEntry(dir1, graftPoint="base")
+        isoImage.addEntry(self.buildPath(["files", "data"]), graftPoint="other")
+        # 24 sectors as for an empty directory, plus directory "other" and two copies of the data = 65, aligned to 80
+        self.assertEqual((80 + 150 + 3 + 64) * 2048, isoImage.getEstimatedSize())
+        os.link(os.path.join(dir1, "data"), os.path.join(dir1, "link"))
+        isoImage = IsoImage()
+        isoImage.addEntry(dir1, graftPoint="base")
+        # 24 sectors as for an empty directory, plus one copy of the data = 44, aligned to 48
+        self.assertEqual((48 + 150 + 2 + 64) * 2048, isoImage.getEstimatedSize())
+
+    def testGetEstimatedSize_005(self):
+        """
+        Test that the directory walk is cached until the entries change.
+        """
+        self.extractTar("tree9")
+        dir1 = self.buildPath(["tree9", "dir001"])
+        dir2 = self.buildPath(["tree9", "dir002"])
+        isoImage = IsoImage()
+        isoImage.addEntry(dir1)
+        first = isoImage.getEstimatedSize()
+        with patch("os.scandir", side_effect=AssertionError("walked again")):
+            self.assertEqual(first, isoImage.getEstimatedSize())
+        isoImage.addEntry(dir2)
+        self.assertTrue(isoImage.getEstimatedSize() > first)
+
+    def testGetEstimatedSize_006(self):
+        """
+        Test that a multisession image is estimated with mkisofs.
+        """
+        self.extractTar("tree9")
+        dir1 = self.buildPath(["tree9", "dir001"])
+        isoImage = IsoImage(device="/dev/cdrw", boundaries=(1, 2))
+        isoImage.addEntry(dir1)
+        with patch.object(IsoImage, "_getEstimatedSize", return_value=12345.0) as mkisofs:
+            self.assertEqual(12345.0, isoImage.getEstimatedSize())
+        mkisofs.assert_called_once_with(isoImage.entries)
+
+    @unittest.skipUnless(runAllTests(), "Limited test suite")
+    def testGetEstimatedSize_007(self):
+        """
+        Test that the in-process estimate is never smaller than mkisofs, and not much larger.
+        """
+        self.extractTar("tree9")
+        for useRockRidge in (True, False):
+            isoImage = IsoImage()
+            isoImage.useRockRidge = useRockRidge
+            isoImage.addEntry(self.buildPath(["tree9"]), graftPoint="base")
+            isoImage.addEntry(self.buildPath(["tree9", "dir002", "file001"]), graftPoint="other/place")
+            expected = isoImage._getEstimatedSize(isoImage.entries)
+            actual = isoImage.getEstimatedSize()
+            self.assertTrue(expected <= actual <= expected * 1.02 + 128 * 2048, "%s vs %s" % (actual, expected))
+
+    #####################
+    # Test streamImage()
+    #####################
+
+    def testStreamImage_001(self):
+        """
+        Attempt to stream an image containing no entries.
+        """
+        isoImage = IsoImage()
+        self.assertRaises(ValueError, isoImage.streamImage, io.BytesIO())
+
+    def testStreamImage_002(self):
+        """
+        Stream an image from a stand-in for mkisofs, and check that stdout is copied exactly.
+        """
+        self.extractTar("tree9")
+        isoImage = IsoImage()
+        isoImage.addEntry(self.buildPath(["tree9"]), graftPoint="base")
+        standin = "import sys; sys.stderr.write('noise'); sys.stdout.buffer.write(' '.join(sys.argv[1:]).encode() * 10000)"
+        output = io.BytesIO()
+        with patch("CedarBackup3.writers.util.MKISOFS_COMMAND", [sys.executable, "-c", standin]):
+            isoImage.streamImage(output)
+        expected = " ".join(isoImage._buildWriteArgs(isoImage.entries, None)).encode() * 10000
+        self.assertEqual(expected, output.getvalue())
+
+    def testStreamImage_003(self):
+        """
+        Stream an image from a stand-in for mkisofs that fails.
+        """
+        self.extractTar("tree9")
+        isoImage = IsoImage()
+        isoImage.addEntry(self.buildPath(["tree9"]), graftPoint="base")
+        with patch("CedarBackup3.writers.util.MKISOFS_COMMAND", [sys.executable, "-c", "import sys; sys.exit(2)"]):
+            self.assertRaises(IOError, isoImage.streamImage, io.BytesIO())
+
     ####################
     # Test writeImage()
     ####################
@@ -1755,3 +1940,138 @@ def testWriteImage_023(self):
         self.assertTrue(pathJoin(mountPath, "something", "dir002", "link004") in fsList)
         self.assertTrue(pathJoin(mountPath, "something", "dir002", "dir001") in fsList)
         self.assertTrue(pathJoin(mountPath, "something", "dir002", "dir002") in fsList)
+
+
+#######################
+# TestRingBuffer class
+#######################
+
+
+class TestRingBuffer(unittest.TestCase):
+    """Tests for the RingBuffer class."""
+
+    ################
+    # Setup methods
+    ################
+
+    @classmethod
+    def setUpClass(cls):
+        configureLogging()
+
+    ##################
+    # Utility methods
+    ##################
+
+    @staticmethod
+    def readAll(buffer, size):
+        """Reads from a buffer until end-of-file, in chunks of a given size."""
+        chunks = []
+        while True:
+            chunk = buffer.read(size)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    ###################
+    # Test constructor
+    ###################
+
+    def testConstructor_001(self):
+        """
+        Test the constructor with a valid capacity.
+        """
+        buffer = RingBuffer(10)
+        self.assertEqual(10, buffer.capacity)
+        self.assertEqual(0, buffer.fill)
+        self.assertEqual(None, buffer.lowWater)
+        self.assertEqual(0, buffer.underruns)
+
+    def testConstructor_002(self):
+        """
+        Test the constructor with an invalid capacity.
+        """
+        self.assertRaises(ValueError, RingBuffer, 0)
+
+    #######################
+    # Test reading/writing
+    #######################
+
+    def testReadWrite_001(self):
+        """
+        Write less than the capacity and close, then read it back across the wrap point.
+        """
+        buffer = RingBuffer(8)
+        buffer.write(b"abcde")
+        self.assertEqual(5, buffer.fill)
+        buffer.close()
+        self.assertEqual(True, buffer.waitPrimed())
+        self.assertEqual(b"abc", buffer.read(3))
+        self.assertEqual(b"de", buffer.read())
+        self.assertEqual(b"", buffer.read())
+        self.assertEqual(0, buffer.underruns)
+
+    def testReadWrite_002(self):
+        """
+        Stream much more data than the capacity through the buffer, and check that it arrives intact.
+        """
+        data = bytes(range(256)) * 1000
+        buffer = RingBuffer(1000)
+
+        def produce():
+            for i in range(0, len(data), 777):
+                buffer.write(data[i : i + 777])
+            buffer.close()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        result = self.readAll(buffer, 333)
+        producer.join()
+        self.assertEqual(data, result)
+        self.assertEqual(len(data), buffer.bytesWritten)
+        self.assertEqual(len(data), buffer.bytesRead)
+        self.assertTrue(buffer.fill == 0)
+
+    def testReadWrite_003(self):
+        """
+        Check that reads wait for the buffer to be primed, and that an empty buffer counts as an underrun.
+        """
+        buffer = RingBuffer(4)
+        results = []
+        consumer = threading.Thread(target=lambda: results.append(self.readAll(buffer, 4)))
+        consumer.start()
+        buffer.write(b"ab")
+        time.sleep(0.1)
+        self.assertEqual(b"", b"".join(results))
+        self.assertEqual(0, buffer.bytesRead)
+        buffer.write(b"cd")
+        while buffer.underruns == 0:
+            time.sleep(0.01)
+        self.assertEqual(0, buffer.lowWater)
+        buffer.write(b"ef")
+        buffer.close()
+        consumer.join()
+        self.assertEqual([b"abcdef"], results)
+        self.assertEqual(1, buffer.underruns)
+
+    def testReadWrite_004(self):
+        """
+        Check that abort releases a blocked writer and a blocked reader.
+        """
+        buffer = RingBuffer(4)
+        errors = []
+
+        def produce():
+            try:
+                buffer.write(b"abcdefghijkl")
+            except OSError as e:
+                errors.append(e)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        self.assertEqual(b"abcd", buffer.read(10))
+        buffer.abort()
+        producer.join()
+        self.assertEqual(1, len(errors))
+        self.assertEqual(b"", buffer.read())
+        self.assertRaises(IOError, buffer.write, b"x")
+        self.assertEqual(False, buffer.waitPrimed())